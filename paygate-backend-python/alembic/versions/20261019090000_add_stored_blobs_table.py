@@ -0,0 +1,36 @@
+"""Add stored_blobs table for content-addressed uploads
+
+Revision ID: 20261019090000
+Revises: 20251104150000, 8658389bca8a
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019090000'
+# Also merges the two existing heads so `alembic upgrade head` is unambiguous
+down_revision = ('20251104150000', '8658389bca8a')
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stored_blobs',
+        sa.Column('sha256', sa.String(length=64), primary_key=True),
+        sa.Column('path', sa.String(length=500), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.CheckConstraint('ref_count >= 0', name='stored_blob_ref_count_check'),
+    )
+    op.create_index('idx_stored_blob_refs_updated', 'stored_blobs', ['ref_count', 'updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_stored_blob_refs_updated', table_name='stored_blobs')
+    op.drop_table('stored_blobs')
@@ -0,0 +1,73 @@
+"""Add campaign dispatch and delivery tables
+
+Revision ID: 20261019100000
+Revises: 20261019090000
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019100000'
+down_revision = '20261019090000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'campaign_dispatches',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('campaign_id', sa.Integer(), sa.ForeignKey('marketing_campaigns.id'), nullable=False),
+        sa.Column('email_list_id', sa.Integer(), sa.ForeignKey('email_lists.id'), nullable=False),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('body_template', sa.Text(), nullable=False),
+        sa.Column('html_template', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True, server_default='pending'),
+        sa.Column('last_subscriber_id', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('fully_queued', sa.Boolean(), nullable=True, server_default=sa.false()),
+        sa.Column('total_recipients', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('queued_count', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('sent_count', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('failed_count', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.UniqueConstraint('campaign_id', 'email_list_id', name='uq_campaign_dispatch_list'),
+    )
+    op.create_index('ix_campaign_dispatches_id', 'campaign_dispatches', ['id'])
+    op.create_index('ix_campaign_dispatches_campaign_id', 'campaign_dispatches', ['campaign_id'])
+    op.create_index('ix_campaign_dispatches_email_list_id', 'campaign_dispatches', ['email_list_id'])
+    op.create_index('ix_campaign_dispatches_status', 'campaign_dispatches', ['status'])
+    op.create_index('ix_campaign_dispatches_created_at', 'campaign_dispatches', ['created_at'])
+
+    op.create_table(
+        'campaign_deliveries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('dispatch_id', sa.Integer(), sa.ForeignKey('campaign_dispatches.id', ondelete='CASCADE'),
+                  nullable=False),
+        sa.Column('subscriber_id', sa.Integer(), sa.ForeignKey('email_subscribers.id'), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint('dispatch_id', 'subscriber_id', name='uq_campaign_delivery_subscriber'),
+    )
+    op.create_index('idx_campaign_delivery_dispatch_status', 'campaign_deliveries', ['dispatch_id', 'status', 'id'])
+    op.create_index('idx_campaign_delivery_claim', 'campaign_deliveries', ['claim_token'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_campaign_delivery_claim', table_name='campaign_deliveries')
+    op.drop_index('idx_campaign_delivery_dispatch_status', table_name='campaign_deliveries')
+    op.drop_table('campaign_deliveries')
+    op.drop_index('ix_campaign_dispatches_created_at', table_name='campaign_dispatches')
+    op.drop_index('ix_campaign_dispatches_status', table_name='campaign_dispatches')
+    op.drop_index('ix_campaign_dispatches_email_list_id', table_name='campaign_dispatches')
+    op.drop_index('ix_campaign_dispatches_campaign_id', table_name='campaign_dispatches')
+    op.drop_index('ix_campaign_dispatches_id', table_name='campaign_dispatches')
+    op.drop_table('campaign_dispatches')
@@ -0,0 +1,44 @@
+"""Add webhook events table
+
+Revision ID: 20261019120000
+Revises: 20261019110000
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019120000'
+down_revision = '20261019110000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'webhook_events',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('provider', sa.String(length=20), nullable=False, server_default='paystack'),
+        sa.Column('idempotency_key', sa.String(length=255), nullable=False, unique=True),
+        sa.Column('event_type', sa.String(length=50), nullable=False),
+        sa.Column('reference', sa.String(length=100), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='received'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_webhook_events_reference', 'webhook_events', ['reference'])
+    op.create_index('idx_webhook_status_id', 'webhook_events', ['status', 'id'])
+    op.create_index('idx_webhook_claim', 'webhook_events', ['claim_token'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_webhook_claim', table_name='webhook_events')
+    op.drop_index('idx_webhook_status_id', table_name='webhook_events')
+    op.drop_index('ix_webhook_events_reference', table_name='webhook_events')
+    op.drop_table('webhook_events')
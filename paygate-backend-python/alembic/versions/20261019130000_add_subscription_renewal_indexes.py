@@ -0,0 +1,25 @@
+"""Add subscription renewal indexes
+
+Revision ID: 20261019130000
+Revises: 20261019120000
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019130000'
+down_revision = '20261019120000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('idx_subscription_renewal_due', 'subscriptions', ['status', 'auto_renew', 'next_billing_date'])
+    op.create_index('idx_invoice_status_updated', 'invoices', ['status', 'updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_invoice_status_updated', table_name='invoices')
+    op.drop_index('idx_subscription_renewal_due', table_name='subscriptions')
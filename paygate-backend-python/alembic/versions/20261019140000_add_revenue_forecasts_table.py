@@ -0,0 +1,33 @@
+"""Add revenue forecasts table
+
+Revision ID: 20261019140000
+Revises: 20261019130000
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019140000'
+down_revision = '20261019130000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'revenue_forecasts',
+        sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('as_of', sa.Date(), nullable=False),
+        sa.Column('horizon_days', sa.Integer(), nullable=False),
+        sa.Column('interval_level', sa.Float(), nullable=False),
+        sa.Column('points', sa.JSON(), nullable=False),
+        sa.Column('trend', sa.String(length=20), nullable=False),
+        sa.Column('model_params', sa.JSON(), nullable=True),
+        sa.Column('generated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('revenue_forecasts')
@@ -0,0 +1,29 @@
+"""Add A/B test results table
+
+Revision ID: 20261019150000
+Revises: 20261019140000
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019150000'
+down_revision = '20261019140000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ab_test_results',
+        sa.Column('test_id', sa.Integer(), sa.ForeignKey('ab_tests.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('results', sa.JSON(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ab_test_results')
@@ -0,0 +1,23 @@
+"""Add allocation mode to A/B tests
+
+Revision ID: 20261019160000
+Revises: 20261019150000
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019160000'
+down_revision = '20261019150000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ab_tests', sa.Column('allocation_mode', sa.String(length=20), server_default='fixed', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('ab_tests', 'allocation_mode')
@@ -0,0 +1,72 @@
+"""Add content access event log and daily aggregates
+
+Revision ID: 20261019170000
+Revises: 20261019160000
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019170000'
+down_revision = '20261019160000'
+branch_labels = None
+depends_on = None
+
+# Matches the default ACCESS_EVENT_PARTITION_DAYS_AHEAD; the daily job keeps extending it
+PARTITION_DAYS_AHEAD = 7
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # Daily range partitions are created ahead of time, here from tomorrow
+        # on and then by the compaction job; the default partition catches
+        # anything outside them (including today's rows)
+        op.execute("""
+            CREATE TABLE content_access_events (
+                id BIGSERIAL,
+                occurred_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                content_id INTEGER NOT NULL,
+                user_id INTEGER,
+                event_type SMALLINT NOT NULL,
+                PRIMARY KEY (id, occurred_at)
+            ) PARTITION BY RANGE (occurred_at)
+        """)
+        op.execute("CREATE TABLE content_access_events_default PARTITION OF content_access_events DEFAULT")
+        today = datetime.utcnow().date()
+        for offset in range(1, PARTITION_DAYS_AHEAD + 1):
+            day = today + timedelta(days=offset)
+            op.execute(
+                f"CREATE TABLE content_access_events_p{day:%Y%m%d} PARTITION OF content_access_events "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+    else:
+        op.create_table(
+            'content_access_events',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('occurred_at', sa.DateTime(), nullable=False),
+            sa.Column('content_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('event_type', sa.SmallInteger(), nullable=False),
+        )
+    op.create_index('idx_access_event_occurred_at', 'content_access_events', ['occurred_at'])
+
+    op.create_table(
+        'content_access_daily',
+        sa.Column('content_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('event_type', sa.SmallInteger(), primary_key=True),
+        sa.Column('events', sa.Integer(), nullable=False),
+        sa.Column('unique_users', sa.Integer(), nullable=False),
+    )
+    op.create_index('idx_access_daily_day', 'content_access_daily', ['day'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_access_daily_day', table_name='content_access_daily')
+    op.drop_table('content_access_daily')
+    op.drop_index('idx_access_event_occurred_at', table_name='content_access_events')
+    op.drop_table('content_access_events')
@@ -0,0 +1,32 @@
+"""Add content popularity table
+
+Revision ID: 20261019180000
+Revises: 20261019170000
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019180000'
+down_revision = '20261019170000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'content_popularity',
+        sa.Column('content_id', sa.Integer(), sa.ForeignKey('content.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('as_of', sa.Date(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('idx_content_popularity_owner_score', 'content_popularity', ['owner_id', 'score'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_content_popularity_owner_score', table_name='content_popularity')
+    op.drop_table('content_popularity')
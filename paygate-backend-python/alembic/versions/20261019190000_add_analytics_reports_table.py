@@ -0,0 +1,33 @@
+"""Add analytics reports table
+
+Revision ID: 20261019190000
+Revises: 20261019180000
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019190000'
+down_revision = '20261019180000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'analytics_reports',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('report_type', sa.String(length=50), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('period_end', sa.Date(), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('generated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint('owner_id', 'report_type', 'period_start', name='uq_analytics_report_period'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('analytics_reports')
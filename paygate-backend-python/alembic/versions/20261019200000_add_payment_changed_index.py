@@ -0,0 +1,23 @@
+"""Index payments by last change for the analytics store sync
+
+Revision ID: 20261019200000
+Revises: 20261019190000
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019200000'
+down_revision = '20261019190000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('idx_payment_changed_id', 'payments', [sa.text('coalesce(updated_at, created_at)'), 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_payment_changed_id', table_name='payments')
@@ -0,0 +1,45 @@
+"""Add revenue cube tables
+
+Revision ID: 20261019210000
+Revises: 20261019200000
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019210000'
+down_revision = '20261019200000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'revenue_cube_cells',
+        sa.Column('cube', sa.String(length=20), primary_key=True),
+        sa.Column('owner_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('currency', sa.String(length=3), primary_key=True, server_default=''),
+        sa.Column('channel', sa.String(length=50), primary_key=True, server_default=''),
+        sa.Column('payment_method', sa.String(length=50), primary_key=True, server_default=''),
+        sa.Column('paywall_id', sa.Integer(), primary_key=True, server_default='0'),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('sales', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('refunded_amount', sa.Float(), nullable=False),
+    )
+    op.create_table(
+        'revenue_cube_sync',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.Column('last_payment_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('revenue_cube_sync')
+    op.drop_table('revenue_cube_cells')
@@ -0,0 +1,32 @@
+"""Add per-day distinct customer sketches
+
+Revision ID: 20261019220000
+Revises: 20261019210000
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019220000'
+down_revision = '20261019210000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'customer_sketches',
+        sa.Column('owner_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('precision', sa.SmallInteger(), nullable=False),
+        sa.Column('exact', sa.Boolean(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+    )
+    # Replay every payment through the cube refresh so past days get sketches too
+    op.execute("DELETE FROM revenue_cube_sync")
+
+
+def downgrade() -> None:
+    op.drop_table('customer_sketches')
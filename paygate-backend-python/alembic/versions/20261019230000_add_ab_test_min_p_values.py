@@ -0,0 +1,23 @@
+"""Keep the running minimum of always-valid p-values per A/B test
+
+Revision ID: 20261019230000
+Revises: 20261019220000
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019230000'
+down_revision = '20261019220000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ab_test_results', sa.Column('always_valid_p_values', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('ab_test_results', 'always_valid_p_values')
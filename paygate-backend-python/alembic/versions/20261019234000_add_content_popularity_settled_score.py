@@ -0,0 +1,26 @@
+"""Split content popularity into settled and recent days
+
+Revision ID: 20261019234000
+Revises: 20261019233000
+Create Date: 2026-10-19 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261019234000'
+down_revision = '20261019233000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('content_popularity', sa.Column('settled_score', sa.Float(), server_default='0', nullable=False))
+    op.add_column('content_popularity', sa.Column('settled_as_of', sa.Date(), nullable=True))
+    # Without settled scores the next refresh rebuilds every score from the daily aggregates
+
+
+def downgrade() -> None:
+    op.drop_column('content_popularity', 'settled_as_of')
+    op.drop_column('content_popularity', 'settled_score')
@@ -0,0 +1,33 @@
+"""Count A/B test visits once per visitor
+
+Revision ID: 20261020000000
+Revises: 20261019234000
+Create Date: 2026-10-20 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by alembic.
+revision = '20261020000000'
+down_revision = '20261019234000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ab_test_exposures',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('test_id', sa.Integer(), sa.ForeignKey('ab_tests.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('visitor_id', sa.String(255), nullable=False),
+        sa.Column('variant_id', sa.Integer(), sa.ForeignKey('ab_test_variants.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint('test_id', 'visitor_id', name='uq_ab_test_exposures_visitor'),
+    )
+    op.create_index('ix_ab_test_exposures_id', 'ab_test_exposures', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ab_test_exposures_id', table_name='ab_test_exposures')
+    op.drop_table('ab_test_exposures')
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.schedules import crontab
 from config.settings import settings
 
 # Create Celery instance
@@ -10,6 +11,9 @@ celery_app = Celery(
         'tasks.email',
         'tasks.file_processing',
         'tasks.analytics',
+        'tasks.marketing',
+        'tasks.payments',
+        'tasks.billing',
     ]
 )
 
@@ -24,10 +28,81 @@ celery_app.conf.update(
         'tasks.email.*': {'queue': 'email'},
         'tasks.file_processing.*': {'queue': 'file_processing'},
         'tasks.analytics.*': {'queue': 'analytics'},
+        'tasks.marketing.*': {'queue': 'email'},
+        'tasks.payments.*': {'queue': 'payments'},
+        'tasks.billing.*': {'queue': 'payments'},
     },
     worker_prefetch_multiplier=1,
     task_acks_late=True,
 )
 
+# Periodic jobs (run with `celery -A celery_worker beat`)
+celery_app.conf.beat_schedule = {
+    'expire-upload-sessions': {
+        'task': 'tasks.file_processing.expire_upload_sessions',
+        'schedule': crontab(minute=15),  # Hourly
+    },
+    'collect-unreferenced-blobs': {
+        'task': 'tasks.file_processing.collect_unreferenced_blobs',
+        'schedule': crontab(hour=3, minute=30),  # Daily at 3:30 AM, after backups
+    },
+    'resume-stalled-campaign-dispatches': {
+        'task': 'tasks.marketing.resume_stalled_campaign_dispatches',
+        'schedule': crontab(minute='*/5'),
+    },
+    'process-webhook-events': {
+        'task': 'tasks.payments.process_webhook_events',
+        'schedule': crontab(minute='*'),  # Safety net for events whose kick was lost
+    },
+    'reconcile-pending-payments': {
+        'task': 'tasks.payments.reconcile_pending_payments',
+        'schedule': crontab(minute='*/15'),
+    },
+    'renew-subscriptions': {
+        'task': 'tasks.billing.renew_subscriptions',
+        'schedule': crontab(minute='*/10'),
+    },
+    'compact-access-events': {
+        'task': 'tasks.analytics.compact_access_events',
+        'schedule': crontab(hour=0, minute=15),  # After the last of yesterday's events is flushed
+    },
+    'update-content-popularity': {
+        'task': 'tasks.analytics.update_content_popularity_scores',
+        'schedule': crontab(hour=0, minute=45),  # Once yesterday's access events are compacted
+    },
+    'generate-daily-analytics-report': {
+        'task': 'tasks.analytics.generate_daily_analytics_report',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'generate-weekly-paywall-performance': {
+        'task': 'tasks.analytics.generate_weekly_paywall_performance',
+        'schedule': crontab(day_of_week=1, hour=1, minute=30),  # Mondays, for the week just ended
+    },
+    'refresh-revenue-cubes': {
+        'task': 'tasks.analytics.refresh_revenue_cubes',
+        'schedule': crontab(minute='*'),
+    },
+    'sync-analytics-store': {
+        'task': 'tasks.analytics.sync_analytics_store',
+        'schedule': crontab(minute='*/5'),
+    },
+    'refresh-revenue-forecasts': {
+        'task': 'tasks.analytics.refresh_revenue_forecasts',
+        'schedule': crontab(hour=0, minute=30),  # Daily, once yesterday's revenue is complete
+    },
+    'refresh-ab-test-results': {
+        'task': 'tasks.analytics.refresh_ab_test_results',
+        'schedule': crontab(minute='*/5'),
+    },
+    'rebalance-bandit-ab-tests': {
+        'task': 'tasks.analytics.rebalance_bandit_ab_tests',
+        'schedule': crontab(minute='*/15'),
+    },
+    'render-monthly-invoices': {
+        'task': 'tasks.billing.render_invoices_for_period',
+        'schedule': crontab(day_of_month=1, hour=2, minute=0),  # Previous month, ahead of month-end downloads
+    },
+}
+
 if __name__ == '__main__':
     celery_app.start()
\ No newline at end of file
@@ -23,6 +23,7 @@ ALLOWED_HEADERS = [
     "X-File-Name",
     "X-File-Size",
     "X-File-Type",
+    "Idempotency-Key",
     "X-Requested-With",
     "Access-Control-Request-Method",
     "Access-Control-Request-Headers",
@@ -57,6 +58,6 @@ def setup_cors(app: ASGIApp) -> None:
         allow_methods=ALLOWED_METHODS,
         allow_headers=ALLOWED_HEADERS,
         # Expose authorization header to allow authentication to work in browser
-        expose_headers=["Access-Control-Allow-Origin", "Authorization", "Content-Disposition", "Content-Type", "X-Total-Count"],
+        expose_headers=["Access-Control-Allow-Origin", "Authorization", "Content-Disposition", "Content-Type", "X-Total-Count", "Idempotent-Replayed"],
         max_age=600,  # 10 minutes
     )
@@ -24,14 +24,136 @@ class Settings(BaseSettings):
     EMAIL_PASSWORD: Optional[str] = os.getenv("EMAIL_PASSWORD")
     EMAIL_SENDER: str = os.getenv("EMAIL_SENDER", "noreply@paygate.com")
     EMAIL_USE_TLS: bool = os.getenv("EMAIL_USE_TLS", "true").lower() == "true"
+    EMAIL_MAX_MESSAGES_PER_CONNECTION: int = int(os.getenv("EMAIL_MAX_MESSAGES_PER_CONNECTION", "100"))
+    EMAIL_CONNECTION_IDLE_TIMEOUT: int = int(os.getenv("EMAIL_CONNECTION_IDLE_TIMEOUT", "60"))  # seconds
+    EMAIL_BATCH_SIZE: int = int(os.getenv("EMAIL_BATCH_SIZE", "100"))
+    EMAIL_DOMAIN_RATE_PER_MINUTE: int = int(os.getenv("EMAIL_DOMAIN_RATE_PER_MINUTE", "120"))
+    EMAIL_DOMAIN_RATE_OVERRIDES: Optional[str] = os.getenv("EMAIL_DOMAIN_RATE_OVERRIDES")  # "gmail.com=300,yahoo.com=60"
+    EMAIL_THROTTLE_MAX_WAIT: int = int(os.getenv("EMAIL_THROTTLE_MAX_WAIT", "2"))  # seconds to sleep before deferring
     
     # Environment
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
+
+    # Uploads
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # 1MB read size
+    UPLOAD_SESSION_TTL_HOURS: int = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+    # Derivative rendering: 0 workers means one per CPU core
+    DERIVATIVE_WORKERS: int = int(os.getenv("DERIVATIVE_WORKERS", "0"))
+    DERIVATIVE_BATCH_SIZE: int = int(os.getenv("DERIVATIVE_BATCH_SIZE", "16"))
+
+    # Campaign dispatch
+    CAMPAIGN_CHUNK_SIZE: int = int(os.getenv("CAMPAIGN_CHUNK_SIZE", "500"))
+    CAMPAIGN_SEND_RATE_PER_SECOND: float = float(os.getenv("CAMPAIGN_SEND_RATE_PER_SECOND", "50"))  # across all campaigns
+    CAMPAIGN_QUEUE_AHEAD_SECONDS: int = int(os.getenv("CAMPAIGN_QUEUE_AHEAD_SECONDS", "300"))
+    CAMPAIGN_CLAIM_TIMEOUT_MINUTES: int = int(os.getenv("CAMPAIGN_CLAIM_TIMEOUT_MINUTES", "15"))
+
+    # Transactional outbox relay
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+    OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+    # On-demand image variants
+    IMAGE_CACHE_MAX_BYTES: int = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 512MB
+    IMAGE_RESIZE_CONCURRENCY: int = int(os.getenv("IMAGE_RESIZE_CONCURRENCY", str(os.cpu_count() or 2)))
+    IMAGE_MAX_DIMENSION: int = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+
+    # Invoice PDFs
+    INVOICE_CACHE_MAX_BYTES: int = int(os.getenv("INVOICE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1GB
+    INVOICE_RENDER_CONCURRENCY: int = int(os.getenv("INVOICE_RENDER_CONCURRENCY", str(os.cpu_count() or 2)))
+    INVOICE_RENDER_BATCH_SIZE: int = int(os.getenv("INVOICE_RENDER_BATCH_SIZE", "500"))  # invoices per page of a period job
+    INVOICE_SELLER_DETAILS: str = os.getenv("INVOICE_SELLER_DETAILS", "Paygate")
+
+    # Protected file delivery: "stream", "x-accel-redirect" (nginx) or "x-sendfile"
+    FILE_DELIVERY_MODE: str = os.getenv("FILE_DELIVERY_MODE", "stream")
+    FILE_DELIVERY_INTERNAL_PREFIX: str = os.getenv("FILE_DELIVERY_INTERNAL_PREFIX", "/protected-uploads/")
     
     # Paystack
     PAYSTACK_SECRET_KEY: Optional[str] = os.getenv("PAYSTACK_SECRET_KEY")
     PAYSTACK_PUBLIC_KEY: Optional[str] = os.getenv("PAYSTACK_PUBLIC_KEY")
+    PAYSTACK_BASE_URL: str = os.getenv("PAYSTACK_BASE_URL", "https://api.paystack.co")  # scripts/paystack_stub.py for offline runs
+    PAYSTACK_TIMEOUT: float = float(os.getenv("PAYSTACK_TIMEOUT", "10"))
+    PAYSTACK_MAX_RETRIES: int = int(os.getenv("PAYSTACK_MAX_RETRIES", "3"))
+    PAYSTACK_MAX_CONNECTIONS: int = int(os.getenv("PAYSTACK_MAX_CONNECTIONS", "100"))
+    PAYSTACK_HTTP2: bool = os.getenv("PAYSTACK_HTTP2", "false").lower() == "true"  # needs the h2 package
+    PAYSTACK_BREAKER_THRESHOLD: int = int(os.getenv("PAYSTACK_BREAKER_THRESHOLD", "5"))
+    PAYSTACK_BREAKER_RESET_SECONDS: float = float(os.getenv("PAYSTACK_BREAKER_RESET_SECONDS", "30"))
+
+    # Webhook ingestion
+    WEBHOOK_BATCH_SIZE: int = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+
+    # Discount code / coupon lookups (validation only; redemption always hits the database)
+    DISCOUNT_CODE_CACHE_TTL: int = int(os.getenv("DISCOUNT_CODE_CACHE_TTL", "30"))
+    DISCOUNT_CODE_NEGATIVE_CACHE_TTL: int = int(os.getenv("DISCOUNT_CODE_NEGATIVE_CACHE_TTL", "10"))
+
+    # Idempotency-Key handling for mutating requests
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # how long a duplicate waits on the original
+    IDEMPOTENCY_MAX_BODY_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+
+    # Pending payment reconciliation
+    RECONCILE_PENDING_AFTER_MINUTES: int = int(os.getenv("RECONCILE_PENDING_AFTER_MINUTES", "30"))
+    RECONCILE_ABANDON_AFTER_HOURS: int = int(os.getenv("RECONCILE_ABANDON_AFTER_HOURS", "24"))
+    RECONCILE_PAGE_SIZE: int = int(os.getenv("RECONCILE_PAGE_SIZE", "500"))
+    RECONCILE_CONCURRENCY: int = int(os.getenv("RECONCILE_CONCURRENCY", "20"))  # concurrent gateway calls
     
+    # Subscription renewals
+    RENEWAL_BATCH_SIZE: int = int(os.getenv("RENEWAL_BATCH_SIZE", "200"))
+    RENEWAL_CONCURRENCY: int = int(os.getenv("RENEWAL_CONCURRENCY", "20"))  # concurrent gateway charges
+    RENEWAL_RETRY_AFTER_MINUTES: int = int(os.getenv("RENEWAL_RETRY_AFTER_MINUTES", "30"))  # charge outcome unknown
+    RENEWAL_ABANDON_AFTER_HOURS: int = int(os.getenv("RENEWAL_ABANDON_AFTER_HOURS", "72"))
+
+    # Revenue forecasting
+    FORECAST_HISTORY_DAYS: int = int(os.getenv("FORECAST_HISTORY_DAYS", "91"))  # at least 14
+    FORECAST_HORIZON_DAYS: int = int(os.getenv("FORECAST_HORIZON_DAYS", "30"))
+    FORECAST_INTERVAL_LEVEL: float = float(os.getenv("FORECAST_INTERVAL_LEVEL", "0.95"))
+    FORECAST_BATCH_SIZE: int = int(os.getenv("FORECAST_BATCH_SIZE", "2000"))  # owners fitted per pass
+
+    # A/B test statistics
+    AB_TEST_ALPHA: float = float(os.getenv("AB_TEST_ALPHA", "0.05"))
+    AB_TEST_MSPRT_TAU: float = float(os.getenv("AB_TEST_MSPRT_TAU", "0.05"))  # expected effect size for always-valid p-values
+    AB_TEST_POSTERIOR_DRAWS: int = int(os.getenv("AB_TEST_POSTERIOR_DRAWS", "4000"))
+    AB_TEST_STATS_BATCH_SIZE: int = int(os.getenv("AB_TEST_STATS_BATCH_SIZE", "1000"))  # tests per vectorised pass
+    AB_TEST_ALLOCATION_CACHE_TTL: float = float(os.getenv("AB_TEST_ALLOCATION_CACHE_TTL", "30"))  # seconds a process reuses a weight table
+    AB_TEST_COUNT_FLUSH_INTERVAL: float = float(os.getenv("AB_TEST_COUNT_FLUSH_INTERVAL", "5"))
+    AB_TEST_COUNT_FLUSH_SIZE: int = int(os.getenv("AB_TEST_COUNT_FLUSH_SIZE", "1000"))  # buffered events that trigger an early flush
+    AB_TEST_BANDIT_MIN_WEIGHT: float = float(os.getenv("AB_TEST_BANDIT_MIN_WEIGHT", "0.05"))  # exploration floor per variant
+
+    # Content access event ingestion
+    ACCESS_EVENT_FLUSH_INTERVAL: float = float(os.getenv("ACCESS_EVENT_FLUSH_INTERVAL", "2"))
+    ACCESS_EVENT_FLUSH_SIZE: int = int(os.getenv("ACCESS_EVENT_FLUSH_SIZE", "5000"))  # buffered events that trigger an early flush
+    ACCESS_EVENT_BUFFER_MAX: int = int(os.getenv("ACCESS_EVENT_BUFFER_MAX", "200000"))  # events beyond this are dropped
+    ACCESS_EVENT_RETENTION_DAYS: int = int(os.getenv("ACCESS_EVENT_RETENTION_DAYS", "90"))  # raw events; daily aggregates are kept
+    ACCESS_EVENT_PARTITION_DAYS_AHEAD: int = int(os.getenv("ACCESS_EVENT_PARTITION_DAYS_AHEAD", "7"))
+
+    # Content popularity
+    POPULARITY_HALF_LIFE_DAYS: float = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "7"))
+    POPULARITY_REFOLD_DAYS: int = int(os.getenv("POPULARITY_REFOLD_DAYS", "3"))  # recent days re-read on every refresh
+    POPULARITY_PURCHASE_WEIGHT: float = float(os.getenv("POPULARITY_PURCHASE_WEIGHT", "10"))  # one paid grant, in views
+    POPULARITY_TOP_K: int = int(os.getenv("POPULARITY_TOP_K", "50"))  # ranking cached per owner
+    POPULARITY_CACHE_TTL: int = int(os.getenv("POPULARITY_CACHE_TTL", "900"))
+
+    # Nightly analytics reports
+    REPORT_OWNER_CHUNK_SIZE: int = int(os.getenv("REPORT_OWNER_CHUNK_SIZE", "500"))  # owners per streamed pass
+    REPORT_CONCURRENCY: int = int(os.getenv("REPORT_CONCURRENCY", "4"))  # chunks in flight, one connection each
+    REPORT_STREAM_BATCH_SIZE: int = int(os.getenv("REPORT_STREAM_BATCH_SIZE", "2000"))  # rows fetched per round trip
+
+    # Columnar analytics store
+    ANALYTICS_STORE_DIR: str = os.getenv("ANALYTICS_STORE_DIR", "analytics_store")  # shared by the API and workers
+    ANALYTICS_STORE_SYNC_BATCH_SIZE: int = int(os.getenv("ANALYTICS_STORE_SYNC_BATCH_SIZE", "50000"))  # rows per Parquet file
+    ANALYTICS_STORE_SYNC_LAG: int = int(os.getenv("ANALYTICS_STORE_SYNC_LAG", "120"))  # seconds; newer changes wait for the next sync
+    ANALYTICS_STORE_MAX_FILES_PER_MONTH: int = int(os.getenv("ANALYTICS_STORE_MAX_FILES_PER_MONTH", "16"))  # before compaction
+
+    # Revenue cubes
+    REVENUE_CUBE_SYNC_BATCH_SIZE: int = int(os.getenv("REVENUE_CUBE_SYNC_BATCH_SIZE", "5000"))  # changed payments per pass
+    REVENUE_CUBE_SYNC_LAG: int = int(os.getenv("REVENUE_CUBE_SYNC_LAG", "30"))  # seconds; newer changes wait for the next run
+
+    # Distinct customer sketches
+    CUSTOMER_SKETCH_ERROR: float = float(os.getenv("CUSTOMER_SKETCH_ERROR", "0.02"))  # relative standard error of large counts
+    CUSTOMER_SKETCH_EXACT_LIMIT: int = int(os.getenv("CUSTOMER_SKETCH_EXACT_LIMIT", "1000"))  # counted exactly up to this many
+
     # Supabase configuration
     NEXT_PUBLIC_SUPABASE_URL: Optional[str] = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
     NEXT_PUBLIC_SUPABASE_ANON_KEY: Optional[str] = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
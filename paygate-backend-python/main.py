@@ -6,11 +6,13 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from config.database import engine
+from config.database import engine, async_session
+from config.settings import settings
 from models import Base
-from routes import auth, users, paywall, content, payment, customer, analytics, upload, access, billing, notification, support, marketing, communication, supabase, backup, monitoring, ab_test
+from routes import auth, users, paywall, content, payment, customer, analytics, upload, access, billing, notification, support, marketing, communication, supabase, backup, monitoring, ab_test, images
 from utils.middleware.advanced_rate_limit import rate_limit_middleware
 from utils.middleware.security_headers import SecurityHeadersMiddleware
+from utils.middleware.idempotency import IdempotencyMiddleware
 from utils.cache import cache
 from config.cors import setup_cors
 from contextlib import asynccontextmanager
@@ -25,7 +27,14 @@ import time
 
 # Import all models to ensure they're registered with SQLAlchemy
 import models
+from services.ab_assignment_service import run_count_flusher
+from services.access_event_service import run_event_flusher
 from services.backup_scheduler import backup_scheduler
+from services.derivative_service import shutdown_process_pool
+from services.outbox_service import run_relay
+from utils.paystack_client import close_paystack_client
+from utils.websocket_broadcast import run_realtime_subscriber
+import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -35,11 +44,24 @@ async def lifespan(app: FastAPI):
     
     # Start backup scheduler
     backup_scheduler.start()
+
+    # Drain the outbox and relay realtime events published by other processes
+    background_tasks = [
+        asyncio.create_task(run_relay(async_session)),
+        asyncio.create_task(run_realtime_subscriber()),
+        asyncio.create_task(run_count_flusher(async_session)),  # Buffered A/B test visits and conversions
+        asyncio.create_task(run_event_flusher(async_session)),  # Buffered content access events
+    ]
     
     yield
     
     # Cleanup on shutdown
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await close_paystack_client()
     backup_scheduler.stop()
+    shutdown_process_pool()
 
 # Create FastAPI application
 app = FastAPI(
@@ -55,6 +77,11 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Replay stored responses for retried requests carrying an Idempotency-Key.
+# Added before CORS so that CORS (the later, outer middleware) also adds its
+# headers to replayed responses and answers preflights before the key check
+app.add_middleware(IdempotencyMiddleware)
+
 # Configure CORS - This must be called before adding other middleware
 setup_cors(app)
 
@@ -155,6 +182,7 @@ app.include_router(supabase.router, prefix="/api", tags=["supabase"])
 app.include_router(backup.router, prefix="/api", tags=["backup"])
 app.include_router(monitoring.router, prefix="/api", tags=["monitoring"])
 app.include_router(ab_test.router, prefix="/api", tags=["ab-testing"])
+app.include_router(images.router, prefix="/api", tags=["images"])
 
 @app.get("/")
 def read_root():
@@ -248,8 +276,10 @@ async def full_health_check():
 
 # Create uploads directory if it doesn't exist
 import os
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("uploads/avatars", exist_ok=True)
+from utils.streaming_upload import PUBLIC_UPLOAD_DIR
+public_uploads = os.path.join(settings.UPLOAD_DIR, PUBLIC_UPLOAD_DIR)
+os.makedirs(public_uploads, exist_ok=True)
 
-# Mount static files directory to serve uploaded avatars
-app.mount("/api/uploads", StaticFiles(directory="uploads"), name="uploads")
\ No newline at end of file
+# Only published assets (avatars) are served statically; content files go
+# through the access-checked /api/access/content/{id}/file endpoint
+app.mount("/api/uploads/public", StaticFiles(directory=public_uploads), name="public_uploads")
\ No newline at end of file
@@ -5,17 +5,20 @@ Base = declarative_base()
 from .user import User
 from .content import Content
 from .paywall import Paywall
-from .payment import Payment
+from .payment import Payment, WebhookEvent
 from .customer import Customer
 from .access import ContentAccess
 from .token_blacklist import TokenBlacklist
 from .billing import SubscriptionPlan, Subscription, Invoice, Coupon, BillingInfo, PaymentMethod
 from .notification import Notification, NotificationPreference
 from .support import SupportCategory, SupportTicket, SupportTicketResponse
-from .marketing import DiscountCode, Affiliate, AffiliateReferral, MarketingCampaign, EmailList, EmailSubscriber
+from .marketing import DiscountCode, Affiliate, AffiliateReferral, MarketingCampaign, EmailList, EmailSubscriber, CampaignDispatch, CampaignDelivery
 from .audit import AuditLog, DataChangeLog
 from .token_blacklist import TokenBlacklist
-from .ab_test import ABTest, ABTestVariant
+from .ab_test import ABTest, ABTestVariant, ABTestResultSnapshot, ABTestConversion, ABTestExposure
+from .blob import StoredBlob
+from .outbox import OutboxEvent
+from .analytics import RevenueForecastSnapshot, ContentAccessEvent, ContentAccessDaily, ContentPopularity, AnalyticsReport, RevenueCubeCell, RevenueCubeSync, CustomerSketch
 
 __all__ = [
     "Base", "User", "Content", "Paywall", "Payment", "Customer", "ContentAccess", "TokenBlacklist",
@@ -23,5 +26,10 @@ __all__ = [
     "Notification", "NotificationPreference",
     "SupportCategory", "SupportTicket", "SupportTicketResponse",
     "DiscountCode", "Affiliate", "AffiliateReferral", "MarketingCampaign", "EmailList", "EmailSubscriber",
-    "ABTest", "ABTestVariant"
+    "CampaignDispatch", "CampaignDelivery",
+    "ABTest", "ABTestVariant", "ABTestResultSnapshot", "ABTestConversion", "ABTestExposure",
+    "StoredBlob",
+    "OutboxEvent", "WebhookEvent",
+    "RevenueForecastSnapshot", "ContentAccessEvent", "ContentAccessDaily", "ContentPopularity",
+    "AnalyticsReport", "RevenueCubeCell", "RevenueCubeSync", "CustomerSketch"
 ]
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 AB Test Experiment Model
 """
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Numeric, Text, Boolean, Date
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Numeric, Text, Boolean, Date, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from config.database import Base
@@ -82,7 +82,7 @@ class ABTestVariant(Base):
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     # Relationship to parent test
-    test = relationship("ABTest", back_populates="variants")
+    test = relationship("ABTest", back_populates="variants", foreign_keys=[test_id])
 
 
 class ABTest(Base):
@@ -100,13 +100,16 @@ class ABTest(Base):
     current_sample = Column(Integer, default=0)
     is_winner_determined = Column(Boolean, default=False)
     winner_variant_id = Column(Integer, ForeignKey("ab_test_variants.id"))  # Foreign key to the winning variant
+    allocation_mode = Column(String(20), default="fixed", server_default="fixed", nullable=False)  # fixed, bandit
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     # Relationships
     owner = relationship("User", back_populates="ab_tests")
-    variants = relationship("ABTestVariant", back_populates="test", cascade="all, delete-orphan")
-    winner_variant = relationship("ABTestVariant", foreign_keys=[winner_variant_id])
+    variants = relationship("ABTestVariant", back_populates="test", cascade="all, delete-orphan",
+                            foreign_keys="ABTestVariant.test_id")
+    # The two tables reference each other; winner_variant_id is set in a separate UPDATE
+    winner_variant = relationship("ABTestVariant", foreign_keys=[winner_variant_id], post_update=True)
 
     def add_variant(self, name: str, description: str, weight: float):
         """Add a new variant to this test"""
@@ -117,4 +120,51 @@ class ABTest(Base):
             weight=weight
         )
         self.variants.append(variant)
-        return variant
\ No newline at end of file
+        return variant
+
+
+class ABTestResultSnapshot(Base):
+    """
+    Last computed statistics of a test, keyed by a fingerprint of the variant
+    counts they were computed from; a snapshot whose fingerprint no longer
+    matches the live counts is recomputed. always_valid_p_values carries the
+    smallest always-valid p-value seen so far per variant id across
+    recomputations, which is the p-value the mSPRT reports.
+    """
+    __tablename__ = "ab_test_results"
+
+    test_id = Column(Integer, ForeignKey("ab_tests.id", ondelete="CASCADE"), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    results = Column(JSON, nullable=False)
+    always_valid_p_values = Column(JSON, nullable=True)
+    computed_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class ABTestConversion(Base):
+    """
+    A visitor's conversion in a test. At most one per visitor, so replayed or
+    repeated conversion calls are counted once.
+    """
+    __tablename__ = "ab_test_conversions"
+    __table_args__ = (UniqueConstraint("test_id", "visitor_id", name="uq_ab_test_conversions_visitor"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("ab_tests.id", ondelete="CASCADE"), nullable=False)
+    visitor_id = Column(String(255), nullable=False)
+    variant_id = Column(Integer, ForeignKey("ab_test_variants.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class ABTestExposure(Base):
+    """
+    The first time a visitor was shown a variant of a test. At most one per
+    visitor, so a visit is counted once however often /assign is called.
+    """
+    __tablename__ = "ab_test_exposures"
+    __table_args__ = (UniqueConstraint("test_id", "visitor_id", name="uq_ab_test_exposures_visitor"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("ab_tests.id", ondelete="CASCADE"), nullable=False)
+    visitor_id = Column(String(255), nullable=False)
+    variant_id = Column(Integer, ForeignKey("ab_test_variants.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
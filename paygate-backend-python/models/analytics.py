@@ -0,0 +1,142 @@
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Boolean, Date, DateTime, Float, JSON, LargeBinary, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from config.database import Base
+
+
+class RevenueForecastSnapshot(Base):
+    """
+    Latest revenue forecast per owner, written by the batch forecasting job
+    so the forecast endpoint is a primary-key lookup.
+    """
+    __tablename__ = "revenue_forecasts"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    as_of = Column(Date, nullable=False)  # Last complete day of history the model saw
+    horizon_days = Column(Integer, nullable=False)
+    interval_level = Column(Float, nullable=False)  # e.g. 0.95 for 95% prediction intervals
+    points = Column(JSON, nullable=False)  # [[date, predicted, lower, upper], ...]
+    trend = Column(String(20), nullable=False)  # increasing, decreasing, stable
+    model_params = Column(JSON, nullable=True)  # alpha, beta, gamma, phi, rmse
+    generated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class ContentAccessEvent(Base):
+    """
+    Append-only log of content accesses, written in bulk by
+    services/access_event_service.py. Kept narrow (no foreign keys, a small
+    integer event type) so inserts stay cheap; on PostgreSQL the migration
+    creates it range-partitioned by day on occurred_at, with (id,
+    occurred_at) as the primary key.
+    """
+    __tablename__ = "content_access_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    occurred_at = Column(DateTime, nullable=False)
+    content_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    event_type = Column(SmallInteger, nullable=False)  # See access_event_service.EVENT_TYPES
+
+    __table_args__ = (
+        Index("idx_access_event_occurred_at", "occurred_at"),
+    )
+
+
+class ContentAccessDaily(Base):
+    """Per-content, per-day event counts compacted from content_access_events"""
+    __tablename__ = "content_access_daily"
+
+    content_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    event_type = Column(SmallInteger, primary_key=True)
+    events = Column(Integer, nullable=False)
+    unique_users = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("idx_access_daily_day", "day"),
+    )
+
+
+class ContentPopularity(Base):
+    """
+    Exponentially decayed popularity of each content item as of the last
+    complete day, maintained incrementally by services/popularity_service.py.
+    settled_score covers only the days up to settled_as_of, whose aggregates
+    no longer change; score adds the more recent days on top.
+    """
+    __tablename__ = "content_popularity"
+
+    content_id = Column(Integer, ForeignKey("content.id", ondelete="CASCADE"), primary_key=True)
+    owner_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    as_of = Column(Date, nullable=False)
+    settled_score = Column(Float, nullable=False, default=0.0, server_default="0")
+    settled_as_of = Column(Date, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("idx_content_popularity_owner_score", "owner_id", "score"),
+    )
+
+
+class AnalyticsReport(Base):
+    """Per-owner report for one period, written by the nightly report jobs"""
+    __tablename__ = "analytics_reports"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    report_type = Column(String(50), nullable=False)  # daily, weekly_paywall_performance
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)  # Exclusive
+    data = Column(JSON, nullable=False)
+    generated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "report_type", "period_start", name="uq_analytics_report_period"),
+    )
+
+
+class RevenueCubeCell(Base):
+    """
+    One cell of a pre-aggregated revenue cube: an owner's payments of one
+    day, grouped by the cube's dimensions (see revenue_cube_service.CUBES).
+    Dimensions a cube does not group by hold '' / 0, as do missing values.
+    """
+    __tablename__ = "revenue_cube_cells"
+
+    cube = Column(String(20), primary_key=True)
+    owner_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True, default="")
+    channel = Column(String(50), primary_key=True, default="")
+    payment_method = Column(String(50), primary_key=True, default="")
+    paywall_id = Column(Integer, primary_key=True, default=0)
+    revenue = Column(Float, nullable=False)  # Completed payments
+    sales = Column(Integer, nullable=False)
+    attempts = Column(Integer, nullable=False)  # Payments in any status
+    failed = Column(Integer, nullable=False)
+    refunded_amount = Column(Float, nullable=False)
+
+
+class RevenueCubeSync(Base):
+    """Keyset position of the revenue cube maintenance in the payment change stream"""
+    __tablename__ = "revenue_cube_sync"
+
+    id = Column(Integer, primary_key=True)  # Single row
+    changed_at = Column(DateTime, nullable=False)
+    last_payment_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CustomerSketch(Base):
+    """
+    Distinct paying customers of an owner on one day as a HyperLogLog
+    sketch (utils/hyperloglog.py), exact while small; maintained with the
+    revenue cubes and merged to count customers over any range of days
+    """
+    __tablename__ = "customer_sketches"
+
+    owner_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    precision = Column(SmallInteger, nullable=False)
+    exact = Column(Boolean, nullable=False)  # data holds the hashes themselves, not registers
+    data = Column(LargeBinary, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from config.database import Base
@@ -24,7 +24,7 @@ class Subscription(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
     plan_id = Column(Integer, ForeignKey("subscription_plans.id"), index=True)
-    status = Column(String, default="active", index=True)  # active, inactive, canceled, expired
+    status = Column(String, default="active", index=True)  # active, inactive, canceled, expired, past_due
     start_date = Column(DateTime(timezone=True), nullable=False)
     end_date = Column(DateTime(timezone=True), nullable=True)
     next_billing_date = Column(DateTime(timezone=True), nullable=True)
@@ -36,6 +36,10 @@ class Subscription(Base):
     user = relationship("User")
     plan = relationship("SubscriptionPlan")
 
+    __table_args__ = (
+        Index('idx_subscription_renewal_due', 'status', 'auto_renew', 'next_billing_date'),  # For the renewal runner
+    )
+
 
 class Invoice(Base):
     __tablename__ = "invoices"
@@ -56,6 +60,10 @@ class Invoice(Base):
     user = relationship("User")
     subscription = relationship("Subscription")
 
+    __table_args__ = (
+        Index('idx_invoice_status_updated', 'status', 'updated_at'),  # For retrying stalled renewal charges
+    )
+
 
 class Coupon(Base):
     __tablename__ = "coupons"
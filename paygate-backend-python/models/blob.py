@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index, CheckConstraint
+from sqlalchemy.sql import func
+from config.database import Base
+
+
+class StoredBlob(Base):
+    """
+    A content-addressed upload, keyed by the SHA-256 of its bytes.
+    ref_count tracks the Content rows and user avatars pointing at it.
+    """
+    __tablename__ = "stored_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String(500), nullable=False)  # Relative to UPLOAD_DIR
+    content_type = Column(String(100), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('idx_stored_blob_refs_updated', 'ref_count', 'updated_at'),  # For garbage collection sweeps
+        CheckConstraint("ref_count >= 0", name="stored_blob_ref_count_check"),
+    )
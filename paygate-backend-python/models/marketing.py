@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from config.database import Base
@@ -96,4 +96,56 @@ class EmailSubscriber(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    email_list = relationship("EmailList")
\ No newline at end of file
+    email_list = relationship("EmailList")
+
+
+class CampaignDispatch(Base):
+    """One send of a campaign to an email list, with a resumable cursor and progress counters"""
+    __tablename__ = "campaign_dispatches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("marketing_campaigns.id"), nullable=False, index=True)
+    email_list_id = Column(Integer, ForeignKey("email_lists.id"), nullable=False, index=True)
+    subject = Column(String, nullable=False)
+    body_template = Column(Text, nullable=False)  # string.Template: $first_name, $unsubscribe_url, $campaign_name...
+    html_template = Column(Text, nullable=True)
+    status = Column(String, default="pending", index=True)  # pending, running, paused, completed, cancelled
+    last_subscriber_id = Column(Integer, default=0)  # Keyset cursor: subscribers up to here are queued
+    fully_queued = Column(Boolean, default=False)
+    total_recipients = Column(Integer, default=0)
+    queued_count = Column(Integer, default=0)
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    campaign = relationship("MarketingCampaign")
+    email_list = relationship("EmailList")
+
+    __table_args__ = (
+        # A campaign is sent to a list at most once
+        UniqueConstraint('campaign_id', 'email_list_id', name='uq_campaign_dispatch_list'),
+    )
+
+
+class CampaignDelivery(Base):
+    """Per-recipient delivery state; the unique key makes re-queuing after a crash idempotent"""
+    __tablename__ = "campaign_deliveries"
+
+    id = Column(Integer, primary_key=True)
+    dispatch_id = Column(Integer, ForeignKey("campaign_dispatches.id", ondelete="CASCADE"), nullable=False)
+    subscriber_id = Column(Integer, ForeignKey("email_subscribers.id"), nullable=False)
+    email = Column(String, nullable=False)
+    status = Column(String, default="queued", nullable=False)  # queued, sending, sent, failed
+    claim_token = Column(String(32), nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    error = Column(Text, nullable=True)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('dispatch_id', 'subscriber_id', name='uq_campaign_delivery_subscriber'),
+        Index('idx_campaign_delivery_dispatch_status', 'dispatch_id', 'status', 'id'),
+        Index('idx_campaign_delivery_claim', 'claim_token'),
+    )
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Index
+from sqlalchemy.sql import func
+from config.database import Base
+
+
+class OutboxEvent(Base):
+    """
+    A side effect recorded in the same transaction as the change that caused it
+    (e.g. a payment), delivered afterwards by the outbox relay.
+    One row per destination topic so each is retried independently.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String(100), nullable=False)  # e.g. email.payment_confirmation, realtime.analytics
+    aggregate_type = Column(String(50), nullable=True)
+    aggregate_id = Column(Integer, nullable=True)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)  # pending, dispatched, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # Retry backoff
+    claim_token = Column(String(32), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)  # Lease held by a relay
+    last_error = Column(Text, nullable=True)
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_outbox_status_available', 'status', 'available_at', 'id'),  # Relay polling
+        Index('idx_outbox_claim', 'claim_token'),
+        Index('idx_outbox_aggregate', 'aggregate_type', 'aggregate_id'),
+    )
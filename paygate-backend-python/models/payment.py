@@ -30,9 +30,38 @@ class Payment(Base):
         Index('idx_payment_owner_status', 'owner_id', 'status'),  # For user payment queries
         Index('idx_payment_customer_status', 'customer_email', 'status'),  # For customer payment queries
         Index('idx_payment_amount_currency', 'amount', 'currency'),  # For amount/currency queries
+        Index('idx_payment_changed_id', func.coalesce(updated_at, created_at), id),  # Analytics store sync
         # Check constraints
         CheckConstraint("amount >= 0.01", name="payment_amount_positive_check"),
         CheckConstraint("LENGTH(currency) = 3", name="payment_currency_length_check"),
         CheckConstraint("status IN ('pending', 'completed', 'failed', 'refunded', 'cancelled')", name="payment_status_check"),
         CheckConstraint("LENGTH(reference) >= 1", name="payment_reference_length_check"),
-    )
\ No newline at end of file
+    )
+
+
+class WebhookEvent(Base):
+    """
+    A gateway webhook as received, stored before any processing so the
+    endpoint can acknowledge immediately. The idempotency key makes gateway
+    retries of the same event a no-op insert.
+    """
+    __tablename__ = "webhook_events"
+
+    id = Column(Integer, primary_key=True)
+    provider = Column(String(20), default="paystack", nullable=False)
+    idempotency_key = Column(String(255), unique=True, nullable=False)  # event type + gateway transaction id
+    event_type = Column(String(50), nullable=False)
+    reference = Column(String(100), nullable=True, index=True)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), default="received", nullable=False)  # received, processed, ignored, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    claim_token = Column(String(32), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)  # Lease held by a worker
+    error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('idx_webhook_status_id', 'status', 'id'),  # Worker polling
+        Index('idx_webhook_claim', 'claim_token'),
+    )
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index, CheckConstraint, UniqueConstraint
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from config.database import Base
 from .encrypted_field import EncryptedString
@@ -27,7 +28,6 @@ class User(Base):
 
     # Relationships
     ab_tests = relationship("ABTest", back_populates="owner", cascade="all, delete-orphan")
-    ab_test_variants = relationship("ABTestVariant", back_populates="test")
 
     # Compound indexes for common queries
     __table_args__ = (
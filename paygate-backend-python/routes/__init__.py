@@ -14,5 +14,6 @@ from . import support
 from . import marketing
 from . import backup
 from . import monitoring
+from . import images
 
-__all__ = ["auth", "users", "paywall", "content", "payment", "customer", "analytics", "upload", "access", "billing", "notification", "support", "marketing"]
\ No newline at end of file
+__all__ = ["auth", "users", "paywall", "content", "payment", "customer", "analytics", "upload", "access", "billing", "notification", "support", "marketing", "images"]
\ No newline at end of file
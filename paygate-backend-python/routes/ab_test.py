@@ -1,15 +1,15 @@
 """
 AB Testing Routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List
 
 from config.database import get_db
 from models.user import User
 from models.ab_test import ABTest as ABTestModel
-from schemas.ab_test_schema import ABTestCreate, ABTestUpdate, ABTest as ABTestSchema, ABTestResults
-from services import ab_test_service
+from schemas.ab_test_schema import ABTestCreate, ABTestUpdate, ABTest as ABTestSchema, ABTestResults, ABTestAssignment
+from services import ab_assignment_service, ab_test_service
 from services.ab_test_service import (
     get_ab_tests_by_owner,
     get_ab_test_by_id,
@@ -219,4 +219,46 @@ async def track_ab_test_conversion(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="AB test or variant not found or you don't have access to track for it"
         )
-    return {"message": "Conversion tracked successfully"}
\ No newline at end of file
+    return {"message": "Conversion tracked successfully"}
+
+
+@router.post("/ab-tests/{test_id}/assign", response_model=ABTestAssignment)
+async def assign_ab_test_variant(
+    test_id: int,
+    visitor_id: str = Query(..., min_length=1, max_length=255),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Assign a visitor to a variant and count the visit, once per visitor.
+    The same visitor always gets the same variant while the weights are
+    unchanged.
+    """
+    assignment = await ab_assignment_service.assign_variant(db, test_id, visitor_id)
+    if not assignment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="AB test not found"
+        )
+    return assignment
+
+
+@router.post("/ab-tests/{test_id}/convert")
+async def record_ab_test_conversion(
+    test_id: int,
+    visitor_id: str = Query(..., min_length=1, max_length=255),
+    token: str = Query(..., min_length=1, max_length=64),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Count a conversion for a visitor, for the variant they were shown. The
+    token is the assignment_token returned by /assign; a visitor's repeated
+    conversions are counted once.
+    """
+    conversion = await ab_assignment_service.record_conversion(db, test_id, visitor_id, token)
+    if conversion is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="AB test not found or invalid assignment token"
+        )
+    variant_id, recorded = conversion
+    return {"message": "Conversion recorded successfully", "variant_id": variant_id, "recorded": recorded}
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import Content, ContentAccess
 from schemas import *
-from services import access_service, content_service, paywall_service, payment_service
+from services import access_event_service, access_service, content_service, paywall_service, payment_service, blob_service
 from utils.auth import get_current_user
+from utils.file_delivery import build_file_response, resolve_upload_path
 from typing import Optional
+import mimetypes
 import uuid
 from datetime import datetime, timedelta
 
@@ -104,17 +106,57 @@ async def get_signed_url(
             detail="Content not found"
         )
     
-    # In a real implementation, we'd generate a time-limited signed URL
-    # For now, just return the original URL
+    # Uploaded files, whether referenced by path or upload URL, are served
+    # through the access-checked delivery endpoint
+    signed_url = content.url
+    if resolve_upload_path(content.file_path, content.url):
+        signed_url = f"/api/access/content/{content_id}/file"
+
     return AccessResponse(
         success=True,
         message="Signed URL generated",
         access_granted=True,
-        signed_url=content.url,
+        signed_url=signed_url,
         expires_at=access_check.expires_at
     )
 
 
+@router.api_route("/access/content/{content_id}/file", methods=["GET", "HEAD"])
+async def download_content_file(
+    content_id: int,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream an uploaded content file to an authorized user, with Range and
+    conditional request support (resumable downloads and video seeking)
+    """
+    content = await content_service.get_content_by_id(db, content_id)
+    if not content:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Content not found"
+        )
+
+    if not await access_service.can_access_content(db, content, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    path = resolve_upload_path(content.file_path, content.url)
+    if not path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Content file not found"
+        )
+
+    blob = await blob_service.get_blob_for_path(db, str(path))
+    media_type = blob.content_type if blob else (mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+    return build_file_response(request, path, media_type, filename=f"{content.title}{path.suffix}")
+
+
 @router.post("/access/track")
 async def track_content_access(
     track_data: dict,
@@ -129,9 +171,22 @@ async def track_content_access(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="contentId is required"
         )
+    # bool is an int subclass, and the id column is a 32-bit INTEGER
+    valid_id = (isinstance(content_id, int) and not isinstance(content_id, bool)
+                and 1 <= content_id <= access_event_service.MAX_CONTENT_ID)
+    if not valid_id or access_type not in access_event_service.EVENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"contentId must be a positive 32-bit integer and accessType one of "
+                   f"{', '.join(access_event_service.EVENT_TYPES)}"
+        )
     
-    # Track the access event
-    await access_service.track_content_access(db, content_id, current_user.id, access_type)
+    # Buffered and written in bulk; the request never waits on the database
+    if not await access_service.track_content_access(db, content_id, current_user.id, access_type):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Access tracking is temporarily overloaded"
+        )
     return {"message": "Access tracked successfully"}
 
 
@@ -1,6 +1,6 @@
 import logging
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -9,7 +9,8 @@ from config.database import get_db
 from models.user import User
 from schemas.analytics import (
     DashboardStats, RevenueData, DailyRevenueData, TopPaywall,
-    RevenueSummary, PaywallPerformance, TopCustomer, RevenueForecastData
+    RevenueSummary, PaywallPerformance, TopCustomer, RevenueForecastData, AnalyticsReportData,
+    TrafficSource, GeographicData, RevenueBreakdown
 )
 
 # Define the RevenueForecast model if it doesn't exist
@@ -22,7 +23,7 @@ class RevenueForecast(BaseModel):
     predicted_revenue: float
     confidence_lower: float
     confidence_upper: float
-from services import analytics_service
+from services import analytics_service, analytics_store_service, report_service
 from utils.auth import get_current_user
 from utils.websocket_broadcast import register_websocket_connection, unregister_websocket_connection, broadcast_to_websocket_clients
 import json
@@ -160,6 +161,25 @@ async def get_revenue_forecast(
     return forecast
 
 
+@router.get("/analytics/reports", response_model=List[AnalyticsReportData])
+async def get_analytics_reports(
+    report_type: str = report_service.DAILY,
+    limit: int = 30,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stored reports from the nightly jobs, newest first
+    (report_type: daily or weekly_paywall_performance)
+    """
+    if report_type not in (report_service.DAILY, report_service.WEEKLY_PAYWALL_PERFORMANCE):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="report_type must be daily or weekly_paywall_performance"
+        )
+    return await report_service.get_reports(db, current_user.id, report_type, min(max(limit, 1), 366))
+
+
 @router.get("/analytics/traffic-sources", response_model=List[TrafficSource])
 async def get_traffic_sources(
     current_user: User = Depends(get_current_user),
@@ -192,6 +212,10 @@ async def get_geographic_data(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Sales and revenue per payment currency. Buyer countries are not recorded,
+    so country is "Unknown" on every row.
+    """
     geographic_data = await analytics_service.get_geographic_data(db, current_user.id)
     return geographic_data
 
@@ -205,6 +229,33 @@ async def get_revenue_breakdown(
     return revenue_breakdown
 
 
+@router.get("/analytics/revenue-breakdown/query", response_model=List[dict])
+async def query_revenue_breakdown(
+    dimensions: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Completed revenue grouped by any of currency, channel, payment_method,
+    paywall_id, day, week and month (comma-separated), for payments created
+    from start_date up to and including end_date (default the last 30 days)
+    """
+    requested = [dimension.strip() for dimension in dimensions.split(",") if dimension.strip()]
+    unknown = [dimension for dimension in requested if dimension not in analytics_store_service.DIMENSIONS]
+    if unknown or len(set(requested)) != len(requested):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Dimensions must be distinct values of: {', '.join(sorted(analytics_store_service.DIMENSIONS))}"
+        )
+    end = (end_date or datetime.utcnow().date()) + timedelta(days=1)
+    start = start_date or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must not be after end_date")
+    return await analytics_service.query_revenue_breakdown(db, current_user.id, start, end, requested)
+
+
 @router.get("/analytics/conversion-funnel", response_model=dict)
 async def get_conversion_funnel(
     current_user: User = Depends(get_current_user),
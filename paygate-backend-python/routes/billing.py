@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import SubscriptionPlan, Subscription, Invoice, BillingInfo, User, PaymentMethod
 from schemas import *
-from services import billing_service, user_service
+from services import billing_service, invoice_render_service, user_service
 from utils.auth import get_current_user
+from utils.file_delivery import build_file_response
 from typing import List
 import uuid
 
@@ -88,6 +89,7 @@ async def get_invoice(
 @router.get("/invoices/{invoice_id}/download")
 async def download_invoice(
     invoice_id: int,
+    request: Request,
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -97,9 +99,10 @@ async def download_invoice(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Invoice not found"
         )
-    # In a real implementation, this would generate and return an invoice PDF
-    # For now, return a placeholder
-    return {"message": f"Invoice {invoice_id} would be downloaded"}
+    path = await invoice_render_service.get_invoice_pdf(db, invoice)
+    return build_file_response(
+        request, path, "application/pdf", filename=f"{invoice.invoice_number or f'invoice-{invoice.id}'}.pdf"
+    )
 
 
 # Coupons
@@ -109,17 +112,39 @@ async def validate_coupon(
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    is_valid = await billing_service.is_discount_code_valid(db, code)
-    if not is_valid:
+    coupon = await billing_service.is_coupon_valid(db, code)
+    if not coupon:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Coupon code is invalid or expired"
         )
-    coupon = await billing_service.get_discount_code_by_code(db, code)
     return {
         "valid": True,
-        "discount_type": coupon.discount_type,
-        "discount_value": coupon.discount_value
+        "discount_type": coupon["discount_type"],
+        "discount_value": coupon["discount_value"]
+    }
+
+
+@router.post("/coupons/redeem")
+async def redeem_coupon(
+    code: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    redemption = await billing_service.redeem_coupon(db, code)
+    if not redemption:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Coupon code is invalid, expired or fully redeemed"
+        )
+    return {
+        "redeemed": True,
+        "discount_type": redemption["discount_type"],
+        "discount_value": redemption["discount_value"],
+        "remaining_uses": (
+            redemption["usage_limit"] - redemption["used_count"]
+            if redemption["usage_limit"] is not None else None
+        )
     }
 
 
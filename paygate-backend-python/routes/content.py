@@ -3,10 +3,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import Content
 from schemas import *
-from services import content_service
+from services import content_service, blob_service
 from utils.auth import get_current_user
 from utils.pagination import PaginationParams, create_paginated_response
 from utils.response_optimization import minimal_content_response
+from utils.streaming_upload import store_upload_file, CONTENT_TYPES
 from typing import List, Optional, Dict, Any
 import os
 
@@ -44,6 +45,10 @@ async def create_content(
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Create content; for a file uploaded with /content/upload, pass the
+    returned url, which makes the stored file referenced
+    """
     # Create the complete content data dict with owner_id from current user
     content_data = {
         "title": content.title,
@@ -132,34 +137,33 @@ async def delete_content(
 @router.post("/content/upload")
 async def content_upload(
     file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Read file content
-    file_content = await file.read()
-    
-    # Save file to uploads directory
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    file_path = os.path.join(upload_dir, file.filename)
-    with open(file_path, "wb") as buffer:
-        buffer.write(file_content)
+    """
+    First step of the two-step upload: stores the file and returns its url
+    without creating content. The client then creates the content with
+    POST /content, passing that url; until then the file is unreferenced
+    and the blob garbage collector removes it once
+    blob_service.GC_GRACE_PERIOD (24h) has passed.
+    """
+    # Stream the file into the uploads directory without buffering it in memory
+    stored = await store_upload_file(file)
+    await blob_service.record_blob(db, stored)
+    file_path = str(stored.path)
     
     # Trigger background file processing
     from tasks.file_processing import process_uploaded_file
     processing_options = {"thumbnail_size": (200, 200)}
-    task = process_uploaded_file.delay(file_path, file.content_type, processing_options)
-    
-    # In a real implementation, this would upload to S3 and return the S3 URL
-    # For now, we'll return a local URL
-    file_url = f"http://localhost:8000/uploads/{file.filename}"
+    task = process_uploaded_file.delay(file_path, stored.content_type, processing_options)
     
     return {
         "success": True,
         "url": file_path,  # Return the local file path
         "message": "File uploaded successfully",
         "original_name": file.filename,
-        "size": len(file_content),
+        "size": stored.size,
+        "sha256": stored.sha256,
         "task_id": task.id  # Return task ID for tracking
     }
 
@@ -194,25 +198,21 @@ async def legacy_upload_content(
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Save file to uploads directory
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    file_path = os.path.join(upload_dir, file.filename)
-    file_content = await file.read()
-    with open(file_path, "wb") as buffer:
-        buffer.write(file_content)
+    # Stream the file into the uploads directory without buffering it in memory
+    stored = await store_upload_file(file)
+    await blob_service.record_blob(db, stored)
+    file_path = str(stored.path)
     
     # Trigger background file processing
     from tasks.file_processing import process_uploaded_file
     processing_options = {"thumbnail_size": (200, 200)}
-    process_uploaded_file.delay(file_path, file.content_type, processing_options)
+    process_uploaded_file.delay(file_path, stored.content_type, processing_options)
     
     # Create content record
     content_create = ContentCreate(
         title=file.filename,
         description=f"Uploaded file: {file.filename}",
-        type=file.content_type or "file",
+        type=CONTENT_TYPES[stored.category],
         url=file_path,  # Store the file path as URL for now
         owner_id=current_user.id
     )
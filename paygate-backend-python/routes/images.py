@@ -0,0 +1,111 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pathlib import Path
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from config.database import get_db
+from config.settings import settings
+from services import access_service, image_variant_service
+from utils.auth import get_current_user
+from utils.file_delivery import build_file_response, resolve_upload_path
+from utils.streaming_upload import PUBLIC_UPLOAD_DIR, STORAGE_URL_PREFIX
+
+router = APIRouter()
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=3600"
+# Protected variants stay out of shared caches; the browser keeps content-addressed ones
+PRIVATE_IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+PRIVATE_REVALIDATE_CACHE_CONTROL = "private, max-age=0, must-revalidate"
+
+
+def _image_source(relative_path: str, public: bool) -> Path:
+    """The source image for a path under uploads/images (or uploads/public/images)"""
+    source = resolve_upload_path(None, f"{STORAGE_URL_PREFIX}{relative_path}")
+    if source:
+        parts = source.relative_to(Path(settings.UPLOAD_DIR).resolve()).parts
+        if public:
+            valid = parts[0] == PUBLIC_UPLOAD_DIR and len(parts) > 2 and parts[1] == "images"
+        else:
+            valid = parts[0] == "images"
+        if valid:
+            return source
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Image not found"
+    )
+
+
+async def _variant_response(request: Request, source: Path, w: Optional[int], h: Optional[int],
+                            fmt: Optional[str], fit: str, private: bool):
+    if not w and not h:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one of w or h is required"
+        )
+
+    output_format = image_variant_service.negotiate_format(fmt, request.headers.get("accept"))
+    try:
+        variant = await image_variant_service.get_variant(source, w, h, output_format, fit)
+    except OSError as e:
+        # Pillow raises OSError subclasses for unreadable or corrupt images
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Image could not be processed: {str(e)}"
+        )
+
+    if image_variant_service.is_immutable_source(source):
+        cache_control = PRIVATE_IMMUTABLE_CACHE_CONTROL if private else IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = PRIVATE_REVALIDATE_CACHE_CONTROL if private else REVALIDATE_CACHE_CONTROL
+    response = build_file_response(
+        request,
+        variant,
+        image_variant_service.FORMAT_MEDIA_TYPES[output_format],
+        cache_control=cache_control,
+    )
+    if not fmt:
+        response.headers["Vary"] = "Accept"
+    return response
+
+
+@router.get("/images/public/{file_path:path}")
+async def get_public_image_variant(
+    file_path: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=settings.IMAGE_MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=settings.IMAGE_MAX_DIMENSION),
+    fmt: Optional[str] = Query(None, pattern="^(avif|webp|jpe?g|png)$"),
+    fit: str = Query("contain", pattern="^(contain|cover)$")
+):
+    """
+    Serve a published image (uploads/public/images, e.g. avatars) at the
+    requested size and format. Publicly cacheable.
+    """
+    source = _image_source(f"{PUBLIC_UPLOAD_DIR}/{file_path}", public=True)
+    return await _variant_response(request, source, w, h, fmt, fit, private=False)
+
+
+@router.get("/images/{file_path:path}")
+async def get_image_variant(
+    file_path: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=settings.IMAGE_MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=settings.IMAGE_MAX_DIMENSION),
+    fmt: Optional[str] = Query(None, pattern="^(avif|webp|jpe?g|png)$"),
+    fit: str = Query("contain", pattern="^(contain|cover)$"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Serve an image stored under uploads/images at the requested size and format,
+    to users who can access content using it. Variants are generated on first
+    request and then served from the disk cache.
+    """
+    source = _image_source(file_path, public=False)
+    relative_path = source.relative_to(Path(settings.UPLOAD_DIR).resolve()).as_posix()
+    if not await access_service.can_access_upload(db, relative_path, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    return await _variant_response(request, source, w, h, fmt, fit, private=True)
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import DiscountCode, Affiliate, AffiliateReferral, MarketingCampaign, EmailSubscriber
 from schemas import *
-from services import marketing_service
+from services import marketing_service, campaign_dispatch_service
 from utils.auth import get_current_user
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -232,4 +232,97 @@ async def get_marketing_campaigns(
             detail="Only administrators can view marketing campaigns"
         )
     campaigns = await marketing_service.get_active_marketing_campaigns(db)
-    return campaigns
\ No newline at end of file
+    return campaigns
+
+# Campaign dispatch
+def _require_admin(current_user, action: str):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Only administrators can {action}"
+        )
+
+
+@router.post("/marketing/campaigns/{campaign_id}/dispatches", response_model=CampaignDispatchProgress,
+             status_code=status.HTTP_202_ACCEPTED)
+async def dispatch_marketing_campaign(
+    campaign_id: int,
+    dispatch_data: CampaignDispatchCreate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    _require_admin(current_user, "send marketing campaigns")
+    dispatch = await campaign_dispatch_service.create_dispatch(
+        db, campaign_id, dispatch_data.email_list_id,
+        dispatch_data.subject, dispatch_data.body, dispatch_data.html_body
+    )
+
+    from tasks.marketing import dispatch_campaign
+    dispatch_campaign.delay(dispatch.id)
+    return await campaign_dispatch_service.get_dispatch_progress(db, dispatch.id)
+
+
+@router.get("/marketing/dispatches/{dispatch_id}", response_model=CampaignDispatchProgress)
+async def get_campaign_dispatch_progress(
+    dispatch_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    _require_admin(current_user, "view campaign progress")
+    return await campaign_dispatch_service.get_dispatch_progress(db, dispatch_id)
+
+
+@router.post("/marketing/dispatches/{dispatch_id}/pause", response_model=CampaignDispatchProgress)
+async def pause_campaign_dispatch(
+    dispatch_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    _require_admin(current_user, "pause campaigns")
+    await campaign_dispatch_service.set_dispatch_status(db, dispatch_id, "paused")
+    return await campaign_dispatch_service.get_dispatch_progress(db, dispatch_id)
+
+
+@router.post("/marketing/dispatches/{dispatch_id}/resume", response_model=CampaignDispatchProgress)
+async def resume_campaign_dispatch(
+    dispatch_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    _require_admin(current_user, "resume campaigns")
+    await campaign_dispatch_service.set_dispatch_status(db, dispatch_id, "running")
+
+    from tasks.marketing import dispatch_campaign
+    dispatch_campaign.delay(dispatch_id, True)
+    return await campaign_dispatch_service.get_dispatch_progress(db, dispatch_id)
+
+
+@router.post("/marketing/dispatches/{dispatch_id}/cancel", response_model=CampaignDispatchProgress)
+async def cancel_campaign_dispatch(
+    dispatch_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    _require_admin(current_user, "cancel campaigns")
+    await campaign_dispatch_service.set_dispatch_status(db, dispatch_id, "cancelled")
+    return await campaign_dispatch_service.get_dispatch_progress(db, dispatch_id)
+
+
+@router.post("/marketing/unsubscribe")
+async def unsubscribe_from_list(
+    subscriber: int,
+    list_id: int = Query(..., alias="list"),
+    token: str = Query(..., min_length=1, max_length=64),
+    reason: Optional[str] = Query(None, max_length=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Unsubscribe from an email list with the signed link sent in campaign
+    emails (the frontend's /unsubscribe page passes its query through)
+    """
+    if not await campaign_dispatch_service.unsubscribe(db, subscriber, list_id, token, reason):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invalid unsubscribe link"
+        )
+    return {"message": "Unsubscribed successfully"}
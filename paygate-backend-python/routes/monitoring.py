@@ -3,6 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from utils.auth import get_current_user
 from utils.database_monitor import db_monitor
+from utils.paystack_client import get_paystack_client
+from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -194,3 +196,26 @@ async def get_system_metrics(
         )
 
 
+@router.get("/gateway/metrics", summary="Get payment gateway client metrics")
+async def get_gateway_metrics(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get per-operation latency and error counts for the Paystack client in this process.
+    Requires admin privileges.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can access gateway metrics"
+        )
+
+    client = get_paystack_client()
+    return {
+        "status": "success",
+        "timestamp": datetime.utcnow().isoformat(),
+        "circuit_state": client.breaker.state,
+        "consecutive_failures": client.breaker.failures,
+        "http2": client.http2,
+        "operations": client.metrics.snapshot()
+    }
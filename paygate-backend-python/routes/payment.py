@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import Payment, Paywall
 from schemas import *
-from services import payment_service, paywall_service, customer_service
+from services import payment_service, paywall_service, customer_service, webhook_service
 from utils.auth import get_current_user
+from utils.paystack_client import GatewayError, get_paystack_client
 from typing import List, Dict, Any
+import json
 import uuid
 from datetime import datetime
 
@@ -43,16 +45,27 @@ async def create_payment(
     )
     
     created_payment = await payment_service.create_payment(db, payment_create)
-    
-    # Return mock Paystack response (in real implementation, this would call Paystack API)
+
+    try:
+        result = await get_paystack_client().initialize_transaction(
+            email=created_payment.customer_email,
+            amount=created_payment.amount,
+            reference=reference,
+            currency=created_payment.currency,
+            callback_url=paywall.success_redirect_url,
+            metadata={"paywall_id": paywall.id, "payment_id": created_payment.id}
+        )
+    except GatewayError as e:
+        # The payment stays pending; reconciliation settles it if the gateway did see it
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE if e.retryable else status.HTTP_502_BAD_GATEWAY,
+            detail=f"Payment gateway error: {str(e)}"
+        )
+
     return PaystackInitializeResponse(
         status=True,
-        message="Payment initialized successfully",
-        data={
-            "authorization_url": f"http://localhost:3000/payments/verify/{reference}",
-            "access_code": "mock_access_code",
-            "reference": reference
-        }
+        message=result.get("message", "Payment initialized successfully"),
+        data=result["data"]
     )
 
 
@@ -93,6 +106,7 @@ async def get_payment(
 @router.get("/payments/verify/{reference}")
 async def verify_payment(
     reference: str,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -103,51 +117,61 @@ async def verify_payment(
             detail="Payment not found"
         )
     
-    # In a real implementation, this would call Paystack to verify the payment
-    # For now, return mock data in the expected format
+    try:
+        result = await get_paystack_client().verify_transaction(reference)
+    except GatewayError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE if e.retryable else status.HTTP_502_BAD_GATEWAY,
+            detail=f"Payment gateway error: {str(e)}"
+        )
+
+    # A successful verification goes through the same pipeline as the
+    # charge.success webhook; the shared idempotency key applies it once
+    transaction = result.get("data") or {}
+    if transaction.get("status") == "success":
+        if await webhook_service.record_event(db, {"event": "charge.success", "data": transaction}):
+            from tasks.payments import process_webhook_events
+            background_tasks.add_task(process_webhook_events.apply_async, countdown=0)
+
     return {
         "data": {
             "payment": payment,
-            "paystack_data": {
-                "status": "success",
-                "message": "Payment verified",
-                "data": {
-                    "reference": reference,
-                    "status": "success",
-                    "amount": payment.amount,
-                    "currency": payment.currency,
-                    "customer": {
-                        "email": payment.customer_email,
-                        "name": payment.customer_name
-                    }
-                }
-            }
+            "paystack_data": result
         }
     }
 
 
 # Payment webhook endpoint for receiving payment notifications from Paystack
 @router.post("/payments/webhook")
-async def payment_webhook(payload: dict):
-    # This endpoint should be called by Paystack when a payment event occurs
-    # Process the webhook payload and update payment status
-    # For security, verify the webhook signature here
-    
-    event_type = payload.get('event')
-    if event_type == 'charge.success':
-        # Extract payment details from the payload
-        data = payload.get('data', {})
-        reference = data.get('reference')
-        status = data.get('status')
-        amount = data.get('amount', 0) / 100  # Paystack sends amount in kobo
-        customer_email = data.get('customer', {}).get('email')
-        
-        # This is a simplified webhook handler - in a real app you'd:
-        # 1. Verify webhook signature
-        # 2. Update payment status in DB
-        # 3. Update customer stats
-        # 4. Update paywall conversion stats
-        # 5. Process the content access grant
-        print(f"Webhook received: {event_type} for reference {reference}")
-    
-    return {"status": "success"}
\ No newline at end of file
+async def payment_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    # Verify against the exact bytes Paystack signed, before parsing anything
+    raw_body = await request.body()
+    if not webhook_service.verify_signature(raw_body, request.headers.get("x-paystack-signature")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid webhook signature"
+        )
+    try:
+        payload = json.loads(raw_body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload"
+        )
+    if not isinstance(payload, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload"
+        )
+
+    # Record and acknowledge; processing happens in batches on a worker.
+    # Duplicate deliveries are dropped by the idempotency key.
+    if await webhook_service.record_event(db, payload):
+        from tasks.payments import process_webhook_events
+        background_tasks.add_task(process_webhook_events.apply_async, countdown=1)
+
+    return {"status": "success"}
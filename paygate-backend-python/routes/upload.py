@@ -1,84 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response, Request, Query, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import Content, User
 from schemas import *
-from services import content_service, user_service
+from services import content_service, user_service, upload_session_service, blob_service
 from utils.auth import get_current_user
+from utils.streaming_upload import MAX_FILE_SIZES, store_stream, store_upload_file, iter_request_body, iter_upload_file
 import os
-import uuid
 from datetime import datetime
-from typing import Optional
-from fastapi.responses import JSONResponse
 
 router = APIRouter()
 security = HTTPBearer()
 
-# Allowed file types and their corresponding directories
-ALLOWED_EXTENSIONS = {
-    'image/jpeg': 'images',
-    'image/png': 'images',
-    'image/gif': 'images',
-    'application/pdf': 'documents',
-    'application/msword': 'documents',
-    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'documents',
-}
-
-# Maximum file size (10MB)
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-
-def get_file_extension(content_type: str) -> str:
-    """Get file extension from content type"""
-    return {
-        'image/jpeg': '.jpg',
-        'image/png': '.png',
-        'image/gif': '.gif',
-        'application/pdf': '.pdf',
-        'application/msword': '.doc',
-        'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
-    }.get(content_type, '.bin')
-
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.ext.asyncio import AsyncSession
-from config.database import get_db
-from models import Content, User
-from schemas import *
-from services import content_service, user_service
-from utils.auth import get_current_user
-import os
-import uuid
-from datetime import datetime
-from typing import Optional
-from fastapi.responses import JSONResponse
-
-router = APIRouter()
-security = HTTPBearer()
-
-# Allowed file types and their corresponding directories
-ALLOWED_EXTENSIONS = {
-    'image/jpeg': 'images',
-    'image/png': 'images',
-    'image/gif': 'images',
-    'application/pdf': 'documents',
-    'application/msword': 'documents',
-    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'documents',
-}
-
-# Maximum file size (10MB)
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-
-def get_file_extension(content_type: str) -> str:
-    """Get file extension from content type"""
-    return {
-        'image/jpeg': '.jpg',
-        'image/png': '.png',
-        'image/gif': '.gif',
-        'application/pdf': '.pdf',
-        'application/msword': '.doc',
-        'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
-    }.get(content_type, '.bin')
+# Maximum file size for images (10MB); documents and videos use MAX_FILE_SIZES
+MAX_FILE_SIZE = MAX_FILE_SIZES['images']
 
 # Test endpoint to verify the route is working
 @router.get("/upload/test")
@@ -88,12 +24,14 @@ async def test_upload():
 @router.post("/upload")
 async def upload_content(
     file: UploadFile = File(...),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Minimal test upload endpoint that returns frontend-expected format"""
     try:
-        # Read file content
-        contents = await file.read()
+        # Stream the file to disk in chunks
+        stored = await store_upload_file(file)
+        await blob_service.record_blob(db, stored)
         
         # Return response in format expected by frontend
         return {
@@ -101,17 +39,20 @@ async def upload_content(
             "message": "File uploaded successfully",
             "data": {
                 "filename": file.filename,
-                "content_type": file.content_type or "application/octet-stream",
-                "size": len(contents),
-                "url": f"/api/uploads/mock/{uuid.uuid4()}_{file.filename}",  # Mock URL with unique ID
+                "content_type": stored.content_type,
+                "size": stored.size,
+                "sha256": stored.sha256,
+                "url": stored.url,
                 "id": 1,  # Mock ID
                 "title": file.filename,
                 "description": f"Uploaded file: {file.filename}",
-                "type": file.content_type or "application/octet-stream",
+                "type": stored.content_type,
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Upload error: {str(e)}")
         import traceback
@@ -121,6 +62,93 @@ async def upload_content(
             detail=f"Upload failed: {str(e)}"
         )
 
+@router.put("/upload/stream")
+async def upload_stream(
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Raw-body upload endpoint for large files.
+    The body is consumed as it arrives, so nothing is spooled by the multipart parser.
+    """
+    stored = await store_stream(
+        iter_request_body(request),
+        original_name=os.path.basename(filename),
+        declared_type=request.headers.get("content-type"),
+    )
+    await blob_service.record_blob(db, stored)
+    return {
+        "success": True,
+        "message": "File uploaded successfully",
+        "data": {
+            "filename": stored.original_name,
+            **stored.to_dict(),
+            "created_at": datetime.utcnow().isoformat()
+        }
+    }
+
+# Resumable upload sessions for large files (create -> PATCH chunks -> complete)
+@router.post("/upload/sessions", response_model=UploadSessionStatus, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_request: UploadSessionCreate,
+    current_user = Depends(get_current_user)
+):
+    return await upload_session_service.create_upload_session(
+        current_user.id, session_request.filename, session_request.size, session_request.content_type
+    )
+
+
+@router.get("/upload/sessions/{session_id}", response_model=UploadSessionStatus)
+async def get_upload_session(
+    session_id: str,
+    response: Response,
+    current_user = Depends(get_current_user)
+):
+    session = await upload_session_service.get_upload_session(session_id, current_user.id)
+    response.headers["Upload-Offset"] = str(session["offset"])
+    response.headers["Upload-Length"] = str(session["size"])
+    return session
+
+
+@router.patch("/upload/sessions/{session_id}", response_model=UploadSessionStatus)
+async def upload_session_chunk(
+    session_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_user = Depends(get_current_user)
+):
+    """Write the request body at Upload-Offset; chunks may be sent in parallel"""
+    session = await upload_session_service.write_chunk(
+        session_id, current_user.id, upload_offset, iter_request_body(request)
+    )
+    response.headers["Upload-Offset"] = str(session["offset"])
+    return session
+
+
+@router.post("/upload/sessions/{session_id}/complete", response_model=Content, status_code=status.HTTP_201_CREATED)
+async def complete_upload_session(
+    session_id: str,
+    completion: UploadSessionComplete,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    content, _ = await upload_session_service.complete_upload_session(
+        db, session_id, current_user.id, completion.dict()
+    )
+    return content
+
+
+@router.delete("/upload/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: str,
+    current_user = Depends(get_current_user)
+):
+    await upload_session_service.abort_upload_session(session_id, current_user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
 # Test endpoint to verify CORS headers
 @router.options("/upload-test", status_code=status.HTTP_200_OK)
 async def upload_options():
@@ -143,5 +171,5 @@ async def upload_test(
     return {
         "filename": file.filename,
         "content_type": file.content_type,
-        "size": len(await file.read())
+        "size": sum([len(chunk) async for chunk in iter_upload_file(file)])
     }
@@ -3,15 +3,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from models import User
 from schemas import *
-from services import user_service
+from services import user_service, blob_service, derivative_service
 from utils.auth import get_current_user
+from utils.streaming_upload import store_upload_file
 from typing import Dict, Any, Optional
-import shutil
-import os
-import uuid
 
 router = APIRouter()
 
+# Rendition stored as the user's avatar_url; 64/128px variants sit beside it
+AVATAR_RENDITION = "avatar_256"
+
 @router.get("/users/me", response_model=UserInDB)
 async def get_current_user_profile(
     current_user: dict = Depends(get_current_user),
@@ -60,30 +61,27 @@ async def update_avatar(
         )
     
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = "uploads/avatars"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Generate unique filename
-        filename = f"{current_user.id}_{uuid.uuid4().hex}_{file.filename}"
-        file_path = os.path.join(upload_dir, filename)
-        
-        # Save the file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Create a URL for the uploaded file
-        avatar_url = f"/api/uploads/avatars/{filename}"
+        # Stream into content-addressed storage; identical images share one blob
+        stored = await store_upload_file(file)
+        if stored.category != 'images':
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only image files are allowed"
+            )
+        await blob_service.record_blob(db, stored)
+
+        # Square-cropped avatar renditions, rendered in the process pool
+        renditions = await derivative_service.render_upload(stored, "avatar")
+        avatar_url = (derivative_service.derivative_url(stored, renditions, AVATAR_RENDITION)
+                      or derivative_service.publish_file(stored.root, stored.relative_path))
         
-        # Update user's avatar URL
-        updated_user = await user_service.update_user(
-            db,
-            current_user.id,
-            {"avatar": avatar_url}
-        )
+        # Update user's avatar URL and move the blob reference
+        updated_user = await user_service.update_user_avatar(db, current_user.id, avatar_url)
         
         return updated_user
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
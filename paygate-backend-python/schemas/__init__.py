@@ -8,4 +8,5 @@ from .access import *
 from .billing import *
 from .notification import *
 from .support import *
-from .marketing_schemas import *
\ No newline at end of file
+from .marketing_schemas import *
+from .upload import *
\ No newline at end of file
@@ -27,6 +27,11 @@ class ABTestType(str, Enum):
     MESSAGING = "messaging"
 
 
+class ABTestAllocationMode(str, Enum):
+    FIXED = "fixed"  # Traffic split by the configured weights
+    BANDIT = "bandit"  # Weights periodically moved towards the better-converting variants
+
+
 class ABTestVariantCreate(BaseModel):
     name: str = Field(..., max_length=255)
     description: Optional[str] = None
@@ -53,6 +58,7 @@ class ABTestCreate(BaseModel):
     objective: ABTestObjective
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+    allocation_mode: ABTestAllocationMode = ABTestAllocationMode.FIXED
     variants: List[ABTestVariantCreate] = Field(default_factory=list)
 
 
@@ -64,6 +70,7 @@ class ABTestUpdate(BaseModel):
     objective: Optional[ABTestObjective] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+    allocation_mode: Optional[ABTestAllocationMode] = None
 
 
 class ABTest(BaseModel):
@@ -79,6 +86,7 @@ class ABTest(BaseModel):
     current_sample: int
     is_winner_determined: bool
     winner_variant_id: Optional[int] = None
+    allocation_mode: ABTestAllocationMode = ABTestAllocationMode.FIXED
     created_at: str
     updated_at: str
     variants: List[ABTestVariant] = []
@@ -92,4 +100,17 @@ class ABTestResults(BaseModel):
     winner_variant_id: Optional[int] = None
     statistical_significance: float  # p-value or confidence level
     conversion_rates: List[dict]  # List of {variant_id: int, conversion_rate: float, sample_size: int}
-    revenue_impact: Optional[float] = None  # Estimated revenue impact
\ No newline at end of file
+    revenue_impact: Optional[float] = None  # Estimated revenue impact
+    total_sample: int = 0
+    control_variant_id: Optional[int] = None
+    chi_square: Optional[float] = None
+    is_significant: bool = False  # Judged on always-valid p-values, safe to check while the test runs
+    computed_at: Optional[str] = None
+
+
+class ABTestAssignment(BaseModel):
+    test_id: int
+    variant_id: int
+    variant_name: str
+    recorded: bool  # False when the test is not running or the visitor was already counted
+    assignment_token: str  # Pass to /convert to credit a conversion to this variant
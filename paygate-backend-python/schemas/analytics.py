@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 
 
 class DashboardStats(BaseModel):
@@ -124,4 +124,15 @@ class TopCustomer(BaseModel):
 class AnalyticsResponse(BaseModel):
     success: bool
     message: str
-    data: Optional[dict] = None
\ No newline at end of file
+    data: Optional[dict] = None
+
+
+class AnalyticsReportData(BaseModel):
+    report_type: str
+    period_start: date
+    period_end: date
+    data: dict
+    generated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -138,4 +138,27 @@ class EmailSubscriber(EmailSubscriberBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CampaignDispatchCreate(BaseModel):
+    email_list_id: int
+    subject: str
+    body: str  # $first_name, $last_name, $full_name, $email, $unsubscribe_url, $campaign_name
+    html_body: Optional[str] = None
+
+
+class CampaignDispatchProgress(BaseModel):
+    id: int
+    campaign_id: int
+    email_list_id: int
+    status: str
+    total_recipients: int
+    queued: int
+    sending: int
+    sent: int
+    failed: int
+    percent_complete: float
+    send_rate_per_second: Optional[float] = None
+    eta_seconds: Optional[int] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
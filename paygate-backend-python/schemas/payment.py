@@ -44,7 +44,7 @@ class PaymentBase(BaseModel):
 
 
 class PaymentCreate(PaymentBase):
-    pass
+    owner_id: Optional[int] = None
 
 
 class PaymentUpdate(BaseModel):
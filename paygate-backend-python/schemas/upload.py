@@ -0,0 +1,40 @@
+from pydantic import BaseModel, Field, validator
+from typing import Optional, List
+from utils.validation import sanitize_string
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255)
+    size: int = Field(..., gt=0)
+    content_type: str = Field(..., min_length=1, max_length=100)
+
+    @validator('filename', pre=True)
+    def validate_and_sanitize_filename(cls, v):
+        return sanitize_string(v)
+
+
+class UploadSessionStatus(BaseModel):
+    id: str
+    filename: str
+    content_type: str
+    size: int
+    offset: int
+    received_bytes: int
+    received_ranges: List[List[int]]
+    complete: bool
+    chunk_size: int
+    expires_at: str
+
+
+class UploadSessionComplete(BaseModel):
+    title: Optional[str] = Field(None, min_length=1, max_length=200)
+    description: Optional[str] = Field(None, max_length=10000)
+    is_protected: bool = False
+    price: Optional[float] = Field(None, ge=0.0, le=1000000.0)
+    currency: Optional[str] = Field("USD", min_length=3, max_length=3)
+
+    @validator('title', 'description', pre=True)
+    def validate_and_sanitize_strings(cls, v):
+        if v is None:
+            return v
+        return sanitize_string(v)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Paystack API, for offline development and load tests
+
+Implements the endpoints the payment client uses:
+    POST /transaction/initialize
+    GET  /transaction/verify/{reference}
+    POST /transaction/charge_authorization
+    POST /refund
+
+Usage:
+    python scripts/paystack_stub.py --port 8010
+    PAYSTACK_BASE_URL=http://127.0.0.1:8010 uvicorn main:app
+
+Options (flags or environment variables):
+    --latency-ms / STUB_LATENCY_MS          added delay per request (default 20)
+    --jitter-ms / STUB_JITTER_MS            random extra delay (default 10)
+    --failure-rate / STUB_FAILURE_RATE      fraction of requests answered with 503 (default 0)
+    --decline-rate / STUB_DECLINE_RATE      fraction of saved-card charges declined (default 0)
+    --webhook-url / STUB_WEBHOOK_URL        if set, each initialized transaction is "paid" and a
+                                            signed charge.success webhook is posted there
+    --secret-key / PAYSTACK_SECRET_KEY      key used to sign webhooks (default sk_test_stub)
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class StubConfig:
+    latency_ms: float = float(os.getenv("STUB_LATENCY_MS", "20"))
+    jitter_ms: float = float(os.getenv("STUB_JITTER_MS", "10"))
+    failure_rate: float = float(os.getenv("STUB_FAILURE_RATE", "0"))
+    decline_rate: float = float(os.getenv("STUB_DECLINE_RATE", "0"))
+    webhook_url: Optional[str] = os.getenv("STUB_WEBHOOK_URL")
+    secret_key: str = os.getenv("PAYSTACK_SECRET_KEY", "sk_test_stub")
+
+
+config = StubConfig()
+app = FastAPI(title="Paystack stub")
+transactions: Dict[str, Dict[str, Any]] = {}
+_ids = itertools.count(1000001)
+_webhook_client: Optional[httpx.AsyncClient] = None
+
+
+def _ok(message: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"status": True, "message": message, "data": data}
+
+
+@app.middleware("http")
+async def simulate_network(request: Request, call_next):
+    delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if config.failure_rate and random.random() < config.failure_rate:
+        return JSONResponse({"status": False, "message": "Service unavailable (stub)"}, status_code=503)
+    return await call_next(request)
+
+
+async def _send_webhook(transaction: Dict[str, Any]):
+    global _webhook_client
+    if _webhook_client is None:
+        _webhook_client = httpx.AsyncClient(timeout=10)
+    body = json.dumps({"event": "charge.success", "data": transaction}).encode()
+    signature = hmac.new(config.secret_key.encode(), body, hashlib.sha512).hexdigest()
+    try:
+        await _webhook_client.post(
+            config.webhook_url, content=body,
+            headers={"Content-Type": "application/json", "x-paystack-signature": signature}
+        )
+    except httpx.HTTPError as e:
+        print(f"Webhook delivery failed for {transaction['reference']}: {e}")
+
+
+@app.post("/transaction/initialize")
+async def initialize(request: Request):
+    payload = await request.json()
+    reference = payload.get("reference") or f"stub_{next(_ids)}"
+    if reference in transactions:
+        return JSONResponse({"status": False, "message": "Duplicate Transaction Reference"}, status_code=400)
+    if not payload.get("email") or not payload.get("amount"):
+        return JSONResponse({"status": False, "message": "email and amount are required"}, status_code=400)
+
+    access_code = hashlib.sha1(reference.encode()).hexdigest()[:15]
+    transactions[reference] = {
+        "id": next(_ids),
+        "reference": reference,
+        "amount": int(payload["amount"]),
+        "currency": payload.get("currency", "NGN"),
+        "status": "abandoned",
+        "channel": "card",
+        "gateway_response": "Approved",
+        "paid_at": None,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "metadata": payload.get("metadata"),
+        "customer": {"email": payload["email"]},
+    }
+    if config.webhook_url:
+        # Behave as if the customer paid straight away
+        transactions[reference].update(status="success", paid_at=datetime.utcnow().isoformat() + "Z")
+        asyncio.create_task(_send_webhook(transactions[reference]))
+
+    return _ok("Authorization URL created", {
+        "authorization_url": f"https://checkout.paystack.com/{access_code}",
+        "access_code": access_code,
+        "reference": reference,
+    })
+
+
+@app.get("/transaction/verify/{reference}")
+async def verify(reference: str):
+    transaction = transactions.get(reference)
+    if transaction is None:
+        return JSONResponse({"status": False, "message": "Transaction reference not found"}, status_code=400)
+    if transaction["status"] == "abandoned":
+        # Verifying a stub transaction settles it
+        transaction.update(status="success", paid_at=datetime.utcnow().isoformat() + "Z")
+    return _ok("Verification successful", transaction)
+
+
+@app.post("/transaction/charge_authorization")
+async def charge_authorization(request: Request):
+    payload = await request.json()
+    reference = payload.get("reference") or f"stub_{next(_ids)}"
+    if reference in transactions:
+        return JSONResponse({"status": False, "message": "Duplicate Transaction Reference"}, status_code=400)
+    if not payload.get("email") or not payload.get("amount") or not payload.get("authorization_code"):
+        return JSONResponse({"status": False, "message": "email, amount and authorization_code are required"},
+                            status_code=400)
+
+    declined = random.random() < config.decline_rate
+    now = datetime.utcnow().isoformat() + "Z"
+    transactions[reference] = {
+        "id": next(_ids),
+        "reference": reference,
+        "amount": int(payload["amount"]),
+        "currency": payload.get("currency", "NGN"),
+        "status": "failed" if declined else "success",
+        "channel": "card",
+        "gateway_response": "Declined" if declined else "Approved",
+        "paid_at": None if declined else now,
+        "created_at": now,
+        "metadata": payload.get("metadata"),
+        "customer": {"email": payload["email"]},
+        "authorization": {"authorization_code": payload["authorization_code"], "reusable": True},
+    }
+    return _ok("Charge attempted", transactions[reference])
+
+
+@app.post("/refund")
+async def refund(request: Request):
+    payload = await request.json()
+    transaction = transactions.get(str(payload.get("transaction")))
+    if transaction is None or transaction["status"] != "success":
+        return JSONResponse({"status": False, "message": "Transaction not found or not refundable"}, status_code=400)
+    amount = int(payload.get("amount") or transaction["amount"])
+    transaction["status"] = "reversed"
+    return _ok("Refund has been queued for processing", {
+        "transaction": {"id": transaction["id"], "reference": transaction["reference"]},
+        "amount": amount,
+        "currency": transaction["currency"],
+        "status": "pending",
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Paystack stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--failure-rate", type=float, default=config.failure_rate)
+    parser.add_argument("--decline-rate", type=float, default=config.decline_rate)
+    parser.add_argument("--webhook-url", default=config.webhook_url)
+    parser.add_argument("--secret-key", default=config.secret_key)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.failure_rate = args.failure_rate
+    config.decline_rate = args.decline_rate
+    config.webhook_url = args.webhook_url
+    config.secret_key = args.secret_key
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
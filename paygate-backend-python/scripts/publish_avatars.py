@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Move existing avatars to the public upload subtree
+
+Only UPLOAD_DIR/public is served statically now. Avatars saved before that
+point at /api/uploads/<path>; this publishes each one and rewrites the
+user's avatar_url to its /api/uploads/public/ URL. Safe to run repeatedly.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from sqlalchemy import select
+from config.database import async_session
+from config.settings import settings
+from models import User
+from services.derivative_service import publish_file
+from utils.file_delivery import resolve_upload_path
+from utils.streaming_upload import PUBLIC_URL_PREFIX
+
+
+async def publish_avatars():
+    root = Path(settings.UPLOAD_DIR).resolve()
+    published = missing = 0
+    async with async_session() as session:
+        result = await session.execute(
+            select(User).where(User.avatar_url.like("/api/uploads/%"))
+        )
+        for user in result.scalars().all():
+            if user.avatar_url.startswith(PUBLIC_URL_PREFIX):
+                continue
+            path = resolve_upload_path(None, user.avatar_url)
+            if path is None:
+                print(f"User {user.id}: avatar file not found ({user.avatar_url})")
+                missing += 1
+                continue
+            user.avatar_url = publish_file(root, path.relative_to(root).as_posix())
+            published += 1
+        await session.commit()
+    print(f"Published {published} avatars, {missing} missing")
+
+
+if __name__ == "__main__":
+    asyncio.run(publish_avatars())
@@ -0,0 +1,333 @@
+"""
+A/B test variant assignment
+
+A visitor is bucketed by hashing (test_id, visitor_id) to a point in [0, 1)
+and finding it in the test's cumulative variant weights, so the same
+visitor always sees the same variant without storing the assignment. Each
+process keeps the weight table of a test for AB_TEST_ALLOCATION_CACHE_TTL
+seconds, so assignments on a warm cache never read the database.
+
+A visitor counts as one visit per test however often they are assigned:
+the first exposure is recorded in ab_test_exposures and only that insert
+counts. Visits and conversions are counted in memory and flushed as one
+UPDATE per variant by a background loop rather than one UPDATE per event.
+
+Tests in bandit mode are re-weighted periodically by Thompson sampling in
+its batched form: every variant's weight becomes the posterior probability
+that it is the best one (estimated for all tests at once by
+utils/experiment_stats.py), with a floor that keeps every variant explored.
+Re-weighting moves some visitors between variants; that is inherent to a
+bandit, so conversions are credited to the variant that was actually shown.
+
+Assignment and conversion are public endpoints. An assignment carries a
+token signing (test, visitor, variant), and a conversion is only accepted
+with that token, so a caller cannot credit a variant it was never shown.
+Each visitor converts at most once per test (ab_test_conversions).
+"""
+import asyncio
+import hashlib
+import hmac
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+from config.settings import settings
+from models.ab_test import ABTest, ABTestConversion, ABTestExposure, ABTestStatus, ABTestVariant
+from utils.db_helpers import insert_ignore_conflicts
+from utils.experiment_stats import compute_experiment_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+ALLOCATION_BANDIT = "bandit"
+
+
+@dataclass(frozen=True)
+class Allocation:
+    status: ABTestStatus
+    winner_variant_id: Optional[int]
+    variant_ids: Tuple[int, ...]  # Control (first created) first
+    variant_names: Tuple[str, ...]
+    cumulative_weights: Tuple[float, ...]  # Normalised, last entry is 1.0
+    loaded_at: float
+
+
+_allocations: Dict[int, Allocation] = {}
+_pending_visits: Dict[int, int] = defaultdict(int)  # variant_id -> count
+_pending_conversions: Dict[int, int] = defaultdict(int)
+_pending_events = 0
+_wakeup: Optional[asyncio.Event] = None
+
+
+def bucket(test_id: int, visitor_id: str) -> float:
+    """Uniform point in [0, 1) for a visitor, independent across tests"""
+    digest = hashlib.blake2b(f"{test_id}:{visitor_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def cumulative_weights(weights) -> Tuple[float, ...]:
+    weights = [max(float(weight or 0), 0.0) for weight in weights]
+    total = sum(weights)
+    if total <= 0:
+        weights, total = [1.0] * len(weights), float(len(weights))
+    cumulative = [weight / total for weight in accumulate(weights)]
+    cumulative[-1] = 1.0
+    return tuple(cumulative)
+
+
+def pick_variant(allocation: Allocation, point: float) -> int:
+    index = min(bisect_right(allocation.cumulative_weights, point), len(allocation.variant_ids) - 1)
+    return allocation.variant_ids[index]
+
+
+def assignment_token(test_id: int, visitor_id: str, variant_id: int) -> str:
+    """Token proving the visitor was assigned the variant, as <variant_id>.<signature>"""
+    message = f"{test_id}:{visitor_id}:{variant_id}".encode()
+    signature = hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+    return f"{variant_id}.{signature}"
+
+
+def verify_assignment_token(test_id: int, visitor_id: str, token: str) -> Optional[int]:
+    """The variant an assignment token was issued for, or None if it is not valid for the visitor"""
+    variant_id, _, signature = token.partition(".")
+    if not variant_id.isdigit() or not signature:
+        return None
+    if not hmac.compare_digest(assignment_token(test_id, visitor_id, int(variant_id)), token):
+        return None
+    return int(variant_id)
+
+
+async def get_allocation(db: AsyncSession, test_id: int) -> Optional[Allocation]:
+    """The test's weight table, from this process's cache while it is fresh"""
+    allocation = _allocations.get(test_id)
+    if allocation is not None and time.monotonic() - allocation.loaded_at < settings.AB_TEST_ALLOCATION_CACHE_TTL:
+        return allocation
+
+    test = (await db.execute(
+        select(ABTest.status, ABTest.winner_variant_id).filter(ABTest.id == test_id)
+    )).one_or_none()
+    variants = (await db.execute(
+        select(ABTestVariant.id, ABTestVariant.name, ABTestVariant.weight)
+        .filter(ABTestVariant.test_id == test_id)
+        .order_by(ABTestVariant.id)
+    )).all() if test is not None else []
+    if not variants:
+        _allocations.pop(test_id, None)
+        return None
+
+    allocation = Allocation(
+        status=test.status,
+        winner_variant_id=test.winner_variant_id,
+        variant_ids=tuple(v.id for v in variants),
+        variant_names=tuple(v.name for v in variants),
+        cumulative_weights=cumulative_weights(v.weight for v in variants),
+        loaded_at=time.monotonic(),
+    )
+    _allocations[test_id] = allocation
+    return allocation
+
+
+def invalidate_allocation(test_id: int):
+    """Drop this process's cached weight table after the test changed"""
+    _allocations.pop(test_id, None)
+
+
+def _queue(pending: Dict[int, int], variant_id: int):
+    global _pending_events
+    pending[variant_id] += 1
+    _pending_events += 1
+    if _wakeup is not None and _pending_events >= settings.AB_TEST_COUNT_FLUSH_SIZE:
+        _wakeup.set()
+
+
+async def assign_variant(db: AsyncSession, test_id: int, visitor_id: str,
+                         record_visit: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    The variant a visitor sees. Only running tests split traffic and count
+    the visit, once per visitor; a completed test serves its winner and any
+    other test its control.
+    """
+    allocation = await get_allocation(db, test_id)
+    if allocation is None:
+        return None
+
+    running = allocation.status == ABTestStatus.RUNNING
+    if running:
+        variant_id = pick_variant(allocation, bucket(test_id, visitor_id))
+    elif allocation.status == ABTestStatus.COMPLETED and allocation.winner_variant_id in allocation.variant_ids:
+        variant_id = allocation.winner_variant_id
+    else:
+        variant_id = allocation.variant_ids[0]
+
+    recorded = False
+    if running and record_visit:
+        result = await db.execute(
+            insert_ignore_conflicts(ABTestExposure.__table__, ["test_id", "visitor_id"])
+            .values(test_id=test_id, visitor_id=visitor_id, variant_id=variant_id)
+        )
+        await db.commit()
+        recorded = result.rowcount == 1
+        if recorded:
+            _queue(_pending_visits, variant_id)
+    return {
+        "test_id": test_id,
+        "variant_id": variant_id,
+        "variant_name": allocation.variant_names[allocation.variant_ids.index(variant_id)],
+        "recorded": recorded,
+        "assignment_token": assignment_token(test_id, visitor_id, variant_id),
+    }
+
+
+async def record_conversion(db: AsyncSession, test_id: int, visitor_id: str,
+                            token: str) -> Optional[Tuple[int, bool]]:
+    """
+    Count a conversion for the variant named by the visitor's assignment
+    token. Returns (variant_id, recorded), or None for an unknown test or an
+    invalid token. Only the first conversion of a visitor in a running test
+    is counted.
+    """
+    variant_id = verify_assignment_token(test_id, visitor_id, token)
+    if variant_id is None:
+        return None
+    allocation = await get_allocation(db, test_id)
+    if allocation is None or variant_id not in allocation.variant_ids:
+        return None
+    if allocation.status != ABTestStatus.RUNNING:
+        return variant_id, False
+
+    result = await db.execute(
+        insert_ignore_conflicts(ABTestConversion.__table__, ["test_id", "visitor_id"])
+        .values(test_id=test_id, visitor_id=visitor_id, variant_id=variant_id)
+    )
+    await db.commit()
+    recorded = result.rowcount == 1
+    if recorded:
+        _queue(_pending_conversions, variant_id)
+    return variant_id, recorded
+
+
+async def flush_counts(db: AsyncSession) -> int:
+    """Apply buffered visits and conversions; returns the number of variants updated"""
+    global _pending_visits, _pending_conversions, _pending_events
+    visits, conversions = _pending_visits, _pending_conversions
+    if not visits and not conversions:
+        return 0
+    _pending_visits, _pending_conversions, _pending_events = defaultdict(int), defaultdict(int), 0
+
+    table = ABTestVariant.__table__
+    rows = [
+        {"variant_id": variant_id, "visits": visits.get(variant_id, 0), "conversions": conversions.get(variant_id, 0)}
+        for variant_id in sorted(set(visits) | set(conversions))  # Stable lock order across processes
+    ]
+    try:
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("variant_id"))
+            .values(
+                total_visitors=func.coalesce(table.c.total_visitors, 0) + bindparam("visits"),
+                converted_count=func.coalesce(table.c.converted_count, 0) + bindparam("conversions"),
+            ),
+            rows,
+        )
+        await db.commit()
+    except Exception:
+        # Keep the counts for the next flush
+        await db.rollback()
+        for variant_id, count in visits.items():
+            _pending_visits[variant_id] += count
+        for variant_id, count in conversions.items():
+            _pending_conversions[variant_id] += count
+        _pending_events += sum(visits.values()) + sum(conversions.values())
+        raise
+    return len(rows)
+
+
+async def run_count_flusher(session_factory, interval: Optional[float] = None):
+    """Background loop flushing buffered counts; flushes once more when cancelled"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    interval = interval or settings.AB_TEST_COUNT_FLUSH_INTERVAL
+    try:
+        while True:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                async with session_factory() as db:
+                    await flush_counts(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"A/B test count flush error: {str(e)}")
+    finally:
+        try:
+            async with session_factory() as db:
+                await flush_counts(db)
+        except Exception as e:
+            logger.error(f"A/B test count flush on shutdown failed: {str(e)}")
+
+
+def bandit_weights(visitors: np.ndarray, conversions: np.ndarray, mask: np.ndarray,
+                   min_weight: float) -> np.ndarray:
+    """Probability-best weights with an exploration floor, rows summing to 1"""
+    stats = compute_experiment_stats(visitors, conversions, mask, draws=settings.AB_TEST_POSTERIOR_DRAWS)
+    counts = mask.sum(axis=1, keepdims=True)
+    floor = np.minimum(min_weight, 1.0 / np.maximum(counts, 1))
+    weights = np.where(mask, floor + (1 - floor * counts) * stats.prob_best, 0.0)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+async def rebalance_bandit_tests(db: AsyncSession, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Re-weight the variants of every running bandit test, a batch of tests per pass"""
+    batch_size = batch_size or settings.AB_TEST_STATS_BATCH_SIZE
+    tests_rebalanced = 0
+    last_id = 0
+    while True:
+        tests = (await db.execute(
+            select(ABTest)
+            .filter(
+                ABTest.status == ABTestStatus.RUNNING,
+                ABTest.allocation_mode == ALLOCATION_BANDIT,
+                ABTest.id > last_id,
+            )
+            .options(selectinload(ABTest.variants))
+            .order_by(ABTest.id)
+            .limit(batch_size)
+        )).scalars().all()
+        if not tests:
+            break
+        last_id = tests[-1].id
+
+        variant_lists = [sorted(test.variants, key=lambda v: v.id) for test in tests]
+        width = max(1, max(len(variants) for variants in variant_lists))
+        visitors = np.zeros((len(tests), width))
+        conversions = np.zeros((len(tests), width))
+        mask = np.zeros((len(tests), width), dtype=bool)
+        for i, variants in enumerate(variant_lists):
+            visitors[i, :len(variants)] = [v.total_visitors or 0 for v in variants]
+            conversions[i, :len(variants)] = [v.converted_count or 0 for v in variants]
+            mask[i, :len(variants)] = True
+
+        weights = np.round(bandit_weights(visitors, conversions, mask, settings.AB_TEST_BANDIT_MIN_WEIGHT), 4)
+        rows = [
+            {"id": variant.id, "weight": float(weights[i, j])}
+            for i, variants in enumerate(variant_lists) for j, variant in enumerate(variants)
+        ]
+        if rows:
+            await db.execute(update(ABTestVariant), rows)
+            await db.commit()
+        tests_rebalanced += len(tests)
+        if len(tests) < batch_size:
+            break
+
+    logger.info(f"Rebalanced {tests_rebalanced} bandit A/B tests")
+    return {"rebalanced": tests_rebalanced}
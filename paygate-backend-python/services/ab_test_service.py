@@ -7,10 +7,18 @@ from sqlalchemy.orm import selectinload
 from sqlalchemy import select as sqlalchemy_select
 from models.ab_test import ABTest as ABTestModel, ABTestVariant as ABTestVariantModel, ABTestStatus, ABTestType, ABTestObjective
 from schemas.ab_test_schema import ABTestCreate, ABTestUpdate, ABTestVariantCreate
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 from datetime import datetime, date
+import hashlib
 import logging
 from decimal import Decimal
+import numpy as np
+from sqlalchemy import delete
+from config.settings import settings
+from models.ab_test import ABTestResultSnapshot
+from utils.db_helpers import insert_ignore_conflicts
+from utils.experiment_stats import compute_experiment_stats
+from . import ab_assignment_service
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +65,8 @@ async def create_ab_test(db: AsyncSession, ab_test: ABTestCreate, owner_id: int)
         end_date=ab_test.end_date,
         status=ABTestStatus.DRAFT,  # Start as draft until activated
         current_sample=0,
-        is_winner_determined=False
+        is_winner_determined=False,
+        allocation_mode=ab_test.allocation_mode.value
     )
     
     db.add(db_ab_test)
@@ -89,10 +98,13 @@ async def update_ab_test(db: AsyncSession, test_id: int, owner_id: int, test_upd
     
     # Update allowed fields
     update_data = test_update.model_dump(exclude_unset=True)
+    if update_data.get("allocation_mode") is not None:
+        update_data["allocation_mode"] = update_data["allocation_mode"].value
     for field, value in update_data.items():
         setattr(db_ab_test, field, value)
     
     await db.commit()
+    ab_assignment_service.invalidate_allocation(test_id)
     await db.refresh(db_ab_test)
     return db_ab_test
 
@@ -105,6 +117,7 @@ async def delete_ab_test(db: AsyncSession, test_id: int, owner_id: int) -> bool:
     
     await db.delete(db_ab_test)
     await db.commit()
+    ab_assignment_service.invalidate_allocation(test_id)
     return True
 
 
@@ -121,6 +134,7 @@ async def activate_ab_test(db: AsyncSession, test_id: int, owner_id: int) -> Opt
     db_ab_test.start_date = db_ab_test.start_date or date.today()  # Set start date if not already set
     
     await db.commit()
+    ab_assignment_service.invalidate_allocation(test_id)
     await db.refresh(db_ab_test)
     return db_ab_test
 
@@ -136,6 +150,7 @@ async def pause_ab_test(db: AsyncSession, test_id: int, owner_id: int) -> Option
     
     db_ab_test.status = ABTestStatus.PAUSED
     await db.commit()
+    ab_assignment_service.invalidate_allocation(test_id)
     await db.refresh(db_ab_test)
     return db_ab_test
 
@@ -152,20 +167,15 @@ async def complete_ab_test(db: AsyncSession, test_id: int, owner_id: int) -> Opt
     db_ab_test.status = ABTestStatus.COMPLETED
     db_ab_test.end_date = db_ab_test.end_date or date.today()  # Set end date if not already set
     
-    # Determine winner based on conversion rate
-    variants_result = await db.execute(
-        select(ABTestVariantModel)
-        .filter(ABTestVariantModel.test_id == test_id)
-    )
-    variants = variants_result.scalars().all()
-    
-    if variants:
-        # Find variant with highest conversion rate
-        best_variant = max(variants, key=lambda v: (v.converted_count / v.total_visitors) if v.total_visitors > 0 else 0)
-        db_ab_test.winner_variant_id = best_variant.id
+    # The variant most likely to be best, from the variants already loaded
+    if db_ab_test.variants:
+        results = compute_results([db_ab_test])[0]
+        best = max(results["conversion_rates"], key=lambda v: (v["prob_best"], v["conversion_rate"]))
+        db_ab_test.winner_variant_id = best["variant_id"]
         db_ab_test.is_winner_determined = True
     
     await db.commit()
+    ab_assignment_service.invalidate_allocation(test_id)
     await db.refresh(db_ab_test)
     return db_ab_test
 
@@ -200,63 +210,160 @@ async def update_variant_metrics(
     return variant
 
 
+# Bump when the statistics change so stored results are recomputed
+STATS_VERSION = 1
+
+
+def _ordered_variants(test: ABTestModel) -> List[ABTestVariantModel]:
+    # The first variant created is the control
+    return sorted(test.variants, key=lambda v: v.id)
+
+
+def results_fingerprint(test: ABTestModel) -> str:
+    """Identifies the counts a result was computed from"""
+    counts = ";".join(f"{v.id}:{v.total_visitors or 0}:{v.converted_count or 0}" for v in _ordered_variants(test))
+    return hashlib.sha256(f"{STATS_VERSION}|{test.winner_variant_id}|{counts}".encode()).hexdigest()
+
+
+def compute_results(tests: Sequence[ABTestModel],
+                    previous_p_values: Optional[Dict[int, Dict[str, float]]] = None) -> List[Dict[str, Any]]:
+    """
+    Statistics for many tests (variants loaded) in one vectorised pass.
+    previous_p_values maps test id to the stored running minimum of each
+    variant's always-valid p-value (keyed by variant id as a string).
+    """
+    if not tests:
+        return []
+    previous_p_values = previous_p_values or {}
+    variant_lists = [_ordered_variants(test) for test in tests]
+    width = max(1, max(len(variants) for variants in variant_lists))
+    visitors = np.zeros((len(tests), width))
+    conversions = np.zeros((len(tests), width))
+    mask = np.zeros((len(tests), width), dtype=bool)
+    for i, variants in enumerate(variant_lists):
+        visitors[i, :len(variants)] = [v.total_visitors or 0 for v in variants]
+        conversions[i, :len(variants)] = [v.converted_count or 0 for v in variants]
+        mask[i, :len(variants)] = True
+
+    stats = compute_experiment_stats(
+        visitors, conversions, mask,
+        draws=settings.AB_TEST_POSTERIOR_DRAWS, tau=settings.AB_TEST_MSPRT_TAU,
+    )
+    computed_at = datetime.utcnow().isoformat()
+
+    results = []
+    for i, (test, variants) in enumerate(zip(tests, variant_lists)):
+        previous = previous_p_values.get(test.id) or {}
+        conversion_rates = []
+        for j, variant in enumerate(variants):
+            # The mSPRT p-value is the running minimum over every look so far
+            always_valid = min(float(stats.always_valid_p_value[i, j]), previous.get(str(variant.id), 1.0))
+            conversion_rates.append({
+                'variant_id': variant.id,
+                'variant_name': variant.name,
+                'is_control': j == 0,
+                'conversion_rate': round(float(stats.conversion_rate[i, j]) * 100, 2),
+                'sample_size': variant.total_visitors or 0,
+                'conversions': variant.converted_count or 0,
+                'lift': round(float(stats.lift[i, j]), 4),
+                'z_score': round(float(stats.z_score[i, j]), 4),
+                'p_value': float(stats.p_value[i, j]),
+                'always_valid_p_value': always_valid,
+                'prob_beat_control': round(float(stats.prob_beat_control[i, j]), 4),
+                'prob_best': round(float(stats.prob_best[i, j]), 4),
+            })
+
+        # Always-valid p-values stay correct however often a running test is checked
+        challengers = conversion_rates[1:]
+        is_significant = bool(challengers) and \
+            min(v['always_valid_p_value'] for v in challengers) < settings.AB_TEST_ALPHA
+        winner_variant_id = test.winner_variant_id
+        if winner_variant_id is None and is_significant:
+            winner_variant_id = max(conversion_rates, key=lambda v: v['prob_best'])['variant_id']
+
+        results.append({
+            'test_id': test.id,
+            'winner_variant_id': winner_variant_id,
+            'statistical_significance': float(stats.chi_square_p_value[i]),
+            'conversion_rates': conversion_rates,
+            'total_sample': sum(v['sample_size'] for v in conversion_rates),
+            'control_variant_id': variants[0].id if variants else None,
+            'chi_square': round(float(stats.chi_square[i]), 4),
+            'is_significant': is_significant,
+            'computed_at': computed_at,
+        })
+    return results
+
+
+def _snapshot_row(fingerprint: str, results: Dict[str, Any], computed_at: datetime) -> Dict[str, Any]:
+    return {
+        "test_id": results["test_id"], "fingerprint": fingerprint, "results": results, "computed_at": computed_at,
+        "always_valid_p_values": {
+            str(variant["variant_id"]): variant["always_valid_p_value"] for variant in results["conversion_rates"]
+        },
+    }
+
+
+async def _store_results(db: AsyncSession, rows: List[Dict[str, Any]]):
+    table = ABTestResultSnapshot.__table__
+    await db.execute(delete(table).where(table.c.test_id.in_([row["test_id"] for row in rows])))
+    await db.execute(insert_ignore_conflicts(table, ["test_id"]), rows)
+    await db.commit()
+
+
 async def get_ab_test_results(db: AsyncSession, test_id: int, owner_id: int) -> Optional[dict]:
-    """Get results for a specific AB test"""
+    """Results for a test: the stored snapshot if the counts are unchanged, else computed now"""
     db_ab_test = await get_ab_test_by_id(db, test_id, owner_id)
     if not db_ab_test:
         return None
-    
-    # Get all variants for this test
-    variants_result = await db.execute(
-        select(ABTestVariantModel)
-        .filter(ABTestVariantModel.test_id == test_id)
-    )
-    variants = variants_result.scalars().all()
-    
-    # Calculate conversion rates and other metrics
-    conversion_rates = []
-    total_sample = 0
-    for variant in variants:
-        conversion_rate = (variant.converted_count / variant.total_visitors * 100) if variant.total_visitors > 0 else 0
-        conversion_rates.append({
-            'variant_id': variant.id,
-            'variant_name': variant.name,
-            'conversion_rate': round(conversion_rate, 2),
-            'sample_size': variant.total_visitors,
-            'conversions': variant.converted_count
-        })
-        total_sample += variant.total_visitors
-    
-    # Determine statistical significance (simplified calculation)
-    # In a real implementation, you'd want to use proper statistical tests
-    stat_sig = 0.0
-    if len(variants) >= 2:
-        # Simple comparison - this is a simplified version
-        conversion_rates_sorted = sorted(conversion_rates, key=lambda x: x['conversion_rate'], reverse=True)
-        if len(conversion_rates_sorted) >= 2:
-            best_rate = conversion_rates_sorted[0]['conversion_rate']
-            second_best_rate = conversion_rates_sorted[1]['conversion_rate']
-            # A simplified statistical significance calculation
-            if total_sample > 100 and best_rate > 0:  # Minimum sample size
-                # This is a simplified calculation; real A/B testing requires proper statistical tests
-                relative_improvement = ((best_rate - second_best_rate) / second_best_rate) if second_best_rate > 0 else 0
-                # Statistical significance based on sample size and effect size
-                if relative_improvement > 0.05 and total_sample > 500:  # 5% improvement with 500+ samples
-                    stat_sig = 0.05  # Significant at 95%
-                else:
-                    stat_sig = 0.15  # Not significant
-    
-    winner_variant_id = None
-    if db_ab_test.winner_variant_id:
-        winner_variant_id = db_ab_test.winner_variant_id
-    elif len(conversion_rates) > 0:
-        # If no winner is set in DB, determine winner based on current data
-        winner_variant_id = conversion_rates[0]['variant_id'] if conversion_rates else None
-    
-    return {
-        'test_id': test_id,
-        'winner_variant_id': winner_variant_id,
-        'statistical_significance': stat_sig,
-        'conversion_rates': conversion_rates,
-        'total_sample': total_sample
-    }
\ No newline at end of file
+
+    fingerprint = results_fingerprint(db_ab_test)
+    snapshot = await db.get(ABTestResultSnapshot, test_id)
+    if snapshot is not None and snapshot.fingerprint == fingerprint:
+        return snapshot.results
+
+    previous = {test_id: snapshot.always_valid_p_values} if snapshot is not None else None
+    results = compute_results([db_ab_test], previous)[0]
+    await _store_results(db, [_snapshot_row(fingerprint, results, datetime.utcnow())])
+    return results
+
+
+async def refresh_ab_test_results(db: AsyncSession, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Recompute stored results of running tests whose counts changed, a batch of tests per pass"""
+    batch_size = batch_size or settings.AB_TEST_STATS_BATCH_SIZE
+    scanned = refreshed = 0
+    last_id = 0
+    while True:
+        tests = (await db.execute(
+            select(ABTestModel)
+            .filter(ABTestModel.status == ABTestStatus.RUNNING, ABTestModel.id > last_id)
+            .options(selectinload(ABTestModel.variants))
+            .order_by(ABTestModel.id)
+            .limit(batch_size)
+        )).scalars().all()
+        if not tests:
+            break
+        last_id = tests[-1].id
+        scanned += len(tests)
+
+        stored = {row.test_id: row for row in (await db.execute(
+            select(ABTestResultSnapshot.test_id, ABTestResultSnapshot.fingerprint,
+                   ABTestResultSnapshot.always_valid_p_values)
+            .filter(ABTestResultSnapshot.test_id.in_([test.id for test in tests]))
+        )).all()}
+        fingerprints = {test.id: results_fingerprint(test) for test in tests}
+        changed = [test for test in tests
+                   if test.id not in stored or stored[test.id].fingerprint != fingerprints[test.id]]
+        if changed:
+            now = datetime.utcnow()
+            previous = {test_id: row.always_valid_p_values for test_id, row in stored.items()}
+            await _store_results(db, [
+                _snapshot_row(fingerprints[results["test_id"]], results, now)
+                for results in compute_results(changed, previous)
+            ])
+            refreshed += len(changed)
+        if len(tests) < batch_size:
+            break
+
+    logger.info(f"A/B test results: {scanned} running tests, {refreshed} recomputed")
+    return {"scanned": scanned, "refreshed": refreshed}
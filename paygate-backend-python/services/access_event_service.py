@@ -0,0 +1,271 @@
+"""
+Content access event ingestion
+
+Recording an access only appends a tuple to an in-process buffer; a
+background loop flushes the buffer in bulk, with COPY on PostgreSQL and a
+single executemany INSERT elsewhere, so tracking costs no database round
+trip per event. The buffer is bounded: when the database falls behind,
+new events are dropped (and counted) rather than exhausting memory. A batch
+the database rejects for its data is bisected down to the offending rows,
+which are dropped, so one bad event can't hold back every flush after it.
+
+On PostgreSQL content_access_events is partitioned by day. A daily job
+creates the partitions of the coming days (from tomorrow on: today's rows
+may already sit in the default partition, which a new partition for the
+same range would conflict with), compacts finished days into
+content_access_daily (one row per content, day and event type) and drops
+partitions past the retention window, which is a cheap DROP TABLE instead
+of a large DELETE.
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, delete, distinct, func, insert, literal, text
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.database import is_postgresql
+from config.settings import settings
+from models import ContentAccessDaily, ContentAccessEvent
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {"view": 1, "preview": 2, "download": 3, "purchase": 4, "share": 5}
+
+COLUMNS = ("occurred_at", "content_id", "user_id", "event_type")
+
+MAX_CONTENT_ID = 2 ** 31 - 1  # content_id is a 32-bit INTEGER column
+
+_buffer: List[Tuple[datetime, int, Optional[int], int]] = []
+_dropped = 0
+_wakeup: Optional[asyncio.Event] = None
+
+
+def record_event(content_id: int, user_id: Optional[int], event_type: str,
+                 occurred_at: Optional[datetime] = None) -> bool:
+    """Buffer one access event; returns False if it was dropped because the buffer is full"""
+    global _dropped
+    if len(_buffer) >= settings.ACCESS_EVENT_BUFFER_MAX:
+        _dropped += 1
+        return False
+    _buffer.append((occurred_at or datetime.utcnow(), content_id, user_id, EVENT_TYPES[event_type]))
+    if _wakeup is not None and len(_buffer) >= settings.ACCESS_EVENT_FLUSH_SIZE:
+        _wakeup.set()
+    return True
+
+
+async def _copy_rows(db: AsyncSession, rows: List[tuple]):
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        ContentAccessEvent.__tablename__, records=rows, columns=list(COLUMNS)
+    )
+
+
+async def _write_rows(db: AsyncSession, rows: List[tuple]):
+    if is_postgresql:
+        await _copy_rows(db, rows)
+    else:
+        await db.execute(insert(ContentAccessEvent.__table__), [dict(zip(COLUMNS, row)) for row in rows])
+    await db.commit()
+
+
+def _is_data_error(error: Exception) -> bool:
+    """Whether the rows themselves were rejected, rather than the database being unreachable"""
+    if isinstance(error, (DataError, IntegrityError)):
+        return True
+    # COPY goes through asyncpg directly, whose errors carry the SQLSTATE
+    # (class 22: data exception, class 23: integrity constraint violation)
+    return str(getattr(error, "sqlstate", None) or "")[:2] in ("22", "23")
+
+
+async def flush_events(db: AsyncSession) -> int:
+    """Write out everything buffered so far; returns the number of events written"""
+    global _buffer, _dropped
+    rows, _buffer = _buffer, []
+    if _dropped:
+        logger.warning(f"Dropped {_dropped} access events: buffer full")
+        _dropped = 0
+    if not rows:
+        return 0
+
+    written = rejected = 0
+    pending = [rows]  # Stack of batches still to write, next one last
+    try:
+        while pending:
+            batch = pending.pop()
+            try:
+                await _write_rows(db, batch)
+            except Exception as e:
+                await db.rollback()
+                if not _is_data_error(e):
+                    pending.append(batch)
+                    raise
+                if len(batch) == 1:
+                    rejected += 1
+                    logger.warning(f"Dropped access event {batch[0]}: {str(e)}")
+                else:
+                    middle = len(batch) // 2
+                    pending += [batch[middle:], batch[:middle]]
+                continue
+            written += len(batch)
+    except Exception:
+        # Keep the events not written yet for the next attempt, within the buffer bound
+        unwritten = [row for batch in reversed(pending) for row in batch]
+        _buffer = (unwritten + _buffer)[:settings.ACCESS_EVENT_BUFFER_MAX]
+        raise
+    if rejected:
+        logger.warning(f"Dropped {rejected} access events rejected by the database")
+    return written
+
+
+async def run_event_flusher(session_factory, interval: Optional[float] = None):
+    """Background loop flushing the buffer; flushes once more when cancelled"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    interval = interval or settings.ACCESS_EVENT_FLUSH_INTERVAL
+    try:
+        while True:
+            if len(_buffer) < settings.ACCESS_EVENT_FLUSH_SIZE:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                async with session_factory() as db:
+                    await flush_events(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Access event flush error: {str(e)}")
+                await asyncio.sleep(interval)
+    finally:
+        try:
+            async with session_factory() as db:
+                await flush_events(db)
+        except Exception as e:
+            logger.error(f"Access event flush on shutdown failed: {str(e)}")
+
+
+def partition_name(day: date) -> str:
+    return f"{ContentAccessEvent.__tablename__}_p{day:%Y%m%d}"
+
+
+def partition_days(today: date, days: int) -> List[date]:
+    """The days to keep partitions ready for: the next `days` days, starting tomorrow"""
+    return [today + timedelta(days=offset) for offset in range(1, days + 1)]
+
+
+def partition_ddl(day: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {ContentAccessEvent.__tablename__} "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+
+
+async def ensure_partitions(db: AsyncSession, today: date, days: int) -> int:
+    """
+    Create the missing daily partitions for the next `days` days, starting
+    tomorrow (PostgreSQL only); returns the number of days checked. A day
+    whose rows already landed in the default partition is skipped and logged
+    rather than failing the run; its events stay in the default partition.
+    """
+    if not is_postgresql:
+        return 0
+    for day in partition_days(today, days):
+        try:
+            async with db.begin_nested():
+                await db.execute(text(partition_ddl(day)))
+        except DBAPIError as e:
+            logger.warning(f"Could not create access event partition for {day}: {str(e)}")
+    await db.commit()
+    return days
+
+
+async def drop_expired(db: AsyncSession, before: date) -> int:
+    """
+    Remove events older than the given day: drops whole partitions on
+    PostgreSQL (returns how many), deletes rows elsewhere (returns how many)
+    """
+    table = ContentAccessEvent.__table__
+    if not is_postgresql:
+        result = await db.execute(delete(table).where(table.c.occurred_at < datetime.combine(before, datetime.min.time())))
+        await db.commit()
+        return result.rowcount or 0
+
+    prefix = f"{ContentAccessEvent.__tablename__}_p"
+    partitions = (await db.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :parent"
+    ), {"parent": ContentAccessEvent.__tablename__})).scalars().all()
+    dropped = 0
+    for name in partitions:
+        if name.startswith(prefix) and name[len(prefix):] < f"{before:%Y%m%d}":
+            await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped += 1
+    # Stragglers that landed in the default partition
+    await db.execute(delete(table).where(table.c.occurred_at < datetime.combine(before, datetime.min.time())))
+    await db.commit()
+    return dropped
+
+
+async def compact_day(db: AsyncSession, day: date) -> int:
+    """(Re)build the day's rows in content_access_daily; returns the number of rows written"""
+    events = ContentAccessEvent.__table__
+    daily = ContentAccessDaily.__table__
+    start = datetime.combine(day, datetime.min.time())
+    await db.execute(delete(daily).where(daily.c.day == day))
+    result = await db.execute(
+        insert(daily).from_select(
+            ["content_id", "day", "event_type", "events", "unique_users"],
+            select(
+                events.c.content_id,
+                literal(day, daily.c.day.type),
+                events.c.event_type,
+                func.count(),
+                func.count(distinct(events.c.user_id)),
+            )
+            .where(and_(events.c.occurred_at >= start, events.c.occurred_at < start + timedelta(days=1)))
+            .group_by(events.c.content_id, events.c.event_type)
+        )
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+
+async def run_daily_maintenance(db: AsyncSession, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Compact every finished day since the last compacted one, make sure the
+    coming days have partitions, and drop events past retention
+    """
+    today = today or datetime.utcnow().date()
+    await ensure_partitions(db, today, settings.ACCESS_EVENT_PARTITION_DAYS_AHEAD)
+
+    retention_start = today - timedelta(days=settings.ACCESS_EVENT_RETENTION_DAYS)
+    last_compacted = (await db.execute(select(func.max(ContentAccessDaily.day)))).scalar()
+    if isinstance(last_compacted, str):
+        last_compacted = date.fromisoformat(last_compacted)
+    if last_compacted is None:
+        first_event = (await db.execute(select(func.min(ContentAccessEvent.occurred_at)))).scalar()
+        if isinstance(first_event, str):
+            first_event = datetime.fromisoformat(first_event)
+        start = first_event.date() if first_event else today
+    else:
+        start = last_compacted + timedelta(days=1)
+    # Yesterday is always rebuilt to pick up events flushed after its last compaction
+    start = max(min(start, today - timedelta(days=1)), retention_start)
+
+    days = rows = 0
+    day = start
+    while day < today:
+        rows += await compact_day(db, day)
+        days += 1
+        day += timedelta(days=1)
+
+    expired = await drop_expired(db, retention_start)
+    logger.info(f"Access events: compacted {days} days into {rows} rows, expired {expired} partitions/events")
+    return {"days_compacted": days, "rows": rows, "expired": expired}
@@ -1,9 +1,12 @@
+from sqlalchemy import or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from datetime import datetime
 from models import ContentAccess, Content, User
+from utils.file_delivery import upload_references
+from . import access_event_service
 from schemas.access import ContentAccessCreate, ContentAccessUpdate, ContentAccessCheck, ContentAccess as ContentAccessSchema
 
 
@@ -56,6 +59,42 @@ async def check_content_access(db: AsyncSession, content_id: int, user_id: int)
     return ContentAccessCheck(has_access=False)
 
 
+async def can_access_content(db: AsyncSession, content: Content, user_id: int) -> bool:
+    """Owners and unprotected content are always readable; otherwise an active grant is required"""
+    if content.owner_id == user_id or not content.is_protected:
+        return True
+    access_check = await check_content_access(db, content.id, user_id)
+    return access_check.has_access
+
+
+async def can_access_upload(db: AsyncSession, relative_path: str, user_id: int) -> bool:
+    """
+    Whether a user may read an uploaded file (path relative to UPLOAD_DIR):
+    some content stored with that file must be readable. One query, by exact
+    value on the indexed file_path and url columns.
+    """
+    references = upload_references(relative_path)
+    granted = (
+        select(ContentAccess.id)
+        .filter(
+            ContentAccess.content_id == Content.id,
+            ContentAccess.user_id == user_id,
+            ContentAccess.is_active == True,
+            or_(ContentAccess.expires_at.is_(None), ContentAccess.expires_at > datetime.utcnow()),
+        )
+        .exists()
+    )
+    result = await db.execute(
+        select(Content.id)
+        .filter(
+            or_(Content.file_path.in_(references), Content.url.in_(references)),
+            or_(Content.owner_id == user_id, Content.is_protected == False, granted),
+        )
+        .limit(1)
+    )
+    return result.first() is not None
+
+
 async def create_content_access(db: AsyncSession, access: ContentAccessCreate) -> ContentAccess:
     db_access = ContentAccess(
         content_id=access.content_id,
@@ -98,7 +137,6 @@ async def revoke_content_access(db: AsyncSession, content_id: int, user_id: int)
     return True
 
 
-async def track_content_access(db: AsyncSession, content_id: int, user_id: int, access_type: str):
-    # For now, we'll just log the access event
-    # In a real implementation, we might want to track analytics
-    pass
\ No newline at end of file
+async def track_content_access(db: AsyncSession, content_id: int, user_id: int, access_type: str) -> bool:
+    """Buffer an access event for bulk insertion; see access_event_service"""
+    return access_event_service.record_event(content_id, user_id, access_type)
\ No newline at end of file
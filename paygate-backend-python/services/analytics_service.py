@@ -2,16 +2,19 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import func, and_, or_, extract, text, case, literal_column
 from typing import List, Optional, Dict, Any, Tuple
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from models.customer import Customer
 from models import Payment, Paywall, User, Customer, Content, ContentAccess as AccessGrant
 from schemas.analytics import (
     DashboardStats, RevenueData, DailyRevenueData, TopPaywall,
-    RevenueSummary, PaywallPerformance, TopCustomer, RevenueForecast, RevenueForecastData
+    RevenueSummary, PaywallPerformance, TopCustomer, RevenueForecast, RevenueForecastData, RevenueBreakdown,
+    TrafficSource, GeographicData
 )
 from decimal import Decimal
+from config.settings import settings
 from utils.cache import cache
-from utils.websocket_broadcast import broadcast_analytics_event
+from utils.websocket_broadcast import publish_analytics_event
+from . import analytics_store_service, customer_sketch_service, forecast_service, popularity_service, revenue_cube_service
 import json
 import logging
 import asyncio
@@ -25,6 +28,7 @@ CACHE_TTL = {
     'revenue_data': 300,
     'top_paywalls': 600,    # 10 minutes
     'customer_data': 600,
+    'revenue_breakdown': 60,  # Cubes are refreshed every minute
 }
 
 # Helper function for cache key generation
@@ -86,12 +90,8 @@ async def get_dashboard_stats(db: AsyncSession, owner_id: int) -> DashboardStats
             )
             active_paywalls = active_paywalls_query.scalar() or 0
 
-            # Get total customers
-            total_customers_query = await db.execute(
-                select(func.count(func.distinct(Customer.email)))
-                .filter(Customer.owner_id == owner_id)
-            )
-            total_customers = total_customers_query.scalar() or 0
+            # Distinct paying customers, merged from the per-day sketches
+            total_customers = await customer_sketch_service.count_customers(db, owner_id)
 
             # Calculate average order value
             avg_order_value = 0
@@ -427,39 +427,12 @@ async def get_top_paywalls(db: AsyncSession, owner_id: int, limit: int = 5) -> L
 
 async def get_customer_data(db: AsyncSession, owner_id: int) -> Dict[str, Any]:
     try:
-        # Get total customers
-        customers_result = await db.execute(
-            select(func.count(Customer.id))
-            .filter(Customer.owner_id == owner_id)
-        )
-        total_customers = customers_result.scalar() or 0
-        
         # Wrap the operation with a timeout to prevent hanging
         async def fetch_customer_data():
-            # For SQLite compatibility, use strftime to extract year-month
-            growth_result = await db.execute(
-                text("""
-                    SELECT 
-                        strftime('%Y-%m', created_at) as month_year,
-                        COUNT(id) as count
-                    FROM customers
-                    WHERE owner_id = :owner_id
-                    GROUP BY strftime('%Y-%m', created_at)
-                    ORDER BY strftime('%Y-%m', created_at)
-                """),
-                {'owner_id': owner_id}
-            )
-            
-            growth_data = []
-            for row in growth_result:
-                growth_data.append({
-                    "month": row[0],  # Month in YYYY-MM format
-                    "new_customers": row[1],  # Count of customers for this month
-                    "total_customers": 0  # This would need cumulative calculation
-                })
-            
+            # Distinct paying customers per month and to date, merged from the per-day sketches
+            growth_data = await customer_sketch_service.monthly_customers(db, owner_id)
             return {
-                "total_customers": total_customers,
+                "total_customers": growth_data[-1]["total_customers"] if growth_data else 0,
                 "customer_growth": growth_data
             }
         
@@ -527,50 +500,26 @@ async def get_revenue_summary(db: AsyncSession, owner_id: int) -> RevenueSummary
 
 
 async def get_paywall_performance(db: AsyncSession, owner_id: int, limit: int = 10) -> List[PaywallPerformance]:
-    # Get paywall performance data
-    result = await db.execute(
-        select(
-            Paywall.id,
-            Paywall.title,
-            func.sum(Payment.amount).label('total_revenue'),
-            func.count(Payment.id).label('total_sales')
-        )
-        .join(Payment, Paywall.id == Payment.paywall_id, isouter=True)
-        .filter(and_(
-            Paywall.owner_id == owner_id,
-            Payment.status == "completed" if Payment.id is not None else True
+    """The owner's paywalls by all-time completed revenue, from the paywall revenue cube"""
+    cells = await revenue_cube_service.query(db, owner_id, date(1970, 1, 1), datetime.utcnow().date() + timedelta(days=1),
+                                             ["paywall_id"])
+    totals = {row["paywall_id"]: row for row in cells if row["paywall_id"] is not None}
+    paywalls = (await db.execute(
+        select(Paywall.id, Paywall.title, Paywall.views).filter(Paywall.owner_id == owner_id)
+    )).all()
+
+    performance = []
+    for paywall_id, title, views in paywalls:
+        row = totals.get(paywall_id, {"revenue": 0.0, "sales": 0})
+        performance.append(PaywallPerformance(
+            id=str(paywall_id),
+            title=title or "Untitled paywall",
+            total_revenue=row["revenue"],
+            total_sales=row["sales"],
+            conversion_rate=round(row["sales"] / views * 100, 2) if views else 0.0,
         ))
-        .group_by(Paywall.id, Paywall.title)
-        .order_by(func.sum(Payment.amount).desc())
-        .limit(limit)
-    )
-    
-    rows = result.all()
-    paywall_performance = []
-    
-    for row in rows:
-        # Calculate conversion rate for each paywall
-        # This requires knowing the number of views for each paywall
-        # For now, using a mock calculation based on paywall views
-        conversion_rate = 0
-        if row.total_sales > 0 and row.views > 0:
-            conversion_rate = (row.total_sales / row.views) * 100
-        elif row.total_sales > 0:
-            # If we don't have view data, we can calculate a different metric
-            # For now, we'll just use 0 for conversion rate
-            conversion_rate = 0
-        
-        paywall_performance.append(
-            PaywallPerformance(
-                id=str(row.id),
-                title=row.title,
-                total_revenue=float(row.total_revenue or 0),
-                total_sales=row.total_sales,
-                conversion_rate=round(conversion_rate, 2)
-            )
-        )
-    
-    return paywall_performance
+    performance.sort(key=lambda item: (-item.total_revenue, -item.total_sales, int(item.id)))
+    return performance[:limit]
 
 
 async def get_top_customers(db: AsyncSession, owner_id: int, limit: int = 10) -> List[TopCustomer]:
@@ -651,17 +600,36 @@ async def get_content_analytics(db: AsyncSession, owner_id: int) -> Dict[str, An
     }
 
 
-async def get_popular_content(db: AsyncSession, owner_id: int, limit: int = 10) -> List[Content]:
-    # This would return content ordered by access count
-    # Since we don't have access tracking implemented yet, we'll return recently created content
-    result = await db.execute(
-        select(Content)
-        .filter(Content.owner_id == owner_id)
-        .order_by(Content.created_at.desc())
-        .limit(limit)
-    )
-    
-    return result.scalars().all()
+async def get_popular_content(db: AsyncSession, owner_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    """Content ranked by decayed popularity, from a cached top-K refreshed with the scores"""
+    top_k = max(limit, settings.POPULARITY_TOP_K)
+    cache_key = get_cache_key("popular:content", owner_id=owner_id, top_k=top_k)
+    try:
+        cached_data = await cache.get(cache_key)
+        if cached_data:
+            return json.loads(cached_data)[:limit]
+    except Exception as e:
+        logger.warning(f"Cache get failed: {str(e)}")
+
+    ranked = await popularity_service.top_content(db, owner_id, top_k)
+    items = [
+        {
+            "id": content.id,
+            "title": content.title,
+            "type": content.type,
+            "price": content.price,
+            "currency": content.currency,
+            "is_protected": content.is_protected,
+            "created_at": content.created_at.isoformat() if content.created_at else None,
+            "popularity_score": round(score, 4),
+        }
+        for content, score in ranked
+    ]
+    try:
+        await cache.set(cache_key, json.dumps(items), expire=settings.POPULARITY_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Cache set failed: {str(e)}")
+    return items[:limit]
 
 
 async def get_content_protection_settings(db: AsyncSession, owner_id: int) -> Dict[str, Any]:
@@ -702,71 +670,134 @@ async def update_content_protection_settings(db: AsyncSession, owner_id: int, pr
     return protection_data
 
 
-async def get_revenue_forecast(db: AsyncSession, owner_id: int) -> RevenueForecast:
-    # Implement revenue forecasting logic
-    # For now, creating a mock forecast based on historical data
-    from datetime import datetime, timedelta
-    from decimal import Decimal
-    
-    # Get historical revenue data for the past 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    result = await db.execute(
-        select(
-            func.date(Payment.created_at).label('date'),
-            func.sum(Payment.amount).label('revenue')
+async def query_revenue_breakdown(db: AsyncSession, owner_id: int, start: date, end: date,
+                                  dimensions: List[str]) -> List[Dict[str, Any]]:
+    """
+    Completed revenue and sales of payments created on days [start, end)
+    grouped by dimensions: from the smallest revenue cube that covers them,
+    otherwise (combinations no cube holds) from the columnar analytics store
+    """
+    rows = await revenue_cube_service.query(db, owner_id, start, end, dimensions)
+    if rows is None:
+        return await analytics_store_service.revenue_breakdown(
+            owner_id, datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()), dimensions
         )
-        .filter(and_(
-            Payment.owner_id == owner_id,
-            Payment.status == "completed",
-            Payment.created_at >= thirty_days_ago
-        ))
-        .group_by(func.date(Payment.created_at))
-        .order_by(func.date(Payment.created_at))
+    return [
+        {**{dimension: row[dimension] for dimension in dimensions}, "revenue": row["revenue"], "payments": row["sales"]}
+        for row in rows if row["sales"]
+    ]
+
+
+async def _paywall_titles(db: AsyncSession, paywall_ids: List[int]) -> Dict[int, str]:
+    if not paywall_ids:
+        return {}
+    return dict((await db.execute(select(Paywall.id, Paywall.title).filter(Paywall.id.in_(paywall_ids)))).all())
+
+
+async def get_revenue_breakdown(db: AsyncSession, owner_id: int, days: int = 30) -> RevenueBreakdown:
+    """Completed revenue of the last `days` days by day, by paywall and by payment channel"""
+    cache_key = get_cache_key("revenue:breakdown", owner_id=owner_id, days=days)
+    try:
+        cached_data = await cache.get(cache_key)
+        if cached_data:
+            return RevenueBreakdown.model_validate_json(cached_data)
+    except Exception as e:
+        logger.warning(f"Cache get failed: {str(e)}")
+
+    end = datetime.utcnow().date() + timedelta(days=1)
+    start = end - timedelta(days=days)
+    by_day = await query_revenue_breakdown(db, owner_id, start, end, ["day"])
+    by_paywall = await query_revenue_breakdown(db, owner_id, start, end, ["paywall_id"])
+    by_channel = await query_revenue_breakdown(db, owner_id, start, end, ["channel"])
+    titles = await _paywall_titles(db, [row["paywall_id"] for row in by_paywall if row["paywall_id"] is not None])
+
+    breakdown = RevenueBreakdown(
+        revenue_by_time=[{"date": row["day"], "revenue": row["revenue"]} for row in by_day],
+        revenue_by_product=[
+            {"product_id": row["paywall_id"], "product_name": titles.get(row["paywall_id"], "Direct payments"),
+             "revenue": row["revenue"]}
+            for row in sorted(by_paywall, key=lambda row: row["revenue"], reverse=True) if row["revenue"]
+        ],
+        revenue_by_segment=[
+            {"segment_id": row["channel"] or "unknown", "segment_name": (row["channel"] or "unknown").replace("_", " ").title(),
+             "revenue": row["revenue"]}
+            for row in sorted(by_channel, key=lambda row: row["revenue"], reverse=True) if row["revenue"]
+        ],
     )
-    
-    historical_data = result.all()
-    
-    # Generate forecast for the next 30 days based on historical trend
-    forecast_data = []
-    current_date = datetime.utcnow().date()
-    
-    for i in range(30):
-        forecast_date = current_date + timedelta(days=i+1)
-        # Simple forecasting algorithm - in reality, this would use more complex algorithms
-        base_revenue = sum([float(row.revenue or 0) for row in historical_data[-7:]]) / 7  # Average of last 7 days
-        # Add some random fluctuation
-        import random
-        forecast_revenue = base_revenue * (1 + random.uniform(-0.1, 0.2))
-        
-        forecast_data.append({
-            'date': forecast_date.isoformat(),
-            'forecasted_revenue': forecast_revenue,
-            'confidence_interval_low': forecast_revenue * 0.8,  # 80% of forecast
-            'confidence_interval_high': forecast_revenue * 1.2  # 120% of forecast
-        })
-    
-    # Calculate trend based on historical data
-    trend = "stable"
-    if len(historical_data) >= 2:
-        recent_avg = sum([float(row.revenue or 0) for row in historical_data[-7:]]) / 7
-        previous_avg = sum([float(row.revenue or 0) for row in historical_data[-14:-7]]) / 7
-        if recent_avg > previous_avg * 1.1:
-            trend = "increasing"
-        elif recent_avg < previous_avg * 0.9:
-            trend = "decreasing"
-    
-    # Return the forecast data directly as a list of forecast items
-    forecast_list = []
-    for item in forecast_data:
-        forecast_list.append(RevenueForecast(
-            date=datetime.fromisoformat(item['date'].split('T')[0]),  # Convert to date object
-            predicted_revenue=item['forecasted_revenue'],
-            confidence_lower=item['confidence_interval_low'],
-            confidence_upper=item['confidence_interval_high']
-        ))
-    
-    return forecast_list
+    try:
+        await cache.set(cache_key, breakdown.model_dump_json(), expire=CACHE_TTL['revenue_breakdown'])
+    except Exception as e:
+        logger.warning(f"Cache set failed: {str(e)}")
+    return breakdown
+
+
+async def get_traffic_sources(db: AsyncSession, owner_id: int, days: int = 30) -> List[TrafficSource]:
+    """
+    Checkout attempts, completed sales and revenue per payment channel over
+    the last `days` days; visits are payments started, as page views are not
+    tracked per channel
+    """
+    end = datetime.utcnow().date() + timedelta(days=1)
+    rows = await revenue_cube_service.query(db, owner_id, end - timedelta(days=days), end, ["channel"])
+    return [
+        TrafficSource(
+            id=row["channel"] or "unknown",
+            name=(row["channel"] or "unknown").replace("_", " ").title(),
+            visits=row["attempts"],
+            conversions=row["sales"],
+            revenue=row["revenue"],
+            conversion_rate=round(row["sales"] / row["attempts"] * 100, 2) if row["attempts"] else 0.0,
+        )
+        for row in sorted(rows, key=lambda row: row["revenue"], reverse=True)
+    ]
+
+
+async def get_traffic_data(db: AsyncSession, owner_id: int, days: int = 30) -> List[Dict[str, Any]]:
+    """Daily checkout attempts, completed sales and revenue over the last `days` days"""
+    end = datetime.utcnow().date() + timedelta(days=1)
+    rows = await revenue_cube_service.query(db, owner_id, end - timedelta(days=days), end, ["day"])
+    return [
+        {"date": row["day"], "visits": row["attempts"], "conversions": row["sales"], "revenue": row["revenue"]}
+        for row in rows
+    ]
+
+
+async def get_geographic_data(db: AsyncSession, owner_id: int, days: int = 30) -> List[GeographicData]:
+    """
+    Completed sales and revenue over the last `days` days by payment
+    currency. The buyer's country is not recorded, and a currency doesn't
+    tell it (USD is paid from anywhere), so every row is reported under
+    country "Unknown" rather than guessed from the currency.
+    """
+    end = datetime.utcnow().date() + timedelta(days=1)
+    rows = [row for row in await revenue_cube_service.query(db, owner_id, end - timedelta(days=days), end, ["currency"])
+            if row["sales"]]
+    total = sum(row["revenue"] for row in rows)
+    return [
+        GeographicData(
+            country="Unknown",
+            country_code="",
+            sales=row["sales"],
+            revenue=row["revenue"],
+            currency=row["currency"] or "",
+            percentage=round(row["revenue"] / total * 100, 2) if total else 0.0,
+        )
+        for row in sorted(rows, key=lambda row: row["revenue"], reverse=True)
+    ]
+
+
+async def get_revenue_forecast(db: AsyncSession, owner_id: int) -> List[Dict[str, Any]]:
+    """Daily revenue forecast with prediction intervals, read from the stored Holt-Winters fit"""
+    forecast = await forecast_service.get_forecast(db, owner_id)
+    return [
+        {
+            'date': datetime.fromisoformat(day).date(),
+            'predicted_revenue': predicted,
+            'confidence_lower': lower,
+            'confidence_upper': upper,
+        }
+        for day, predicted, lower, upper in forecast['points']
+    ]
 
 
 async def trigger_realtime_analytics_update(event_type: str, data: Dict[str, Any], owner_id: int = None):
@@ -782,8 +813,8 @@ async def trigger_realtime_analytics_update(event_type: str, data: Dict[str, Any
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        # Broadcast to all connected WebSocket clients
-        await broadcast_analytics_event(event_type, analytics_event)
+        # Broadcast to the WebSocket clients of every API process
+        await publish_analytics_event(event_type, analytics_event)
         logger.info(f"Broadcast analytics event: {event_type}")
     except Exception as e:
         logger.error(f"Error broadcasting analytics event: {str(e)}")
\ No newline at end of file
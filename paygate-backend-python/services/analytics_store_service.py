@@ -0,0 +1,192 @@
+"""
+Columnar analytics store sync and queries
+
+Payments and content access events are mirrored into the Parquet store of
+utils/columnar_store.py so that breakdowns over long periods read only the
+columns they need, with the owner's rows found by row-group statistics,
+instead of scanning the OLTP tables that serve checkout.
+
+Payments are synced by keyset on (coalesce(updated_at, created_at), id),
+so a payment changing status is written again and the newer version wins
+on read. Rows changed within the last ANALYTICS_STORE_SYNC_LAG seconds are
+held back until transactions that started before them have committed.
+Payments are partitioned by the month they were created in, which never
+changes, so every version of a payment lands in the same partition.
+
+Access events are append-only and synced by id; the store keeps them past
+the raw event retention of access_event_service.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import and_, func, or_, type_coerce, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Content, ContentAccessEvent, Payment
+from utils.columnar_store import ColumnarStore
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAYMENTS = "payments"
+ACCESS_EVENTS = "access_events"
+
+PAYMENT_COLUMNS = ("id", "owner_id", "paywall_id", "amount", "currency", "status", "payment_method",
+                   "channel", "customer_email", "created_at", "updated_at")
+EVENT_COLUMNS = ("id", "owner_id", "content_id", "user_id", "event_type", "occurred_at")
+
+TIME_DIMENSIONS = {"day": "day", "week": "week", "month": "month"}
+DIMENSIONS = {"currency", "channel", "payment_method", "paywall_id", *TIME_DIMENSIONS}
+
+store = ColumnarStore(settings.ANALYTICS_STORE_DIR)
+
+
+def _payment_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int64()), ("owner_id", pa.int64()), ("paywall_id", pa.int64()), ("amount", pa.float64()),
+        ("currency", pa.string()), ("status", pa.string()), ("payment_method", pa.string()),
+        ("channel", pa.string()), ("customer_email", pa.string()),
+        ("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us")),
+    ])
+
+
+def _event_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int64()), ("owner_id", pa.int64()), ("content_id", pa.int64()), ("user_id", pa.int64()),
+        ("event_type", pa.int16()), ("occurred_at", pa.timestamp("us")),
+    ])
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, as stored"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _table(rows, columns, schema):
+    import pyarrow as pa
+    data = {column: [] for column in columns}
+    for row in rows:
+        for column, value in zip(columns, row):
+            data[column].append(_utc(value) if isinstance(value, datetime) else value)
+    return pa.table(data, schema=schema)
+
+
+async def sync_payments(db: AsyncSession, batch_size: Optional[int] = None) -> int:
+    """Mirror payments created or changed since the last sync; returns rows written"""
+    batch_size = batch_size or settings.ANALYTICS_STORE_SYNC_BATCH_SIZE
+    changed_at = type_coerce(func.coalesce(Payment.updated_at, Payment.created_at), DateTime(timezone=True))
+    horizon = datetime.utcnow() - timedelta(seconds=settings.ANALYTICS_STORE_SYNC_LAG)
+    written = 0
+    # Called from the worker; the lock and file writes block only that process
+    with store.writer() as manifest:
+        watermark = manifest["datasets"].get(PAYMENTS, {}).get("watermark")
+        while True:
+            query = (
+                select(*[getattr(Payment, column) for column in PAYMENT_COLUMNS], changed_at)
+                .filter(changed_at < horizon)
+                .order_by(changed_at, Payment.id)
+                .limit(batch_size)
+            )
+            if watermark:
+                last_changed, last_id = datetime.fromisoformat(watermark[0]), watermark[1]
+                query = query.filter(or_(changed_at > last_changed,
+                                         and_(changed_at == last_changed, Payment.id > last_id)))
+            rows = (await db.execute(query)).all()
+            if not rows:
+                break
+            watermark = [_utc(rows[-1][-1]).isoformat(), rows[-1].id]
+            store.append(manifest, PAYMENTS, _table(rows, PAYMENT_COLUMNS, _payment_schema()),
+                         "created_at", ["owner_id", "created_at"], watermark)
+            written += len(rows)
+            if len(rows) < batch_size:
+                break
+    return written
+
+
+async def sync_access_events(db: AsyncSession, batch_size: Optional[int] = None) -> int:
+    """Mirror access events recorded since the last sync; returns rows written"""
+    batch_size = batch_size or settings.ANALYTICS_STORE_SYNC_BATCH_SIZE
+    horizon = datetime.utcnow() - timedelta(seconds=settings.ANALYTICS_STORE_SYNC_LAG)
+    written = 0
+    with store.writer() as manifest:
+        last_id = manifest["datasets"].get(ACCESS_EVENTS, {}).get("watermark") or 0
+        while True:
+            rows = (await db.execute(
+                select(ContentAccessEvent.id, Content.owner_id, ContentAccessEvent.content_id,
+                       ContentAccessEvent.user_id, ContentAccessEvent.event_type, ContentAccessEvent.occurred_at)
+                .join(Content, Content.id == ContentAccessEvent.content_id)
+                .filter(ContentAccessEvent.id > last_id, ContentAccessEvent.occurred_at < horizon)
+                .order_by(ContentAccessEvent.id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            store.append(manifest, ACCESS_EVENTS, _table(rows, EVENT_COLUMNS, _event_schema()),
+                         "occurred_at", ["owner_id", "occurred_at"], last_id)
+            written += len(rows)
+            if len(rows) < batch_size:
+                break
+    return written
+
+
+async def sync_store(db: AsyncSession) -> Dict[str, Any]:
+    """Sync both datasets, then compact busy months and remove superseded files"""
+    payments = await sync_payments(db)
+    events = await sync_access_events(db)
+    max_files = settings.ANALYTICS_STORE_MAX_FILES_PER_MONTH
+    with store.writer() as manifest:
+        compacted = store.compact(manifest, PAYMENTS, "id", ["owner_id", "created_at"], max_files)
+        compacted += store.compact(manifest, ACCESS_EVENTS, None, ["owner_id", "occurred_at"], max_files)
+        removed = store.collect_garbage(manifest)
+    logger.info(f"Analytics store: synced {payments} payments and {events} access events, "
+                f"compacted {compacted} months, removed {removed} files")
+    return {"payments": payments, "access_events": events, "months_compacted": compacted, "files_removed": removed}
+
+
+def _revenue_breakdown(owner_id: int, start: datetime, end: datetime, dimensions: List[str]) -> List[Dict[str, Any]]:
+    import pyarrow.compute as pc
+
+    table = store.read(
+        PAYMENTS, start, end,
+        columns=["owner_id", "paywall_id", "amount", "currency", "status", "payment_method", "channel", "created_at"],
+        filters=[("owner_id", "=", owner_id)], key="id",
+    )
+    if table is None:
+        return []
+    # Status changes, so it is only filtered after older versions are dropped
+    table = table.filter(pc.and_(
+        pc.and_(pc.equal(table["owner_id"], owner_id), pc.equal(table["status"], "completed")),
+        pc.and_(pc.greater_equal(table["created_at"], start), pc.less(table["created_at"], end)),
+    ))
+    for dimension in dimensions:
+        if dimension in TIME_DIMENSIONS:
+            table = table.append_column(dimension, pc.floor_temporal(table["created_at"], unit=TIME_DIMENSIONS[dimension]))
+
+    grouped = table.group_by(dimensions).aggregate([("amount", "sum"), ("amount", "count")])
+    results = []
+    for row in grouped.to_pylist():
+        entry = {
+            dimension: row[dimension].date().isoformat() if dimension in TIME_DIMENSIONS else row[dimension]
+            for dimension in dimensions
+        }
+        entry["revenue"] = round(row["amount_sum"] or 0.0, 2)
+        entry["payments"] = row["amount_count"]
+        results.append(entry)
+    results.sort(key=lambda entry: tuple((entry[d] is None, entry[d] or 0) for d in dimensions))
+    return results
+
+
+async def revenue_breakdown(owner_id: int, start: datetime, end: datetime,
+                            dimensions: List[str]) -> List[Dict[str, Any]]:
+    """
+    Completed revenue and payment count of an owner's payments created in
+    [start, end), grouped by the given dimensions (see DIMENSIONS). As of
+    the last store sync.
+    """
+    return await asyncio.to_thread(_revenue_breakdown, owner_id, _utc(start), _utc(end), dimensions)
@@ -14,6 +14,7 @@ from schemas.billing import (
 )
 from schemas.payment import PaymentMethodCreate, PaymentMethodUpdate
 from utils.cache import cache
+from . import coupon_service
 
 
 # Subscription Plan Services
@@ -118,11 +119,23 @@ async def get_coupon_by_code(db: AsyncSession, code: str) -> Optional[Coupon]:
     return result.scalar_one_or_none()
 
 
+async def is_coupon_valid(db: AsyncSession, code: str) -> Optional[dict]:
+    """Validation only: the cached coupon snapshot if it could currently be redeemed"""
+    return await coupon_service.validate_code(db, Coupon, code)
+
+
+async def redeem_coupon(db: AsyncSession, code: str, commit: bool = True) -> Optional[dict]:
+    """Atomically use up one redemption; None if the coupon can't be redeemed"""
+    return await coupon_service.redeem_code(db, Coupon, code, commit=commit)
+
+
 async def create_coupon(db: AsyncSession, coupon: CouponCreate) -> Coupon:
     db_coupon = Coupon(**coupon.model_dump())
     db.add(db_coupon)
     await db.commit()
     await db.refresh(db_coupon)
+    # Drop any cached "unknown code" entry
+    await coupon_service.invalidate_code(Coupon, db_coupon.code)
     return db_coupon
 
 
@@ -0,0 +1,213 @@
+"""
+Content-addressed blob registry and garbage collection
+
+Every stored upload has a StoredBlob row keyed by its SHA-256. Content rows
+(file_path/url) and user avatars (avatar_url) reference blobs by path, and
+ref_count is adjusted as those rows are created, changed or deleted. The
+garbage collector recomputes the counts from the referencing tables, so
+drift from failed requests is repaired, then removes blobs that have been
+unreferenced for longer than the grace period. That grace period is also
+the window a client has to create content for a file uploaded with
+/content/upload, which stores the file before any row references it.
+"""
+import asyncio
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional
+from sqlalchemy import update, delete, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Content, User, StoredBlob
+from utils.db_helpers import insert_ignore_conflicts
+from utils.streaming_upload import PUBLIC_UPLOAD_DIR, StoredUpload
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Matches the <hash[0:2]>/<hash[2:4]>/<hash> tail of a content-addressed path or URL;
+# derivatives (<hash>_<rendition>.<ext>) count as references to their source blob
+BLOB_HASH_PATTERN = re.compile(r"/([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(?:_\w+)?(?:\.\w+)?$")
+
+GC_GRACE_PERIOD = timedelta(hours=24)
+GC_BATCH_SIZE = 1000
+
+
+def blob_hash_from_path(path: Optional[str]) -> Optional[str]:
+    """Extract the SHA-256 from a content-addressed file path or upload URL"""
+    if not path:
+        return None
+    match = BLOB_HASH_PATTERN.search(path.replace("\\", "/"))
+    return match.group(3) if match else None
+
+
+async def get_blob_for_path(db: AsyncSession, path: Optional[str]) -> Optional[StoredBlob]:
+    sha256 = blob_hash_from_path(path)
+    if not sha256:
+        return None
+    return await db.get(StoredBlob, sha256)
+
+
+async def record_blob(db: AsyncSession, stored: StoredUpload) -> None:
+    """Register a stored upload; re-uploads of existing bytes just refresh the timestamp"""
+    await db.execute(
+        insert_ignore_conflicts(StoredBlob, index_elements=["sha256"]).values(
+            sha256=stored.sha256,
+            path=stored.relative_path,
+            content_type=stored.content_type,
+            size=stored.size,
+            ref_count=0,
+        )
+    )
+    if stored.deduplicated:
+        # Keeps the blob out of the current GC window while the new reference is created
+        await db.execute(
+            update(StoredBlob)
+            .where(StoredBlob.sha256 == stored.sha256)
+            .values(updated_at=datetime.utcnow())
+        )
+
+
+async def add_reference(db: AsyncSession, path: Optional[str]) -> Optional[str]:
+    sha256 = blob_hash_from_path(path)
+    if sha256:
+        await db.execute(
+            update(StoredBlob)
+            .where(StoredBlob.sha256 == sha256)
+            .values(ref_count=StoredBlob.ref_count + 1, updated_at=datetime.utcnow())
+        )
+    return sha256
+
+
+async def release_reference(db: AsyncSession, path: Optional[str]) -> Optional[str]:
+    sha256 = blob_hash_from_path(path)
+    if sha256:
+        await db.execute(
+            update(StoredBlob)
+            .where(and_(StoredBlob.sha256 == sha256, StoredBlob.ref_count > 0))
+            .values(ref_count=StoredBlob.ref_count - 1, updated_at=datetime.utcnow())
+        )
+    return sha256
+
+
+async def _count_references(db: AsyncSession, batch_size: int) -> Counter:
+    """Walk Content and User by primary-key keyset and count references per blob"""
+    references: Counter = Counter()
+
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(Content.id, Content.file_path, Content.url)
+            .filter(Content.id > last_id)
+            .order_by(Content.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        for row in rows:
+            sha256 = blob_hash_from_path(row.file_path) or blob_hash_from_path(row.url)
+            if sha256:
+                references[sha256] += 1
+        last_id = rows[-1].id
+
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(User.id, User.avatar_url)
+            .filter(and_(User.id > last_id, User.avatar_url.isnot(None)))
+            .order_by(User.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        for row in rows:
+            sha256 = blob_hash_from_path(row.avatar_url)
+            if sha256:
+                references[sha256] += 1
+        last_id = rows[-1].id
+
+    return references
+
+
+def _remove_blob_files(root: Path, relative_path: str, sha256: str):
+    """
+    Delete a blob, any derivative files stored beside it (<hash>_thumb.png
+    etc.) and their published copies under the public subtree
+    """
+    parent = Path(relative_path).parent
+    for directory in (root / parent, root / PUBLIC_UPLOAD_DIR / parent):
+        for sibling in directory.glob(f"{sha256}*"):
+            try:
+                sibling.unlink()
+            except FileNotFoundError:
+                pass
+
+
+async def collect_garbage(
+    db: AsyncSession,
+    grace_period: timedelta = GC_GRACE_PERIOD,
+    batch_size: int = GC_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Reconcile ref_count with the referencing rows and delete blobs that have
+    had no references for longer than grace_period.
+    """
+    root = Path(settings.UPLOAD_DIR)
+    cutoff = datetime.utcnow() - grace_period
+    references = await _count_references(db, batch_size)
+
+    scanned = corrected = removed = freed_bytes = 0
+    last_sha = ""
+    while True:
+        result = await db.execute(
+            select(StoredBlob.sha256, StoredBlob.path, StoredBlob.size,
+                   StoredBlob.ref_count, StoredBlob.updated_at)
+            .filter(StoredBlob.sha256 > last_sha)
+            .order_by(StoredBlob.sha256)
+            .limit(batch_size)
+        )
+        blobs = result.all()
+        if not blobs:
+            break
+        last_sha = blobs[-1].sha256
+        scanned += len(blobs)
+
+        for blob in blobs:
+            actual = references.get(blob.sha256, 0)
+            if actual != blob.ref_count:
+                await db.execute(
+                    update(StoredBlob)
+                    .where(StoredBlob.sha256 == blob.sha256)
+                    .values(ref_count=actual)
+                )
+                corrected += 1
+            if actual:
+                continue
+
+            # Conditional delete: a reference added since we read the row keeps it alive
+            deleted = await db.execute(
+                delete(StoredBlob).where(and_(
+                    StoredBlob.sha256 == blob.sha256,
+                    StoredBlob.ref_count == 0,
+                    StoredBlob.updated_at < cutoff,
+                ))
+            )
+            if deleted.rowcount:
+                await asyncio.to_thread(_remove_blob_files, root, blob.path, blob.sha256)
+                removed += 1
+                freed_bytes += blob.size or 0
+
+        await db.commit()
+
+    summary = {
+        "scanned_blobs": scanned,
+        "corrected_ref_counts": corrected,
+        "removed_blobs": removed,
+        "freed_bytes": freed_bytes,
+    }
+    logger.info(f"Blob garbage collection finished: {summary}")
+    return summary
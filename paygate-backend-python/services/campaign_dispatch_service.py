@@ -0,0 +1,574 @@
+"""
+Marketing campaign dispatcher
+
+A dispatch sends one campaign to one email list:
+  1. The coordinator streams subscribers by primary-key keyset in chunks,
+     bulk-inserts a CampaignDelivery row per recipient and advances the
+     dispatch cursor in the same transaction, then schedules a chunk task.
+     Chunk ETAs come from a global send clock, so all dispatches together
+     stay under CAMPAIGN_SEND_RATE_PER_SECOND.
+  2. Chunk tasks claim their queued rows, render the campaign templates
+     (compiled once per process per dispatch) for each recipient, send over
+     the pooled SMTP connection and record the outcomes in bulk.
+
+Every step is idempotent: deliveries are unique per subscriber, claims
+expire, and a recovery run re-schedules anything still queued, so a crashed
+coordinator or worker can simply be resumed.
+"""
+import hashlib
+import hmac
+import html
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from string import Template
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import CampaignDelivery, CampaignDispatch, EmailList, EmailSubscriber, MarketingCampaign
+from utils.db_helpers import insert_ignore_conflicts
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Placeholders filled per recipient; anything else unknown is left verbatim
+RECIPIENT_FIELDS = {"email", "first_name", "last_name", "full_name", "unsubscribe_url"}
+
+ACTIVE_STATUSES = ("pending", "running")
+
+# Coordinator ranges are (first_subscriber_id, last_subscriber_id, reserved_sends, countdown_seconds)
+ChunkRange = Tuple[int, int, int, float]
+
+
+class CompiledTemplate:
+    """
+    A string.Template split once into literal and per-recipient segments, with
+    campaign-level values ($campaign_name, ...) already baked into the literals.
+    Substituted values pass through escape (html.escape for HTML bodies).
+    """
+
+    def __init__(self, template: str, campaign_values: Dict[str, Any],
+                 escape: Optional[Callable[[str], str]] = None):
+        self.escape = escape or str
+        self.parts: List[Tuple[bool, str]] = []
+        literal: List[str] = []
+        position = 0
+        for match in Template.pattern.finditer(template):
+            literal.append(template[position:match.start()])
+            position = match.end()
+            name = match.group("named") or match.group("braced")
+            if match.group("escaped") is not None:
+                literal.append("$")
+            elif name in campaign_values:
+                literal.append(self.escape(str(campaign_values[name])))
+            elif name in RECIPIENT_FIELDS:
+                self.parts.append((False, "".join(literal)))
+                self.parts.append((True, name))
+                literal = []
+            else:
+                literal.append(match.group(0))
+        literal.append(template[position:])
+        self.parts.append((False, "".join(literal)))
+
+    def render(self, recipient: Dict[str, Any]) -> str:
+        return "".join(
+            self.escape(str(recipient.get(text) or "")) if is_field else text for is_field, text in self.parts
+        )
+
+
+@lru_cache(maxsize=64)
+def _compiled_templates(dispatch_id: int, subject: str, body: str, html_body: Optional[str],
+                        campaign_name: str, campaign_description: str):
+    campaign_values = {"campaign_name": campaign_name, "campaign_description": campaign_description}
+    return (
+        CompiledTemplate(subject, campaign_values),
+        CompiledTemplate(body, campaign_values),
+        CompiledTemplate(html_body, campaign_values, html.escape) if html_body else None,
+    )
+
+
+def unsubscribe_token(subscriber_id: int, email_list_id: int) -> str:
+    message = f"{subscriber_id}:{email_list_id}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def unsubscribe_url(subscriber_id: int, email_list_id: int) -> str:
+    query = urlencode({
+        "subscriber": subscriber_id,
+        "list": email_list_id,
+        "token": unsubscribe_token(subscriber_id, email_list_id),
+    })
+    return f"{settings.FRONTEND_URL}/unsubscribe?{query}"
+
+
+async def unsubscribe(db: AsyncSession, subscriber_id: int, email_list_id: int, token: str,
+                      reason: Optional[str] = None) -> bool:
+    """
+    Unsubscribe through the signed link of a campaign email. Returns False
+    if the token does not match or the subscriber is not on the list;
+    repeating a valid request is a no-op.
+    """
+    if not hmac.compare_digest(unsubscribe_token(subscriber_id, email_list_id), token):
+        return False
+    subscriber = (await db.execute(
+        select(EmailSubscriber)
+        .filter(EmailSubscriber.id == subscriber_id, EmailSubscriber.email_list_id == email_list_id)
+    )).scalar_one_or_none()
+    if subscriber is None:
+        return False
+    if subscriber.is_subscribed:
+        subscriber.is_subscribed = False
+        subscriber.unsubscribe_reason = reason
+        await db.execute(
+            update(EmailList)
+            .where(EmailList.id == email_list_id, EmailList.subscriber_count > 0)
+            .values(subscriber_count=EmailList.subscriber_count - 1)
+        )
+        await db.commit()
+    return True
+
+
+class SendClock:
+    """
+    Global send-rate cap shared by every dispatch. reserve(n) books n sends
+    and returns how many seconds from now the batch may start. The clock is
+    kept in Redis when reachable so it holds across coordinators.
+    """
+
+    _SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local clock = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if clock < now then clock = now end
+    redis.call('SET', KEYS[1], tostring(clock + tonumber(ARGV[2])), 'EX', 86400)
+    return tostring(clock - now)
+    """
+
+    _RELEASE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local clock = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if clock > now then
+        redis.call('SET', KEYS[1], tostring(math.max(clock - tonumber(ARGV[2]), now)), 'EX', 86400)
+    end
+    return 0
+    """
+
+    def __init__(self, rate_per_second: float, redis_url: Optional[str] = None):
+        self.rate_per_second = rate_per_second
+        self._local_clock = 0.0
+        self._reserve = None
+        self._release = None
+        if redis_url:
+            try:
+                import redis
+                client = redis.from_url(redis_url, socket_timeout=1)
+                client.ping()
+                self._reserve = client.register_script(self._SCRIPT)
+                self._release = client.register_script(self._RELEASE_SCRIPT)
+            except Exception as e:
+                logger.warning(f"Campaign send clock falling back to in-process state: {e}")
+
+    def reserve(self, count: int) -> float:
+        now = time.time()
+        cost = count / self.rate_per_second
+        if self._reserve is not None:
+            try:
+                return float(self._reserve(keys=["campaign_send_clock"], args=[now, cost]))
+            except Exception as e:
+                logger.warning(f"Campaign send clock Redis error: {e}")
+        start = max(self._local_clock, now)
+        self._local_clock = start + cost
+        return start - now
+
+    def release(self, count: int):
+        """Hand back n booked sends that will not happen; later bookings start sooner"""
+        now = time.time()
+        cost = count / self.rate_per_second
+        if self._release is not None:
+            try:
+                self._release(keys=["campaign_send_clock"], args=[now, cost])
+                return
+            except Exception as e:
+                logger.warning(f"Campaign send clock Redis error: {e}")
+        if self._local_clock > now:
+            self._local_clock = max(self._local_clock - cost, now)
+
+
+_send_clock: Optional[SendClock] = None
+
+
+def get_send_clock() -> SendClock:
+    global _send_clock
+    if _send_clock is None:
+        _send_clock = SendClock(settings.CAMPAIGN_SEND_RATE_PER_SECOND, settings.REDIS_URL)
+    return _send_clock
+
+
+async def get_dispatch(db: AsyncSession, dispatch_id: int) -> Optional[CampaignDispatch]:
+    result = await db.execute(select(CampaignDispatch).filter(CampaignDispatch.id == dispatch_id))
+    return result.scalar_one_or_none()
+
+
+def _subscriber_filter(email_list_id: int):
+    return and_(EmailSubscriber.email_list_id == email_list_id, EmailSubscriber.is_subscribed == True)
+
+
+async def create_dispatch(
+    db: AsyncSession,
+    campaign_id: int,
+    email_list_id: int,
+    subject: str,
+    body: str,
+    html_body: Optional[str] = None,
+) -> CampaignDispatch:
+    campaign = await db.get(MarketingCampaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Campaign not found")
+    if not await db.get(EmailList, email_list_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email list not found")
+
+    total = await db.scalar(select(func.count(EmailSubscriber.id)).filter(_subscriber_filter(email_list_id)))
+    dispatch = CampaignDispatch(
+        campaign_id=campaign_id,
+        email_list_id=email_list_id,
+        subject=subject,
+        body_template=body,
+        html_template=html_body,
+        status="pending",
+        total_recipients=total or 0,
+    )
+    db.add(dispatch)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This campaign has already been dispatched to this list"
+        )
+    await db.refresh(dispatch)
+    return dispatch
+
+
+async def _release_stale_claims(db: AsyncSession, dispatch_id: int) -> int:
+    """Return rows claimed by a worker that died mid-chunk to the queue"""
+    cutoff = datetime.utcnow() - timedelta(minutes=settings.CAMPAIGN_CLAIM_TIMEOUT_MINUTES)
+    result = await db.execute(
+        update(CampaignDelivery)
+        .where(and_(
+            CampaignDelivery.dispatch_id == dispatch_id,
+            CampaignDelivery.status == "sending",
+            CampaignDelivery.claimed_at < cutoff,
+        ))
+        .values(status="queued", claim_token=None, claimed_at=None)
+    )
+    return result.rowcount or 0
+
+
+async def _queued_ranges(db: AsyncSession, dispatch_id: int, chunk_size: int) -> List[Tuple[int, int, int]]:
+    """Keyset-walk deliveries still queued and group them into subscriber-id ranges"""
+    ranges = []
+    last_subscriber_id = 0
+    while True:
+        result = await db.execute(
+            select(CampaignDelivery.subscriber_id)
+            .filter(and_(
+                CampaignDelivery.dispatch_id == dispatch_id,
+                CampaignDelivery.status == "queued",
+                CampaignDelivery.subscriber_id > last_subscriber_id,
+            ))
+            .order_by(CampaignDelivery.subscriber_id)
+            .limit(chunk_size)
+        )
+        ids = result.scalars().all()
+        if not ids:
+            break
+        ranges.append((ids[0], ids[-1], len(ids)))
+        last_subscriber_id = ids[-1]
+    return ranges
+
+
+async def _queue_next_chunk(db: AsyncSession, dispatch: CampaignDispatch, chunk_size: int) -> Optional[Tuple[int, int, int]]:
+    """Create delivery rows for the next keyset chunk and advance the cursor atomically"""
+    result = await db.execute(
+        select(EmailSubscriber.id, EmailSubscriber.email)
+        .filter(and_(_subscriber_filter(dispatch.email_list_id), EmailSubscriber.id > dispatch.last_subscriber_id))
+        .order_by(EmailSubscriber.id)
+        .limit(chunk_size)
+    )
+    subscribers = result.all()
+    if not subscribers:
+        dispatch.fully_queued = True
+        await db.commit()
+        return None
+
+    # The cursor moves in the same transaction, so conflicts only arise if two
+    # coordinators race on one dispatch; the unique key makes that harmless
+    await db.execute(
+        insert_ignore_conflicts(CampaignDelivery.__table__, index_elements=["dispatch_id", "subscriber_id"]),
+        [
+            {"dispatch_id": dispatch.id, "subscriber_id": row.id, "email": row.email, "status": "queued"}
+            for row in subscribers
+        ]
+    )
+    dispatch.last_subscriber_id = subscribers[-1].id
+    dispatch.queued_count = (dispatch.queued_count or 0) + len(subscribers)
+    await db.commit()
+    return subscribers[0].id, subscribers[-1].id, len(subscribers)
+
+
+async def run_coordinator(db: AsyncSession, dispatch_id: int, recover: bool = False) -> Dict[str, Any]:
+    """
+    Queue chunks until the schedule is CAMPAIGN_QUEUE_AHEAD_SECONDS ahead.
+    Returns the chunk ranges to schedule and, if work remains, when to run again.
+    With recover=True, stale claims are released and leftover queued rows re-scheduled.
+    """
+    dispatch = await get_dispatch(db, dispatch_id)
+    if not dispatch or dispatch.status not in ACTIVE_STATUSES:
+        return {"chunks": [], "continue_in": None}
+
+    if dispatch.status == "pending":
+        dispatch.status = "running"
+        dispatch.started_at = datetime.utcnow()
+        await db.commit()
+
+    chunk_size = settings.CAMPAIGN_CHUNK_SIZE
+    clock = get_send_clock()
+    chunks: List[ChunkRange] = []
+
+    if recover:
+        released = await _release_stale_claims(db, dispatch_id)
+        await db.commit()
+        leftovers = await _queued_ranges(db, dispatch_id, chunk_size)
+        for first_id, last_id, count in leftovers:
+            chunks.append((first_id, last_id, count, clock.reserve(count)))
+        if released or leftovers:
+            logger.info(f"Dispatch {dispatch_id}: released {released} stale claims, "
+                        f"re-scheduled {len(leftovers)} chunks")
+
+    continue_in = None
+    while not dispatch.fully_queued:
+        queued = await _queue_next_chunk(db, dispatch, chunk_size)
+        if queued is None:
+            break
+        first_id, last_id, count = queued
+        countdown = clock.reserve(count)
+        chunks.append((first_id, last_id, count, countdown))
+        if countdown > settings.CAMPAIGN_QUEUE_AHEAD_SECONDS:
+            # Don't hold far-future ETAs in the broker; pick up again later
+            continue_in = countdown - settings.CAMPAIGN_QUEUE_AHEAD_SECONDS
+            break
+
+    if dispatch.fully_queued and not chunks:
+        await _complete_if_finished(db, dispatch)
+
+    return {"chunks": chunks, "continue_in": continue_in}
+
+
+async def _complete_if_finished(db: AsyncSession, dispatch: CampaignDispatch) -> bool:
+    if not dispatch.fully_queued or dispatch.status != "running":
+        return False
+    outstanding = await db.scalar(
+        select(func.count(CampaignDelivery.id)).filter(and_(
+            CampaignDelivery.dispatch_id == dispatch.id,
+            CampaignDelivery.status.in_(("queued", "sending")),
+        ))
+    )
+    if outstanding:
+        return False
+    dispatch.status = "completed"
+    dispatch.completed_at = datetime.utcnow()
+    await db.commit()
+    logger.info(f"Dispatch {dispatch.id} completed: {dispatch.sent_count} sent, {dispatch.failed_count} failed")
+    return True
+
+
+async def send_chunk(
+    db: AsyncSession,
+    dispatch_id: int,
+    first_subscriber_id: int,
+    last_subscriber_id: int,
+    send_messages: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+    reserved: int = 0,
+) -> Dict[str, Any]:
+    """
+    Claim, render, send and record one chunk. send_messages receives message
+    dicts and returns one {"status": sent|failed|deferred, ...} per message.
+    reserved is the number of sends booked on the send clock for this task;
+    those it does not use (rows already sent or re-queued by a recovery run,
+    or a paused dispatch) are released.
+    """
+    dispatch = await get_dispatch(db, dispatch_id)
+    if not dispatch or dispatch.status != "running":
+        if reserved:
+            get_send_clock().release(reserved)
+        return {"status": "skipped", "sent": 0, "failed": 0, "deferred": 0}
+
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    await db.execute(
+        update(CampaignDelivery)
+        .where(and_(
+            CampaignDelivery.dispatch_id == dispatch_id,
+            CampaignDelivery.subscriber_id.between(first_subscriber_id, last_subscriber_id),
+            CampaignDelivery.status == "queued",
+        ))
+        .values(status="sending", claim_token=token, claimed_at=now)
+    )
+    await db.commit()
+
+    result = await db.execute(
+        select(CampaignDelivery.id, CampaignDelivery.subscriber_id, CampaignDelivery.email,
+               EmailSubscriber.first_name, EmailSubscriber.last_name)
+        .join(EmailSubscriber, EmailSubscriber.id == CampaignDelivery.subscriber_id)
+        .filter(CampaignDelivery.claim_token == token)
+        .order_by(CampaignDelivery.subscriber_id)
+    )
+    rows = result.all()
+    if reserved > len(rows):
+        get_send_clock().release(reserved - len(rows))
+    if not rows:
+        return {"status": "empty", "sent": 0, "failed": 0, "deferred": 0}
+
+    campaign = await db.get(MarketingCampaign, dispatch.campaign_id)
+    subject_template, body_template, html_template = _compiled_templates(
+        dispatch.id, dispatch.subject, dispatch.body_template, dispatch.html_template,
+        campaign.name if campaign else "", (campaign.description if campaign else "") or "",
+    )
+
+    messages = []
+    for row in rows:
+        recipient = {
+            "email": row.email,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "full_name": " ".join(part for part in (row.first_name, row.last_name) if part),
+            "unsubscribe_url": unsubscribe_url(row.subscriber_id, dispatch.email_list_id),
+        }
+        messages.append({
+            "to": row.email,
+            "subject": subject_template.render(recipient),
+            "body": body_template.render(recipient),
+            "html_body": html_template.render(recipient) if html_template else None,
+        })
+
+    outcomes = send_messages(messages)
+
+    sent_at = datetime.utcnow()
+    updates = []
+    sent = failed = 0
+    deferred_wait = 0.0
+    for row, outcome in zip(rows, outcomes):
+        if outcome["status"] == "sent":
+            sent += 1
+            updates.append({"id": row.id, "status": "sent", "sent_at": sent_at, "claim_token": None, "error": None})
+        elif outcome["status"] == "failed":
+            failed += 1
+            updates.append({"id": row.id, "status": "failed", "claim_token": None, "error": outcome.get("error")})
+        else:
+            deferred_wait = max(deferred_wait, outcome.get("retry_in", 60))
+            updates.append({"id": row.id, "status": "queued", "claim_token": None, "claimed_at": None})
+
+    # Bulk UPDATE by primary key (executemany)
+    await db.execute(update(CampaignDelivery), updates)
+    await db.execute(
+        update(CampaignDispatch)
+        .where(CampaignDispatch.id == dispatch_id)
+        .values(
+            sent_count=CampaignDispatch.sent_count + sent,
+            failed_count=CampaignDispatch.failed_count + failed,
+            updated_at=sent_at,
+        )
+    )
+    await db.commit()
+
+    deferred = len(rows) - sent - failed
+    if not deferred:
+        await db.refresh(dispatch)
+        await _complete_if_finished(db, dispatch)
+    return {
+        "status": "completed" if not deferred else "partial",
+        "sent": sent,
+        "failed": failed,
+        "deferred": deferred,
+        "retry_in": deferred_wait if deferred else None,
+    }
+
+
+async def get_dispatch_progress(db: AsyncSession, dispatch_id: int) -> Dict[str, Any]:
+    dispatch = await get_dispatch(db, dispatch_id)
+    if not dispatch:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dispatch not found")
+
+    result = await db.execute(
+        select(CampaignDelivery.status, func.count(CampaignDelivery.id))
+        .filter(CampaignDelivery.dispatch_id == dispatch_id)
+        .group_by(CampaignDelivery.status)
+    )
+    counts = {state: count for state, count in result.all()}
+    done = counts.get("sent", 0) + counts.get("failed", 0)
+    total = max(dispatch.total_recipients or 0, sum(counts.values()))
+
+    rate = None
+    eta_seconds = None
+    if dispatch.started_at and done:
+        started_at = dispatch.started_at.replace(tzinfo=None)
+        elapsed = ((dispatch.completed_at or datetime.utcnow()).replace(tzinfo=None) - started_at).total_seconds()
+        if elapsed > 0:
+            rate = done / elapsed
+            if dispatch.status == "running":
+                eta_seconds = max(total - done, 0) / rate
+
+    return {
+        "id": dispatch.id,
+        "campaign_id": dispatch.campaign_id,
+        "email_list_id": dispatch.email_list_id,
+        "status": dispatch.status,
+        "total_recipients": total,
+        "queued": counts.get("queued", 0) + max(total - sum(counts.values()), 0),
+        "sending": counts.get("sending", 0),
+        "sent": counts.get("sent", 0),
+        "failed": counts.get("failed", 0),
+        "percent_complete": round(done / total * 100, 2) if total else 100.0,
+        "send_rate_per_second": round(rate, 2) if rate else None,
+        "eta_seconds": round(eta_seconds) if eta_seconds is not None else None,
+        "started_at": dispatch.started_at,
+        "completed_at": dispatch.completed_at,
+    }
+
+
+async def set_dispatch_status(db: AsyncSession, dispatch_id: int, new_status: str) -> CampaignDispatch:
+    """Pause, resume or cancel a dispatch; chunk tasks check the status before sending"""
+    dispatch = await get_dispatch(db, dispatch_id)
+    if not dispatch:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dispatch not found")
+    allowed = {
+        "paused": ("pending", "running"),
+        "running": ("paused",),
+        "cancelled": ("pending", "running", "paused"),
+    }
+    if dispatch.status not in allowed[new_status]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Cannot change a {dispatch.status} dispatch to {new_status}"
+        )
+    dispatch.status = new_status
+    await db.commit()
+    await db.refresh(dispatch)
+    return dispatch
+
+
+async def find_stalled_dispatches(db: AsyncSession) -> List[int]:
+    """Running dispatches with no progress for longer than the claim timeout"""
+    cutoff = datetime.utcnow() - timedelta(minutes=settings.CAMPAIGN_CLAIM_TIMEOUT_MINUTES)
+    result = await db.execute(
+        select(CampaignDispatch.id)
+        .filter(CampaignDispatch.status == "running")
+        .filter(CampaignDispatch.updated_at < cutoff)
+    )
+    return result.scalars().all()
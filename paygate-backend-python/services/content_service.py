@@ -7,6 +7,7 @@ from models import Content, User
 from schemas.content import ContentCreate, ContentUpdate, ContentUpdateProtection
 from fastapi import HTTPException, status
 from utils.pagination import create_paginated_response, PaginationParams
+from . import blob_service
 
 
 async def get_content_by_id(db: AsyncSession, content_id: int) -> Optional[Content]:
@@ -76,6 +77,7 @@ async def create_content(db: AsyncSession, content_data) -> Content:
                 description=content_data.get('description'),
                 type=content_data.get('type', 'file'),
                 url=content_data.get('url'),
+                file_path=content_data.get('file_path'),
                 is_protected=content_data.get('is_protected', False),
                 price=content_data.get('price'),
                 currency=content_data.get('currency', 'USD'),
@@ -94,6 +96,7 @@ async def create_content(db: AsyncSession, content_data) -> Content:
             )
         
         db.add(db_content)
+        await blob_service.add_reference(db, db_content.file_path or db_content.url)
         await db.commit()
         await db.refresh(db_content)
         return db_content
@@ -108,9 +111,15 @@ async def update_content(db: AsyncSession, content_id: int, content_update: Cont
     if not db_content:
         return None
     
+    previous_blob_path = db_content.file_path or db_content.url
     for field, value in content_update.dict(exclude_unset=True).items():
         setattr(db_content, field, value)
     
+    current_blob_path = db_content.file_path or db_content.url
+    if current_blob_path != previous_blob_path:
+        await blob_service.release_reference(db, previous_blob_path)
+        await blob_service.add_reference(db, current_blob_path)
+    
     db_content.updated_at = datetime.utcnow()
     await db.commit()
     await db.refresh(db_content)
@@ -143,6 +152,7 @@ async def delete_content(db: AsyncSession, content_id: int) -> bool:
     if not db_content:
         return False
     
+    await blob_service.release_reference(db, db_content.file_path or db_content.url)
     await db.delete(db_content)
     await db.commit()
     return True
\ No newline at end of file
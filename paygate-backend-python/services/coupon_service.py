@@ -0,0 +1,122 @@
+"""
+Lookup and redemption of discount codes (marketing DiscountCode and billing Coupon)
+
+Redemption is a single conditional UPDATE ... RETURNING that only matches
+while the code is active, inside its validity window and under its usage
+limit, so concurrent checkouts can never push used_count past usage_limit.
+
+Validation-only calls (showing a discount before checkout) read a
+short-lived snapshot of the code from the cache, including a negative
+entry for unknown codes, so hammering a popular or mistyped code doesn't
+hit the database on every keystroke. A cached "valid" can be stale by up
+to the TTL; redemption is always checked against the database.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Type, Union
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Coupon, DiscountCode
+from utils.cache import cache
+
+CodeModel = Type[Union[DiscountCode, Coupon]]
+
+SNAPSHOT_FIELDS = (
+    "id", "code", "discount_type", "discount_value", "usage_limit", "used_count",
+    "valid_from", "valid_until", "is_active",
+)
+
+
+def _cache_key(model: CodeModel, code: str) -> str:
+    return f"discount_code:{model.__tablename__}:{code}"
+
+
+def _snapshot(row) -> Dict[str, Any]:
+    snapshot = {field: getattr(row, field) for field in SNAPSHOT_FIELDS}
+    for field in ("valid_from", "valid_until"):
+        if snapshot[field] is not None:
+            snapshot[field] = snapshot[field].replace(tzinfo=None).isoformat()
+    return snapshot
+
+
+def is_redeemable(snapshot: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    now = now or datetime.utcnow()
+    if not snapshot.get("is_active"):
+        return False
+    if datetime.fromisoformat(snapshot["valid_from"]) > now or datetime.fromisoformat(snapshot["valid_until"]) < now:
+        return False
+    limit = snapshot.get("usage_limit")
+    return not (limit and (snapshot.get("used_count") or 0) >= limit)
+
+
+async def lookup_code(db: AsyncSession, model: CodeModel, code: str) -> Optional[Dict[str, Any]]:
+    """Cached snapshot of a code's metadata, or None if it doesn't exist"""
+    key = _cache_key(model, code)
+    cached = await cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    result = await db.execute(select(model).filter(model.code == code))
+    row = result.scalar_one_or_none()
+    snapshot = _snapshot(row) if row else None
+    await cache.set(
+        key, json.dumps(snapshot),
+        expire=settings.DISCOUNT_CODE_CACHE_TTL if snapshot else settings.DISCOUNT_CODE_NEGATIVE_CACHE_TTL
+    )
+    return snapshot
+
+
+async def validate_code(db: AsyncSession, model: CodeModel, code: str) -> Optional[Dict[str, Any]]:
+    """Validation only: the code's snapshot if it could currently be redeemed"""
+    snapshot = await lookup_code(db, model, code)
+    if snapshot is None or not is_redeemable(snapshot):
+        return None
+    return snapshot
+
+
+async def redeem_code(db: AsyncSession, model: CodeModel, code: str, commit: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Atomically consume one use of a code. Returns the redeemed code's
+    discount, or None when it is unknown, inactive, expired or used up.
+    Pass commit=False to make the redemption part of the caller's transaction.
+    """
+    now = datetime.utcnow()
+    table = model.__table__
+    result = await db.execute(
+        update(table)
+        .where(and_(
+            table.c.code == code,
+            table.c.is_active == True,
+            table.c.valid_from <= now,
+            table.c.valid_until >= now,
+            or_(table.c.usage_limit.is_(None), func.coalesce(table.c.used_count, 0) < table.c.usage_limit),
+        ))
+        .values(used_count=func.coalesce(table.c.used_count, 0) + 1, updated_at=now)
+        .returning(table.c.id, table.c.discount_type, table.c.discount_value, table.c.used_count, table.c.usage_limit)
+    )
+    row = result.first()
+    if commit:
+        await db.commit()
+    # The cached used_count is now behind
+    await cache.delete(_cache_key(model, code))
+    return dict(row._mapping) if row else None
+
+
+async def release_code(db: AsyncSession, model: CodeModel, code: str, commit: bool = True) -> bool:
+    """Give back a use, e.g. when the payment a redemption was made for fails"""
+    table = model.__table__
+    result = await db.execute(
+        update(table)
+        .where(and_(table.c.code == code, table.c.used_count > 0))
+        .values(used_count=table.c.used_count - 1, updated_at=datetime.utcnow())
+    )
+    if commit:
+        await db.commit()
+    await cache.delete(_cache_key(model, code))
+    return bool(result.rowcount)
+
+
+async def invalidate_code(model: CodeModel, code: str):
+    await cache.delete(_cache_key(model, code))
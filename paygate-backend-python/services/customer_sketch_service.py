@@ -0,0 +1,118 @@
+"""
+Distinct customer counts from per-day sketches
+
+Every (owner, day) with completed payments has a sketch of its distinct
+customer emails, rebuilt by the revenue cube refresh whenever a payment of
+that owner-day changes. Counting the customers of any range merges the
+range's day sketches instead of running COUNT(DISTINCT) over payments.
+Owners with up to CUSTOMER_SKETCH_EXACT_LIMIT customers in a range get an
+exact count; beyond that the count is within about CUSTOMER_SKETCH_ERROR
+(relative standard error).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import CustomerSketch, Payment
+from utils.hyperloglog import HyperLogLog, precision_for_error
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def new_sketch() -> HyperLogLog:
+    return HyperLogLog(precision_for_error(settings.CUSTOMER_SKETCH_ERROR), settings.CUSTOMER_SKETCH_EXACT_LIMIT)
+
+
+def _customer_key(email: str) -> str:
+    return email.strip().lower()
+
+
+async def rebuild_sketches(db: AsyncSession, owner_days: Iterable[Tuple[int, date]]) -> int:
+    """Recompute the sketches of the given (owner, day) pairs; returns sketches written (not committed)"""
+    owners_by_day: Dict[date, set] = defaultdict(set)
+    for owner_id, day in owner_days:
+        owners_by_day[day].add(owner_id)
+
+    table = CustomerSketch.__table__
+    written = 0
+    for day, owner_ids in sorted(owners_by_day.items()):
+        start = datetime.combine(day, datetime.min.time())
+        rows = (await db.execute(
+            select(Payment.owner_id, Payment.customer_email).distinct()
+            .filter(and_(Payment.owner_id.in_(owner_ids), Payment.status == "completed",
+                         Payment.created_at >= start, Payment.created_at < start + timedelta(days=1)))
+        )).all()
+        sketches: Dict[int, HyperLogLog] = defaultdict(new_sketch)
+        for owner_id, email in rows:
+            if email:
+                sketches[owner_id].add(_customer_key(email))
+
+        await db.execute(delete(table).where(and_(table.c.owner_id.in_(owner_ids), table.c.day == day)))
+        if sketches:
+            await db.execute(insert(table), [
+                {"owner_id": owner_id, "day": day, "precision": sketch.precision,
+                 "exact": sketch.is_exact, "data": sketch.to_bytes()}
+                for owner_id, sketch in sketches.items()
+            ])
+        written += len(sketches)
+    return written
+
+
+async def _day_sketches(db: AsyncSession, owner_id: int, start: Optional[date], end: Optional[date]):
+    query = select(CustomerSketch.day, CustomerSketch.precision, CustomerSketch.exact, CustomerSketch.data) \
+        .filter(CustomerSketch.owner_id == owner_id)
+    if start is not None:
+        query = query.filter(CustomerSketch.day >= start)
+    if end is not None:
+        query = query.filter(CustomerSketch.day < end)
+    rows = await db.stream(query.order_by(CustomerSketch.day).execution_options(yield_per=1000))
+    async for day, precision, exact, data in rows:
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        yield day, HyperLogLog.from_bytes(data, precision, exact, settings.CUSTOMER_SKETCH_EXACT_LIMIT)
+
+
+async def count_customers(db: AsyncSession, owner_id: int, start: Optional[date] = None,
+                          end: Optional[date] = None) -> int:
+    """Distinct paying customers on days [start, end), all time by default"""
+    merged = new_sketch()
+    async for _, sketch in _day_sketches(db, owner_id, start, end):
+        merged.merge(sketch)
+    return merged.count()
+
+
+async def monthly_customers(db: AsyncSession, owner_id: int) -> List[Dict[str, Any]]:
+    """
+    Per month with sales: distinct customers that month, customers to date,
+    and new customers (the growth of customers to date)
+    """
+    months: List[Dict[str, Any]] = []
+    to_date = new_sketch()
+    month_key, month_sketch = None, None
+
+    def close_month():
+        total = to_date.count()
+        previous = months[-1]["total_customers"] if months else 0
+        months.append({
+            "month": month_key,
+            "active_customers": month_sketch.count(),
+            # Estimates can dip slightly; customers are never lost
+            "new_customers": max(total - previous, 0),
+            "total_customers": max(total, previous),
+        })
+
+    async for day, sketch in _day_sketches(db, owner_id, None, None):
+        key = f"{day.year:04d}-{day.month:02d}"
+        if key != month_key:
+            if month_key is not None:
+                close_month()
+            month_key, month_sketch = key, new_sketch()
+        month_sketch.merge(sketch)
+        to_date.merge(sketch)
+    if month_key is not None:
+        close_month()
+    return months
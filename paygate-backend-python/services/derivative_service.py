@@ -0,0 +1,148 @@
+"""
+Process-pool execution of the derivative pipeline
+
+Rendering is CPU-bound, so batches of files are sent to a ProcessPoolExecutor
+sized to the machine's cores instead of running on the event loop or in
+threads that contend for the GIL.
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
+from config.settings import settings
+from utils.derivatives import render_batch
+from utils.streaming_upload import PUBLIC_UPLOAD_DIR, PUBLIC_URL_PREFIX, StoredUpload
+import logging
+
+logger = logging.getLogger(__name__)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _pool_size() -> int:
+    return settings.DERIVATIVE_WORKERS or os.cpu_count() or 1
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Lazily create the shared pool. Returns None inside daemonic processes
+    (Celery prefork children), which may not spawn children of their own;
+    there the worker's own concurrency provides the parallelism.
+    """
+    global _process_pool
+    if multiprocessing.current_process().daemon:
+        return None
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=_pool_size())
+        logger.info(f"Started derivative process pool with {_pool_size()} workers")
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+
+
+def job_for_upload(stored: StoredUpload, rendition_set: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Build a render job for a stored upload, or None if the type has no derivatives"""
+    if stored.content_type.startswith("image/"):
+        kind = "image"
+    elif stored.content_type == "application/pdf":
+        kind = "pdf"
+    else:
+        return None
+    return {"path": str(stored.path), "kind": kind, "rendition_set": rendition_set, "sha256": stored.sha256}
+
+
+def _batches(jobs: List[Dict[str, Any]], batch_size: int) -> List[List[Dict[str, Any]]]:
+    # Never leave cores idle with fewer, larger batches than workers
+    batch_size = max(1, min(batch_size, -(-len(jobs) // _pool_size())))
+    return [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+
+
+def map_batches(batch_function: Callable[[List[Any]], List[Any]], jobs: List[Any],
+                batch_size: Optional[int] = None) -> List[Any]:
+    """
+    Run a module-level batch function over jobs in the process pool from
+    synchronous code, one result per job in job order
+    """
+    if not jobs:
+        return []
+    pool = get_process_pool()
+    if pool is None:
+        return batch_function(jobs)
+
+    batches = _batches(jobs, batch_size or settings.DERIVATIVE_BATCH_SIZE)
+    results = []
+    for batch_results in pool.map(batch_function, batches):
+        results.extend(batch_results)
+    return results
+
+
+def render_jobs(jobs: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Render jobs from synchronous code (Celery tasks)"""
+    return map_batches(render_batch, jobs, batch_size)
+
+
+async def render_jobs_async(jobs: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Render jobs without blocking the event loop"""
+    if not jobs:
+        return []
+    pool = get_process_pool()
+    loop = asyncio.get_running_loop()
+    if pool is None:
+        return await asyncio.to_thread(render_batch, jobs)
+
+    batches = _batches(jobs, batch_size or settings.DERIVATIVE_BATCH_SIZE)
+    batch_results = await asyncio.gather(*[
+        loop.run_in_executor(pool, render_batch, batch) for batch in batches
+    ])
+    return [result for batch in batch_results for result in batch]
+
+
+async def render_upload(stored: StoredUpload, rendition_set: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Render the derivatives for a single upload and return its result"""
+    job = job_for_upload(stored, rendition_set)
+    if job is None:
+        return None
+    result = (await render_jobs_async([job]))[0]
+    if "error" in result:
+        raise ValueError(result["error"])
+    return result
+
+
+def publish_file(root: Path, relative_path: str) -> str:
+    """
+    Expose a stored file under the public upload subtree and return its URL.
+    The public copy keeps the blob's sharded path, so it counts as a reference
+    to the blob and is removed with it.
+    """
+    public_path = root / PUBLIC_UPLOAD_DIR / relative_path
+    if not public_path.exists():
+        public_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = public_path.with_name(f".{public_path.name}.{os.getpid()}")
+        try:
+            os.link(root / relative_path, temp_path)
+        except OSError:
+            shutil.copyfile(root / relative_path, temp_path)
+        os.replace(temp_path, public_path)
+    return f"{PUBLIC_URL_PREFIX}{relative_path}"
+
+
+def derivative_url(stored: StoredUpload, result: Dict[str, Any], rendition: str,
+                   preferred_formats=("webp", "jpeg", "png")) -> Optional[str]:
+    """
+    Publish a rendition in the first available preferred format and return
+    its public URL. Only for renditions meant to be public (avatars).
+    """
+    outputs = result["renditions"].get(rendition, {})
+    for fmt in preferred_formats:
+        if fmt in outputs:
+            relative = os.path.relpath(outputs[fmt], stored.root).replace(os.sep, "/")
+            return publish_file(stored.root, relative)
+    return None
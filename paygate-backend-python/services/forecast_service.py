@@ -0,0 +1,157 @@
+"""
+Stored revenue forecasts
+
+A daily job builds the daily completed-revenue series for a chunk of owners
+with one GROUP BY query, fits Holt-Winters to the whole chunk in one
+vectorised pass (utils/forecasting.py) and replaces those owners' stored
+forecasts. The forecast endpoint reads the stored row; an owner without a
+current forecast (new, or no revenue when the job last ran) is fitted on
+demand and stored the same way.
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import and_, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Payment, RevenueForecastSnapshot
+from utils.db_helpers import insert_ignore_conflicts
+from utils.forecasting import DAMPING, holt_winters
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _as_date(value) -> date:
+    # func.date() comes back as a date on PostgreSQL and a string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _history_window(as_of: date, history_days: int):
+    start = as_of - timedelta(days=history_days - 1)
+    return start, datetime.combine(start, datetime.min.time()), datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+
+
+async def load_daily_revenue(db: AsyncSession, owner_ids: Sequence[int], as_of: date,
+                             history_days: int) -> np.ndarray:
+    """(owners, days) matrix of completed revenue, zero-filled, oldest day first"""
+    start, start_at, end_at = _history_window(as_of, history_days)
+    matrix = np.zeros((len(owner_ids), history_days))
+    if not owner_ids:
+        return matrix
+    row_of = {owner_id: i for i, owner_id in enumerate(owner_ids)}
+    day = func.date(Payment.created_at)
+    result = await db.execute(
+        select(Payment.owner_id, day.label("day"), func.sum(Payment.amount).label("revenue"))
+        .filter(and_(
+            Payment.owner_id.in_(list(owner_ids)),
+            Payment.status == "completed",
+            Payment.created_at >= start_at,
+            Payment.created_at < end_at,
+        ))
+        .group_by(Payment.owner_id, day)
+    )
+    rows = result.all()
+    if rows:
+        owners = np.fromiter((row_of[row.owner_id] for row in rows), dtype=np.int64, count=len(rows))
+        days = np.fromiter(((_as_date(row.day) - start).days for row in rows), dtype=np.int64, count=len(rows))
+        revenue = np.fromiter((float(row.revenue or 0) for row in rows), dtype=np.float64, count=len(rows))
+        np.add.at(matrix, (owners, days), revenue)
+    return matrix
+
+
+def _snapshots(owner_ids: Sequence[int], history: np.ndarray, as_of: date, horizon: int,
+               interval_level: float) -> List[Dict[str, Any]]:
+    result = holt_winters(history, horizon, interval_level=interval_level)
+    dates = [(as_of + timedelta(days=h)).isoformat() for h in range(1, horizon + 1)]
+
+    # Next week's forecast against the last observed week
+    recent = history[:, -7:].sum(axis=1)
+    upcoming = result.forecast[:, :7].sum(axis=1)
+    trends = np.where(upcoming > recent * 1.1, "increasing", np.where(upcoming < recent * 0.9, "decreasing", "stable"))
+
+    forecast = np.round(result.forecast, 2).tolist()
+    lower = np.round(result.lower, 2).tolist()
+    upper = np.round(result.upper, 2).tolist()
+    rows = []
+    for i, owner_id in enumerate(owner_ids):
+        alpha, beta, gamma = result.params[i].tolist()
+        rows.append({
+            "owner_id": owner_id,
+            "as_of": as_of,
+            "horizon_days": horizon,
+            "interval_level": interval_level,
+            "points": [list(point) for point in zip(dates, forecast[i], lower[i], upper[i])],
+            "trend": str(trends[i]),
+            "model_params": {"alpha": alpha, "beta": beta, "gamma": gamma, "phi": DAMPING,
+                             "rmse": round(float(result.rmse[i]), 4)},
+            "generated_at": datetime.utcnow(),
+        })
+    return rows
+
+
+async def _store(db: AsyncSession, rows: List[Dict[str, Any]]):
+    table = RevenueForecastSnapshot.__table__
+    await db.execute(delete(table).where(table.c.owner_id.in_([row["owner_id"] for row in rows])))
+    # A concurrent on-demand fit of the same owner may have stored it first
+    await db.execute(insert_ignore_conflicts(table, ["owner_id"]), rows)
+    await db.commit()
+
+
+async def forecast_owners(db: AsyncSession, owner_ids: Sequence[int], as_of: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Fit and store forecasts for the given owners in one pass"""
+    as_of = as_of or (datetime.utcnow().date() - timedelta(days=1))  # Today is still incomplete
+    history = await load_daily_revenue(db, owner_ids, as_of, settings.FORECAST_HISTORY_DAYS)
+    rows = _snapshots(owner_ids, history, as_of, settings.FORECAST_HORIZON_DAYS, settings.FORECAST_INTERVAL_LEVEL)
+    await _store(db, rows)
+    return rows
+
+
+async def refresh_all_forecasts(db: AsyncSession, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Forecast every owner with revenue in the history window, a chunk of owners at a time"""
+    batch_size = batch_size or settings.FORECAST_BATCH_SIZE
+    as_of = datetime.utcnow().date() - timedelta(days=1)
+    _, start_at, end_at = _history_window(as_of, settings.FORECAST_HISTORY_DAYS)
+    owners = 0
+    last_owner_id = 0
+    while True:
+        owner_ids = (await db.execute(
+            select(Payment.owner_id)
+            .filter(and_(
+                Payment.status == "completed",
+                Payment.created_at >= start_at,
+                Payment.created_at < end_at,
+                Payment.owner_id > last_owner_id,
+            ))
+            .group_by(Payment.owner_id)
+            .order_by(Payment.owner_id)
+            .limit(batch_size)
+        )).scalars().all()
+        if not owner_ids:
+            break
+        last_owner_id = owner_ids[-1]
+        await forecast_owners(db, owner_ids, as_of)
+        owners += len(owner_ids)
+        if len(owner_ids) < batch_size:
+            break
+
+    # Owners whose revenue dried up keep no stale forecast; they are refitted on request
+    table = RevenueForecastSnapshot.__table__
+    await db.execute(delete(table).where(table.c.as_of < as_of))
+    await db.commit()
+    logger.info(f"Refreshed revenue forecasts for {owners} owners as of {as_of}")
+    return {"as_of": as_of.isoformat(), "owners": owners}
+
+
+async def get_forecast(db: AsyncSession, owner_id: int) -> Dict[str, Any]:
+    """The owner's stored forecast, fitted on the spot when there is no current one"""
+    as_of = datetime.utcnow().date() - timedelta(days=1)
+    snapshot = await db.get(RevenueForecastSnapshot, owner_id)
+    if snapshot is not None and snapshot.as_of >= as_of:
+        return {
+            "as_of": snapshot.as_of, "points": snapshot.points, "trend": snapshot.trend,
+            "interval_level": snapshot.interval_level, "model_params": snapshot.model_params,
+        }
+    row = (await forecast_owners(db, [owner_id], as_of))[0]
+    return {key: row[key] for key in ("as_of", "points", "trend", "interval_level", "model_params")}
@@ -0,0 +1,133 @@
+"""
+On-demand image variants (?w=&h=&fmt=) backed by an on-disk LRU cache
+
+Variants are keyed by the source's identity (its content hash for
+content-addressed blobs) plus the requested parameters, so a cached file
+never goes stale and can be served with a strong ETag and, for
+content-addressed sources, immutable cache headers. Generation runs in the
+derivative process pool, limited by a semaphore, and concurrent requests
+for the same missing variant share one render.
+"""
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+from fastapi import HTTPException, status
+from config.settings import settings
+from utils.derivatives import FORMAT_SPECS, render_variant, supported_formats
+from utils.disk_cache import DiskLRUCache
+from utils.file_delivery import SHA256_NAME_PATTERN, make_etag
+from . import derivative_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when rendering changes so old cache entries are no longer addressed
+VARIANT_VERSION = 1
+
+FORMAT_MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+_cache: Optional[DiskLRUCache] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def get_variant_cache() -> DiskLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskLRUCache(Path(settings.UPLOAD_DIR) / ".cache" / "variants", settings.IMAGE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.IMAGE_RESIZE_CONCURRENCY)
+    return _semaphore
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Use the requested format, or the best one the client advertises in Accept"""
+    formats = supported_formats()
+    if requested:
+        requested = "jpeg" if requested == "jpg" else requested
+        if requested not in formats:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported format: {requested}. Supported: {', '.join(formats)}"
+            )
+        return requested
+
+    accept = accept or ""
+    for fmt in ("avif", "webp"):
+        if fmt in formats and FORMAT_MEDIA_TYPES[fmt] in accept:
+            return fmt
+    return "jpeg"
+
+
+def is_immutable_source(source: Path) -> bool:
+    """Content-addressed files (and their derivatives) never change at a given URL"""
+    return bool(SHA256_NAME_PATTERN.match(source.name.split(".")[0].split("_")[0]))
+
+
+def variant_key(source: Path, width: Optional[int], height: Optional[int], fmt: str, fit: str) -> str:
+    source_etag = make_etag(source, source.stat())
+    raw = f"{VARIANT_VERSION}|{source_etag}|{width or 0}|{height or 0}|{fmt}|{fit}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _render_into_cache(cache: DiskLRUCache, key: str, source: Path, width: Optional[int],
+                       height: Optional[int], fmt: str, fit: str) -> Path:
+    pool = derivative_service.get_process_pool()
+
+    def write(temp_path: Path):
+        args = (str(source), str(temp_path), width, height, fmt, fit == "cover")
+        if pool is None:
+            render_variant(*args)
+        else:
+            pool.submit(render_variant, *args).result()
+
+    return cache.put(key, FORMAT_SPECS[fmt][1], write)
+
+
+async def get_variant(source: Path, width: Optional[int], height: Optional[int],
+                      fmt: str, fit: str = "contain") -> Path:
+    """Return the cached variant file, rendering it first if needed"""
+    cache = get_variant_cache()
+    key = variant_key(source, width, height, fmt, fit)
+    suffix = FORMAT_SPECS[fmt][1]
+
+    cached = cache.get(key, suffix)
+    if cached:
+        return cached
+
+    pending = _in_flight.get(key)
+    if pending:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise  # This request was cancelled
+            # The rendering request was cancelled; take over
+            return await get_variant(source, width, height, fmt, fit)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        async with _get_semaphore():
+            path = await asyncio.to_thread(_render_into_cache, cache, key, source, width, height, fmt, fit)
+        future.set_result(path)
+        return path
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark retrieved when no other request is waiting
+        raise
+    finally:
+        if not future.done():
+            future.cancel()  # Cancelled mid-render; waiters must not hang on it
+        _in_flight.pop(key, None)
@@ -0,0 +1,225 @@
+"""
+Invoice PDFs, rendered once and served from an on-disk cache
+
+A PDF is keyed by the invoice id and its version (the template version plus
+the invoice's last modification time), so a status change such as
+pending -> paid addresses a new file and stale PDFs simply age out of the
+LRU cache. The cache file name is a content-independent hash, which
+file_delivery turns into a strong ETag for conditional and Range requests.
+
+Rendering runs in the derivative process pool. Downloads render on first
+request (concurrent requests for the same invoice share one render), and
+render_invoices_for_period pre-renders a whole billing period in batches
+so month-end downloads are served straight from disk.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import BillingInfo, Invoice, User
+from utils.disk_cache import DiskLRUCache
+from utils.invoice_pdf import TEMPLATE_VERSION, render_invoice_batch, render_invoice_pdf
+from . import derivative_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".pdf"
+
+_cache: Optional[DiskLRUCache] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def get_invoice_cache() -> DiskLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskLRUCache(Path(settings.UPLOAD_DIR) / ".cache" / "invoices", settings.INVOICE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.INVOICE_RENDER_CONCURRENCY)
+    return _semaphore
+
+
+def invoice_version(updated_at: Optional[datetime], created_at: Optional[datetime]) -> str:
+    changed = updated_at or created_at
+    return f"{TEMPLATE_VERSION}.{changed.replace(tzinfo=None).isoformat() if changed else 0}"
+
+
+def invoice_cache_key(invoice_id: int, version: str) -> str:
+    return hashlib.sha256(f"invoice|{invoice_id}|{version}".encode()).hexdigest()
+
+
+def _format_date(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime("%d %b %Y") if value else None
+
+
+async def _load_contexts(db: AsyncSession, invoices: List[Any]) -> Dict[int, Dict[str, Any]]:
+    """Template contexts for a batch of invoice rows, with two extra queries in total"""
+    user_ids = list({invoice.user_id for invoice in invoices if invoice.user_id})
+    users = {}
+    billing = {}
+    if user_ids:
+        users = {row.id: row for row in (await db.execute(
+            select(User.id, User.email, User.full_name).filter(User.id.in_(user_ids))
+        )).all()}
+        billing = {row.user_id: row for row in (await db.execute(
+            select(BillingInfo).filter(BillingInfo.user_id.in_(user_ids))
+        )).scalars().all()}
+
+    contexts = {}
+    for invoice in invoices:
+        user = users.get(invoice.user_id)
+        info = billing.get(invoice.user_id)
+        if info is not None:
+            name = " ".join(part for part in (info.first_name, info.last_name) if part)
+            bill_to = [
+                name or (user.full_name if user else None), info.company,
+                info.address_line_1, info.address_line_2,
+                ", ".join(part for part in (info.city, info.state, info.postal_code) if part),
+                info.country, user.email if user else None,
+            ]
+        else:
+            bill_to = [user.full_name, user.email] if user else []
+        contexts[invoice.id] = {
+            "id": invoice.id,
+            "invoice_number": invoice.invoice_number,
+            "status": invoice.status,
+            "amount": invoice.amount,
+            "currency": invoice.currency,
+            "description": invoice.description,
+            "issued_at": _format_date(invoice.created_at),
+            "due_date": _format_date(invoice.due_date),
+            "paid_at": _format_date(invoice.paid_at),
+            "bill_to": [line for line in bill_to if line],
+            "seller": settings.INVOICE_SELLER_DETAILS,
+        }
+    return contexts
+
+
+def _render_into_cache(cache: DiskLRUCache, key: str, context: Dict[str, Any]) -> Path:
+    pool = derivative_service.get_process_pool()
+
+    def write(temp_path: Path):
+        if pool is None:
+            render_invoice_pdf(context, str(temp_path))
+        else:
+            pool.submit(render_invoice_pdf, context, str(temp_path)).result()
+
+    return cache.put(key, SUFFIX, write)
+
+
+async def get_invoice_pdf(db: AsyncSession, invoice: Invoice) -> Path:
+    """Return the cached PDF for an invoice, rendering it first if needed"""
+    cache = get_invoice_cache()
+    key = invoice_cache_key(invoice.id, invoice_version(invoice.updated_at, invoice.created_at))
+
+    cached = cache.get(key, SUFFIX)
+    if cached:
+        return cached
+
+    pending = _in_flight.get(key)
+    if pending:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise  # This request was cancelled
+            # The rendering request was cancelled; take over
+            return await get_invoice_pdf(db, invoice)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        context = (await _load_contexts(db, [invoice]))[invoice.id]
+        async with _get_semaphore():
+            path = await asyncio.to_thread(_render_into_cache, cache, key, context)
+        future.set_result(path)
+        return path
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark retrieved when no other request is waiting
+        raise
+    finally:
+        if not future.done():
+            future.cancel()  # Cancelled mid-render; waiters must not hang on it
+        _in_flight.pop(key, None)
+
+
+def _render_batch_into_cache(cache: DiskLRUCache, keyed_contexts: List[tuple]) -> List[Dict[str, Any]]:
+    """Render many invoices across the pool, then move each finished file into the cache"""
+    staging = cache.root / ".staging"
+    staging.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for key, context in keyed_contexts:
+        # The prefix keeps half-written files out of the cache's size accounting
+        fd, temp_name = tempfile.mkstemp(dir=staging, prefix=".entry_", suffix=SUFFIX)
+        os.close(fd)
+        jobs.append({"key": key, "context": context, "output_path": temp_name})
+
+    results = derivative_service.map_batches(render_invoice_batch, jobs)
+
+    for job, result in zip(jobs, results):
+        if "error" in result:
+            try:
+                os.unlink(job["output_path"])
+            except FileNotFoundError:
+                pass
+            continue
+        cache.put(job["key"], SUFFIX, lambda temp_path, rendered=job["output_path"]: os.replace(rendered, temp_path))
+    return results
+
+
+async def render_invoices_for_period(db: AsyncSession, start: datetime, end: datetime,
+                                     page_size: Optional[int] = None) -> Dict[str, Any]:
+    """Pre-render every invoice issued in [start, end) that is not cached yet"""
+    page_size = page_size or settings.INVOICE_RENDER_BATCH_SIZE
+    cache = get_invoice_cache()
+    scanned = rendered = failed = 0
+    last_id = 0
+    while True:
+        invoices = (await db.execute(
+            select(
+                Invoice.id, Invoice.user_id, Invoice.invoice_number, Invoice.status, Invoice.amount,
+                Invoice.currency, Invoice.description, Invoice.due_date, Invoice.paid_at,
+                Invoice.created_at, Invoice.updated_at,
+            )
+            .filter(and_(Invoice.created_at >= start, Invoice.created_at < end, Invoice.id > last_id))
+            .order_by(Invoice.id)
+            .limit(page_size)
+        )).all()
+        if not invoices:
+            break
+        last_id = invoices[-1].id
+        scanned += len(invoices)
+
+        missing = []
+        for invoice in invoices:
+            key = invoice_cache_key(invoice.id, invoice_version(invoice.updated_at, invoice.created_at))
+            if not cache.path_for(key, SUFFIX).exists():
+                missing.append((key, invoice))
+        if missing:
+            contexts = await _load_contexts(db, [invoice for _, invoice in missing])
+            results = await asyncio.to_thread(
+                _render_batch_into_cache, cache, [(key, contexts[invoice.id]) for key, invoice in missing]
+            )
+            failures = sum(1 for result in results if "error" in result)
+            failed += failures
+            rendered += len(results) - failures
+        if len(invoices) < page_size:
+            break
+
+    logger.info(f"Invoice PDFs for {start:%Y-%m-%d}..{end:%Y-%m-%d}: {scanned} invoices, "
+                f"{rendered} rendered, {failed} failed")
+    return {"scanned": scanned, "rendered": rendered, "cached": scanned - rendered - failed, "failed": failed}
@@ -7,6 +7,7 @@ from schemas.marketing_schemas import (
     DiscountCodeCreate, AffiliateCreate, AffiliateReferralCreate, 
     MarketingCampaignCreate, EmailListCreate, EmailSubscriberCreate
 )
+from . import coupon_service
 
 
 # Discount Code Services
@@ -16,18 +17,13 @@ async def get_discount_code_by_code(db: AsyncSession, code: str) -> Optional[Dis
 
 
 async def is_discount_code_valid(db: AsyncSession, code: str) -> bool:
-    discount_code = await get_discount_code_by_code(db, code)
-    if not discount_code:
-        return False
-    if not discount_code.is_active:
-        return False
-    if discount_code.valid_from > datetime.utcnow():
-        return False
-    if discount_code.valid_until < datetime.utcnow():
-        return False
-    if discount_code.usage_limit and discount_code.used_count >= discount_code.usage_limit:
-        return False
-    return True
+    # Validation only; served from a short-lived cache of the code's metadata
+    return await coupon_service.validate_code(db, DiscountCode, code) is not None
+
+
+async def redeem_discount_code(db: AsyncSession, code: str, commit: bool = True) -> Optional[dict]:
+    """Atomically use up one redemption; None if the code can't be redeemed"""
+    return await coupon_service.redeem_code(db, DiscountCode, code, commit=commit)
 
 
 async def create_discount_code(db: AsyncSession, discount_code: DiscountCodeCreate) -> DiscountCode:
@@ -35,6 +31,8 @@ async def create_discount_code(db: AsyncSession, discount_code: DiscountCodeCrea
     db.add(db_discount_code)
     await db.commit()
     await db.refresh(db_discount_code)
+    # Drop any cached "unknown code" entry
+    await coupon_service.invalidate_code(DiscountCode, db_discount_code.code)
     return db_discount_code
 
 
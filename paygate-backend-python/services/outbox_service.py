@@ -0,0 +1,201 @@
+"""
+Transactional outbox for side effects of database changes
+
+Services call enqueue_event() inside the same transaction as the change
+(a payment, a status update) and notify_relay() after committing. The
+relay, a background task in each API process, claims pending events in
+batches under a lease, hands each topic's batch to its handler (Celery
+publish, realtime bus) off the request path and marks them dispatched.
+Failed events are retried with exponential backoff; events whose relay died
+mid-batch are picked up again when the lease expires. Delivery is
+therefore at-least-once and never lost with the request.
+"""
+import asyncio
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import OutboxEvent
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60
+RETENTION = timedelta(days=7)
+
+Handler = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+_handlers: Dict[str, Handler] = {}
+_wakeup: Optional[asyncio.Event] = None
+
+
+def outbox_handler(topic: str):
+    """Register the coroutine that delivers a batch of payloads for a topic"""
+    def register(func: Handler) -> Handler:
+        _handlers[topic] = func
+        return func
+    return register
+
+
+def enqueue_event(db: AsyncSession, topic: str, payload: Dict[str, Any],
+                  aggregate_type: Optional[str] = None, aggregate_id: Optional[int] = None) -> OutboxEvent:
+    """Add an event to the caller's transaction; it is only visible once they commit"""
+    event = OutboxEvent(topic=topic, payload=payload, aggregate_type=aggregate_type, aggregate_id=aggregate_id)
+    db.add(event)
+    return event
+
+
+def notify_relay():
+    """Wake this process's relay so freshly committed events go out without waiting for the poll"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def claim_batch(db: AsyncSession, batch_size: int) -> List[OutboxEvent]:
+    """
+    Lease up to batch_size due events. The conditional UPDATE re-checks the
+    lease per row, so concurrent relays never claim the same event.
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    due = (
+        select(OutboxEvent.id)
+        .filter(and_(
+            OutboxEvent.status == "pending",
+            OutboxEvent.available_at <= now,
+            or_(OutboxEvent.claimed_until.is_(None), OutboxEvent.claimed_until < now),
+        ))
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+    )
+    await db.execute(
+        update(OutboxEvent)
+        .where(and_(
+            OutboxEvent.id.in_(due.scalar_subquery()),
+            or_(OutboxEvent.claimed_until.is_(None), OutboxEvent.claimed_until < now),
+        ))
+        .values(claim_token=token, claimed_until=now + timedelta(seconds=LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    result = await db.execute(
+        select(OutboxEvent).filter(OutboxEvent.claim_token == token).order_by(OutboxEvent.id)
+    )
+    return result.scalars().all()
+
+
+async def relay_once(db: AsyncSession, batch_size: Optional[int] = None) -> int:
+    """Deliver one batch; returns the number of events claimed"""
+    events = await claim_batch(db, batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not events:
+        return 0
+
+    by_topic: Dict[str, List[OutboxEvent]] = defaultdict(list)
+    for event in events:
+        by_topic[event.topic].append(event)
+
+    now = datetime.utcnow()
+    outcomes = []
+    for topic, topic_events in by_topic.items():
+        handler = _handlers.get(topic)
+        try:
+            if handler is None:
+                raise LookupError(f"No outbox handler registered for topic {topic}")
+            await handler([event.payload for event in topic_events])
+            outcomes.extend(
+                {"id": event.id, "status": "dispatched", "dispatched_at": now,
+                 "claim_token": None, "claimed_until": None, "last_error": None}
+                for event in topic_events
+            )
+        except Exception as e:
+            logger.error(f"Outbox delivery for {topic} failed ({len(topic_events)} events): {str(e)}")
+            for event in topic_events:
+                attempts = event.attempts + 1
+                outcomes.append({
+                    "id": event.id,
+                    "status": "failed" if attempts >= settings.OUTBOX_MAX_ATTEMPTS else "pending",
+                    "attempts": attempts,
+                    "available_at": now + timedelta(seconds=min(2 ** attempts, 3600)),
+                    "claim_token": None,
+                    "claimed_until": None,
+                    "last_error": str(e)[:1000],
+                })
+
+    # Bulk UPDATE by primary key, grouped by the set of columns being written
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for outcome in outcomes:
+        groups[tuple(sorted(outcome))].append(outcome)
+    for rows in groups.values():
+        await db.execute(update(OutboxEvent), rows)
+    await db.commit()
+    return len(events)
+
+
+async def purge_dispatched(db: AsyncSession, older_than: timedelta = RETENTION) -> int:
+    result = await db.execute(
+        delete(OutboxEvent).where(and_(
+            OutboxEvent.status == "dispatched",
+            OutboxEvent.dispatched_at < datetime.utcnow() - older_than,
+        ))
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+
+async def run_relay(session_factory, poll_interval: Optional[float] = None):
+    """
+    Background loop: drain full batches back to back, otherwise sleep until
+    notified or the poll interval elapses. Cancel the task to stop it.
+    """
+    global _wakeup
+    _wakeup = asyncio.Event()
+    poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+    batch_size = settings.OUTBOX_BATCH_SIZE
+    last_purge = datetime.utcnow()
+
+    while True:
+        try:
+            async with session_factory() as db:
+                claimed = await relay_once(db, batch_size)
+                if datetime.utcnow() - last_purge > timedelta(hours=1):
+                    await purge_dispatched(db)
+                    last_purge = datetime.utcnow()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Outbox relay error: {str(e)}")
+            claimed = 0
+
+        if claimed >= batch_size:
+            continue
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+# Topic handlers
+
+@outbox_handler("email.payment_confirmation")
+async def _publish_payment_confirmations(payloads: List[Dict[str, Any]]):
+    from tasks.email import send_payment_confirmation_email
+
+    def publish():
+        # Broker round-trips stay off the event loop
+        for payload in payloads:
+            send_payment_confirmation_email.delay(payload["customer_email"], payload["payment_details"])
+
+    await asyncio.to_thread(publish)
+
+
+@outbox_handler("realtime.analytics")
+async def _publish_realtime_events(payloads: List[Dict[str, Any]]):
+    from .analytics_service import trigger_realtime_analytics_update
+
+    for payload in payloads:
+        await trigger_realtime_analytics_update(payload["event_type"], payload["data"], payload.get("owner_id"))
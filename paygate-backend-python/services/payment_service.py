@@ -6,6 +6,7 @@ from datetime import datetime
 import uuid
 from models import Payment, User, Paywall
 from schemas.payment import PaymentCreate, PaymentUpdate
+from . import outbox_service
 
 
 async def get_payment_by_reference(db: AsyncSession, reference: str) -> Optional[Payment]:
@@ -53,23 +54,23 @@ async def create_payment(db: AsyncSession, payment: PaymentCreate) -> Payment:
         owner_id=payment.owner_id
     )
     db.add(db_payment)
-    await db.commit()
-    await db.refresh(db_payment)
-    
-    # Trigger payment confirmation email in background
-    from tasks.email import send_payment_confirmation_email
-    payment_details = {
-        "amount": payment.amount,
-        "currency": payment.currency,
-        "reference": payment.reference,
-        "date": datetime.utcnow().isoformat()
-    }
-    send_payment_confirmation_email.delay(payment.customer_email, payment_details)
-    
-    # Trigger real-time analytics event for new payment
-    try:
-        from .analytics_service import trigger_realtime_analytics_update
-        analytics_data = {
+    await db.flush()
+
+    # Side effects are recorded in the same transaction and delivered by the
+    # outbox relay, so they are neither lost nor sent for a rolled-back payment
+    outbox_service.enqueue_event(db, "email.payment_confirmation", {
+        "customer_email": payment.customer_email,
+        "payment_details": {
+            "amount": payment.amount,
+            "currency": payment.currency,
+            "reference": payment.reference,
+            "date": datetime.utcnow().isoformat()
+        }
+    }, aggregate_type="payment", aggregate_id=db_payment.id)
+    outbox_service.enqueue_event(db, "realtime.analytics", {
+        "event_type": "new_sale",
+        "owner_id": payment.owner_id,
+        "data": {
             "payment_id": db_payment.id,
             "amount": payment.amount,
             "currency": payment.currency,
@@ -77,11 +78,11 @@ async def create_payment(db: AsyncSession, payment: PaymentCreate) -> Payment:
             "customer_email": payment.customer_email,
             "status": payment.status
         }
-        await trigger_realtime_analytics_update("new_sale", analytics_data, payment.owner_id)
-    except Exception as e:
-        # Log error but don't fail the payment creation if analytics broadcast fails
-        import logging
-        logging.error(f"Failed to broadcast analytics event: {str(e)}")
+    }, aggregate_type="payment", aggregate_id=db_payment.id)
+
+    await db.commit()
+    await db.refresh(db_payment)
+    outbox_service.notify_relay()
     
     return db_payment
 
@@ -97,14 +98,13 @@ async def update_payment_status(db: AsyncSession, reference: str, status: str, g
         db_payment.gateway_response = gateway_response
     
     db_payment.updated_at = datetime.utcnow()
-    await db.commit()
-    await db.refresh(db_payment)
-    
-    # Trigger real-time analytics event if payment status changes significantly
-    try:
-        from .analytics_service import trigger_realtime_analytics_update
-        if old_status != status and db_payment.owner_id:  # Only if there was a change and we have an owner
-            analytics_data = {
+
+    # Real-time analytics event if the status changed and we have an owner
+    if old_status != status and db_payment.owner_id:
+        outbox_service.enqueue_event(db, "realtime.analytics", {
+            "event_type": "payment_status_updated",
+            "owner_id": db_payment.owner_id,
+            "data": {
                 "payment_id": db_payment.id,
                 "reference": reference,
                 "old_status": old_status,
@@ -113,11 +113,11 @@ async def update_payment_status(db: AsyncSession, reference: str, status: str, g
                 "customer_email": db_payment.customer_email,
                 "paywall_id": db_payment.paywall_id
             }
-            await trigger_realtime_analytics_update("payment_status_updated", analytics_data, db_payment.owner_id)
-    except Exception as e:
-        # Log error but don't fail the payment update if analytics broadcast fails
-        import logging
-        logging.error(f"Failed to broadcast analytics event: {str(e)}")
+        }, aggregate_type="payment", aggregate_id=db_payment.id)
+
+    await db.commit()
+    await db.refresh(db_payment)
+    outbox_service.notify_relay()
     
     return db_payment
 
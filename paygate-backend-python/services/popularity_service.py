@@ -0,0 +1,174 @@
+"""
+Time-decayed content popularity
+
+A content item's score is the sum of its weighted events, each decayed
+exponentially with its age:
+
+    score(T) = sum_e weight(e) * 0.5 ** ((T - day(e)) / POPULARITY_HALF_LIFE_DAYS)
+
+which can be maintained incrementally: moving from day T to day T' only
+multiplies every stored score by 0.5 ** ((T' - T) / half_life) and adds the
+events of the days in between. Events come from the daily access
+aggregates (content_access_daily) and paid access grants; client-reported
+"purchase" events are not trusted and weigh nothing, the grant created by
+the payment webhook counts instead.
+
+Only settled days are folded in for good (settled_score). A day's
+aggregates can still change after it ends: it may be compacted after the
+refresh ran, or rebuilt to pick up late events. So the last
+POPULARITY_REFOLD_DAYS days, and any day not compacted yet, are re-read on
+every refresh and added on top of the settled score.
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+from sqlalchemy import and_, case, delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Content, ContentAccess, ContentAccessDaily, ContentPopularity
+from utils.db_helpers import dialect_insert
+from .access_event_service import EVENT_TYPES
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_WEIGHTS = {"view": 1.0, "preview": 0.5, "download": 2.0, "share": 3.0, "purchase": 0.0}
+
+# Scores that decayed below this are removed; the content drops out of rankings
+MIN_SCORE = 0.01
+
+
+def decay(days: float) -> float:
+    return 0.5 ** (days / settings.POPULARITY_HALF_LIFE_DAYS)
+
+
+async def _day_contributions(db: AsyncSession, day: date, multiplier: float,
+                             scores: Dict[int, list]):
+    """Add one day's weighted events, scaled by multiplier, into scores {content_id: [owner_id, score]}"""
+    weight = case(
+        *[(ContentAccessDaily.event_type == EVENT_TYPES[name], value) for name, value in EVENT_WEIGHTS.items()],
+        else_=0.0,
+    )
+    events = (await db.execute(
+        select(ContentAccessDaily.content_id, Content.owner_id, func.sum(ContentAccessDaily.events * weight))
+        .join(Content, Content.id == ContentAccessDaily.content_id)
+        .filter(ContentAccessDaily.day == day)
+        .group_by(ContentAccessDaily.content_id, Content.owner_id)
+    )).all()
+
+    start = datetime.combine(day, datetime.min.time())
+    purchases = (await db.execute(
+        select(ContentAccess.content_id, Content.owner_id, func.count())
+        .join(Content, Content.id == ContentAccess.content_id)
+        .filter(and_(
+            ContentAccess.granted_by == "payment",
+            ContentAccess.granted_at >= start,
+            ContentAccess.granted_at < start + timedelta(days=1),
+        ))
+        .group_by(ContentAccess.content_id, Content.owner_id)
+    )).all()
+
+    for rows, unit in ((events, 1.0), (purchases, settings.POPULARITY_PURCHASE_WEIGHT)):
+        for content_id, owner_id, value in rows:
+            entry = scores.setdefault(content_id, [owner_id, 0.0])
+            entry[1] += float(value or 0) * unit * multiplier
+
+
+async def refresh_popularity(db: AsyncSession, today: Optional[date] = None,
+                             batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Bring every score forward to yesterday: fold the days that have settled
+    since the last refresh into the settled scores, then re-read the
+    unsettled days on top of them
+    """
+    today = today or datetime.utcnow().date()
+    as_of = today - timedelta(days=1)
+    table = ContentPopularity.__table__
+
+    last_settled = (await db.execute(select(func.max(table.c.settled_as_of)))).scalar()
+    last_compacted = (await db.execute(select(func.max(ContentAccessDaily.day)))).scalar()
+    if isinstance(last_settled, str):
+        last_settled = date.fromisoformat(last_settled)
+    if isinstance(last_compacted, str):
+        last_compacted = date.fromisoformat(last_compacted)
+
+    # A day settles once it is out of the re-read window and has been compacted
+    settled_to = as_of - timedelta(days=settings.POPULARITY_REFOLD_DAYS)
+    if last_compacted is not None:
+        settled_to = min(settled_to, last_compacted)
+    if last_settled is not None:
+        settled_to = max(settled_to, last_settled)
+        first_day = last_settled + timedelta(days=1)
+    else:
+        # From scratch, days older than ~10 half-lives contribute under 0.1%
+        first_day = as_of - timedelta(days=int(settings.POPULARITY_HALF_LIFE_DAYS * 10))
+        settled_to = max(settled_to, first_day - timedelta(days=1))
+
+    settled: Dict[int, list] = {}
+    day = first_day
+    while day <= settled_to:
+        await _day_contributions(db, day, decay((settled_to - day).days), settled)
+        day += timedelta(days=1)
+    recent: Dict[int, list] = {}
+    day = settled_to + timedelta(days=1)
+    while day <= as_of:
+        await _day_contributions(db, day, decay((as_of - day).days), recent)
+        day += timedelta(days=1)
+
+    # Drops the previous unsettled days; they are re-added from `recent` below
+    settled_decay = decay((settled_to - last_settled).days) if last_settled is not None else 0.0
+    recent_decay = decay((as_of - settled_to).days)
+    await db.execute(update(table).values(
+        settled_score=table.c.settled_score * settled_decay,
+        score=table.c.settled_score * (settled_decay * recent_decay),
+        settled_as_of=settled_to,
+        as_of=as_of,
+    ))
+
+    rows = []
+    for content_id in settled.keys() | recent.keys():
+        owner_id, settled_score = settled.get(content_id) or recent[content_id]
+        settled_score = settled_score if content_id in settled else 0.0
+        recent_score = recent[content_id][1] if content_id in recent else 0.0
+        score = settled_score * recent_decay + recent_score
+        if score > 0:
+            rows.append({"content_id": content_id, "owner_id": owner_id, "score": score,
+                         "settled_score": settled_score, "as_of": as_of, "settled_as_of": settled_to})
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["content_id"],
+        set_={"score": table.c.score + statement.excluded.score,
+              "settled_score": table.c.settled_score + statement.excluded.settled_score,
+              "as_of": statement.excluded.as_of, "settled_as_of": statement.excluded.settled_as_of,
+              "owner_id": statement.excluded.owner_id, "updated_at": func.now()},
+    )
+    for start in range(0, len(rows), batch_size):
+        await db.execute(statement, rows[start:start + batch_size])
+    await db.execute(delete(table).where(table.c.score < MIN_SCORE))
+    await db.commit()
+
+    days = (as_of - first_day).days + 1
+    logger.info(f"Content popularity as of {as_of} (settled to {settled_to}): "
+                f"{days} days read, {len(rows)} items with activity")
+    return {"as_of": as_of.isoformat(), "settled_as_of": settled_to.isoformat(), "days": days, "updated": len(rows)}
+
+
+async def top_content(db: AsyncSession, owner_id: int, limit: int):
+    """The owner's highest-scoring content, newest first among unscored items to fill the list"""
+    ranked = (await db.execute(
+        select(Content, ContentPopularity.score)
+        .join(ContentPopularity, ContentPopularity.content_id == Content.id)
+        .filter(ContentPopularity.owner_id == owner_id)
+        .order_by(ContentPopularity.score.desc(), Content.id)
+        .limit(limit)
+    )).all()
+    if len(ranked) < limit:
+        seen = [content.id for content, _ in ranked]
+        newest = (await db.execute(
+            select(Content)
+            .filter(Content.owner_id == owner_id, Content.id.notin_(seen))
+            .order_by(Content.created_at.desc())
+            .limit(limit - len(ranked))
+        )).scalars().all()
+        ranked.extend((content, 0.0) for content in newest)
+    return ranked
@@ -0,0 +1,184 @@
+"""
+Reconciliation of payments stuck in pending
+
+Pending payments older than a cut-off are streamed oldest first by keyset
+on (created_at, id), which idx_payment_status_created serves directly, one
+narrow page at a time. Each page is verified against the gateway under a
+semaphore. Outcomes are applied in bulk:
+- paid transactions become charge.success events in the webhook pipeline,
+  so conversions, customer stats and access grants are applied exactly as
+  for a webhook;
+- failed, reversed, unknown and long-abandoned transactions are moved with
+  one conditional UPDATE per target status.
+"""
+import asyncio
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Payment, WebhookEvent
+from utils.db_helpers import insert_ignore_conflicts
+from utils.paystack_client import CircuitOpenError, GatewayError, PaystackClient, get_paystack_client
+from .webhook_service import idempotency_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Gateway transaction status -> local payment status
+TERMINAL_STATUSES = {
+    "failed": "failed",
+    "reversed": "refunded",
+}
+# Customer has not paid (yet); only cancelled once the abandon window passes
+UNPAID_STATUSES = {"abandoned", "ongoing", "pending", "processing", "queued"}
+
+
+async def _verify_page(client: PaystackClient, rows: List[Tuple[int, str, datetime]],
+                       semaphore: asyncio.Semaphore) -> List[Tuple[int, str, datetime, Optional[Dict[str, Any]], Optional[GatewayError]]]:
+    async def verify(row):
+        payment_id, reference, created_at = row
+        async with semaphore:
+            try:
+                result = await client.verify_transaction(reference)
+                return payment_id, reference, created_at, result.get("data") or {}, None
+            except GatewayError as e:
+                return payment_id, reference, created_at, None, e
+
+    return await asyncio.gather(*(verify(row) for row in rows))
+
+
+def _classify(data: Optional[Dict[str, Any]], error: Optional[GatewayError], created_at: datetime,
+              abandon_before: datetime) -> str:
+    if error is not None:
+        # A 4xx for a reference means the gateway never saw the transaction
+        if error.status_code in (400, 404) and not error.retryable:
+            return "cancelled" if created_at < abandon_before else "pending"
+        return "error"
+    gateway_status = (data.get("status") or "").lower()
+    if gateway_status == "success":
+        return "completed"
+    if gateway_status in TERMINAL_STATUSES:
+        return TERMINAL_STATUSES[gateway_status]
+    if gateway_status in UNPAID_STATUSES and created_at < abandon_before:
+        return "cancelled"
+    return "pending"
+
+
+async def _apply_page(db: AsyncSession, outcomes: Dict[str, List[Tuple[int, Optional[Dict[str, Any]]]]]) -> Dict[str, int]:
+    applied: Dict[str, int] = {}
+    now = datetime.utcnow()
+
+    paid = outcomes.get("completed", [])
+    if paid:
+        # One executemany; a transaction already seen via webhook hits the key and is skipped
+        await db.execute(
+            insert_ignore_conflicts(WebhookEvent.__table__, ["idempotency_key"]),
+            [{
+                "provider": "paystack",
+                "idempotency_key": idempotency_key({"event": "charge.success", "data": data})[:255],
+                "event_type": "charge.success",
+                "reference": data.get("reference"),
+                "payload": {"event": "charge.success", "data": data},
+                "status": "received",
+                "attempts": 0,
+            } for _, data in paid]
+        )
+        applied["completed"] = len(paid)
+
+    for new_status in ("failed", "refunded", "cancelled"):
+        ids = [payment_id for payment_id, _ in outcomes.get(new_status, [])]
+        if not ids:
+            continue
+        # Conditional on still being pending, in case a webhook got there first
+        result = await db.execute(
+            update(Payment.__table__)
+            .where(and_(Payment.__table__.c.id.in_(ids), Payment.__table__.c.status == "pending"))
+            .values(status=new_status, updated_at=now)
+        )
+        applied[new_status] = result.rowcount or 0
+
+    await db.commit()
+    return applied
+
+
+async def reconcile_pending_payments(db: AsyncSession, older_than_minutes: Optional[int] = None,
+                                     page_size: Optional[int] = None, concurrency: Optional[int] = None,
+                                     client: Optional[PaystackClient] = None) -> Dict[str, Any]:
+    """Verify every pending payment older than the cut-off; returns a summary report"""
+    older_than_minutes = older_than_minutes or settings.RECONCILE_PENDING_AFTER_MINUTES
+    page_size = page_size or settings.RECONCILE_PAGE_SIZE
+    client = client or get_paystack_client()
+    semaphore = asyncio.Semaphore(concurrency or settings.RECONCILE_CONCURRENCY)
+
+    started = time.monotonic()
+    now = datetime.utcnow()
+    cutoff = now - timedelta(minutes=older_than_minutes)
+    abandon_before = now - timedelta(hours=settings.RECONCILE_ABANDON_AFTER_HOURS)
+
+    scanned = 0
+    classified: Counter = Counter()
+    applied: Counter = Counter()
+    error_samples: List[str] = []
+    aborted: Optional[str] = None
+    cursor: Optional[Tuple[datetime, int]] = None
+
+    while True:
+        query = (
+            select(Payment.id, Payment.reference, Payment.created_at)
+            .filter(Payment.status == "pending")
+            .filter(Payment.created_at < cutoff)
+        )
+        if cursor is not None:
+            query = query.filter(or_(
+                Payment.created_at > cursor[0],
+                and_(Payment.created_at == cursor[0], Payment.id > cursor[1]),
+            ))
+        rows = (await db.execute(query.order_by(Payment.created_at, Payment.id).limit(page_size))).all()
+        if not rows:
+            break
+        cursor = (rows[-1].created_at, rows[-1].id)
+        scanned += len(rows)
+
+        results = await _verify_page(client, rows, semaphore)
+        outcomes: Dict[str, List[Tuple[int, Optional[Dict[str, Any]]]]] = defaultdict(list)
+        circuit_open = False
+        for payment_id, reference, created_at, data, error in results:
+            outcome = _classify(data, error, created_at, abandon_before)
+            classified[outcome] += 1
+            outcomes[outcome].append((payment_id, data))
+            if outcome == "error":
+                circuit_open = circuit_open or isinstance(error, CircuitOpenError)
+                if len(error_samples) < 10:
+                    error_samples.append(f"{reference}: {error}")
+
+        applied.update(await _apply_page(db, outcomes))
+
+        if circuit_open:
+            # Hammering a gateway that is down only delays its recovery
+            aborted = "Payment gateway circuit open"
+            break
+        if len(rows) < page_size:
+            break
+
+    elapsed = time.monotonic() - started
+    report = {
+        "started_at": now.isoformat(),
+        "cutoff": cutoff.isoformat(),
+        "scanned": scanned,
+        "outcomes": dict(classified),
+        "applied": dict(applied),
+        "errors": classified.get("error", 0),
+        "error_samples": error_samples,
+        "aborted": aborted,
+        "duration_seconds": round(elapsed, 2),
+        "rows_per_second": round(scanned / elapsed, 1) if elapsed > 0 else None,
+    }
+    logger.info(
+        f"Reconciled {scanned} pending payments in {report['duration_seconds']}s: "
+        f"{dict(classified)}" + (f" (aborted: {aborted})" if aborted else "")
+    )
+    return report
@@ -0,0 +1,250 @@
+"""
+Nightly per-owner analytics reports
+
+Owners are taken in keyset-paginated chunks. Each chunk streams its rows
+(payments, and for the paywall report the paywalls) with server-side
+cursors and folds them into per-owner aggregates in a single pass, so memory
+is bounded by the chunk's aggregates rather than the period's rows. Up to
+REPORT_CONCURRENCY chunks run at once, each on its own session, and every
+chunk upserts its report rows so a rerun of a period replaces them.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import AnalyticsReport, Payment, Paywall
+from utils.db_helpers import dialect_insert
+import logging
+
+logger = logging.getLogger(__name__)
+
+DAILY = "daily"
+WEEKLY_PAYWALL_PERFORMANCE = "weekly_paywall_performance"
+
+TOP_PAYWALLS = 5
+
+
+def _bounds(start: date, end: date):
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+
+
+async def _store_reports(db: AsyncSession, report_type: str, start: date, end: date,
+                         reports: Dict[int, Dict[str, Any]]):
+    if not reports:
+        return
+    table = AnalyticsReport.__table__
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["owner_id", "report_type", "period_start"],
+        set_={"data": statement.excluded.data, "period_end": statement.excluded.period_end,
+              "generated_at": func.now()},
+    )
+    await db.execute(statement, [
+        {"owner_id": owner_id, "report_type": report_type, "period_start": start, "period_end": end, "data": data}
+        for owner_id, data in reports.items()
+    ])
+    await db.commit()
+
+
+async def _for_owner_chunks(session_factory, owner_query, chunk_handler: Callable[[AsyncSession, List[int]], Awaitable[int]],
+                            chunk_size: int, concurrency: int) -> Dict[str, int]:
+    """
+    Page through the owner ids selected by owner_query (a select of one
+    owner_id column) and run chunk_handler on each page, at most
+    `concurrency` pages at a time
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    owners = 0
+
+    async def run(owner_ids: List[int]) -> int:
+        try:
+            async with session_factory() as db:
+                return await chunk_handler(db, owner_ids)
+        finally:
+            semaphore.release()
+
+    async with session_factory() as db:
+        last_owner_id = 0
+        while True:
+            owner_ids = (await db.execute(
+                owner_query.filter(owner_query.selected_columns[0] > last_owner_id)
+                .group_by(owner_query.selected_columns[0])
+                .order_by(owner_query.selected_columns[0])
+                .limit(chunk_size)
+            )).scalars().all()
+            if not owner_ids:
+                break
+            last_owner_id = owner_ids[-1]
+            owners += len(owner_ids)
+            # Wait for a free slot before reading the next page
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run(owner_ids)))
+            if len(owner_ids) < chunk_size:
+                break
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        # Successful chunks are already stored; a retry rewrites every chunk
+        raise failures[0]
+    return {"owners": owners, "reports": sum(results)}
+
+
+def _new_daily() -> Dict[str, Any]:
+    return {
+        "revenue": 0.0, "payments": 0, "refunded_amount": 0.0,
+        "by_status": defaultdict(int), "revenue_by_currency": defaultdict(float),
+        "paywall_revenue": defaultdict(float), "customers": set(),
+    }
+
+
+def _finish_daily(aggregate: Dict[str, Any]) -> Dict[str, Any]:
+    completed = aggregate["by_status"].get("completed", 0)
+    top = sorted(aggregate["paywall_revenue"].items(), key=lambda item: item[1], reverse=True)[:TOP_PAYWALLS]
+    return {
+        "revenue": round(aggregate["revenue"], 2),
+        "payments": aggregate["payments"],
+        "completed_payments": completed,
+        "payments_by_status": dict(aggregate["by_status"]),
+        "refunded_amount": round(aggregate["refunded_amount"], 2),
+        "unique_customers": len(aggregate["customers"]),
+        "average_order_value": round(aggregate["revenue"] / completed, 2) if completed else 0.0,
+        "success_rate": round(completed / aggregate["payments"], 4) if aggregate["payments"] else 0.0,
+        "revenue_by_currency": {currency: round(amount, 2) for currency, amount in aggregate["revenue_by_currency"].items()},
+        "top_paywalls": [{"paywall_id": paywall_id, "revenue": round(amount, 2)} for paywall_id, amount in top],
+    }
+
+
+async def _daily_chunk(db: AsyncSession, owner_ids: List[int], day: date) -> int:
+    start_at, end_at = _bounds(day, day + timedelta(days=1))
+    aggregates: Dict[int, Dict[str, Any]] = defaultdict(_new_daily)
+    rows = await db.stream(
+        select(Payment.owner_id, Payment.paywall_id, Payment.amount, Payment.currency,
+               Payment.status, Payment.customer_email)
+        .filter(and_(Payment.owner_id.in_(owner_ids), Payment.created_at >= start_at, Payment.created_at < end_at))
+        .execution_options(yield_per=settings.REPORT_STREAM_BATCH_SIZE)
+    )
+    async for owner_id, paywall_id, amount, currency, status, customer_email in rows:
+        aggregate = aggregates[owner_id]
+        aggregate["payments"] += 1
+        aggregate["by_status"][status] += 1
+        if status == "completed":
+            amount = float(amount or 0)
+            aggregate["revenue"] += amount
+            aggregate["revenue_by_currency"][currency] += amount
+            aggregate["customers"].add(customer_email)
+            if paywall_id is not None:
+                aggregate["paywall_revenue"][paywall_id] += amount
+        elif status == "refunded":
+            aggregate["refunded_amount"] += float(amount or 0)
+
+    await _store_reports(db, DAILY, day, day + timedelta(days=1),
+                         {owner_id: _finish_daily(aggregate) for owner_id, aggregate in aggregates.items()})
+    return len(aggregates)
+
+
+async def generate_daily_reports(session_factory, day: date, chunk_size: Optional[int] = None,
+                                 concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Daily report for every owner with payments on the given day"""
+    start_at, end_at = _bounds(day, day + timedelta(days=1))
+    result = await _for_owner_chunks(
+        session_factory,
+        select(Payment.owner_id).filter(and_(
+            Payment.owner_id.isnot(None), Payment.created_at >= start_at, Payment.created_at < end_at,
+        )),
+        lambda db, owner_ids: _daily_chunk(db, owner_ids, day),
+        chunk_size or settings.REPORT_OWNER_CHUNK_SIZE,
+        concurrency or settings.REPORT_CONCURRENCY,
+    )
+    logger.info(f"Daily reports for {day}: {result['reports']} owners")
+    return {"day": day.isoformat(), **result}
+
+
+async def _weekly_paywall_chunk(db: AsyncSession, owner_ids: List[int], start: date, end: date) -> int:
+    start_at, end_at = _bounds(start, end)
+    paywalls: Dict[int, Dict[str, Any]] = {}
+    by_owner: Dict[int, List[int]] = defaultdict(list)
+    rows = await db.stream(
+        select(Paywall.id, Paywall.owner_id, Paywall.title, Paywall.status, Paywall.price, Paywall.currency)
+        .filter(Paywall.owner_id.in_(owner_ids))
+        .execution_options(yield_per=settings.REPORT_STREAM_BATCH_SIZE)
+    )
+    async for paywall_id, owner_id, title, status, price, currency in rows:
+        paywalls[paywall_id] = {
+            "paywall_id": paywall_id, "title": title, "status": status, "price": price, "currency": currency,
+            "revenue": 0.0, "sales": 0, "attempts": 0, "failed": 0, "customers": set(),
+        }
+        by_owner[owner_id].append(paywall_id)
+
+    rows = await db.stream(
+        select(Payment.paywall_id, Payment.amount, Payment.status, Payment.customer_email)
+        .filter(and_(Payment.owner_id.in_(owner_ids), Payment.paywall_id.isnot(None),
+                     Payment.created_at >= start_at, Payment.created_at < end_at))
+        .execution_options(yield_per=settings.REPORT_STREAM_BATCH_SIZE)
+    )
+    async for paywall_id, amount, status, customer_email in rows:
+        paywall = paywalls.get(paywall_id)
+        if paywall is None:
+            continue
+        paywall["attempts"] += 1
+        if status == "completed":
+            paywall["sales"] += 1
+            paywall["revenue"] += float(amount or 0)
+            paywall["customers"].add(customer_email)
+        elif status == "failed":
+            paywall["failed"] += 1
+
+    reports = {}
+    for owner_id, paywall_ids in by_owner.items():
+        entries = [paywalls[paywall_id] for paywall_id in paywall_ids]
+        total_revenue = sum(entry["revenue"] for entry in entries)
+        performance = []
+        for entry in sorted(entries, key=lambda e: (-e["revenue"], e["paywall_id"])):
+            customers = entry.pop("customers")
+            performance.append({
+                **entry,
+                "revenue": round(entry["revenue"], 2),
+                "unique_customers": len(customers),
+                "success_rate": round(entry["sales"] / entry["attempts"], 4) if entry["attempts"] else 0.0,
+                "revenue_share": round(entry["revenue"] / total_revenue, 4) if total_revenue else 0.0,
+            })
+        reports[owner_id] = {
+            "total_revenue": round(total_revenue, 2),
+            "total_sales": sum(entry["sales"] for entry in entries),
+            "paywalls_with_sales": sum(1 for entry in entries if entry["sales"]),
+            "paywalls": performance,
+        }
+
+    await _store_reports(db, WEEKLY_PAYWALL_PERFORMANCE, start, end, reports)
+    return len(reports)
+
+
+async def generate_weekly_paywall_reports(session_factory, week_start: date, chunk_size: Optional[int] = None,
+                                          concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Paywall performance over [week_start, week_start + 7 days) for every owner with paywalls"""
+    end = week_start + timedelta(days=7)
+    result = await _for_owner_chunks(
+        session_factory,
+        select(Paywall.owner_id).filter(Paywall.owner_id.isnot(None)),
+        lambda db, owner_ids: _weekly_paywall_chunk(db, owner_ids, week_start, end),
+        chunk_size or settings.REPORT_OWNER_CHUNK_SIZE,
+        concurrency or settings.REPORT_CONCURRENCY,
+    )
+    logger.info(f"Weekly paywall reports for {week_start}: {result['reports']} owners")
+    return {"week_start": week_start.isoformat(), **result}
+
+
+async def get_reports(db: AsyncSession, owner_id: int, report_type: str, limit: int = 30) -> List[AnalyticsReport]:
+    """The owner's most recent reports of a type, newest first"""
+    result = await db.execute(
+        select(AnalyticsReport)
+        .filter(AnalyticsReport.owner_id == owner_id, AnalyticsReport.report_type == report_type)
+        .order_by(AnalyticsReport.period_start.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
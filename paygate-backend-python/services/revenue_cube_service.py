@@ -0,0 +1,236 @@
+"""
+Pre-aggregated revenue cubes
+
+Each cube holds an owner's payments summed per day and per combination of
+the cube's dimensions. A breakdown is answered from the smallest cube whose
+dimensions cover the requested ones, with week and month rolled up from
+days, so it reads a few cells per day instead of the payments themselves.
+
+The cubes are maintained incrementally: every run takes the payments
+created or changed since the last one, by keyset on
+(coalesce(updated_at, created_at), id), and rebuilds the cells of each
+(owner, day) they touch from that owner's payments of the day. Rebuilding
+rather than adding deltas keeps the cells right when a payment changes
+status, and lets a run be repeated safely. Changes newer than
+REVENUE_CUBE_SYNC_LAG seconds wait for the next run, so transactions still
+in flight cannot be skipped. The same pass rebuilds the touched owner-days'
+distinct customer sketches (customer_sketch_service).
+
+The position is a single revenue_cube_sync row, seeded on first use and
+locked (SELECT ... FOR UPDATE) for each batch, so overlapping runs take
+turns batch by batch instead of folding the same payments twice.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, insert, or_, type_coerce, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Payment, RevenueCubeCell, RevenueCubeSync
+from utils.db_helpers import insert_ignore_conflicts
+from . import customer_sketch_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Smallest first: the planner takes the first cube covering a request
+CUBES: Dict[str, Tuple[str, ...]] = {
+    "totals": (),
+    "currency": ("currency",),
+    "paywall": ("currency", "paywall_id"),
+    "payment": ("currency", "channel", "payment_method"),
+}
+
+TIME_DIMENSIONS = ("day", "week", "month")
+DIMENSIONS = {dimension for dims in CUBES.values() for dimension in dims} | set(TIME_DIMENSIONS)
+MEASURES = ("revenue", "sales", "attempts", "failed", "refunded_amount")
+
+_EMPTY = {"currency": "", "channel": "", "payment_method": "", "paywall_id": 0}
+
+# Position of a fresh sync row: before every payment
+SYNC_START = datetime(1970, 1, 1)
+
+
+def plan(dimensions: Iterable[str]) -> Optional[str]:
+    """The smallest cube that can answer a breakdown by these dimensions, or None"""
+    wanted = {dimension for dimension in dimensions if dimension not in TIME_DIMENSIONS}
+    for name, dims in CUBES.items():
+        if wanted <= set(dims):
+            return name
+    return None
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _cells(owner_id: int, day: date, groups) -> List[Dict[str, Any]]:
+    """Roll one owner-day's finest-grain groups up into the cells of every cube"""
+    cells: Dict[tuple, Dict[str, Any]] = {}
+    for paywall_id, currency, channel, payment_method, status, amount, count in groups:
+        values = {"currency": currency or "", "channel": channel or "",
+                  "payment_method": payment_method or "", "paywall_id": paywall_id or 0}
+        for cube, dims in CUBES.items():
+            key = (cube,) + tuple(values[dimension] for dimension in dims)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = {
+                    "cube": cube, "owner_id": owner_id, "day": day, **_EMPTY,
+                    **{dimension: values[dimension] for dimension in dims},
+                    "revenue": 0.0, "sales": 0, "attempts": 0, "failed": 0, "refunded_amount": 0.0,
+                }
+            cell["attempts"] += count
+            if status == "completed":
+                cell["revenue"] += float(amount or 0)
+                cell["sales"] += count
+            elif status == "failed":
+                cell["failed"] += count
+            elif status == "refunded":
+                cell["refunded_amount"] += float(amount or 0)
+    return list(cells.values())
+
+
+async def rebuild_cells(db: AsyncSession, owner_days: Iterable[Tuple[int, date]]) -> int:
+    """Recompute every cube's cells for the given (owner, day) pairs; returns cells written (not committed)"""
+    owners_by_day: Dict[date, set] = defaultdict(set)
+    for owner_id, day in owner_days:
+        owners_by_day[day].add(owner_id)
+
+    table = RevenueCubeCell.__table__
+    written = 0
+    for day, owner_ids in sorted(owners_by_day.items()):
+        start = datetime.combine(day, datetime.min.time())
+        groups = (await db.execute(
+            select(Payment.owner_id, Payment.paywall_id, Payment.currency, Payment.channel,
+                   Payment.payment_method, Payment.status, func.sum(Payment.amount), func.count())
+            .filter(and_(Payment.owner_id.in_(owner_ids), Payment.created_at >= start,
+                         Payment.created_at < start + timedelta(days=1)))
+            .group_by(Payment.owner_id, Payment.paywall_id, Payment.currency, Payment.channel,
+                      Payment.payment_method, Payment.status)
+        )).all()
+        by_owner = defaultdict(list)
+        for owner_id, *group in groups:
+            by_owner[owner_id].append(group)
+
+        await db.execute(delete(table).where(and_(
+            table.c.cube.in_(list(CUBES)), table.c.owner_id.in_(owner_ids), table.c.day == day,  # Primary key prefix
+        )))
+        rows = [cell for owner_id, owner_groups in by_owner.items() for cell in _cells(owner_id, day, owner_groups)]
+        if rows:
+            await db.execute(insert(table), rows)
+        written += len(rows)
+    return written
+
+
+async def _lock_sync_state(db: AsyncSession) -> RevenueCubeSync:
+    """The sync position, locked until the caller commits"""
+    await db.execute(
+        insert_ignore_conflicts(RevenueCubeSync.__table__, ["id"])
+        .values(id=1, changed_at=SYNC_START, last_payment_id=0)
+    )
+    return (await db.execute(
+        select(RevenueCubeSync)
+        .filter(RevenueCubeSync.id == 1)
+        .with_for_update()
+        .execution_options(populate_existing=True)  # Another run may have moved it
+    )).scalar_one()
+
+
+async def refresh_cubes(db: AsyncSession, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Fold the payments changed since the last run into the cubes"""
+    batch_size = batch_size or settings.REVENUE_CUBE_SYNC_BATCH_SIZE
+    changed_at = type_coerce(func.coalesce(Payment.updated_at, Payment.created_at), DateTime(timezone=True))
+    horizon = datetime.utcnow() - timedelta(seconds=settings.REVENUE_CUBE_SYNC_LAG)
+
+    payments = cells = sketches = 0
+    while True:
+        state = await _lock_sync_state(db)
+        rows = (await db.execute(
+            select(Payment.id, Payment.owner_id, Payment.created_at, changed_at)
+            .filter(
+                Payment.owner_id.isnot(None),
+                changed_at < horizon,
+                or_(
+                    changed_at > state.changed_at,
+                    and_(changed_at == state.changed_at, Payment.id > state.last_payment_id),
+                ),
+            )
+            .order_by(changed_at, Payment.id)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            await db.commit()
+            break
+
+        owner_days = {(row.owner_id, _naive_utc(row.created_at).date()) for row in rows}
+        cells += await rebuild_cells(db, owner_days)
+        sketches += await customer_sketch_service.rebuild_sketches(db, owner_days)
+        state.changed_at = _naive_utc(rows[-1][-1])
+        state.last_payment_id = rows[-1].id
+        # Cells, sketches and position commit together, so a failed run is simply repeated
+        await db.commit()
+        payments += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    if payments:
+        logger.info(f"Revenue cubes: folded in {payments} changed payments, "
+                    f"{cells} cells and {sketches} customer sketches rewritten")
+    return {"payments": payments, "cells": cells, "customer_sketches": sketches}
+
+
+def _time_key(dimension: str, day: date) -> str:
+    if dimension == "week":
+        day = day - timedelta(days=day.weekday())
+    elif dimension == "month":
+        day = day.replace(day=1)
+    return day.isoformat()
+
+
+async def query(db: AsyncSession, owner_id: int, start: date, end: date,
+                dimensions: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    An owner's payments created on days [start, end) grouped by the given
+    dimensions, with every measure, from the smallest covering cube. None
+    if no cube covers the dimensions.
+    """
+    cube = plan(dimensions)
+    if cube is None:
+        return None
+    table = RevenueCubeCell.__table__
+    group_columns = [table.c[dimension] for dimension in dimensions if dimension not in TIME_DIMENSIONS]
+    time_dimensions = [dimension for dimension in dimensions if dimension in TIME_DIMENSIONS]
+    if time_dimensions:
+        group_columns.append(table.c.day)
+
+    rows = (await db.execute(
+        select(*group_columns, *[func.sum(table.c[measure]) for measure in MEASURES])
+        .where(and_(table.c.cube == cube, table.c.owner_id == owner_id, table.c.day >= start, table.c.day < end))
+        .group_by(*group_columns)
+    )).all()
+
+    results: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        values = dict(zip([column.name for column in group_columns], row[:len(group_columns)]))
+        if isinstance(values.get("day"), str):
+            values["day"] = date.fromisoformat(values["day"])
+        entry_key = {}
+        for dimension in dimensions:
+            if dimension in TIME_DIMENSIONS:
+                entry_key[dimension] = _time_key(dimension, values["day"])
+            else:
+                entry_key[dimension] = values[dimension] or None  # '' / 0 back to missing
+        key = tuple(entry_key.values())
+        entry = results.setdefault(key, {**entry_key, **{measure: 0 for measure in MEASURES}})
+        for measure, value in zip(MEASURES, row[len(group_columns):]):
+            entry[measure] += value or 0
+
+    entries = list(results.values())
+    for entry in entries:
+        entry["revenue"] = round(float(entry["revenue"]), 2)
+        entry["refunded_amount"] = round(float(entry["refunded_amount"]), 2)
+    entries.sort(key=lambda entry: tuple((entry[d] is None, entry[d] or 0) for d in dimensions))
+    return entries
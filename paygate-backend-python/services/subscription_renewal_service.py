@@ -0,0 +1,413 @@
+"""
+Subscription renewals
+
+Due subscriptions (active, auto-renewing, next_billing_date in the past) are
+claimed in batches. On PostgreSQL the batch is read with
+SELECT ... FOR UPDATE SKIP LOCKED, so parallel workers each take different
+rows without waiting on each other; on SQLite, which has no row locks, each
+row is claimed with an UPDATE conditional on its next_billing_date still
+being the one that was read. In the claiming transaction the billing dates
+are advanced by one period and the invoices for the period are inserted in
+bulk, with an invoice number derived from the subscription and period so
+a period can never be invoiced twice.
+
+Charges are made after the claim commits, against the customer's saved
+Paystack authorization, under a semaphore. The invoice number doubles as
+the gateway reference and Paystack rejects a reused reference, so a charge
+is never taken twice for one invoice. Invoices whose outcome is unknown
+(gateway errors, a worker dying mid-batch) stay pending and are verified,
+and only then recharged, by a later run; past RENEWAL_ABANDON_AFTER_HOURS
+they are only verified, and declined once the gateway reports the charge
+failed or unknown. A request the gateway refuses
+outright (bad credentials or configuration) stops the run, since every
+other charge would be refused too, and leaves its invoice pending.
+"""
+import asyncio
+import calendar
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, exists, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.database import is_postgresql
+from config.settings import settings
+from models import Invoice, PaymentMethod, Subscription, SubscriptionPlan, User
+from utils.db_helpers import insert_ignore_conflicts
+from utils.paystack_client import CircuitOpenError, GatewayError, PaystackClient, get_paystack_client
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def advance_billing_date(current: datetime, billing_period: Optional[str]) -> datetime:
+    """Start of the next period; month and year steps clamp to the end of short months"""
+    period = (billing_period or "month").lower()
+    if period == "day":
+        return current + timedelta(days=1)
+    if period == "week":
+        return current + timedelta(weeks=1)
+    months = 12 if period == "year" else 1
+    month_index = current.month - 1 + months
+    year, month = current.year + month_index // 12, month_index % 12 + 1
+    return current.replace(year=year, month=month, day=min(current.day, calendar.monthrange(year, month)[1]))
+
+
+def invoice_number(subscription_id: int, period_start: datetime) -> str:
+    return f"SUB-{subscription_id}-{period_start:%Y%m%d}"
+
+
+async def _claim_due(db: AsyncSession, batch_size: int, now: datetime) -> List[Any]:
+    """Lock (or conditionally claim) a batch of due subscriptions and advance their billing dates"""
+    rows = (await db.execute(
+        select(
+            Subscription.id, Subscription.user_id, Subscription.next_billing_date,
+            SubscriptionPlan.name, SubscriptionPlan.price, SubscriptionPlan.currency,
+            SubscriptionPlan.billing_period,
+        )
+        .join(SubscriptionPlan, SubscriptionPlan.id == Subscription.plan_id)
+        .filter(and_(
+            Subscription.status == "active",
+            Subscription.auto_renew == True,
+            Subscription.next_billing_date <= now,
+        ))
+        .order_by(Subscription.next_billing_date, Subscription.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=Subscription)
+    )).all()
+    if not rows:
+        return []
+
+    if is_postgresql:
+        # Rows are locked until commit; nobody else can have claimed them
+        await db.execute(update(Subscription), [
+            {"id": row.id, "next_billing_date": advance_billing_date(row.next_billing_date, row.billing_period),
+             "updated_at": now}
+            for row in rows
+        ])
+        return rows
+
+    claimed = []
+    for row in rows:
+        result = await db.execute(
+            update(Subscription.__table__)
+            .where(and_(
+                Subscription.__table__.c.id == row.id,
+                Subscription.__table__.c.next_billing_date == row.next_billing_date,
+            ))
+            .values(next_billing_date=advance_billing_date(row.next_billing_date, row.billing_period), updated_at=now)
+        )
+        if result.rowcount:
+            claimed.append(row)
+    return claimed
+
+
+async def _create_invoices(db: AsyncSession, rows: List[Any], now: datetime) -> List[Dict[str, Any]]:
+    """Insert one invoice per claimed period; returns the ones still to be charged"""
+    numbers = [invoice_number(row.id, row.next_billing_date) for row in rows]
+    await db.execute(
+        insert_ignore_conflicts(Invoice.__table__, ["invoice_number"]),
+        [{
+            "user_id": row.user_id,
+            "subscription_id": row.id,
+            "amount": row.price,
+            "currency": row.currency,
+            # Free plans renew without a charge
+            "status": "pending" if row.price > 0 else "paid",
+            "paid_at": None if row.price > 0 else now,
+            "invoice_number": number,
+            "description": f"{row.name} subscription, "
+                           f"{row.next_billing_date:%Y-%m-%d} to "
+                           f"{advance_billing_date(row.next_billing_date, row.billing_period):%Y-%m-%d}",
+            "due_date": row.next_billing_date,
+            "created_at": now,
+            "updated_at": now,
+        } for row, number in zip(rows, numbers)]
+    )
+    invoices = (await db.execute(
+        select(Invoice.id, Invoice.user_id, Invoice.subscription_id, Invoice.amount, Invoice.currency,
+               Invoice.invoice_number)
+        .filter(and_(Invoice.invoice_number.in_(numbers), Invoice.status == "pending"))
+    )).all()
+    return [dict(invoice._mapping) for invoice in invoices]
+
+
+async def _load_payers(db: AsyncSession, user_ids: List[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+    """user_id -> (email, Paystack authorization code of the preferred active payment method)"""
+    payers: Dict[int, Tuple[str, Optional[str]]] = {}
+    if not user_ids:
+        return payers
+    users = await db.execute(select(User.id, User.email).filter(User.id.in_(user_ids)))
+    for user_id, email in users.all():
+        payers[user_id] = (email, None)
+    methods = await db.execute(
+        select(PaymentMethod.user_id, PaymentMethod.provider_payment_method_id)
+        .filter(and_(
+            PaymentMethod.user_id.in_(user_ids),
+            PaymentMethod.provider == "paystack",
+            PaymentMethod.is_active == True,
+            PaymentMethod.provider_payment_method_id.isnot(None),
+        ))
+        .order_by(PaymentMethod.user_id, PaymentMethod.is_default.desc(), PaymentMethod.id.desc())
+    )
+    seen = set()
+    for user_id, authorization_code in methods.all():
+        if user_id in seen or user_id not in payers:
+            continue
+        seen.add(user_id)
+        payers[user_id] = (payers[user_id][0], authorization_code)
+    return payers
+
+
+def _charge_outcome(data: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    status = data.get("status")
+    if status == "success":
+        return "paid", None
+    if status in ("failed", "reversed"):
+        return "declined", data.get("gateway_response") or "Charge declined"
+    # Still processing; a later run verifies it
+    return "error", f"Charge {status}"
+
+
+async def _charge_invoices(client: PaystackClient, invoices: List[Dict[str, Any]],
+                           payers: Dict[int, Tuple[str, Optional[str]]], semaphore: asyncio.Semaphore,
+                           verify_first: bool = False) -> List[Tuple[Dict[str, Any], str, Optional[str]]]:
+    """
+    Returns (invoice, outcome, error) with outcome one of paid, declined,
+    no_payment_method, error, rejected or unavailable; the last three leave
+    the invoice pending. Only a charge the gateway processed and failed is
+    declined; a request it refused (bad credentials or configuration) is
+    rejected.
+    """
+    async def charge(invoice):
+        email, authorization_code = payers.get(invoice["user_id"], (None, None))
+        async with semaphore:
+            try:
+                if verify_first:
+                    # A previous attempt may have reached the gateway before its outcome was lost
+                    try:
+                        result = await client.verify_transaction(invoice["invoice_number"])
+                    except GatewayError as e:
+                        # Only "reference not found" means it is safe to charge
+                        if e.retryable or e.status_code not in (400, 404):
+                            raise
+                    else:
+                        return (invoice, *_charge_outcome(result.get("data") or {}))
+                if not email or not authorization_code:
+                    return invoice, "no_payment_method", "No saved Paystack payment method"
+                result = await client.charge_authorization(
+                    email, invoice["amount"], authorization_code, invoice["invoice_number"],
+                    currency=invoice["currency"],
+                    metadata={"invoice_id": invoice["id"], "subscription_id": invoice["subscription_id"]},
+                )
+                return (invoice, *_charge_outcome(result.get("data") or {}))
+            except CircuitOpenError as e:
+                return invoice, "unavailable", str(e)
+            except GatewayError as e:
+                if not e.retryable and e.status_code is not None:
+                    return invoice, "rejected", f"{e.status_code}: {e}"
+                return invoice, "error", str(e)
+
+    return await asyncio.gather(*(charge(invoice) for invoice in invoices))
+
+
+async def _verify_abandoned(client: PaystackClient, invoices: List[Dict[str, Any]],
+                            semaphore: asyncio.Semaphore) -> List[Tuple[Dict[str, Any], str, Optional[str]]]:
+    """
+    Settles invoices past the abandon window without charging them again. An
+    invoice is declined only when the gateway reports its charge failed or
+    never saw it; a charge that went through is paid, and anything else
+    leaves it pending for the next run.
+    """
+    async def verify(invoice):
+        async with semaphore:
+            try:
+                result = await client.verify_transaction(invoice["invoice_number"])
+            except CircuitOpenError as e:
+                return invoice, "unavailable", str(e)
+            except GatewayError as e:
+                if not e.retryable and e.status_code in (400, 404):
+                    return invoice, "declined", "Not collected in time"
+                if not e.retryable and e.status_code is not None:
+                    return invoice, "rejected", f"{e.status_code}: {e}"
+                return invoice, "error", str(e)
+            return (invoice, *_charge_outcome(result.get("data") or {}))
+
+    return await asyncio.gather(*(verify(invoice) for invoice in invoices))
+
+
+async def _apply_outcomes(db: AsyncSession, results: List[Tuple[Dict[str, Any], str, Optional[str]]], now: datetime):
+    by_outcome: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for invoice, outcome, _ in results:
+        by_outcome[outcome].append(invoice)
+
+    table = Invoice.__table__
+    paid = by_outcome.get("paid", [])
+    if paid:
+        await db.execute(
+            update(table)
+            .where(and_(table.c.id.in_([invoice["id"] for invoice in paid]), table.c.status == "pending"))
+            .values(status="paid", paid_at=now, updated_at=now)
+        )
+        # A charge confirmed late lifts the past_due its subscription got meanwhile,
+        # unless a later period has failed since
+        subscriptions = Subscription.__table__
+        paid_invoices, failed_invoices = table.alias("paid_invoices"), table.alias("failed_invoices")
+        latest_paid = (
+            select(func.max(paid_invoices.c.due_date))
+            .where(and_(paid_invoices.c.subscription_id == subscriptions.c.id, paid_invoices.c.status == "paid"))
+            .scalar_subquery()
+        )
+        await db.execute(
+            update(subscriptions)
+            .where(and_(
+                subscriptions.c.id.in_(list({invoice["subscription_id"] for invoice in paid})),
+                subscriptions.c.status == "past_due",
+                ~exists().where(and_(
+                    failed_invoices.c.subscription_id == subscriptions.c.id,
+                    failed_invoices.c.status == "failed",
+                    failed_invoices.c.due_date > latest_paid,
+                )),
+            ))
+            .values(status="active", updated_at=now)
+        )
+
+    failed = by_outcome.get("declined", []) + by_outcome.get("no_payment_method", [])
+    if failed:
+        await db.execute(
+            update(table)
+            .where(and_(table.c.id == bindparam("invoice_id"), table.c.status == "pending"))
+            .values(status="failed", description=table.c.description + bindparam("reason"), updated_at=now),
+            [{"invoice_id": invoice["id"], "reason": f" ({reason})"}
+             for invoice, outcome, reason in results if outcome in ("declined", "no_payment_method")]
+        )
+        # Keeps further periods from being billed on a card that is failing
+        await db.execute(
+            update(Subscription.__table__)
+            .where(and_(
+                Subscription.__table__.c.id.in_(list({invoice["subscription_id"] for invoice in failed})),
+                Subscription.__table__.c.status == "active",
+            ))
+            .values(status="past_due", updated_at=now)
+        )
+
+    await db.commit()
+
+
+async def _claim_stalled_invoices(db: AsyncSession, batch_size: int, now: datetime) -> List[Dict[str, Any]]:
+    """Pending renewal invoices whose charge outcome was never recorded; refreshing updated_at is the lease"""
+    stale_before = now - timedelta(minutes=settings.RENEWAL_RETRY_AFTER_MINUTES)
+    table = Invoice.__table__
+    due = (
+        select(table.c.id)
+        .where(and_(table.c.status == "pending", table.c.subscription_id.isnot(None), table.c.updated_at < stale_before))
+        .order_by(table.c.updated_at)
+        .limit(batch_size)
+    )
+    rows = (await db.execute(
+        update(table)
+        .where(and_(table.c.id.in_(due.scalar_subquery()), table.c.status == "pending", table.c.updated_at < stale_before))
+        .values(updated_at=now)
+        .returning(table.c.id, table.c.user_id, table.c.subscription_id, table.c.amount, table.c.currency,
+                   table.c.invoice_number, table.c.created_at)
+    )).all()
+    await db.commit()
+    return [dict(row._mapping) for row in rows]
+
+
+async def _expire_lapsed(db: AsyncSession, now: datetime) -> int:
+    """Subscriptions that were set not to renew end when their period does"""
+    result = await db.execute(
+        update(Subscription.__table__)
+        .where(and_(
+            Subscription.__table__.c.status == "active",
+            or_(Subscription.__table__.c.auto_renew == False, Subscription.__table__.c.auto_renew.is_(None)),
+            Subscription.__table__.c.next_billing_date <= now,
+        ))
+        .values(status="expired", end_date=Subscription.__table__.c.next_billing_date, updated_at=now)
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+
+async def run_renewals(db: AsyncSession, batch_size: Optional[int] = None, max_batches: int = 50,
+                       concurrency: Optional[int] = None, client: Optional[PaystackClient] = None) -> Dict[str, Any]:
+    """Renew due subscriptions and retry stalled charges; returns a summary report"""
+    batch_size = batch_size or settings.RENEWAL_BATCH_SIZE
+    client = client or get_paystack_client()
+    semaphore = asyncio.Semaphore(concurrency or settings.RENEWAL_CONCURRENCY)
+    started = time.monotonic()
+    outcomes: Counter = Counter()
+    error_samples: List[str] = []
+    aborted: Optional[str] = None
+
+    def tally(results):
+        nonlocal aborted
+        for invoice, outcome, error in results:
+            outcomes[outcome] += 1
+            if outcome in ("error", "rejected") and len(error_samples) < 10:
+                error_samples.append(f"{invoice['invoice_number']}: {error}")
+            if outcome == "unavailable":
+                # Hammering a gateway that is down only delays its recovery
+                aborted = "Payment gateway circuit open"
+            elif outcome == "rejected" and aborted is None:
+                # Every other charge would be refused the same way until it is fixed
+                aborted = f"Payment gateway rejected the request ({error})"
+
+    expired = await _expire_lapsed(db, datetime.utcnow())
+
+    # Retry charges left pending by earlier runs before taking on new ones
+    now = datetime.utcnow()
+    stalled = await _claim_stalled_invoices(db, batch_size, now)
+    if stalled:
+        abandon_before = now - timedelta(hours=settings.RENEWAL_ABANDON_AFTER_HOURS)
+        retry, abandoned = [], []
+        for invoice in stalled:
+            created_at = invoice["created_at"].replace(tzinfo=None)
+            (retry if created_at >= abandon_before else abandoned).append(invoice)
+        payers = await _load_payers(db, list({invoice["user_id"] for invoice in retry}))
+        results = await _charge_invoices(client, retry, payers, semaphore, verify_first=True)
+        results += await _verify_abandoned(client, abandoned, semaphore)
+        tally(results)
+        await _apply_outcomes(db, results, now)
+
+    renewed = 0
+    batches = 0
+    while aborted is None and batches < max_batches:
+        now = datetime.utcnow()
+        rows = await _claim_due(db, batch_size, now)
+        if not rows:
+            await db.rollback()
+            break
+        batches += 1
+        invoices = await _create_invoices(db, rows, now)
+        payers = await _load_payers(db, list({invoice["user_id"] for invoice in invoices}))
+        # Claim and invoices commit together, before any money moves
+        await db.commit()
+        renewed += len(rows)
+        outcomes["free"] += sum(1 for row in rows if row.price <= 0)
+
+        results = await _charge_invoices(client, invoices, payers, semaphore)
+        tally(results)
+        await _apply_outcomes(db, results, now)
+        if len(rows) < batch_size:
+            break
+
+    elapsed = time.monotonic() - started
+    report = {
+        "renewed": renewed,
+        "batches": batches,
+        "retried": len(stalled),
+        "expired": expired,
+        "outcomes": dict(outcomes),
+        "error_samples": error_samples,
+        "aborted": aborted,
+        "more_due": batches == max_batches,
+        "duration_seconds": round(elapsed, 2),
+    }
+    logger.info(
+        f"Renewed {renewed} subscriptions in {batches} batches ({report['duration_seconds']}s): {dict(outcomes)}"
+        + (f" (aborted: {aborted})" if aborted else "")
+    )
+    return report
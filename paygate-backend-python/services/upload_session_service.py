@@ -0,0 +1,263 @@
+"""
+Resumable upload sessions for large content files
+
+Each session is a directory under UPLOAD_DIR/.sessions holding:
+  - session.json: immutable metadata (owner, filename, declared size/type, expiry)
+  - data: a preallocated file that chunks are written into at their offsets
+  - ranges/<start>-<end>: one empty marker per chunk that has been fully written
+
+Markers are only created after a chunk's bytes are on disk, so any number of
+workers can accept PATCHes for the same session in parallel without a lock;
+the received offset is derived by merging the marker ranges.
+"""
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.settings import settings
+from models import Content
+from utils.streaming_upload import (
+    ALLOWED_EXTENSIONS, MAX_FILE_SIZES, CONTENT_TYPES, StoredUpload, commit_file
+)
+from . import content_service, blob_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+RANGE_PATTERN = re.compile(r"^(\d+)-(\d+)$")
+
+
+def _sessions_root() -> Path:
+    return Path(settings.UPLOAD_DIR) / ".sessions"
+
+
+def _session_dir(session_id: str) -> Path:
+    if not SESSION_ID_PATTERN.match(session_id or ""):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return _sessions_root() / session_id
+
+
+def _read_metadata(session_dir: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(session_dir / "session.json", "r") as meta_file:
+            return json.load(meta_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _received_ranges(session_dir: Path) -> List[Tuple[int, int]]:
+    """Merge the per-chunk markers into sorted, non-overlapping [start, end) ranges"""
+    try:
+        names = os.listdir(session_dir / "ranges")
+    except FileNotFoundError:
+        return []
+
+    ranges = []
+    for name in names:
+        match = RANGE_PATTERN.match(name)
+        if match:
+            ranges.append((int(match.group(1)), int(match.group(2))))
+    ranges.sort()
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _contiguous_offset(ranges: List[Tuple[int, int]]) -> int:
+    """Bytes received without gaps from the start of the file (tus Upload-Offset)"""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+def _session_status(session_id: str, metadata: Dict[str, Any], ranges: List[Tuple[int, int]]) -> Dict[str, Any]:
+    received = sum(end - start for start, end in ranges)
+    return {
+        "id": session_id,
+        "filename": metadata["filename"],
+        "content_type": metadata["content_type"],
+        "size": metadata["size"],
+        "offset": _contiguous_offset(ranges),
+        "received_bytes": received,
+        "received_ranges": [[start, end] for start, end in ranges],
+        "complete": received == metadata["size"],
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "expires_at": metadata["expires_at"],
+    }
+
+
+def _load_session(session_id: str, owner_id: int) -> Tuple[Path, Dict[str, Any]]:
+    session_dir = _session_dir(session_id)
+    metadata = _read_metadata(session_dir)
+    if not metadata or metadata["owner_id"] != owner_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if datetime.fromisoformat(metadata["expires_at"]) < datetime.utcnow():
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Upload session has expired")
+    return session_dir, metadata
+
+
+async def create_upload_session(owner_id: int, filename: str, size: int, content_type: str) -> Dict[str, Any]:
+    """Create a session and preallocate its data file"""
+    if content_type not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {content_type}"
+        )
+    limit = MAX_FILE_SIZES[ALLOWED_EXTENSIONS[content_type]]
+    if size > limit:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the maximum size of {limit} bytes"
+        )
+
+    session_id = uuid.uuid4().hex
+    session_dir = _sessions_root() / session_id
+    (session_dir / "ranges").mkdir(parents=True)
+
+    now = datetime.utcnow()
+    metadata = {
+        "owner_id": owner_id,
+        "filename": os.path.basename(filename),
+        "size": size,
+        "content_type": content_type,
+        "created_at": now.isoformat(),
+        "expires_at": (now + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)).isoformat(),
+    }
+
+    def _initialise():
+        with open(session_dir / "data", "wb") as data_file:
+            data_file.truncate(size)  # Sparse on most filesystems
+        with open(session_dir / "session.json", "w") as meta_file:
+            json.dump(metadata, meta_file)
+
+    await asyncio.to_thread(_initialise)
+    logger.info(f"Created upload session {session_id} for {metadata['filename']} ({size} bytes)")
+    return _session_status(session_id, metadata, [])
+
+
+async def get_upload_session(session_id: str, owner_id: int) -> Dict[str, Any]:
+    session_dir, metadata = _load_session(session_id, owner_id)
+    return _session_status(session_id, metadata, _received_ranges(session_dir))
+
+
+async def write_chunk(session_id: str, owner_id: int, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Write a streamed chunk at the given offset.
+    Chunks may arrive out of order or in parallel; rewriting a range is idempotent.
+    """
+    session_dir, metadata = _load_session(session_id, owner_id)
+    total_size = metadata["size"]
+    if offset < 0 or offset >= total_size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail=f"Offset {offset} is outside the upload of {total_size} bytes"
+        )
+
+    position = offset
+    fd = os.open(session_dir / "data", os.O_WRONLY)
+    try:
+        async for chunk in chunks:
+            if position + len(chunk) > total_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Chunk extends past the declared upload size"
+                )
+            await asyncio.to_thread(os.pwrite, fd, chunk, position)
+            position += len(chunk)
+        await asyncio.to_thread(os.fsync, fd)
+    finally:
+        os.close(fd)
+
+    if position > offset:
+        # Only record the range once its bytes are durable
+        (session_dir / "ranges" / f"{offset}-{position}").touch()
+
+    return _session_status(session_id, metadata, _received_ranges(session_dir))
+
+
+async def complete_upload_session(
+    db: AsyncSession,
+    session_id: str,
+    owner_id: int,
+    content_fields: Dict[str, Any],
+) -> Tuple[Content, StoredUpload]:
+    """Verify every byte has arrived, move the file into place and create the Content row"""
+    session_dir, metadata = _load_session(session_id, owner_id)
+    ranges = _received_ranges(session_dir)
+    if ranges != [(0, metadata["size"])]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Upload is incomplete",
+                "received_ranges": [[start, end] for start, end in ranges],
+            }
+        )
+
+    try:
+        stored = await commit_file(session_dir / "data", metadata["filename"], metadata["content_type"])
+    except FileNotFoundError:
+        # Another request finalised this session first
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload session already completed")
+
+    await asyncio.to_thread(shutil.rmtree, session_dir, True)
+    await blob_service.record_blob(db, stored)
+
+    content_data = {
+        "title": content_fields.get("title") or metadata["filename"],
+        "description": content_fields.get("description"),
+        "type": CONTENT_TYPES[stored.category],
+        "url": stored.url,
+        "file_path": str(stored.path),
+        "is_protected": content_fields.get("is_protected", False),
+        "price": content_fields.get("price"),
+        "currency": content_fields.get("currency") or "USD",
+        "owner_id": owner_id,
+    }
+    content = await content_service.create_content(db, content_data)
+    return content, stored
+
+
+async def abort_upload_session(session_id: str, owner_id: int) -> bool:
+    session_dir, _ = _load_session(session_id, owner_id)
+    await asyncio.to_thread(shutil.rmtree, session_dir, True)
+    return True
+
+
+def expire_upload_sessions(now: Optional[datetime] = None) -> int:
+    """Remove abandoned sessions past their expiry; returns the number removed"""
+    now = now or datetime.utcnow()
+    root = _sessions_root()
+    if not root.exists():
+        return 0
+
+    removed = 0
+    for session_dir in root.iterdir():
+        if not session_dir.is_dir():
+            continue
+        metadata = _read_metadata(session_dir)
+        if metadata:
+            expired = datetime.fromisoformat(metadata["expires_at"]) < now
+        else:
+            # Half-created session; give it a grace period before reaping
+            expired = time.time() - session_dir.stat().st_mtime > 3600
+        if expired:
+            shutil.rmtree(session_dir, ignore_errors=True)
+            removed += 1
+
+    if removed:
+        logger.info(f"Expired {removed} abandoned upload sessions")
+    return removed
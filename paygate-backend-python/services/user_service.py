@@ -212,6 +212,24 @@ async def update_user(db: AsyncSession, user_id: int, user_update: UserUpdate) -
     await db.refresh(db_user)
     return db_user
 
+async def update_user_avatar(db: AsyncSession, user_id: int, avatar_url: str) -> Optional[User]:
+    """Point the user's avatar at a stored blob, moving the blob reference from the old one"""
+    from . import blob_service
+    db_user = await get_user_by_id(db, user_id)
+    if not db_user:
+        return None
+    
+    previous_avatar = db_user.avatar_url
+    if previous_avatar != avatar_url:
+        await blob_service.release_reference(db, previous_avatar)
+        await blob_service.add_reference(db, avatar_url)
+    
+    db_user.avatar_url = avatar_url
+    db_user.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
 async def change_user_password(db: AsyncSession, user_id: int, current_password: str, new_password: str) -> bool:
     db_user = await get_user_by_id(db, user_id)
     if not db_user:
@@ -0,0 +1,343 @@
+"""
+Payment gateway webhook ingestion
+
+The endpoint only verifies the signature and records the event; a gateway
+retrying the same event hits the unique idempotency key and costs a single
+ignored insert. A worker drains recorded events in batches: events are
+grouped by payment reference, and the payment transitions, paywall
+conversions, customer stats and content access grants for the whole batch
+are written in one transaction.
+"""
+import hashlib
+import hmac
+import json
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config.settings import settings
+from models import Payment, Paywall, Customer, ContentAccess, User, WebhookEvent
+from utils.db_helpers import insert_ignore_conflicts
+from . import outbox_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 120
+
+# Gateway event type -> payment status it moves the payment to
+EVENT_STATUSES = {
+    "charge.success": "completed",
+    "charge.failed": "failed",
+}
+
+
+def verify_signature(raw_body: bytes, signature: Optional[str], secret: Optional[str] = None) -> bool:
+    """Paystack signs the raw request body with HMAC-SHA512 of the secret key"""
+    secret = secret or settings.PAYSTACK_SECRET_KEY
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), raw_body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def idempotency_key(payload: Dict[str, Any]) -> str:
+    data = payload.get("data") or {}
+    identifier = data.get("id") or data.get("reference") or hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"{payload.get('event', 'unknown')}:{identifier}"
+
+
+async def record_event(db: AsyncSession, payload: Dict[str, Any], provider: str = "paystack") -> bool:
+    """Store a verified event; returns False when it was already received"""
+    data = payload.get("data") or {}
+    result = await db.execute(
+        insert_ignore_conflicts(WebhookEvent.__table__, ["idempotency_key"]),
+        [{
+            "provider": provider,
+            "idempotency_key": idempotency_key(payload)[:255],
+            "event_type": str(payload.get("event", "unknown"))[:50],
+            "reference": (str(data["reference"])[:100] if data.get("reference") else None),
+            "payload": payload,
+            "status": "received",
+            "attempts": 0,
+        }]
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+async def claim_batch(db: AsyncSession, batch_size: int) -> List[WebhookEvent]:
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    due = (
+        select(WebhookEvent.id)
+        .filter(and_(
+            WebhookEvent.status == "received",
+            or_(WebhookEvent.claimed_until.is_(None), WebhookEvent.claimed_until < now),
+        ))
+        .order_by(WebhookEvent.id)
+        .limit(batch_size)
+    )
+    await db.execute(
+        update(WebhookEvent)
+        .where(and_(
+            WebhookEvent.id.in_(due.scalar_subquery()),
+            or_(WebhookEvent.claimed_until.is_(None), WebhookEvent.claimed_until < now),
+        ))
+        .values(claim_token=token, claimed_until=now + timedelta(seconds=LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    result = await db.execute(
+        select(WebhookEvent).filter(WebhookEvent.claim_token == token).order_by(WebhookEvent.id)
+    )
+    return result.scalars().all()
+
+
+def _paywall_content_ids(paywall: Paywall) -> List[int]:
+    try:
+        return [int(content_id) for content_id in json.loads(paywall.content_ids or "[]")]
+    except (TypeError, ValueError):
+        return []
+
+
+def _resolve_references(events: List[WebhookEvent], payments: Dict[str, Payment]) -> Tuple[Dict[str, Tuple[str, Dict[str, Any]]], Dict[int, Tuple[str, Optional[str]]]]:
+    """
+    Fold each reference's events (in arrival order) into the status it ends in.
+    Returns the target per reference and an outcome per event.
+    """
+    targets: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    outcomes: Dict[int, Tuple[str, Optional[str]]] = {}
+
+    for event in events:
+        new_status = EVENT_STATUSES.get(event.event_type)
+        if new_status is None:
+            outcomes[event.id] = ("ignored", f"Unhandled event type {event.event_type}")
+            continue
+        payment = payments.get(event.reference)
+        if payment is None:
+            outcomes[event.id] = ("ignored", "Unknown payment reference")
+            continue
+
+        data = event.payload.get("data") or {}
+        if new_status == "completed":
+            # Paystack amounts are in the currency's subunit
+            paid = (data.get("amount") or 0) / 100
+            currency = (data.get("currency") or payment.currency).upper()
+            if abs(paid - payment.amount) > 0.005 or currency != payment.currency:
+                outcomes[event.id] = ("ignored", f"Amount mismatch: received {paid} {currency}")
+                continue
+
+        current = targets.get(event.reference, (payment.status, {}))[0]
+        if current == "completed" or (new_status == "failed" and current != "pending"):
+            outcomes[event.id] = ("processed", "No status change")
+            continue
+        targets[event.reference] = (new_status, data)
+        outcomes[event.id] = ("processed", None)
+
+    return targets, outcomes
+
+
+async def _apply_transitions(db: AsyncSession, targets: Dict[str, Tuple[str, Dict[str, Any]]],
+                             payments: Dict[str, Payment]) -> int:
+    now = datetime.utcnow()
+    by_status: Dict[str, List[str]] = defaultdict(list)
+    for reference, (new_status, _) in targets.items():
+        by_status[new_status].append(reference)
+
+    # Conditional UPDATE ... RETURNING: only references this batch actually
+    # moved get side effects, even if another worker raced on the same payment
+    transitioned: Dict[str, str] = {}
+    for new_status, references in by_status.items():
+        allowed = ["pending", "failed", "cancelled"] if new_status == "completed" else ["pending"]
+        result = await db.execute(
+            update(Payment.__table__)
+            .where(and_(Payment.__table__.c.reference.in_(references), Payment.__table__.c.status.in_(allowed)))
+            .values(status=new_status, updated_at=now)
+            .returning(Payment.__table__.c.reference)
+        )
+        for (reference,) in result.all():
+            transitioned[reference] = new_status
+    if not transitioned:
+        return 0
+
+    gateway_rows = []
+    for reference in transitioned:
+        data = targets[reference][1]
+        row = {"id": payments[reference].id, "gateway_response": data}
+        if data.get("channel"):
+            row["channel"] = str(data["channel"])[:50]
+        gateway_rows.append(row)
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for row in gateway_rows:
+        groups[tuple(sorted(row))].append(row)
+    for rows in groups.values():
+        await db.execute(update(Payment), rows)
+
+    completed = [payments[reference] for reference, new_status in transitioned.items() if new_status == "completed"]
+    if completed:
+        await _apply_completed(db, completed, now)
+
+    for reference, new_status in transitioned.items():
+        payment = payments[reference]
+        if payment.owner_id:
+            outbox_service.enqueue_event(db, "realtime.analytics", {
+                "event_type": "payment_status_updated",
+                "owner_id": payment.owner_id,
+                "data": {
+                    "payment_id": payment.id,
+                    "reference": reference,
+                    "old_status": payment.status,
+                    "new_status": new_status,
+                    "amount": payment.amount,
+                    "customer_email": payment.customer_email,
+                    "paywall_id": payment.paywall_id
+                }
+            }, aggregate_type="payment", aggregate_id=payment.id)
+    return len(transitioned)
+
+
+async def _apply_completed(db: AsyncSession, completed: List[Payment], now: datetime):
+    """Aggregate the batch's successful payments into one statement per table"""
+    conversions: Dict[int, int] = defaultdict(int)
+    spend: Dict[str, Dict[str, Any]] = {}
+    for payment in completed:
+        if payment.paywall_id:
+            conversions[payment.paywall_id] += 1
+        entry = spend.setdefault(payment.customer_email, {"amount": 0.0, "count": 0, "owner_id": payment.owner_id})
+        entry["amount"] += payment.amount
+        entry["count"] += 1
+
+    paywalls_table = Paywall.__table__
+    if conversions:
+        await db.execute(
+            update(paywalls_table)
+            .where(paywalls_table.c.id == bindparam("b_id"))
+            .values(conversions=paywalls_table.c.conversions + bindparam("b_count")),
+            [{"b_id": paywall_id, "b_count": count} for paywall_id, count in conversions.items()]
+        )
+
+    # Create missing customers first, then increment everyone in one pass
+    customers_table = Customer.__table__
+    await db.execute(
+        insert_ignore_conflicts(customers_table, ["email"]),
+        [{
+            "name": email.split("@")[0],
+            "email": email,
+            "total_spent": 0,
+            "total_purchases": 0,
+            "status": "active",
+            "owner_id": entry["owner_id"],
+        } for email, entry in spend.items()]
+    )
+    await db.execute(
+        update(customers_table)
+        .where(customers_table.c.email == bindparam("b_email"))
+        .values(
+            total_spent=customers_table.c.total_spent + bindparam("b_amount"),
+            total_purchases=customers_table.c.total_purchases + bindparam("b_count"),
+            last_purchase=now,
+        ),
+        [{"b_email": email, "b_amount": entry["amount"], "b_count": entry["count"]} for email, entry in spend.items()]
+    )
+
+    await _grant_access(db, completed, now)
+
+
+async def _grant_access(db: AsyncSession, completed: List[Payment], now: datetime):
+    paywall_ids = {payment.paywall_id for payment in completed if payment.paywall_id}
+    if not paywall_ids:
+        return
+    paywalls = {
+        paywall.id: paywall
+        for paywall in (await db.execute(select(Paywall).filter(Paywall.id.in_(paywall_ids)))).scalars().all()
+    }
+    emails = {payment.customer_email for payment in completed}
+    users = dict((await db.execute(select(User.email, User.id).filter(User.email.in_(emails)))).all())
+
+    wanted: Dict[Tuple[int, int], Optional[datetime]] = {}
+    for payment in completed:
+        paywall = paywalls.get(payment.paywall_id)
+        user_id = users.get(payment.customer_email)
+        if paywall is None or user_id is None:
+            continue
+        days = paywall.expiration_days or paywall.duration
+        expires_at = now + timedelta(days=days) if days else None
+        for content_id in _paywall_content_ids(paywall):
+            wanted[(user_id, content_id)] = expires_at
+    if not wanted:
+        return
+
+    existing = await db.execute(
+        select(ContentAccess.user_id, ContentAccess.content_id)
+        .filter(ContentAccess.user_id.in_({user_id for user_id, _ in wanted}))
+        .filter(ContentAccess.content_id.in_({content_id for _, content_id in wanted}))
+        .filter(ContentAccess.is_active == True)
+        .filter(or_(ContentAccess.expires_at.is_(None), ContentAccess.expires_at > now))
+    )
+    for key in existing.all():
+        wanted.pop(tuple(key), None)
+    if wanted:
+        await db.execute(ContentAccess.__table__.insert(), [
+            {"user_id": user_id, "content_id": content_id, "granted_by": "payment",
+             "granted_at": now, "expires_at": expires_at, "is_active": True}
+            for (user_id, content_id), expires_at in wanted.items()
+        ])
+
+
+async def _release_failed_batch(db: AsyncSession, claimed: List[Tuple[int, int]], error: str):
+    now = datetime.utcnow()
+    rows = []
+    for event_id, previous_attempts in claimed:
+        attempts = previous_attempts + 1
+        rows.append({
+            "id": event_id,
+            "attempts": attempts,
+            "status": "failed" if attempts >= settings.WEBHOOK_MAX_ATTEMPTS else "received",
+            "error": error[:1000],
+            "claim_token": None,
+            # Back off before the next worker picks these up again
+            "claimed_until": now + timedelta(seconds=min(30 * 2 ** attempts, 3600)),
+        })
+    await db.execute(update(WebhookEvent), rows)
+    await db.commit()
+
+
+async def process_batch(db: AsyncSession, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Claim and apply one batch of received events"""
+    events = await claim_batch(db, batch_size or settings.WEBHOOK_BATCH_SIZE)
+    if not events:
+        return {"claimed": 0, "transitioned": 0}
+    # Plain values survive the rollback that expires the ORM instances
+    claimed = [(event.id, event.attempts) for event in events]
+
+    try:
+        references = {event.reference for event in events if event.reference}
+        payments: Dict[str, Payment] = {}
+        if references:
+            result = await db.execute(select(Payment).filter(Payment.reference.in_(references)))
+            payments = {payment.reference: payment for payment in result.scalars().all()}
+
+        targets, outcomes = _resolve_references(events, payments)
+        transitioned = await _apply_transitions(db, targets, payments) if targets else 0
+
+        now = datetime.utcnow()
+        await db.execute(update(WebhookEvent), [
+            {"id": event_id, "status": status, "error": error, "processed_at": now,
+             "claim_token": None, "claimed_until": None}
+            for event_id, (status, error) in outcomes.items()
+        ])
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Webhook batch of {len(claimed)} events failed: {str(e)}")
+        await _release_failed_batch(db, claimed, str(e))
+        raise
+
+    return {"claimed": len(events), "transitioned": transitioned}
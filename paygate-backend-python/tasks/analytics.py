@@ -1,7 +1,7 @@
 from celery import current_task
 from celery_worker import celery_app
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import engine
 from models import Payment, Paywall
@@ -10,43 +10,42 @@ from sqlalchemy import select, func
 logger = logging.getLogger(__name__)
 
 @celery_app.task(bind=True)
-def generate_daily_analytics_report(self):
+def generate_daily_analytics_report(self, day: str = None):
     """
-    Generate daily analytics report in background
+    Generate the daily analytics report of every owner with payments on the
+    given day (ISO date, default yesterday)
     """
     try:
-        # In a real implementation, this would connect to the database
-        # and generate comprehensive reports
-        report_data = {
-            "date": datetime.now().isoformat(),
-            "report_type": "daily",
-            "generated_at": datetime.now().isoformat()
-        }
-        
-        # This would include database queries for actual analytics
-        # For now we return placeholder data
-        logger.info("Daily analytics report generated")
-        return {"status": "completed", "report": report_data}
+        from config.database import async_session
+        from services import report_service
+        from tasks.async_runner import run_async
+
+        report_day = date.fromisoformat(day) if day else datetime.utcnow().date() - timedelta(days=1)
+        result = run_async(report_service.generate_daily_reports(async_session, report_day))
+        return {"status": "completed", **result}
     
     except Exception as exc:
         logger.error(f"Daily analytics report generation failed: {str(exc)}")
         raise self.retry(exc=exc, countdown=300, max_retries=2)  # Retry after 5 minutes
 
 @celery_app.task(bind=True)
-def generate_weekly_paywall_performance(self):
+def generate_weekly_paywall_performance(self, week_start: str = None):
     """
-    Generate weekly paywall performance report in background
+    Generate the paywall performance report of every owner for the week
+    starting on week_start (ISO date, default the last full Monday-Sunday week)
     """
     try:
-        # In a real implementation, this would calculate paywall performance metrics
-        report_data = {
-            "date": datetime.now().isoformat(),
-            "report_type": "weekly_paywall_performance",
-            "generated_at": datetime.now().isoformat()
-        }
-        
-        logger.info("Weekly paywall performance report generated")
-        return {"status": "completed", "report": report_data}
+        from config.database import async_session
+        from services import report_service
+        from tasks.async_runner import run_async
+
+        if week_start:
+            start = date.fromisoformat(week_start)
+        else:
+            today = datetime.utcnow().date()
+            start = today - timedelta(days=today.weekday() + 7)
+        result = run_async(report_service.generate_weekly_paywall_reports(async_session, start))
+        return {"status": "completed", **result}
     
     except Exception as exc:
         logger.error(f"Weekly paywall performance report generation failed: {str(exc)}")
@@ -55,14 +54,178 @@ def generate_weekly_paywall_performance(self):
 @celery_app.task(bind=True)
 def update_content_popularity_scores(self):
     """
-    Update content popularity scores based on access patterns
+    Decay content popularity scores and add the days since the last run
     """
     try:
-        # This would update content popularity scores in the database
-        # based on access counts, conversion rates, etc.
-        logger.info("Content popularity scores updated")
-        return {"status": "completed", "message": "Popularity scores updated"}
-    
+        from config.database import async_session
+        from services import popularity_service
+        from tasks.async_runner import run_async
+
+        async def _refresh():
+            async with async_session() as db:
+                return await popularity_service.refresh_popularity(db)
+
+        result = run_async(_refresh())
+        return {"status": "completed", **result}
+
     except Exception as exc:
         logger.error(f"Content popularity update failed: {str(exc)}")
-        raise self.retry(exc=exc, countdown=600, max_retries=2)  # Retry after 10 minutes
\ No newline at end of file
+        raise self.retry(exc=exc, countdown=600, max_retries=2)  # Retry after 10 minutes
+
+
+@celery_app.task(bind=True)
+def refresh_revenue_forecasts(self):
+    """
+    Refit the revenue forecast of every owner with recent revenue and store it
+    """
+    try:
+        from config.database import async_session
+        from services import forecast_service
+        from tasks.async_runner import run_async
+
+        async def _refresh():
+            async with async_session() as db:
+                return await forecast_service.refresh_all_forecasts(db)
+
+        result = run_async(_refresh())
+        return {"status": "completed", **result}
+
+    except Exception as exc:
+        logger.error(f"Revenue forecast refresh failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=600, max_retries=2)
+
+
+@celery_app.task(bind=True)
+def refresh_ab_test_results(self):
+    """
+    Recompute the statistics of running A/B tests whose counts changed
+    """
+    try:
+        from config.database import async_session
+        from services import ab_test_service
+        from tasks.async_runner import run_async
+
+        async def _refresh():
+            async with async_session() as db:
+                return await ab_test_service.refresh_ab_test_results(db)
+
+        result = run_async(_refresh())
+        return {"status": "completed", **result}
+
+    except Exception as exc:
+        logger.error(f"A/B test results refresh failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=300, max_retries=2)
+
+
+@celery_app.task(bind=True)
+def rebalance_bandit_ab_tests(self):
+    """
+    Move the traffic weights of running bandit-mode A/B tests towards the
+    variants most likely to be best
+    """
+    try:
+        from config.database import async_session
+        from services import ab_assignment_service
+        from tasks.async_runner import run_async
+
+        async def _rebalance():
+            async with async_session() as db:
+                return await ab_assignment_service.rebalance_bandit_tests(db)
+
+        result = run_async(_rebalance())
+        return {"status": "completed", **result}
+
+    except Exception as exc:
+        logger.error(f"Bandit A/B test rebalance failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=300, max_retries=2)
+
+
+@celery_app.task(bind=True)
+def compact_access_events(self):
+    """
+    Roll finished days of content access events up into daily aggregates,
+    create upcoming partitions and drop expired ones
+    """
+    try:
+        from config.database import async_session
+        from services import access_event_service
+        from tasks.async_runner import run_async
+
+        async def _compact():
+            async with async_session() as db:
+                return await access_event_service.run_daily_maintenance(db)
+
+        result = run_async(_compact())
+        return {"status": "completed", **result}
+
+    except Exception as exc:
+        logger.error(f"Access event compaction failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=600, max_retries=2)
+
+
+@celery_app.task(bind=True)
+def sync_analytics_store(self):
+    """
+    Mirror new and changed payments and access events into the columnar
+    analytics store, compacting months that gathered many files
+    """
+    try:
+        from config.database import async_session
+        from services import analytics_store_service
+        from tasks.async_runner import run_async
+
+        async def _sync():
+            async with async_session() as db:
+                return await analytics_store_service.sync_store(db)
+
+        result = run_async(_sync())
+        return {"status": "completed", **result}
+
+    except Exception as exc:
+        logger.error(f"Analytics store sync failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60, max_retries=2)
+
+
+@celery_app.task(bind=True)
+def refresh_revenue_cubes(self):
+    """
+    Fold payments created or changed since the last run into the revenue
+    cubes
+    """
+    lock = None
+    try:
+        from config.database import async_session
+        from config.settings import settings
+        from services import revenue_cube_service
+        from tasks.async_runner import run_async
+
+        # A backlog can outlast the schedule interval; never overlap (the
+        # service also locks its position row, in case Redis is unavailable)
+        try:
+            import redis
+            lock = redis.from_url(settings.REDIS_URL, socket_timeout=1).lock(
+                "paygate:refresh_revenue_cubes", timeout=3600, blocking=False
+            )
+            if not lock.acquire():
+                logger.info("Revenue cube refresh already running, skipping")
+                return {"status": "skipped"}
+        except Exception as e:
+            logger.warning(f"Revenue cube lock unavailable, running without it: {e}")
+            lock = None
+
+        async def _refresh():
+            async with async_session() as db:
+                return await revenue_cube_service.refresh_cubes(db)
+
+        result = run_async(_refresh())
+        return {"status": "completed", **result}
+
+    except Exception as exc:
+        logger.error(f"Revenue cube refresh failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=30, max_retries=2)
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except Exception:
+                pass
@@ -0,0 +1,17 @@
+import asyncio
+from config.database import engine
+
+
+def run_async(coro):
+    """
+    Run a coroutine from a synchronous Celery task.
+    Each call gets a fresh event loop, so pooled connections are disposed
+    afterwards rather than being reused across loops.
+    """
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(_runner())
@@ -0,0 +1,60 @@
+from celery_worker import celery_app
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(bind=True)
+def renew_subscriptions(self, max_batches: int = 50):
+    """
+    Bill subscriptions whose period has ended. Safe to run on several workers
+    at once: each claims its own batch of due subscriptions.
+    """
+    try:
+        from config.database import async_session
+        from services import subscription_renewal_service
+        from tasks.async_runner import run_async
+
+        async def _renew():
+            async with async_session() as db:
+                return await subscription_renewal_service.run_renewals(db, max_batches=max_batches)
+
+        report = run_async(_renew())
+        if report["more_due"] and not report["aborted"]:
+            # A large backlog; continue without holding this worker slot
+            renew_subscriptions.delay(max_batches)
+        return {"status": "completed", **report}
+
+    except Exception as exc:
+        logger.error(f"Error renewing subscriptions: {str(exc)}")
+        raise self.retry(exc=exc, countdown=120, max_retries=3)
+
+
+@celery_app.task(bind=True)
+def render_invoices_for_period(self, start: str = None, end: str = None):
+    """
+    Pre-render invoice PDFs issued in [start, end) (ISO dates); defaults to
+    the previous calendar month so month-end downloads are served from disk.
+    """
+    try:
+        from datetime import datetime, timedelta
+        from config.database import async_session
+        from services import invoice_render_service
+        from tasks.async_runner import run_async
+
+        if start and end:
+            period_start, period_end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+        else:
+            period_end = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            period_start = (period_end - timedelta(days=1)).replace(day=1)
+
+        async def _render():
+            async with async_session() as db:
+                return await invoice_render_service.render_invoices_for_period(db, period_start, period_end)
+
+        report = run_async(_render())
+        return {"status": "completed", "start": period_start.isoformat(), "end": period_end.isoformat(), **report}
+
+    except Exception as exc:
+        logger.error(f"Error rendering invoices for period: {str(exc)}")
+        raise self.retry(exc=exc, countdown=300, max_retries=2)
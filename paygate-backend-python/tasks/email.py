@@ -1,40 +1,125 @@
+import math
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
+from typing import Any, Dict, List, Optional
 from celery import current_task
+from celery.exceptions import Retry
 from celery_worker import celery_app
 from config.settings import settings
+from utils.smtp_pool import (
+    RECONNECT_ERRORS, build_message, get_domain_throttle, get_smtp_pool, recipient_domain
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task(bind=True)
-def send_email_task(self, to_email, subject, body, html_body=None):
+
+def _deliver(task, to_email, subject, body, html_body=None):
     """
-    Send email in background
+    Send one message over the worker's pooled SMTP connection.
+    Throttled domains wait briefly or are retried when their window reopens.
     """
     try:
-        msg = MIMEMultipart()
-        msg['From'] = settings.EMAIL_SENDER or 'noreply@paygate.com'
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add body to email
-        if html_body:
-            msg.attach(MIMEText(html_body, 'html'))
-        else:
-            msg.attach(MIMEText(body, 'plain'))
-        
-        # In a real implementation, you would connect to your email server
-        # For now, we'll just simulate sending an email
-        print(f"Email sent to {to_email}: {subject}")
-        
+        wait = get_domain_throttle().acquire(recipient_domain(to_email))
+        if wait > settings.EMAIL_THROTTLE_MAX_WAIT:
+            raise task.retry(countdown=math.ceil(wait), max_retries=10)
+        if wait:
+            time.sleep(wait)
+
+        get_smtp_pool().send(build_message(to_email, subject, body, html_body))
         logger.info(f"Email sent successfully to {to_email}")
         return {"status": "success", "to": to_email, "subject": subject}
-    
+
+    except Retry:
+        raise
+    except smtplib.SMTPRecipientsRefused as exc:
+        # Permanent for this address; retrying would only be refused again
+        logger.error(f"Email to {to_email} refused: {exc.recipients}")
+        return {"status": "refused", "to": to_email, "subject": subject}
     except Exception as exc:
         logger.error(f"Email sending failed: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60, max_retries=3)
+        raise task.retry(exc=exc, countdown=60, max_retries=3)
+
+
+@celery_app.task(bind=True)
+def send_email_task(self, to_email, subject, body, html_body=None):
+    """
+    Send email in background
+    """
+    return _deliver(self, to_email, subject, body, html_body)
+
+
+@celery_app.task(bind=True)
+def send_email_batch(self, messages: List[Dict[str, Any]]):
+    """
+    Send many messages over one SMTP connection.
+    Each message is {"to", "subject", "body", "html_body"?}. Messages for
+    throttled domains are re-queued for when their window reopens; if the
+    server becomes unreachable the unsent remainder is re-queued as a batch.
+    """
+    pool = get_smtp_pool()
+    throttle = get_domain_throttle()
+    sent = 0
+    failures = []
+    deferred: List[Dict[str, Any]] = []
+    deferred_wait = 0.0
+    throttled_domains = set()
+
+    for index, message in enumerate(messages):
+        domain = recipient_domain(message["to"])
+        if domain in throttled_domains:
+            deferred.append(message)
+            continue
+
+        wait = throttle.acquire(domain)
+        if wait and wait <= settings.EMAIL_THROTTLE_MAX_WAIT:
+            time.sleep(wait)
+            wait = throttle.acquire(domain)
+        if wait:
+            throttled_domains.add(domain)
+            deferred.append(message)
+            deferred_wait = max(deferred_wait, wait)
+            continue
+
+        try:
+            pool.send(build_message(message["to"], message["subject"], message.get("body", ""),
+                                    message.get("html_body")))
+            sent += 1
+        except RECONNECT_ERRORS as exc:
+            logger.error(f"SMTP unavailable after {sent} messages: {str(exc)}")
+            remaining = messages[index:] + deferred
+            send_email_batch.apply_async((remaining,), countdown=60)
+            return {
+                "status": "requeued",
+                "sent": sent,
+                "failed": len(failures),
+                "requeued": len(remaining),
+                "failures": failures,
+            }
+        except (smtplib.SMTPException, ValueError) as exc:
+            failures.append({"to": message["to"], "error": str(exc)})
+
+    if deferred:
+        send_email_batch.apply_async((deferred,), countdown=math.ceil(deferred_wait))
+
+    logger.info(f"Email batch finished: {sent} sent, {len(failures)} failed, {len(deferred)} deferred")
+    return {
+        "status": "completed",
+        "sent": sent,
+        "failed": len(failures),
+        "deferred": len(deferred),
+        "failures": failures,
+    }
+
+
+def queue_email_batches(messages: List[Dict[str, Any]], batch_size: Optional[int] = None) -> int:
+    """Split messages into send_email_batch tasks; returns the number of tasks queued"""
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    batches = 0
+    for start in range(0, len(messages), batch_size):
+        send_email_batch.delay(messages[start:start + batch_size])
+        batches += 1
+    return batches
 
 @celery_app.task(bind=True)
 def send_welcome_email(self, user_email, user_name):
@@ -53,7 +138,7 @@ def send_welcome_email(self, user_email, user_name):
     The Paygate Team
     """
     
-    return send_email_task.delay(user_email, subject, body)
+    return _deliver(self, user_email, subject, body)
 
 @celery_app.task(bind=True)
 def send_payment_confirmation_email(self, user_email, payment_details):
@@ -76,7 +161,7 @@ def send_payment_confirmation_email(self, user_email, payment_details):
     The Paygate Team
     """
     
-    return send_email_task.delay(user_email, subject, body)
+    return _deliver(self, user_email, subject, body)
 
 @celery_app.task(bind=True)
 def send_password_reset_email(self, user_email, reset_token):
@@ -98,14 +183,13 @@ def send_password_reset_email(self, user_email, reset_token):
     The Paygate Team
     """
     
-    return send_email_task.delay(user_email, subject, body)
+    return _deliver(self, user_email, subject, body)
 
 @celery_app.task(bind=True)
 def send_verification_email(self, user_email, user_name, verification_token):
     """
     Send email verification in background
     """
-    from config.settings import settings
     verification_url = f"{settings.FRONTEND_URL}/verify-email/{verification_token}"
     subject = "Verify Your Email Address"
     body = f"""
@@ -141,4 +225,4 @@ def send_verification_email(self, user_email, user_name, verification_token):
     </html>
     """
 
-    return send_email_task.delay(user_email, subject, body, html_body)
\ No newline at end of file
+    return _deliver(self, user_email, subject, body, html_body)
\ No newline at end of file
@@ -6,7 +6,7 @@ import fitz  # PyMuPDF for PDF processing
 from celery import current_task
 from celery_worker import celery_app
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +19,14 @@ def process_uploaded_file(self, file_path: str, file_type: str, processing_optio
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
-        if file_type.startswith('image/'):
-            return process_image_file(file_path, processing_options)
-        elif file_type == 'application/pdf':
-            return process_pdf_file(file_path, processing_options)
+        if file_type.startswith('image/') or file_type == 'application/pdf':
+            from services.derivative_service import render_jobs
+            kind = 'pdf' if file_type == 'application/pdf' else 'image'
+            rendition_set = (processing_options or {}).get('rendition_set')
+            result = render_jobs([{"path": file_path, "kind": kind, "rendition_set": rendition_set}])[0]
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            return {"status": "completed", "file_path": file_path, "processed_type": kind, **result}
         else:
             # For other file types, just return basic info
             file_size = os.path.getsize(file_path)
@@ -41,6 +45,7 @@ def process_image_file(file_path: str, processing_options: Dict[str, Any] = None
     """
     Process image file - resize, create thumbnails, etc.
     """
+    processing_options = processing_options or {}
     try:
         with Image.open(file_path) as img:
             # Get original dimensions
@@ -166,4 +171,64 @@ def create_content_thumbnail(self, file_path: str, content_id: int):
     
     except Exception as exc:
         logger.error(f"Thumbnail creation failed: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60, max_retries=3)
\ No newline at end of file
+        raise self.retry(exc=exc, countdown=60, max_retries=3)
+
+@celery_app.task(bind=True)
+def generate_derivatives(self, jobs: List[Dict[str, Any]], batch_size: Optional[int] = None):
+    """
+    Render derivatives for many files in one task, fanned out over the process pool.
+    Each job is {"path", "kind": "image"|"pdf", "rendition_set"?, "sha256"?}.
+    """
+    try:
+        from services.derivative_service import render_jobs
+        results = render_jobs(jobs, batch_size)
+        failed = [result for result in results if "error" in result]
+        return {
+            "status": "completed" if not failed else "partial",
+            "processed": len(results) - len(failed),
+            "failed": len(failed),
+            "generated": sum(result.get("generated", 0) for result in results),
+            "results": results,
+        }
+
+    except Exception as exc:
+        logger.error(f"Derivative batch failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60, max_retries=3)
+
+
+@celery_app.task(bind=True)
+def expire_upload_sessions(self):
+    """
+    Remove resumable upload sessions that were abandoned past their expiry
+    """
+    try:
+        from services.upload_session_service import expire_upload_sessions as expire_sessions
+        removed = expire_sessions()
+        return {"status": "completed", "removed_sessions": removed}
+
+    except Exception as exc:
+        logger.error(f"Upload session expiry failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=300, max_retries=2)
+
+
+@celery_app.task(bind=True)
+def collect_unreferenced_blobs(self, grace_period_hours: int = 24):
+    """
+    Reconcile blob reference counts and delete blobs no Content row or avatar points at
+    """
+    try:
+        from datetime import timedelta
+        from config.database import async_session
+        from services import blob_service
+        from tasks.async_runner import run_async
+
+        async def _collect():
+            async with async_session() as db:
+                return await blob_service.collect_garbage(db, timedelta(hours=grace_period_hours))
+
+        summary = run_async(_collect())
+        return {"status": "completed", **summary}
+
+    except Exception as exc:
+        logger.error(f"Blob garbage collection failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=600, max_retries=2)
@@ -0,0 +1,143 @@
+import math
+import smtplib
+import time
+from typing import Any, Dict, List
+from celery_worker import celery_app
+from config.settings import settings
+from utils.smtp_pool import (
+    RECONNECT_ERRORS, build_message, get_domain_throttle, get_smtp_pool, recipient_domain
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _send_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Send rendered campaign messages over the worker's pooled SMTP connection.
+    Throttled domains and an unreachable server yield "deferred" outcomes so
+    the rows go back to the queue instead of being marked failed.
+    """
+    pool = get_smtp_pool()
+    throttle = get_domain_throttle()
+    outcomes: List[Dict[str, Any]] = []
+    throttled: Dict[str, float] = {}
+    server_down = False
+
+    for message in messages:
+        domain = recipient_domain(message["to"])
+        if server_down:
+            outcomes.append({"status": "deferred", "retry_in": 60})
+            continue
+        if domain in throttled:
+            outcomes.append({"status": "deferred", "retry_in": throttled[domain]})
+            continue
+
+        wait = throttle.acquire(domain)
+        if wait and wait <= settings.EMAIL_THROTTLE_MAX_WAIT:
+            time.sleep(wait)
+            wait = throttle.acquire(domain)
+        if wait:
+            throttled[domain] = wait
+            outcomes.append({"status": "deferred", "retry_in": wait})
+            continue
+
+        try:
+            pool.send(build_message(message["to"], message["subject"], message["body"], message.get("html_body")))
+            outcomes.append({"status": "sent"})
+        except RECONNECT_ERRORS as exc:
+            logger.error(f"SMTP unavailable during campaign chunk: {str(exc)}")
+            server_down = True
+            outcomes.append({"status": "deferred", "retry_in": 60})
+        except (smtplib.SMTPException, ValueError) as exc:
+            outcomes.append({"status": "failed", "error": str(exc)})
+
+    return outcomes
+
+
+@celery_app.task(bind=True)
+def dispatch_campaign(self, dispatch_id: int, recover: bool = False):
+    """
+    Coordinator: queue the next window of subscriber chunks and schedule
+    their send tasks against the global send clock
+    """
+    try:
+        from config.database import async_session
+        from services import campaign_dispatch_service
+        from tasks.async_runner import run_async
+
+        async def _coordinate():
+            async with async_session() as db:
+                return await campaign_dispatch_service.run_coordinator(db, dispatch_id, recover)
+
+        plan = run_async(_coordinate())
+        for first_id, last_id, reserved, countdown in plan["chunks"]:
+            send_campaign_chunk.apply_async((dispatch_id, first_id, last_id, reserved), countdown=countdown)
+        if plan["continue_in"] is not None:
+            dispatch_campaign.apply_async((dispatch_id,), countdown=plan["continue_in"])
+
+        return {"status": "completed", "scheduled_chunks": len(plan["chunks"]), "continue_in": plan["continue_in"]}
+
+    except Exception as exc:
+        logger.error(f"Campaign dispatch {dispatch_id} coordination failed: {str(exc)}")
+        # Recover on retry so chunks queued before the failure are rescheduled
+        raise self.retry(exc=exc, countdown=60, max_retries=5, args=(dispatch_id, True))
+
+
+@celery_app.task(bind=True)
+def send_campaign_chunk(self, dispatch_id: int, first_subscriber_id: int, last_subscriber_id: int,
+                        reserved: int = 0):
+    """
+    Send one chunk of a campaign over a single pooled SMTP connection
+    """
+    try:
+        from config.database import async_session
+        from services import campaign_dispatch_service
+        from tasks.async_runner import run_async
+
+        async def _send():
+            async with async_session() as db:
+                return await campaign_dispatch_service.send_chunk(
+                    db, dispatch_id, first_subscriber_id, last_subscriber_id, _send_messages, reserved
+                )
+
+        summary = run_async(_send())
+        if summary.get("deferred"):
+            # The retry is booked on the send clock like any other chunk
+            retry_reserved = summary["deferred"]
+            countdown = max(summary["retry_in"] or 60, campaign_dispatch_service.get_send_clock().reserve(retry_reserved))
+            send_campaign_chunk.apply_async(
+                (dispatch_id, first_subscriber_id, last_subscriber_id, retry_reserved),
+                countdown=math.ceil(countdown),
+            )
+        return summary
+
+    except Exception as exc:
+        # Rows claimed before the failure are released by the stall recovery sweep
+        logger.error(f"Campaign chunk {dispatch_id}:{first_subscriber_id}-{last_subscriber_id} failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60, max_retries=3)
+
+
+@celery_app.task(bind=True)
+def resume_stalled_campaign_dispatches(self):
+    """
+    Restart coordinators for running dispatches that stopped making progress
+    (e.g. a worker crashed mid-chunk)
+    """
+    try:
+        from config.database import async_session
+        from services import campaign_dispatch_service
+        from tasks.async_runner import run_async
+
+        async def _find():
+            async with async_session() as db:
+                return await campaign_dispatch_service.find_stalled_dispatches(db)
+
+        stalled = run_async(_find())
+        for dispatch_id in stalled:
+            dispatch_campaign.delay(dispatch_id, True)
+        return {"status": "completed", "resumed": len(stalled)}
+
+    except Exception as exc:
+        logger.error(f"Stalled dispatch sweep failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=300, max_retries=2)
@@ -0,0 +1,83 @@
+from celery_worker import celery_app
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(bind=True)
+def process_webhook_events(self, max_batches: int = 20):
+    """
+    Drain received gateway webhooks in batches. Several workers can run this
+    at once; each claims its own batch under a lease.
+    """
+    try:
+        from config.database import async_session
+        from services import webhook_service
+        from tasks.async_runner import run_async
+
+        async def _drain():
+            totals = {"batches": 0, "events": 0, "transitioned": 0}
+            async with async_session() as db:
+                for _ in range(max_batches):
+                    result = await webhook_service.process_batch(db)
+                    if not result["claimed"]:
+                        break
+                    totals["batches"] += 1
+                    totals["events"] += result["claimed"]
+                    totals["transitioned"] += result["transitioned"]
+            return totals
+
+        totals = run_async(_drain())
+        if totals["batches"] == max_batches:
+            # More may be waiting; continue without holding this worker slot
+            process_webhook_events.delay(max_batches)
+
+        logger.info(f"Processed {totals['events']} webhook events in {totals['batches']} batches")
+        return {"status": "completed", **totals}
+
+    except Exception as exc:
+        logger.error(f"Error processing webhook events: {str(exc)}")
+        raise self.retry(exc=exc, countdown=30, max_retries=3)
+
+
+@celery_app.task(bind=True)
+def reconcile_pending_payments(self, older_than_minutes: int = None):
+    """Verify stale pending payments against the gateway and settle them"""
+    lock = None
+    try:
+        from config.database import async_session
+        from config.settings import settings
+        from services import reconciliation_service
+        from tasks.async_runner import run_async
+
+        # Runs over large backlogs can outlast the schedule interval; never overlap
+        try:
+            import redis
+            lock = redis.from_url(settings.REDIS_URL, socket_timeout=1).lock(
+                "paygate:reconcile_pending_payments", timeout=3600, blocking=False
+            )
+            if not lock.acquire():
+                logger.info("Pending payment reconciliation already running, skipping")
+                return {"status": "skipped"}
+        except Exception as e:
+            logger.warning(f"Reconciliation lock unavailable, running without it: {e}")
+            lock = None
+
+        async def _reconcile():
+            async with async_session() as db:
+                return await reconciliation_service.reconcile_pending_payments(db, older_than_minutes)
+
+        report = run_async(_reconcile())
+        if report["outcomes"].get("completed"):
+            process_webhook_events.delay()
+        return {"status": "completed", **report}
+
+    except Exception as exc:
+        logger.error(f"Error reconciling pending payments: {str(exc)}")
+        raise self.retry(exc=exc, countdown=300, max_retries=2)
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except Exception:
+                pass
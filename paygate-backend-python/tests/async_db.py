@@ -0,0 +1,25 @@
+"""
+In-memory SQLite database for service tests. The services are async, so
+each test body is a coroutine taking a session factory, run on a fresh
+database with every table created.
+"""
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import models  # noqa: F401  (registers every table)
+from config.database import Base
+
+
+def run_with_db(test):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            await test(async_sessionmaker(engine, expire_on_commit=False))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+from collections import Counter
+
+import pytest
+from sqlalchemy import func, select
+
+from async_db import run_with_db
+from models import ABTest, ABTestExposure, ABTestVariant, User
+from models.ab_test import ABTestStatus
+from services import ab_assignment_service
+from services.ab_assignment_service import (
+    Allocation,
+    assignment_token,
+    bucket,
+    cumulative_weights,
+    pick_variant,
+    verify_assignment_token,
+)
+
+
+def _allocation(weights):
+    return Allocation(
+        status=ABTestStatus.RUNNING,
+        winner_variant_id=None,
+        variant_ids=tuple(range(1, len(weights) + 1)),
+        variant_names=tuple(f"V{i}" for i in range(1, len(weights) + 1)),
+        cumulative_weights=cumulative_weights(weights),
+        loaded_at=0.0,
+    )
+
+
+def test_bucket_is_deterministic_and_in_range():
+    points = [bucket(7, f"visitor-{i}") for i in range(1000)]
+    assert points == [bucket(7, f"visitor-{i}") for i in range(1000)]
+    assert all(0 <= point < 1 for point in points)
+    assert len(set(points)) == len(points)
+
+
+def test_bucket_is_independent_across_tests():
+    same = sum(abs(bucket(1, f"v{i}") - bucket(2, f"v{i}")) < 0.01 for i in range(1000))
+    assert same < 50
+    assert bucket(1, "v") != bucket(11, "v")
+
+
+def test_cumulative_weights_are_normalised():
+    assert cumulative_weights([1, 1, 2]) == pytest.approx((0.25, 0.5, 1.0))
+    assert cumulative_weights([0.3, 0.7])[-1] == 1.0
+    # Rounded weights that do not sum to one still end at exactly 1.0
+    assert cumulative_weights([0.3333, 0.3333, 0.3333])[-1] == 1.0
+
+
+def test_cumulative_weights_without_usable_weights_split_evenly():
+    assert cumulative_weights([0, 0, 0, 0]) == pytest.approx((0.25, 0.5, 0.75, 1.0))
+    assert cumulative_weights([None, -1]) == pytest.approx((0.5, 1.0))
+    # Negative weights count as zero
+    assert cumulative_weights([-5, 1]) == pytest.approx((0.0, 1.0))
+
+
+def test_pick_variant_follows_the_weights():
+    allocation = _allocation([1, 3])
+    assert pick_variant(allocation, 0.0) == 1
+    assert pick_variant(allocation, 0.2499) == 1
+    assert pick_variant(allocation, 0.25) == 2
+    assert pick_variant(allocation, 0.9999) == 2
+    counts = Counter(pick_variant(allocation, bucket(3, f"visitor-{i}")) for i in range(20000))
+    assert counts[2] / 20000 == pytest.approx(0.75, abs=0.015)
+
+
+def test_zero_weight_variant_gets_no_traffic():
+    allocation = _allocation([0, 1, 0])
+    assert {pick_variant(allocation, bucket(4, f"visitor-{i}")) for i in range(2000)} == {2}
+
+
+def test_assignment_token_round_trip():
+    token = assignment_token(5, "visitor", 12)
+    assert token.startswith("12.")
+    assert verify_assignment_token(5, "visitor", token) == 12
+
+
+@pytest.mark.parametrize("test_id,visitor_id,token", [
+    (5, "other-visitor", None),
+    (6, "visitor", None),
+    (5, "visitor", "13." + "0" * 32),
+    (5, "visitor", "12"),
+    (5, "visitor", "x.y"),
+    (5, "visitor", ""),
+])
+def test_invalid_assignment_tokens(test_id, visitor_id, token):
+    token = token if token is not None else assignment_token(5, "visitor", 12)
+    assert verify_assignment_token(test_id, visitor_id, token) is None
+
+
+def test_forged_variant_is_rejected():
+    token = assignment_token(5, "visitor", 12)
+    forged = "13." + token.partition(".")[2]
+    assert verify_assignment_token(5, "visitor", forged) is None
+
+
+async def _seed_test(db, status=ABTestStatus.RUNNING):
+    db.add(User(id=1, email="owner@example.com", hashed_password="x"))
+    db.add(ABTest(id=1, owner_id=1, name="Headline", status=status))
+    db.add_all([ABTestVariant(id=1, test_id=1, name="A", weight=0.5),
+                ABTestVariant(id=2, test_id=1, name="B", weight=0.5)])
+    await db.commit()
+    ab_assignment_service.invalidate_allocation(1)
+
+
+def test_repeated_assignments_count_one_visit_per_visitor():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed_test(db)
+            first = await ab_assignment_service.assign_variant(db, 1, "visitor-1")
+            again = await ab_assignment_service.assign_variant(db, 1, "visitor-1")
+            other = await ab_assignment_service.assign_variant(db, 1, "visitor-2")
+            assert (first["recorded"], again["recorded"], other["recorded"]) == (True, False, True)
+            assert again["variant_id"] == first["variant_id"]
+
+            await ab_assignment_service.flush_counts(db)
+            visits = (await db.execute(select(func.sum(ABTestVariant.total_visitors)))).scalar()
+            assert visits == 2
+            exposures = (await db.execute(select(ABTestExposure.visitor_id, ABTestExposure.variant_id))).all()
+            assert sorted(exposures) == [("visitor-1", first["variant_id"]), ("visitor-2", other["variant_id"])]
+
+    run_with_db(body)
+
+
+def test_visits_are_not_counted_outside_a_running_test():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed_test(db, status=ABTestStatus.PAUSED)
+            assignment = await ab_assignment_service.assign_variant(db, 1, "visitor-1")
+            assert (assignment["variant_id"], assignment["recorded"]) == (1, False)
+            assert (await db.execute(select(ABTestExposure))).first() is None
+
+    run_with_db(body)
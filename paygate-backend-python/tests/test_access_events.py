@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from async_db import run_with_db
+from models import ContentAccessEvent
+from services import access_event_service
+
+
+@pytest.fixture(autouse=True)
+def empty_buffer(monkeypatch):
+    monkeypatch.setattr(access_event_service, "_buffer", [])
+    monkeypatch.setattr(access_event_service, "_dropped", 0)
+
+
+def test_rows_the_database_rejects_are_dropped_and_the_rest_written():
+    async def body(sessions):
+        for content_id in (1, 2, None, 4, 5, None, 7):
+            access_event_service.record_event(content_id, 9, "view", datetime(2026, 10, 19, 12))
+
+        async with sessions() as db:
+            assert await access_event_service.flush_events(db) == 5
+            written = (await db.execute(select(ContentAccessEvent.content_id))).scalars().all()
+            assert sorted(written) == [1, 2, 4, 5, 7]
+        assert access_event_service._buffer == []
+
+    run_with_db(body)
+
+
+def test_events_are_kept_when_the_database_is_unavailable():
+    class Unavailable:
+        async def execute(self, *args, **kwargs):
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+        async def rollback(self):
+            pass
+
+    for content_id in (1, 2, 3):
+        access_event_service.record_event(content_id, None, "view")
+    with pytest.raises(OperationalError):
+        asyncio.run(access_event_service.flush_events(Unavailable()))
+    assert [row[1] for row in access_event_service._buffer] == [1, 2, 3]
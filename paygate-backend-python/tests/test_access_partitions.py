@@ -0,0 +1,35 @@
+import re
+from datetime import date, timedelta
+
+from services.access_event_service import partition_days, partition_ddl, partition_name
+
+RANGE = re.compile(r"PARTITION OF content_access_events FOR VALUES FROM \('([\d-]+)'\) TO \('([\d-]+)'\)$")
+
+
+def _range(day):
+    start, end = RANGE.search(partition_ddl(day)).groups()
+    return date.fromisoformat(start), date.fromisoformat(end)
+
+
+def test_partitions_start_tomorrow():
+    today = date(2026, 10, 19)
+    days = partition_days(today, 7)
+    # Today's rows may already be in the default partition; its range is never created
+    assert today not in days
+    assert days == [today + timedelta(days=offset) for offset in range(1, 8)]
+
+
+def test_partition_ranges_are_contiguous_single_days():
+    days = partition_days(date(2026, 12, 29), 5)  # Crosses a year boundary
+    ranges = [_range(day) for day in days]
+    assert ranges[0] == (date(2026, 12, 30), date(2026, 12, 31))
+    for (start, end), day in zip(ranges, days):
+        assert start == day and end == day + timedelta(days=1)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+
+
+def test_partition_ddl_is_idempotent_and_named_by_day():
+    ddl = partition_ddl(date(2027, 1, 2))
+    assert ddl.startswith(f"CREATE TABLE IF NOT EXISTS {partition_name(date(2027, 1, 2))} ")
+    assert partition_name(date(2027, 1, 2)) == "content_access_events_p20270102"
@@ -0,0 +1,49 @@
+import html
+
+from services.campaign_dispatch_service import CompiledTemplate, SendClock, _compiled_templates
+
+CAMPAIGN = {"campaign_name": "Spring <Sale>", "campaign_description": ""}
+
+
+def test_recipient_fields_and_campaign_values():
+    template = CompiledTemplate("Hi $first_name, welcome to ${campaign_name}!", CAMPAIGN)
+    assert template.render({"first_name": "Ada"}) == "Hi Ada, welcome to Spring <Sale>!"
+
+
+def test_missing_values_and_unknown_placeholders():
+    template = CompiledTemplate("Hi $first_name, you owe $$5 for $product", CAMPAIGN)
+    assert template.render({"first_name": None}) == "Hi , you owe $5 for $product"
+
+
+def test_html_values_are_escaped():
+    template = CompiledTemplate(
+        '<p>Hi $first_name</p><h1>$campaign_name</h1><a href="$unsubscribe_url">Unsubscribe</a>',
+        CAMPAIGN, html.escape,
+    )
+    rendered = template.render({
+        "first_name": '<script>alert("x")</script>',
+        "unsubscribe_url": "https://example.com/unsubscribe?subscriber=1&list=2",
+    })
+    assert rendered == (
+        "<p>Hi &lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;</p><h1>Spring &lt;Sale&gt;</h1>"
+        '<a href="https://example.com/unsubscribe?subscriber=1&amp;list=2">Unsubscribe</a>'
+    )
+
+
+def test_only_the_html_part_is_escaped():
+    subject, body, html_body = _compiled_templates(
+        1, "Hello $first_name", "Hello $first_name", "<b>Hello $first_name</b>", "Campaign", "",
+    )
+    recipient = {"first_name": "Tom & Jerry"}
+    assert subject.render(recipient) == "Hello Tom & Jerry"
+    assert body.render(recipient) == "Hello Tom & Jerry"
+    assert html_body.render(recipient) == "<b>Hello Tom &amp; Jerry</b>"
+
+
+def test_send_clock_release():
+    clock = SendClock(rate_per_second=10)
+    assert clock.reserve(10) == 0
+    assert 0.9 < clock.reserve(10) <= 1.0
+    clock.release(10)
+    # The released second goes to the next booking
+    assert 0.9 < clock.reserve(5) <= 1.0
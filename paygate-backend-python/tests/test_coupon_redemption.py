@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from async_db import run_with_db
+from models import Coupon, DiscountCode
+from services import coupon_service
+from utils.cache import cache
+
+
+async def _seed(db, model, code, usage_limit=None, used_count=0, is_active=True, starts_in=-1, ends_in=1):
+    now = datetime.utcnow()
+    db.add(model(code=code, discount_type="percentage", discount_value=20.0, usage_limit=usage_limit,
+                 used_count=used_count, is_active=is_active,
+                 valid_from=now + timedelta(days=starts_in), valid_until=now + timedelta(days=ends_in)))
+    await db.commit()
+
+
+async def _used(db, model, code):
+    return (await db.execute(select(model.used_count).filter(model.code == code))).scalar_one()
+
+
+def test_concurrent_redemptions_stop_at_the_usage_limit():
+    async def body(sessions):
+        await cache.clear()
+        async with sessions() as db:
+            await _seed(db, Coupon, "SAVE20", usage_limit=10)
+
+        async def redeem():
+            async with sessions() as db:
+                return await coupon_service.redeem_code(db, Coupon, "SAVE20")
+
+        results = await asyncio.gather(*(redeem() for _ in range(30)))
+        redeemed = [result for result in results if result is not None]
+        assert len(redeemed) == 10
+        assert sorted(result["used_count"] for result in redeemed) == list(range(1, 11))
+        async with sessions() as db:
+            assert await _used(db, Coupon, "SAVE20") == 10
+
+    run_with_db(body)
+
+
+def test_inactive_expired_and_unknown_codes_are_not_redeemed():
+    async def body(sessions):
+        await cache.clear()
+        async with sessions() as db:
+            await _seed(db, DiscountCode, "OFF", is_active=False)
+            await _seed(db, DiscountCode, "EARLY", starts_in=1, ends_in=2)
+            await _seed(db, DiscountCode, "LATE", starts_in=-2, ends_in=-1)
+            await _seed(db, DiscountCode, "OPEN")
+
+            for code in ("OFF", "EARLY", "LATE", "MISSING"):
+                assert await coupon_service.redeem_code(db, DiscountCode, code) is None
+            # No usage limit means unlimited
+            for _ in range(3):
+                assert await coupon_service.redeem_code(db, DiscountCode, "OPEN") is not None
+            assert await _used(db, DiscountCode, "OPEN") == 3
+            total = (await db.execute(select(func.sum(DiscountCode.used_count)))).scalar()
+            assert total == 3
+
+    run_with_db(body)
+
+
+def test_release_gives_a_use_back():
+    async def body(sessions):
+        await cache.clear()
+        async with sessions() as db:
+            await _seed(db, Coupon, "ONCE", usage_limit=1)
+            assert await coupon_service.redeem_code(db, Coupon, "ONCE") is not None
+            assert await coupon_service.redeem_code(db, Coupon, "ONCE") is None
+
+            assert await coupon_service.release_code(db, Coupon, "ONCE")
+            assert await coupon_service.redeem_code(db, Coupon, "ONCE") is not None
+            # Never below zero
+            await coupon_service.release_code(db, Coupon, "ONCE")
+            assert not await coupon_service.release_code(db, Coupon, "ONCE")
+            assert await _used(db, Coupon, "ONCE") == 0
+
+    run_with_db(body)
+
+
+def test_redeem_without_commit_joins_the_callers_transaction():
+    async def body(sessions):
+        await cache.clear()
+        async with sessions() as db:
+            await _seed(db, Coupon, "CHECKOUT", usage_limit=5)
+            assert await coupon_service.redeem_code(db, Coupon, "CHECKOUT", commit=False) is not None
+            # The checkout failed further on
+            await db.rollback()
+            assert await _used(db, Coupon, "CHECKOUT") == 0
+
+    run_with_db(body)
+
+
+def test_validation_is_served_from_cache_until_a_redemption():
+    async def body(sessions):
+        await cache.clear()
+        async with sessions() as db:
+            await _seed(db, Coupon, "LAST", usage_limit=1)
+            assert (await coupon_service.validate_code(db, Coupon, "LAST"))["used_count"] == 0
+            assert await coupon_service.validate_code(db, Coupon, "NOPE") is None
+
+            await coupon_service.redeem_code(db, Coupon, "LAST")
+            # Redeeming dropped the cached snapshot, so the code now reads as used up
+            assert await coupon_service.validate_code(db, Coupon, "LAST") is None
+            assert (await coupon_service.lookup_code(db, Coupon, "LAST"))["used_count"] == 1
+
+    run_with_db(body)
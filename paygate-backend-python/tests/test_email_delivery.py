@@ -0,0 +1,83 @@
+import socket
+import pytest
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+from utils.smtp_pool import SMTPConnectionPool, DomainThrottle, build_message
+
+
+class RecordingHandler:
+    """SMTP sink that records every delivered envelope and the connection it arrived on"""
+
+    def __init__(self):
+        self.envelopes = []
+        self.peers = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        self.peers.add(session.peer)
+        return "250 Message accepted for delivery"
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_sink():
+    handler = RecordingHandler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    try:
+        yield handler, controller.port
+    finally:
+        controller.stop()
+
+
+def _messages(count, domain="example.com"):
+    return [
+        {"to": f"user{i}@{domain}", "subject": f"Message {i}", "body": "Hello"}
+        for i in range(count)
+    ]
+
+
+def test_batch_is_sent_over_one_connection(smtp_sink, monkeypatch):
+    from tasks import email as email_tasks
+
+    handler, port = smtp_sink
+    pool = SMTPConnectionPool("127.0.0.1", port, use_tls=False)
+    monkeypatch.setattr(email_tasks, "get_smtp_pool", lambda: pool)
+    monkeypatch.setattr(email_tasks, "get_domain_throttle", lambda: DomainThrottle(1000))
+
+    result = email_tasks.send_email_batch.run(_messages(5))
+    pool.close()
+
+    assert result["sent"] == 5
+    assert result["failed"] == 0
+    assert len(handler.envelopes) == 5
+    assert len(handler.peers) == 1
+
+
+def test_pool_reconnects_after_connection_drop(smtp_sink):
+    handler, port = smtp_sink
+    pool = SMTPConnectionPool("127.0.0.1", port, use_tls=False)
+
+    pool.send(build_message("a@example.com", "First", "Hello"))
+    pool._connection.sock.shutdown(socket.SHUT_RDWR)
+    pool.send(build_message("b@example.com", "Second", "Hello"))
+    pool.close()
+
+    assert [envelope.rcpt_tos for envelope in handler.envelopes] == [["a@example.com"], ["b@example.com"]]
+    assert len(handler.peers) == 2
+
+
+def test_domain_throttle_limits_each_domain_separately():
+    throttle = DomainThrottle(2, {"slow.example": 1})
+
+    assert throttle.acquire("example.com") == 0
+    assert throttle.acquire("example.com") == 0
+    assert throttle.acquire("example.com") > 0
+    assert throttle.acquire("slow.example") == 0
+    assert throttle.acquire("slow.example") > 0
@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+import pytest
+
+from utils.experiment_stats import chi2_sf, compute_experiment_stats, erfc, normal_sf
+
+
+def _stats(visitors, conversions, **kwargs):
+    visitors, conversions = np.array([visitors]), np.array([conversions])
+    return compute_experiment_stats(visitors, conversions, np.ones_like(visitors, dtype=bool), **kwargs)
+
+
+def test_tail_functions_match_reference_values():
+    for x in (-2.0, -0.5, 0.0, 0.3, 1.0, 2.5, 4.0):
+        assert erfc(x) == pytest.approx(math.erfc(x), rel=2e-7)
+    assert normal_sf(1.959963984540054) == pytest.approx(0.025, rel=1e-6)
+    # 95th percentiles of chi-square with 1 to 5 degrees of freedom
+    critical = [3.841458820694124, 5.991464547107979, 7.814727903251178, 9.487729036781154, 11.070497693516351]
+    np.testing.assert_allclose(chi2_sf(critical, [1, 2, 3, 4, 5]), 0.05, rtol=1e-6)
+    assert chi2_sf(0.0, 3) == pytest.approx(1.0)
+
+
+def test_two_proportion_z_test():
+    stats = _stats([1000, 1000], [100, 130])
+    # Pooled rate 0.115: z = 0.03 / sqrt(0.115 * 0.885 * 2 / 1000)
+    assert stats.z_score[0, 1] == pytest.approx(2.102741, rel=1e-5)
+    assert stats.p_value[0, 1] == pytest.approx(0.035488, rel=1e-4)
+    assert stats.lift[0, 1] == pytest.approx(0.3)
+    assert stats.p_value[0, 0] == 1.0
+
+
+def test_chi_square_matches_z_test_for_two_arms():
+    stats = _stats([1000, 1000], [100, 130])
+    assert stats.chi_square[0] == pytest.approx(stats.z_score[0, 1] ** 2, rel=1e-9)
+    assert stats.chi_square_p_value[0] == pytest.approx(stats.p_value[0, 1], rel=1e-6)
+
+
+def test_chi_square_three_arms():
+    stats = _stats([500, 500, 500], [50, 60, 80])
+    # Expected conversions 190 / 3 per arm out of 500
+    expected = 190 / 3
+    manual = sum((c - expected) ** 2 / expected + ((500 - c) - (500 - expected)) ** 2 / (500 - expected)
+                 for c in (50, 60, 80))
+    assert stats.chi_square[0] == pytest.approx(manual)
+    assert stats.chi_square_p_value[0] == pytest.approx(math.exp(-manual / 2), rel=1e-6)  # df = 2
+
+
+def test_bayesian_small_arms_use_exact_beta_posteriors():
+    # Control Beta(1, 1) against Beta(2, 1): P(variant beats control) = 2/3
+    stats = _stats([0, 1], [0, 1], draws=200_000)
+    assert stats.prob_beat_control[0, 1] == pytest.approx(2 / 3, abs=0.005)
+    assert stats.prob_best[0, 1] == pytest.approx(2 / 3, abs=0.005)
+    assert stats.prob_best[0].sum() == pytest.approx(1.0)
+
+
+def test_bayesian_large_arms_match_beta_sampling():
+    stats = _stats([1000, 1000], [100, 130])
+    rng = np.random.default_rng(1)
+    control = rng.beta(101, 901, 400_000)
+    variant = rng.beta(131, 871, 400_000)
+    assert stats.prob_beat_control[0, 1] == pytest.approx((variant > control).mean(), abs=0.003)
+    assert stats.prob_beat_control[0, 0] == 0.0
+
+
+def test_msprt_always_valid_p_value():
+    stats = _stats([1000, 1000], [100, 130], tau=0.05)
+    variance = 0.1 * 0.9 / 1000 + 0.13 * 0.87 / 1000
+    tau2 = 0.05 ** 2
+    log_lambda = 0.5 * math.log(variance / (variance + tau2)) + tau2 * 0.03 ** 2 / (2 * variance * (variance + tau2))
+    assert stats.always_valid_p_value[0, 1] == pytest.approx(math.exp(-log_lambda))
+    assert stats.always_valid_p_value[0, 1] == pytest.approx(0.470032, rel=1e-5)
+    # More conservative than the fixed-horizon test at the same data
+    assert stats.always_valid_p_value[0, 1] > stats.p_value[0, 1]
+
+
+def test_msprt_shrinks_with_evidence_and_ignores_empty_arms():
+    p_values = [_stats([n, n], [n // 10, int(n * 0.13)]).always_valid_p_value[0, 1] for n in (1000, 4000, 16000)]
+    assert p_values[0] > p_values[1] > p_values[2]
+    assert p_values[2] < 1e-10
+    assert _stats([0, 100], [0, 10]).always_valid_p_value[0, 1] == 1.0
+
+
+def test_padded_variants_are_masked_out():
+    visitors = np.array([[1000, 1000, 0], [500, 500, 500]])
+    conversions = np.array([[100, 130, 0], [50, 60, 80]])
+    mask = np.array([[True, True, False], [True, True, True]])
+    stats = compute_experiment_stats(visitors, conversions, mask)
+    single = _stats([1000, 1000], [100, 130])
+    assert stats.chi_square[0] == pytest.approx(single.chi_square[0])
+    assert stats.p_value[0, 2] == 1.0 and stats.prob_best[0, 2] == 0.0
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from config.settings import settings
+from utils.disk_cache import DiskLRUCache
+from utils.file_delivery import build_file_response, parse_range_header, resolve_upload_path
+
+
+def test_no_range_header():
+    assert parse_range_header(None, 100) is None
+    assert parse_range_header("", 100) is None
+
+
+def test_simple_and_open_ended_ranges():
+    assert parse_range_header("bytes=0-9", 100) == (0, 9)
+    assert parse_range_header("bytes=90-", 100) == (90, 99)
+    # An end past the file is clamped to the last byte
+    assert parse_range_header("bytes=50-500", 100) == (50, 99)
+
+
+def test_suffix_ranges():
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    # A suffix longer than the file is the whole file
+    assert parse_range_header("bytes=-500", 100) == (0, 99)
+
+
+def test_multiple_and_overlapping_ranges_are_served_whole():
+    assert parse_range_header("bytes=0-9,20-29", 100) is None
+    assert parse_range_header("bytes=0-50,25-75", 100) is None
+
+
+def test_malformed_ranges_are_ignored():
+    assert parse_range_header("bytes=-", 100) is None
+    assert parse_range_header("items=0-9", 100) is None
+    assert parse_range_header("bytes=a-b", 100) is None
+
+
+@pytest.mark.parametrize("header,size", [
+    ("bytes=100-", 100),
+    ("bytes=150-200", 100),
+    ("bytes=20-10", 100),
+    ("bytes=-0", 100),
+    ("bytes=-5", 0),
+])
+def test_unsatisfiable_ranges(header, size):
+    with pytest.raises(HTTPException) as excinfo:
+        parse_range_header(header, size)
+    assert excinfo.value.status_code == 416
+    assert excinfo.value.headers["Content-Range"] == f"bytes */{size}"
+
+
+def test_resolve_upload_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    stored = tmp_path / "documents" / "ab" / "cd" / "file.pdf"
+    stored.parent.mkdir(parents=True)
+    stored.write_bytes(b"%PDF-")
+    (tmp_path.parent / "outside.txt").write_text("secret")
+
+    assert resolve_upload_path(None, "upload://documents/ab/cd/file.pdf") == stored.resolve()
+    assert resolve_upload_path(None, "/api/uploads/documents/ab/cd/file.pdf") == stored.resolve()
+    assert resolve_upload_path(str(stored), None) == stored.resolve()
+    assert resolve_upload_path(None, "upload://../outside.txt") is None
+    assert resolve_upload_path(None, "upload://documents/missing.pdf") is None
+    assert resolve_upload_path(None, "https://cdn.example.com/file.pdf") is None
+
+
+@pytest.mark.parametrize("mode,header,expected", [
+    ("x-accel-redirect", "X-Accel-Redirect", "/protected-uploads/.cache/invoices/ab/invoice.pdf"),
+    ("x-sendfile", "X-Sendfile", None),
+])
+def test_offload_modes_with_relative_upload_dir(tmp_path, monkeypatch, mode, header, expected):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", "uploads")
+    monkeypatch.setattr(settings, "FILE_DELIVERY_MODE", mode)
+    monkeypatch.setattr(settings, "FILE_DELIVERY_INTERNAL_PREFIX", "/protected-uploads/")
+    cached = tmp_path / "uploads" / ".cache" / "invoices" / "ab" / "invoice.pdf"
+    cached.parent.mkdir(parents=True)
+    cached.write_bytes(b"%PDF-")
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+    for path in (DiskLRUCache(Path("uploads") / ".cache" / "invoices", 1024).root / "ab" / "invoice.pdf",
+                 Path("uploads/.cache/invoices/ab/invoice.pdf")):
+        response = build_file_response(request, path, "application/pdf")
+        assert response.status_code == 200
+        assert response.headers[header] == (expected or str(cached.resolve()))
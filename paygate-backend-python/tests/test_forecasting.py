@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from utils.forecasting import SEASON_LENGTH, holt_winters
+
+WEEKLY = np.array([100.0, 120.0, 130.0, 125.0, 160.0, 220.0, 180.0])
+
+
+def _seasonal_series(days, level=0.0, slope=0.0, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    return level + slope * t + WEEKLY[t % SEASON_LENGTH] + rng.normal(0, noise, days)
+
+
+def test_exact_seasonal_series_is_reproduced():
+    series = _seasonal_series(8 * SEASON_LENGTH)
+    result = holt_winters(series, horizon=14)
+    expected = WEEKLY[np.arange(len(series), len(series) + 14) % SEASON_LENGTH]
+    np.testing.assert_allclose(result.forecast[0], expected, atol=1e-6)
+    assert result.rmse[0] == pytest.approx(0, abs=1e-6)
+
+
+def test_trend_and_season_are_tracked():
+    days = 16 * SEASON_LENGTH
+    series = _seasonal_series(days, level=50, slope=2.0, noise=3.0, seed=1)
+    result = holt_winters(series, horizon=SEASON_LENGTH)
+    t = np.arange(days, days + SEASON_LENGTH)
+    truth = 50 + 2.0 * t + WEEKLY[t % SEASON_LENGTH]
+    # Damping pulls the trend in slightly; a week ahead stays close to the truth
+    assert np.abs(result.forecast[0] - truth).max() < 15
+    assert np.argmax(result.forecast[0]) == np.argmax(truth)
+    assert 1 < result.rmse[0] < 6
+
+
+def test_intervals_contain_forecast_and_widen():
+    series = _seasonal_series(10 * SEASON_LENGTH, level=200, noise=10.0, seed=2)
+    result = holt_winters(series, horizon=21, interval_level=0.9)
+    assert np.all(result.lower <= result.forecast) and np.all(result.forecast <= result.upper)
+    width = result.upper[0] - result.lower[0]
+    assert np.all(np.diff(width) >= -1e-9)
+    # One step ahead the interval is just the residual quantile
+    assert width[0] / 2 == pytest.approx(1.6448536 * result.rmse[0], rel=1e-6)
+
+
+def test_series_are_fitted_independently():
+    a = _seasonal_series(9 * SEASON_LENGTH, level=10, noise=5.0, seed=3)
+    b = _seasonal_series(9 * SEASON_LENGTH, level=500, slope=-1.0, noise=20.0, seed=4)
+    together = holt_winters(np.vstack([a, b]), horizon=10)
+    for row, series in enumerate((a, b)):
+        alone = holt_winters(series, horizon=10)
+        np.testing.assert_allclose(together.forecast[row], alone.forecast[0])
+        np.testing.assert_allclose(together.params[row], alone.params[0])
+
+
+def test_forecasts_are_clipped_at_zero():
+    series = np.maximum(_seasonal_series(6 * SEASON_LENGTH, level=400, slope=-10.0), 0)
+    result = holt_winters(series, horizon=30)
+    assert result.forecast.min() >= 0 and result.lower.min() >= 0
+
+
+def test_needs_two_seasons():
+    with pytest.raises(ValueError):
+        holt_winters(np.ones(2 * SEASON_LENGTH - 1), horizon=7)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from utils.hyperloglog import HyperLogLog, _fold, precision_for_error
+
+
+def _values(start, stop):
+    return [f"customer-{i}@example.com" for i in range(start, stop)]
+
+
+def _sketch(values, precision, exact_limit=0):
+    sketch = HyperLogLog(precision, exact_limit)
+    sketch.update(values)
+    return sketch
+
+
+def test_precision_for_error():
+    assert precision_for_error(0.01) == 14  # 1.04 / sqrt(2 ** 14) = 0.0081
+    assert precision_for_error(0.02) == 12
+    assert precision_for_error(0.5) == 4
+    assert precision_for_error(0.0001) == 16
+
+
+def test_exact_until_the_limit():
+    sketch = _sketch(_values(0, 100), precision=10, exact_limit=100)
+    assert sketch.is_exact and sketch.count() == 100
+    sketch.update(_values(0, 100))  # Duplicates do not count
+    assert sketch.is_exact and sketch.count() == 100
+
+    sketch.add("one more")
+    assert not sketch.is_exact
+    direct = _sketch(_values(0, 100) + ["one more"], precision=10)
+    np.testing.assert_array_equal(sketch.registers, direct.registers)
+
+
+def test_registers_estimate_within_error():
+    values = _values(0, 50_000)
+    sketch = _sketch(values, precision=12)
+    # Standard error 1.6%; the hashes are fixed, so this is deterministic
+    assert sketch.count() == pytest.approx(len(values), rel=0.05)
+    # Linear counting for small cardinalities
+    assert _sketch(_values(0, 300), precision=12).count() == pytest.approx(300, rel=0.03)
+
+
+@pytest.mark.parametrize("precision,target", [(12, 11), (12, 8), (14, 4), (10, 10)])
+def test_fold_matches_a_directly_built_coarser_sketch(precision, target):
+    values = _values(0, 20_000)
+    fine = _sketch(values, precision)
+    coarse = _sketch(values, target)
+    np.testing.assert_array_equal(_fold(fine.registers, precision, target), coarse.registers)
+
+
+def test_merge_is_the_sketch_of_the_union():
+    a, b = _values(0, 6000), _values(4000, 10_000)
+    merged = _sketch(a, 11)
+    merged.merge(_sketch(b, 11))
+    np.testing.assert_array_equal(merged.registers, _sketch(a + b, 11).registers)
+
+
+def test_merge_of_exact_sketches_stays_exact_until_the_limit():
+    merged = _sketch(_values(0, 60), 10, exact_limit=100)
+    merged.merge(_sketch(_values(30, 90), 10, exact_limit=100))
+    assert merged.is_exact and merged.count() == 90
+
+    merged.merge(_sketch(_values(90, 120), 10, exact_limit=100))
+    assert not merged.is_exact
+    np.testing.assert_array_equal(merged.registers, _sketch(_values(0, 120), 10).registers)
+
+
+@pytest.mark.parametrize("a_limit,b_limit", [(0, 0), (10_000, 0), (0, 10_000), (10_000, 10_000)])
+def test_merge_across_precisions_folds_to_the_coarser(a_limit, b_limit):
+    a, b = _values(0, 3000), _values(2000, 5000)
+    limit = a_limit and b_limit  # Only two exact sketches stay exact
+    expected = _sketch(a + b, 9, exact_limit=limit)
+    for first, second in ((_sketch(a, 12, a_limit), _sketch(b, 9, b_limit)),
+                          (_sketch(b, 9, b_limit), _sketch(a, 12, a_limit))):
+        first.merge(second)
+        assert first.precision == 9
+        if limit:
+            assert first.is_exact and first.count() == 5000
+        else:
+            np.testing.assert_array_equal(first.registers, expected.registers)
+
+
+def test_serialisation_round_trip():
+    for sketch in (_sketch(_values(0, 50), 10, exact_limit=100), _sketch(_values(0, 5000), 10)):
+        restored = HyperLogLog.from_bytes(sketch.to_bytes(), sketch.precision, sketch.is_exact, 100)
+        assert restored.is_exact == sketch.is_exact
+        assert restored.count() == sketch.count()
+        if not sketch.is_exact:
+            np.testing.assert_array_equal(restored.registers, sketch.registers)
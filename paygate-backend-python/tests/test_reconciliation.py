@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from async_db import run_with_db
+from models import Payment, WebhookEvent
+from services import reconciliation_service
+from utils.paystack_client import GatewayError
+
+
+class FakeGateway:
+    """Answers verify_transaction from a reference -> status map"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.verified = []
+
+    async def verify_transaction(self, reference):
+        self.verified.append(reference)
+        status = self.statuses.get(reference)
+        if status is None:
+            raise GatewayError("Transaction reference not found", status_code=404)
+        if isinstance(status, GatewayError):
+            raise status
+        return {"data": {"id": f"tx-{reference}", "reference": reference, "status": status,
+                         "amount": 2500, "currency": "NGN"}}
+
+
+async def _seed(db, *payments):
+    db.add_all([
+        Payment(reference=reference, amount=25.0, currency="NGN", status=status,
+                customer_email="buyer@example.com", created_at=created_at)
+        for reference, status, created_at in payments
+    ])
+    await db.commit()
+
+
+async def _statuses(db):
+    rows = await db.execute(select(Payment.reference, Payment.status))
+    return dict(rows.all())
+
+
+def test_keyset_pages_visit_every_pending_payment_once():
+    async def body(sessions):
+        stamp = datetime.utcnow() - timedelta(hours=1)
+        async with sessions() as db:
+            # Equal timestamps straddle page boundaries; id breaks the tie
+            await _seed(db, *[(f"ref-{i}", "pending", stamp + timedelta(seconds=i // 3)) for i in range(7)])
+            await _seed(db, ("ref-done", "completed", stamp), ("ref-new", "pending", datetime.utcnow()))
+
+            gateway = FakeGateway({f"ref-{i}": "ongoing" for i in range(7)})
+            report = await reconciliation_service.reconcile_pending_payments(
+                db, older_than_minutes=30, page_size=2, client=gateway)
+
+            assert sorted(gateway.verified) == sorted(f"ref-{i}" for i in range(7))
+            assert report["scanned"] == 7
+            assert report["outcomes"] == {"pending": 7}
+
+    run_with_db(body)
+
+
+def test_outcomes_are_applied_per_status():
+    async def body(sessions):
+        recent = datetime.utcnow() - timedelta(hours=1)
+        stale = datetime.utcnow() - timedelta(days=3)
+        async with sessions() as db:
+            await _seed(db, ("paid", "pending", recent), ("failed", "pending", recent),
+                        ("reversed", "pending", recent), ("waiting", "pending", recent),
+                        ("abandoned", "pending", stale), ("unknown-old", "pending", stale),
+                        ("unknown-new", "pending", recent), ("flaky", "pending", recent))
+            gateway = FakeGateway({
+                "paid": "success", "failed": "failed", "reversed": "reversed",
+                "waiting": "ongoing", "abandoned": "abandoned",
+                "flaky": GatewayError("Gateway timeout", status_code=504, retryable=True),
+            })
+            report = await reconciliation_service.reconcile_pending_payments(
+                db, older_than_minutes=30, client=gateway)
+
+            assert report["outcomes"] == {"completed": 1, "failed": 1, "refunded": 1, "pending": 2,
+                                          "cancelled": 2, "error": 1}
+            assert report["applied"] == {"completed": 1, "failed": 1, "refunded": 1, "cancelled": 2}
+            # Paid transactions go through the webhook pipeline rather than being set here
+            assert await _statuses(db) == {
+                "paid": "pending", "failed": "failed", "reversed": "refunded", "waiting": "pending",
+                "abandoned": "cancelled", "unknown-old": "cancelled", "unknown-new": "pending",
+                "flaky": "pending",
+            }
+            event = (await db.execute(select(WebhookEvent))).scalar_one()
+            assert (event.event_type, event.reference, event.status) == ("charge.success", "paid", "received")
+
+    run_with_db(body)
+
+
+def test_updates_skip_payments_no_longer_pending():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, ("raced", "completed", datetime.utcnow()), ("stuck", "pending", datetime.utcnow()))
+            ids = dict((await db.execute(select(Payment.reference, Payment.id))).all())
+
+            # A webhook completed "raced" between the page read and the update
+            applied = await reconciliation_service._apply_page(
+                db, {"failed": [(ids["raced"], {}), (ids["stuck"], {})]})
+
+            assert applied == {"failed": 1}
+            assert await _statuses(db) == {"raced": "completed", "stuck": "failed"}
+
+    run_with_db(body)
+
+
+def test_paid_transaction_already_seen_by_webhook_is_not_recorded_twice():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, ("paid", "pending", datetime.utcnow() - timedelta(hours=1)))
+            gateway = FakeGateway({"paid": "success"})
+            for _ in range(2):
+                await reconciliation_service.reconcile_pending_payments(db, older_than_minutes=30, client=gateway)
+
+            events = (await db.execute(select(WebhookEvent))).scalars().all()
+            assert len(events) == 1
+
+    run_with_db(body)
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import date
+from itertools import combinations
+
+import pytest
+
+from services.revenue_cube_service import CUBES, TIME_DIMENSIONS, _cells, plan
+
+GROUPING = ("currency", "channel", "payment_method", "paywall_id")
+DAY = date(2026, 10, 19)
+
+
+@pytest.mark.parametrize("dimensions", [
+    set(combo) for size in range(len(GROUPING) + 1) for combo in combinations(GROUPING, size)
+])
+def test_plan_picks_the_smallest_covering_cube(dimensions):
+    covering = [name for name, dims in CUBES.items() if dimensions <= set(dims)]
+    assert plan(dimensions) == (covering[0] if covering else None)
+    # Time dimensions are rolled up from days and never change the cube
+    for time_dimension in TIME_DIMENSIONS:
+        assert plan(dimensions | {time_dimension}) == plan(dimensions)
+
+
+def test_plan_examples():
+    assert plan([]) == "totals"
+    assert plan(["month"]) == "totals"
+    assert plan(["currency", "week"]) == "currency"
+    assert plan(["paywall_id"]) == "paywall"
+    assert plan(["channel"]) == "payment"
+    assert plan(["payment_method", "currency", "day"]) == "payment"
+    assert plan(["paywall_id", "channel"]) is None
+
+
+GROUPS = [
+    # paywall_id, currency, channel, payment_method, status, amount, count
+    (1, "USD", "card", "visa", "completed", 30.0, 3),
+    (1, "USD", "card", "visa", "failed", 20.0, 2),
+    (2, "USD", "bank", None, "completed", 15.5, 1),
+    (2, "NGN", "bank", None, "refunded", 7.25, 1),
+    (None, "NGN", None, None, "pending", 9.0, 4),
+]
+
+
+def _by_key(cells, cube):
+    return {tuple(cell[d] for d in CUBES[cube]): cell for cell in cells if cell["cube"] == cube}
+
+
+def test_cells_cover_every_cube_with_the_same_totals():
+    cells = _cells(7, DAY, GROUPS)
+    assert {cell["cube"] for cell in cells} == set(CUBES)
+    assert all(cell["owner_id"] == 7 and cell["day"] == DAY for cell in cells)
+    for cube in CUBES:
+        cube_cells = [cell for cell in cells if cell["cube"] == cube]
+        assert sum(cell["attempts"] for cell in cube_cells) == 11
+        assert sum(cell["sales"] for cell in cube_cells) == 4
+        assert sum(cell["failed"] for cell in cube_cells) == 2
+        assert sum(cell["revenue"] for cell in cube_cells) == pytest.approx(45.5)
+        assert sum(cell["refunded_amount"] for cell in cube_cells) == pytest.approx(7.25)
+
+
+def test_cells_are_grouped_by_the_cube_dimensions():
+    cells = _cells(7, DAY, GROUPS)
+    assert set(_by_key(cells, "totals")) == {()}
+    currency = _by_key(cells, "currency")
+    assert set(currency) == {("USD",), ("NGN",)}
+    assert currency[("USD",)]["revenue"] == pytest.approx(45.5)
+    assert currency[("NGN",)]["attempts"] == 5
+    # Missing values are stored as '' / 0 so they can be part of the key
+    assert set(_by_key(cells, "paywall")) == {("USD", 1), ("USD", 2), ("NGN", 2), ("NGN", 0)}
+    payment = _by_key(cells, "payment")
+    assert set(payment) == {("USD", "card", "visa"), ("USD", "bank", ""), ("NGN", "bank", ""), ("NGN", "", "")}
+    assert payment[("USD", "card", "visa")]["failed"] == 2
+
+
+def test_dimensions_outside_the_cube_are_blank():
+    for cell in _cells(7, DAY, GROUPS):
+        for dimension in GROUPING:
+            if dimension not in CUBES[cell["cube"]]:
+                assert cell[dimension] == ("" if dimension != "paywall_id" else 0)
+
+
+def test_geographic_data_does_not_guess_countries_from_currencies(monkeypatch):
+    from services import analytics_service, revenue_cube_service
+
+    async def query(db, owner_id, start, end, dimensions):
+        assert dimensions == ["currency"]
+        return [{"currency": "NGN", "sales": 3, "revenue": 30.0},
+                {"currency": "USD", "sales": 1, "revenue": 90.0},
+                {"currency": "GHS", "sales": 0, "revenue": 0.0}]
+
+    monkeypatch.setattr(revenue_cube_service, "query", query)
+    rows = asyncio.run(analytics_service.get_geographic_data(None, 7))
+    assert [(row.currency, row.country, row.country_code, row.percentage) for row in rows] == [
+        ("USD", "Unknown", "", 75.0), ("NGN", "Unknown", "", 25.0),
+    ]
@@ -0,0 +1,220 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from async_db import run_with_db
+from models import Invoice, PaymentMethod, Subscription, SubscriptionPlan, User
+from services import subscription_renewal_service
+from utils.paystack_client import GatewayError
+
+
+class FakeGateway:
+    """Charges and verifies from reference -> status maps; unknown references are not found"""
+
+    def __init__(self, charges=None, verified=None):
+        self.charges = charges or {}
+        self.verified = verified or {}
+        self.charged = []
+        self.lookups = []
+
+    async def charge_authorization(self, email, amount, authorization_code, reference, currency=None, metadata=None):
+        self.charged.append(reference)
+        return {"data": {"reference": reference, "status": self.charges.get(reference, "success"),
+                         "gateway_response": "Insufficient Funds"}}
+
+    async def verify_transaction(self, reference):
+        self.lookups.append(reference)
+        status = self.verified.get(reference)
+        if status is None:
+            raise GatewayError("Transaction reference not found", status_code=404)
+        if isinstance(status, GatewayError):
+            raise status
+        return {"data": {"reference": reference, "status": status}}
+
+
+async def _seed(db, *subscriptions, card=True):
+    """subscriptions: (id, next_billing_date, price)"""
+    db.add(User(id=1, email="member@example.com", hashed_password="x"))
+    if card:
+        db.add(PaymentMethod(user_id=1, type="card", provider="paystack", provider_payment_method_id="AUTH_1",
+                             is_default=True, is_active=True))
+    for subscription_id, due, price in subscriptions:
+        db.add(SubscriptionPlan(id=subscription_id, name="Pro", price=price, currency="NGN", billing_period="month"))
+        db.add(Subscription(id=subscription_id, user_id=1, plan_id=subscription_id, status="active",
+                            start_date=due - timedelta(days=31), next_billing_date=due, auto_renew=True))
+    await db.commit()
+
+
+async def _invoices(db):
+    rows = await db.execute(select(Invoice.invoice_number, Invoice.status).order_by(Invoice.invoice_number))
+    return dict(rows.all())
+
+
+async def _subscription(db, subscription_id):
+    return (await db.execute(
+        select(Subscription.status, Subscription.next_billing_date).filter(Subscription.id == subscription_id)
+    )).one()
+
+
+def test_due_subscription_is_claimed_invoiced_and_charged_once():
+    async def body(sessions):
+        due = datetime(2026, 1, 31, 9, 0)
+        async with sessions() as db:
+            await _seed(db, (1, due, 5000.0), (2, datetime.utcnow() + timedelta(days=3), 5000.0))
+            gateway = FakeGateway()
+            report = await subscription_renewal_service.run_renewals(db, client=gateway)
+
+            assert report["renewed"] == 1
+            assert report["outcomes"] == {"paid": 1, "free": 0}
+            assert gateway.charged == ["SUB-1-20260131"]
+            assert await _invoices(db) == {"SUB-1-20260131": "paid"}
+            # The period advanced, clamped to the end of February
+            assert await _subscription(db, 1) == ("active", datetime(2026, 2, 28, 9, 0))
+
+            # Each run takes the next missed period; a period is never invoiced twice
+            await subscription_renewal_service.run_renewals(db, client=gateway)
+            assert gateway.charged == ["SUB-1-20260131", "SUB-1-20260228"]
+            assert list(await _invoices(db)) == ["SUB-1-20260131", "SUB-1-20260228"]
+
+    run_with_db(body)
+
+
+def test_claim_skips_a_subscription_another_worker_advanced():
+    async def body(sessions):
+        due = datetime(2026, 1, 31, 9, 0)
+        async with sessions() as db:
+            await _seed(db, (1, due, 5000.0), (2, due, 5000.0))
+
+            class Interleaved:
+                """Lets another worker renew subscription 2 right after the batch is read"""
+                reads = 0
+
+                async def execute(self, *args, **kwargs):
+                    result = await db.execute(*args, **kwargs)
+                    self.reads += 1
+                    if self.reads == 1:
+                        await db.execute(Subscription.__table__.update()
+                                         .where(Subscription.__table__.c.id == 2)
+                                         .values(next_billing_date=datetime(2026, 2, 28, 9, 0)))
+                    return result
+
+            rows = await subscription_renewal_service._claim_due(Interleaved(), 10, datetime.utcnow())
+            assert [row.id for row in rows] == [1]
+            assert (await _subscription(db, 1))[1] == (await _subscription(db, 2))[1] == datetime(2026, 2, 28, 9, 0)
+
+    run_with_db(body)
+
+
+def test_missing_card_fails_the_invoice_and_marks_past_due():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, (1, datetime.utcnow() - timedelta(hours=1), 5000.0), card=False)
+            report = await subscription_renewal_service.run_renewals(db, client=FakeGateway())
+            assert report["outcomes"] == {"no_payment_method": 1, "free": 0}
+            assert list((await _invoices(db)).values()) == ["failed"]
+            assert (await _subscription(db, 1))[0] == "past_due"
+
+    run_with_db(body)
+
+
+def test_declined_charge_fails_the_invoice_with_the_reason():
+    async def body(sessions):
+        due = datetime(2026, 1, 31, 9, 0)
+        async with sessions() as db:
+            await _seed(db, (1, due, 5000.0))
+            gateway = FakeGateway(charges={"SUB-1-20260131": "failed"})
+            report = await subscription_renewal_service.run_renewals(db, client=gateway)
+            assert report["outcomes"] == {"declined": 1, "free": 0}
+            (status, description) = (await db.execute(select(Invoice.status, Invoice.description))).one()
+            assert status == "failed" and description.endswith("(Insufficient Funds)")
+            assert (await _subscription(db, 1))[0] == "past_due"
+
+            # No further periods are billed on a failing card
+            await subscription_renewal_service.run_renewals(db, client=gateway)
+            assert gateway.charged == ["SUB-1-20260131"]
+
+    run_with_db(body)
+
+
+def test_free_plan_renews_without_a_charge():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, (1, datetime.utcnow() - timedelta(hours=1), 0.0))
+            gateway = FakeGateway()
+            report = await subscription_renewal_service.run_renewals(db, client=gateway)
+            assert report["outcomes"] == {"free": 1}
+            assert gateway.charged == []
+            assert list((await _invoices(db)).values()) == ["paid"]
+
+    run_with_db(body)
+
+
+def test_stalled_invoices_are_verified_before_any_recharge():
+    async def body(sessions):
+        now = datetime.utcnow()
+        stale = now - timedelta(hours=2)
+        async with sessions() as db:
+            await _seed(db, (1, now + timedelta(days=10), 5000.0))
+            db.add_all([
+                Invoice(user_id=1, subscription_id=1, amount=5000.0, currency="NGN", status="pending",
+                        invoice_number=number, description="Pro", created_at=stale, updated_at=stale)
+                for number in ("went-through", "never-sent", "in-flight")
+            ])
+            await db.commit()
+            gateway = FakeGateway(verified={"went-through": "success", "in-flight": "processing"})
+            report = await subscription_renewal_service.run_renewals(db, client=gateway)
+
+            assert report["retried"] == 3
+            # Only the charge the gateway never saw is sent again
+            assert gateway.charged == ["never-sent"]
+            assert await _invoices(db) == {"in-flight": "pending", "never-sent": "paid", "went-through": "paid"}
+
+    run_with_db(body)
+
+
+def test_abandoned_invoices_are_declined_only_when_the_gateway_says_so():
+    async def body(sessions):
+        now = datetime.utcnow()
+        abandoned = now - timedelta(hours=200)
+        async with sessions() as db:
+            await _seed(db, (1, now + timedelta(days=10), 5000.0))
+            db.add_all([
+                Invoice(user_id=1, subscription_id=1, amount=5000.0, currency="NGN", status="pending",
+                        invoice_number=number, description="Pro", created_at=abandoned, updated_at=abandoned)
+                for number in ("paid-late", "failed", "never-seen", "processing", "timed-out")
+            ])
+            await db.commit()
+            gateway = FakeGateway(verified={
+                "paid-late": "success", "failed": "failed", "processing": "processing",
+                "timed-out": GatewayError("Gateway timeout", status_code=504, retryable=True),
+            })
+            report = await subscription_renewal_service.run_renewals(db, client=gateway)
+
+            assert gateway.charged == []
+            assert sorted(gateway.lookups) == ["failed", "never-seen", "paid-late", "processing", "timed-out"]
+            assert report["outcomes"] == {"paid": 1, "declined": 2, "error": 2}
+            assert await _invoices(db) == {
+                "failed": "failed", "never-seen": "failed", "paid-late": "paid",
+                "processing": "pending", "timed-out": "pending",
+            }
+
+    run_with_db(body)
+
+
+def test_gateway_refusing_the_request_stops_the_run():
+    async def body(sessions):
+        due = datetime.utcnow() - timedelta(hours=1)
+        async with sessions() as db:
+            await _seed(db, (1, due, 5000.0))
+
+            class Refusing(FakeGateway):
+                async def charge_authorization(self, *args, **kwargs):
+                    raise GatewayError("Invalid key", status_code=401)
+
+            report = await subscription_renewal_service.run_renewals(db, client=Refusing())
+            assert report["outcomes"] == {"rejected": 1, "free": 0}
+            assert report["aborted"].startswith("Payment gateway rejected the request")
+            assert list((await _invoices(db)).values()) == ["pending"]
+            assert (await _subscription(db, 1))[0] == "active"
+
+    run_with_db(body)
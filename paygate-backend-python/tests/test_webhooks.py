@@ -0,0 +1,139 @@
+import hashlib
+import hmac
+import json
+
+from sqlalchemy import func, select
+
+from async_db import run_with_db
+from models import ContentAccess, Customer, Payment, Paywall, User, WebhookEvent
+from services import webhook_service
+
+SECRET = "sk_test_secret"
+
+
+def _charge(reference, amount=25.0, currency="NGN", event="charge.success", transaction_id=None):
+    return {"event": event, "data": {
+        "id": transaction_id or f"tx-{reference}-{event}", "reference": reference,
+        "amount": int(round(amount * 100)), "currency": currency, "channel": "card",
+    }}
+
+
+async def _seed(db, *payments):
+    db.add_all([
+        User(id=1, email="owner@example.com", hashed_password="x"),
+        User(id=2, email="buyer@example.com", hashed_password="x"),
+        Paywall(id=1, title="Course", owner_id=1, price=25.0, currency="NGN",
+                content_ids=json.dumps([10, 11]), conversions=0, expiration_days=0),
+    ])
+    db.add_all([
+        Payment(reference=reference, amount=25.0, currency="NGN", status=status, paywall_id=1,
+                customer_email="buyer@example.com", owner_id=1)
+        for reference, status in payments
+    ])
+    await db.commit()
+
+
+async def _status(db, reference):
+    return (await db.execute(select(Payment.status).filter(Payment.reference == reference))).scalar_one()
+
+
+def test_signature_is_hmac_sha512_of_the_raw_body():
+    body = json.dumps(_charge("ref-1")).encode()
+    signature = hmac.new(SECRET.encode(), body, hashlib.sha512).hexdigest()
+    assert webhook_service.verify_signature(body, signature, SECRET)
+    assert not webhook_service.verify_signature(body + b" ", signature, SECRET)
+    assert not webhook_service.verify_signature(body, signature, "another-secret")
+    assert not webhook_service.verify_signature(body, None, SECRET)
+    assert not webhook_service.verify_signature(body, "", SECRET)
+
+
+def test_idempotency_key_uses_event_and_transaction():
+    assert webhook_service.idempotency_key(_charge("ref-1", transaction_id=42)) == "charge.success:42"
+    without_id = {"event": "charge.failed", "data": {"reference": "ref-1"}}
+    assert webhook_service.idempotency_key(without_id) == "charge.failed:ref-1"
+
+
+def test_redelivered_events_are_recorded_once():
+    async def body(sessions):
+        async with sessions() as db:
+            assert await webhook_service.record_event(db, _charge("ref-1"))
+            assert not await webhook_service.record_event(db, _charge("ref-1"))
+            assert await webhook_service.record_event(db, _charge("ref-1", event="charge.failed"))
+            assert (await db.execute(select(func.count()).select_from(WebhookEvent))).scalar() == 2
+
+    run_with_db(body)
+
+
+def test_successful_charge_completes_payment_once():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, ("ref-1", "pending"))
+            await webhook_service.record_event(db, _charge("ref-1"))
+            assert await webhook_service.process_batch(db) == {"claimed": 1, "transitioned": 1}
+            # A gateway retry is dropped at ingest; nothing is left to process
+            assert not await webhook_service.record_event(db, _charge("ref-1"))
+            assert await webhook_service.process_batch(db) == {"claimed": 0, "transitioned": 0}
+
+            assert await _status(db, "ref-1") == "completed"
+            assert (await db.get(Paywall, 1)).conversions == 1
+            customer = (await db.execute(select(Customer))).scalar_one()
+            assert (customer.email, customer.total_purchases, customer.total_spent) == ("buyer@example.com", 1, 25.0)
+            grants = (await db.execute(select(ContentAccess.user_id, ContentAccess.content_id))).all()
+            assert sorted(grants) == [(2, 10), (2, 11)]
+            event = (await db.execute(select(WebhookEvent))).scalar_one()
+            assert event.status == "processed" and event.claim_token is None
+
+    run_with_db(body)
+
+
+def test_amount_or_currency_mismatch_is_ignored():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, ("ref-1", "pending"), ("ref-2", "pending"))
+            await webhook_service.record_event(db, _charge("ref-1", amount=2.5))
+            await webhook_service.record_event(db, _charge("ref-2", currency="USD"))
+            assert (await webhook_service.process_batch(db))["transitioned"] == 0
+            assert await _status(db, "ref-1") == "pending"
+            assert await _status(db, "ref-2") == "pending"
+            errors = (await db.execute(select(WebhookEvent.status, WebhookEvent.error))).all()
+            assert all(status == "ignored" and error.startswith("Amount mismatch") for status, error in errors)
+
+    run_with_db(body)
+
+
+def test_events_of_a_reference_fold_in_arrival_order():
+    async def body(sessions):
+        async with sessions() as db:
+            await _seed(db, ("ref-1", "pending"), ("ref-2", "pending"), ("ref-3", "completed"))
+            # A retried charge that failed first and then succeeded
+            await webhook_service.record_event(db, _charge("ref-1", event="charge.failed"))
+            await webhook_service.record_event(db, _charge("ref-1"))
+            await webhook_service.record_event(db, _charge("ref-2", event="charge.failed"))
+            # A late failure never undoes a completed payment
+            await webhook_service.record_event(db, _charge("ref-3", event="charge.failed"))
+            await webhook_service.record_event(db, _charge("unknown-ref"))
+
+            assert (await webhook_service.process_batch(db))["transitioned"] == 2
+            assert await _status(db, "ref-1") == "completed"
+            assert await _status(db, "ref-2") == "failed"
+            assert await _status(db, "ref-3") == "completed"
+            assert (await db.get(Paywall, 1)).conversions == 1
+            outcomes = dict((await db.execute(select(WebhookEvent.reference, WebhookEvent.error)
+                                              .filter(WebhookEvent.reference.in_(["ref-3", "unknown-ref"])))).all())
+            assert outcomes == {"ref-3": "No status change", "unknown-ref": "Unknown payment reference"}
+
+    run_with_db(body)
+
+
+def test_claimed_events_are_not_claimed_again():
+    async def body(sessions):
+        async with sessions() as db:
+            await webhook_service.record_event(db, _charge("ref-1"))
+            await webhook_service.record_event(db, _charge("ref-2"))
+            first = await webhook_service.claim_batch(db, 1)
+            second = await webhook_service.claim_batch(db, 10)
+            assert [event.reference for event in first] == ["ref-1"]
+            assert [event.reference for event in second] == ["ref-2"]
+            assert await webhook_service.claim_batch(db, 10) == []
+
+    run_with_db(body)
@@ -0,0 +1,201 @@
+"""
+Embedded columnar store
+
+A directory of Parquet datasets, each partitioned by calendar month of a
+timestamp column:
+
+    <root>/<dataset>/<YYYY-MM>/<sequence>.parquet
+    <root>/manifest.json
+
+The manifest lists the live files and each dataset's sync watermark, and is
+replaced atomically (write + os.replace), so a writer's new files only
+become visible when the manifest naming them is in place, and a reader that
+loaded a manifest sees a consistent set of files. Files left behind by a
+crashed writer or superseded by compaction are deleted once they are older
+than ORPHAN_GRACE_SECONDS, long enough for in-flight readers to finish.
+
+Rows may be written again when they change (payments move from pending to
+completed, or are refunded). Datasets with a key column are read newest
+file first and older versions of a key are dropped; compaction rewrites a
+month into a single deduplicated file. Writers serialise on an flock on
+<root>/.lock; readers take no lock.
+"""
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+ORPHAN_GRACE_SECONDS = 600
+
+
+def month_of(value: datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def months_between(start: datetime, end: datetime) -> List[str]:
+    """Month partitions overlapping [start, end)"""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class ColumnarStore:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    # Manifest
+
+    def load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.root / MANIFEST) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"sequence": 0, "datasets": {}}
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp = self.root / f".{MANIFEST}.{os.getpid()}"
+        with open(temp, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.root / MANIFEST)
+
+    @contextmanager
+    def writer(self):
+        """Exclusive writer section; yields the current manifest"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield self.load_manifest()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def watermark(self, dataset: str) -> Optional[Any]:
+        return self.load_manifest()["datasets"].get(dataset, {}).get("watermark")
+
+    # Writing (call inside writer())
+
+    def append(self, manifest: Dict[str, Any], dataset: str, table, time_column: str,
+               sort_by: Iterable[str], watermark: Any):
+        """
+        Write a pyarrow table into its month partitions and publish it
+        together with the new watermark
+        """
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        entry = manifest["datasets"].setdefault(dataset, {"files": {}, "watermark": None})
+        if table.num_rows:
+            months = pc.strftime(table[time_column], format="%Y-%m")
+            for month in pc.unique(months).to_pylist():
+                part = table.filter(pc.equal(months, month))
+                # Sorted row groups let readers skip by min/max statistics
+                part = part.sort_by([(column, "ascending") for column in sort_by])
+                manifest["sequence"] += 1
+                name = f"{manifest['sequence']:012d}.parquet"
+                directory = self.root / dataset / month
+                directory.mkdir(parents=True, exist_ok=True)
+                pq.write_table(part, directory / name, compression="zstd", row_group_size=64 * 1024)
+                entry["files"].setdefault(month, []).append(name)
+        entry["watermark"] = watermark
+        self._save_manifest(manifest)
+
+    def compact(self, manifest: Dict[str, Any], dataset: str, key: Optional[str],
+                sort_by: Iterable[str], max_files: int) -> int:
+        """Rewrite every month with more than max_files files as a single file; returns months compacted"""
+        import pyarrow.parquet as pq
+
+        entry = manifest["datasets"].get(dataset)
+        if not entry:
+            return 0
+        compacted = 0
+        for month, names in list(entry["files"].items()):
+            if len(names) <= max_files:
+                continue
+            table = self._read_files(dataset, month, names, None, None, key)
+            table = table.sort_by([(column, "ascending") for column in sort_by])
+            manifest["sequence"] += 1
+            name = f"{manifest['sequence']:012d}.parquet"
+            pq.write_table(table, self.root / dataset / month / name, compression="zstd", row_group_size=64 * 1024)
+            entry["files"][month] = [name]
+            compacted += 1
+        if compacted:
+            self._save_manifest(manifest)
+        return compacted
+
+    def collect_garbage(self, manifest: Dict[str, Any]) -> int:
+        """Delete data files the manifest no longer names, once past the reader grace period"""
+        live = {
+            self.root / dataset / month / name
+            for dataset, entry in manifest["datasets"].items()
+            for month, names in entry["files"].items() for name in names
+        }
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        removed = 0
+        for path in self.root.glob("*/*/*.parquet"):
+            if path not in live and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    # Reading
+
+    def _read_files(self, dataset: str, month: str, names: List[str], columns: Optional[List[str]],
+                    filters, key: Optional[str]):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        read_columns = None if columns is None else list(dict.fromkeys(columns + ([key] if key else [])))
+        tables = []
+        seen = None
+        for name in reversed(names):  # Newest first
+            table = pq.read_table(self.root / dataset / month / name, columns=read_columns, filters=filters)
+            if key:
+                if seen is not None and table.num_rows:
+                    table = table.filter(pc.invert(pc.is_in(table[key], value_set=seen)))
+                keys = table[key].combine_chunks()
+                seen = keys if seen is None else pa.concat_arrays([seen, keys])
+            tables.append(table)
+        if not tables:
+            return None
+        return pa.concat_tables(tables)
+
+    def read(self, dataset: str, start: datetime, end: datetime, columns: Optional[List[str]] = None,
+             filters=None, key: Optional[str] = None):
+        """
+        Rows of the months overlapping [start, end) as one pyarrow table, or
+        None if there are none. filters (pyarrow DNF or expression) must only
+        involve columns that never change for a key, otherwise an older
+        version could survive deduplication; filter on mutable columns
+        afterwards. Callers still apply the exact time range.
+        """
+        import pyarrow as pa
+
+        for attempt in range(2):
+            files = self.load_manifest()["datasets"].get(dataset, {}).get("files", {})
+            try:
+                tables = [
+                    table for table in (
+                        self._read_files(dataset, month, files[month], columns, filters, key)
+                        for month in months_between(start, end) if files.get(month)
+                    ) if table is not None
+                ]
+                return pa.concat_tables(tables) if tables else None
+            except FileNotFoundError:
+                # Compacted and collected under us; the new manifest names the replacement
+                if attempt:
+                    raise
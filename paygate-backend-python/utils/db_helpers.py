@@ -0,0 +1,21 @@
+"""
+Dialect-aware SQL helpers shared by the services
+"""
+from config.database import is_postgresql
+
+
+def dialect_insert(model):
+    """INSERT construct of the active dialect, for ON CONFLICT clauses (PostgreSQL and SQLite)"""
+    if is_postgresql:
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def insert_ignore_conflicts(model, index_elements=None):
+    """
+    INSERT that silently skips rows violating a unique/primary key constraint.
+    Works on both PostgreSQL and SQLite (ON CONFLICT DO NOTHING).
+    """
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=index_elements)
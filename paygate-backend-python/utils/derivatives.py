@@ -0,0 +1,223 @@
+"""
+Image and PDF derivative rendering
+
+Renditions are declared once in RENDITION_SETS and rendered next to the
+source blob as <sha256>_<rendition>.<ext>. Because the name is keyed by the
+source hash, re-running a job is a no-op for outputs that already exist, and
+the blob garbage collector removes derivatives together with their source.
+
+Everything here is CPU-bound and module-level so it can be shipped to a
+ProcessPoolExecutor; see services/derivative_service.py for the pool.
+"""
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from PIL import Image, ImageOps
+import logging
+
+try:
+    import pillow_avif  # noqa: F401 - registers the AVIF plugin on Pillow < 11.3
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Rendition:
+    name: str
+    width: int
+    height: int
+    # Every format Pillow can write is produced; jpeg/png are the universal fallbacks
+    formats: Tuple[str, ...] = ("avif", "webp", "jpeg")
+    crop: bool = False  # Fill the box exactly (avatars) instead of fitting inside it
+    quality: int = 80
+
+
+RENDITION_SETS: Dict[str, Tuple[Rendition, ...]] = {
+    "image": (
+        Rendition("thumb", 200, 200),
+        Rendition("medium", 800, 800),
+        Rendition("large", 1600, 1600),
+    ),
+    "avatar": (
+        Rendition("avatar_64", 64, 64, crop=True),
+        Rendition("avatar_128", 128, 128, crop=True),
+        Rendition("avatar_256", 256, 256, crop=True),
+    ),
+    "pdf": (
+        Rendition("preview", 400, 566, formats=("webp", "png")),
+        Rendition("preview_large", 1200, 1697, formats=("webp", "png")),
+    ),
+}
+
+# Pillow format name and file extension for each rendition format
+FORMAT_SPECS = {
+    "avif": ("AVIF", ".avif"),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+
+
+def supported_formats() -> List[str]:
+    """Rendition formats the installed Pillow build can encode"""
+    Image.init()
+    return [name for name, (pil_format, _) in FORMAT_SPECS.items() if pil_format in Image.SAVE]
+
+
+def derivative_path(source: Path, sha256: str, rendition: str, fmt: str) -> Path:
+    return source.parent / f"{sha256}_{rendition}{FORMAT_SPECS[fmt][1]}"
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_image(path: Path) -> Image.Image:
+    with Image.open(path) as img:
+        img.seek(0)  # First frame of animated GIF/WebP
+        img = ImageOps.exif_transpose(img)
+        img.load()
+        return img
+
+
+def _load_pdf_page(path: Path, width: int) -> Image.Image:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(str(path))
+    try:
+        page = doc[0]
+        scale = width / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    finally:
+        doc.close()
+
+
+def _resize(img: Image.Image, rendition: Rendition) -> Image.Image:
+    box = (rendition.width, rendition.height)
+    if rendition.crop:
+        return ImageOps.fit(img, box, Image.LANCZOS)
+    resized = img.copy()
+    resized.thumbnail(box, Image.LANCZOS)  # Never upscales
+    return resized
+
+
+def _save(img: Image.Image, output, fmt: str, quality: int):
+    pil_format = FORMAT_SPECS[fmt][0]
+    if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    img.save(output, format=pil_format, quality=quality, optimize=pil_format in ("JPEG", "PNG"))
+
+
+def _save_atomic(img: Image.Image, target: Path, fmt: str, quality: int):
+    fd, temp_name = tempfile.mkstemp(dir=target.parent, prefix=".derivative_", suffix=target.suffix)
+    try:
+        with os.fdopen(fd, "wb") as output:
+            _save(img, output, fmt, quality)
+        os.replace(temp_name, target)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def render_derivatives(path: str, kind: str, rendition_set: Optional[str] = None,
+                       sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Render every rendition in the set for one source file.
+    Existing outputs are skipped, so the call is idempotent.
+    """
+    source = Path(path)
+    rendition_set = rendition_set or ("pdf" if kind == "pdf" else "image")
+    renditions = RENDITION_SETS[rendition_set]
+    formats = supported_formats()
+    sha256 = sha256 or _file_sha256(source)
+
+    result: Dict[str, Any] = {
+        "source": str(source),
+        "sha256": sha256,
+        "rendition_set": rendition_set,
+        "renditions": {},
+        "generated": 0,
+        "skipped": 0,
+    }
+
+    base_image = None
+    for rendition in renditions:
+        outputs = {}
+        pending = []
+        for fmt in rendition.formats:
+            if fmt not in formats:
+                continue
+            target = derivative_path(source, sha256, rendition.name, fmt)
+            outputs[fmt] = str(target)
+            if target.exists():
+                result["skipped"] += 1
+            else:
+                pending.append((fmt, target))
+        result["renditions"][rendition.name] = outputs
+        if not pending:
+            continue
+
+        if kind == "pdf":
+            # Rasterise at the rendition's width rather than scaling a bitmap down
+            img = _resize(_load_pdf_page(source, rendition.width), rendition)
+        else:
+            if base_image is None:
+                base_image = _load_image(source)
+            img = _resize(base_image, rendition)
+
+        for fmt, target in pending:
+            _save_atomic(img, target, fmt, rendition.quality)
+            result["generated"] += 1
+
+    return result
+
+
+def render_variant(source_path: str, target_path: str, width: Optional[int], height: Optional[int],
+                   fmt: str, crop: bool = False, quality: int = 80) -> None:
+    """
+    Render one ad-hoc size of an image (the on-demand resize endpoint).
+    A missing dimension keeps the aspect ratio; images are never upscaled.
+    """
+    img = _load_image(Path(source_path))
+    box_width = width or img.width
+    box_height = height or img.height
+    if crop and width and height:
+        # Keep the requested aspect ratio but shrink the box rather than upscale
+        scale = min(1.0, img.width / width, img.height / height)
+        box_width, box_height = max(1, round(width * scale)), max(1, round(height * scale))
+    rendition = Rendition("variant", box_width, box_height, (fmt,), crop=bool(crop and width and height),
+                          quality=quality)
+    with open(target_path, "wb") as output:
+        _save(_resize(img, rendition), output, fmt, quality)
+
+
+def render_batch(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Render a batch of files in one worker call; a failure is reported per file
+    instead of aborting the rest of the batch.
+    """
+    results = []
+    for job in jobs:
+        try:
+            results.append(render_derivatives(
+                job["path"], job["kind"], job.get("rendition_set"), job.get("sha256")
+            ))
+        except Exception as e:
+            logger.error(f"Derivative rendering failed for {job.get('path')}: {str(e)}")
+            results.append({"source": job.get("path"), "error": str(e)})
+    return results
@@ -0,0 +1,120 @@
+"""
+Size-bounded on-disk LRU cache
+
+Entries are files named by a hex key under two shard levels. A file's mtime
+records its last use: hits refresh it (at most once per TOUCH_INTERVAL so hot
+entries don't cause a write per request), and when the cache grows past
+max_bytes the least recently used files are removed until it is back under
+the low-water mark. Several processes can share one cache directory; each
+keeps its own running size estimate and rescans the directory to evict.
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOUCH_INTERVAL = 60  # seconds
+LOW_WATER_RATIO = 0.9
+
+
+class DiskLRUCache:
+    def __init__(self, root: Path, max_bytes: int):
+        # Absolute, so entries can be handed to file delivery (which maps them under UPLOAD_DIR)
+        self.root = Path(root).resolve()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    def path_for(self, key: str, suffix: str = "") -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = "") -> Optional[Path]:
+        path = self.path_for(key, suffix)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                return None  # Evicted by another process just now
+        return path
+
+    def put(self, key: str, suffix: str, write: Callable[[Path], None]) -> Path:
+        """
+        Create an entry by calling write(temp_path); the file is renamed into
+        place atomically so readers never see a partial entry.
+        """
+        path = self.path_for(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".entry_", suffix=suffix)
+        os.close(fd)
+        try:
+            write(Path(temp_name))
+            size = os.path.getsize(temp_name)
+            os.replace(temp_name, path)
+        except BaseException:
+            try:
+                os.unlink(temp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+        return path
+
+    def _entries(self):
+        if not self.root.exists():
+            return []
+        entries = []
+        for shard in self.root.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in shard.iterdir():
+                if entry.name.startswith(".entry_"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """Remove least recently used entries until below the low-water mark"""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[0])
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * LOW_WATER_RATIO)
+            removed = 0
+            for _, size, entry in entries:
+                if total <= target:
+                    break
+                try:
+                    entry.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._size = total
+
+        if removed:
+            logger.info(f"Evicted {removed} entries from {self.root}; {total} bytes remain")
+        return removed
@@ -0,0 +1,163 @@
+"""
+Vectorised A/B test statistics
+
+Conversion counts for many experiments are laid out as padded
+(n_tests, max_variants) arrays with a validity mask; column 0 of every row
+is the control. Everything below works on whole arrays, so the statistics
+of thousands of experiments are one set of NumPy operations:
+
+- two-proportion z-test of every variant against the control;
+- chi-square test of independence across all variants of a test;
+- Bayesian beta-binomial (uniform prior) probability that each variant
+  beats the control and that it is the best, by Monte Carlo with a fixed
+  seed so results are reproducible and cacheable (normal approximation for
+  well-populated arms);
+- always-valid p-values from the mixture sequential probability ratio test
+  (mSPRT, Johari et al. 2017), which stay valid however often the results
+  are looked at, unlike the fixed-horizon p-values above.
+
+Tail probabilities are computed here rather than with SciPy, which is not a
+dependency.
+"""
+from dataclasses import dataclass
+import numpy as np
+
+_NR_ERFC = (-1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+            0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277)
+
+
+def erfc(x: np.ndarray) -> np.ndarray:
+    """Complementary error function (Numerical Recipes erfcc, relative error < 1.2e-7)"""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    poly = np.zeros_like(z)
+    for coefficient in reversed(_NR_ERFC[1:]):
+        poly = t * (coefficient + poly)
+    result = t * np.exp(-z * z + _NR_ERFC[0] + poly)
+    return np.where(x >= 0, result, 2.0 - result)
+
+
+def normal_sf(z: np.ndarray) -> np.ndarray:
+    return 0.5 * erfc(np.asarray(z, dtype=np.float64) / np.sqrt(2.0))
+
+
+def chi2_sf(x: np.ndarray, df: np.ndarray) -> np.ndarray:
+    """Upper tail of the chi-square distribution for integer degrees of freedom, elementwise"""
+    x = np.maximum(np.asarray(x, dtype=np.float64), 0.0)
+    df = np.asarray(df, dtype=np.int64)
+    x, df = np.broadcast_arrays(x, df)
+    even = df % 2 == 0
+
+    # Even df: exp(-x/2) * sum_{i<df/2} (x/2)^i / i!
+    half = x / 2
+    term = np.ones_like(x)
+    even_sum = np.ones_like(x)
+    # Odd df: 2*Q(sqrt x) + 2*phi(sqrt x) * sum_{i=1}^{(df-1)/2} x^(i-1/2) / (1*3*...*(2i-1))
+    root = np.sqrt(x)
+    odd_term = root.copy()
+    odd_sum = np.zeros_like(x)
+    for i in range(1, int(df.max(initial=1)) // 2 + 1):
+        term = term * half / i
+        even_sum += np.where(i < df / 2, term, 0.0)
+        odd_sum += np.where(i <= (df - 1) // 2, odd_term, 0.0)
+        odd_term = odd_term * x / (2 * i + 1)
+
+    even_sf = np.exp(-half) * even_sum
+    odd_sf = 2 * normal_sf(root) + 2 * np.exp(-half) / np.sqrt(2 * np.pi) * odd_sum
+    return np.clip(np.where(even, even_sf, odd_sf), 0.0, 1.0)
+
+
+@dataclass
+class ExperimentStats:
+    """Per-variant arrays are (n_tests, max_variants); per-test arrays are (n_tests,)"""
+    conversion_rate: np.ndarray
+    lift: np.ndarray  # relative to the control's rate
+    z_score: np.ndarray
+    p_value: np.ndarray  # two-sided, against the control
+    prob_beat_control: np.ndarray
+    prob_best: np.ndarray
+    always_valid_p_value: np.ndarray
+    chi_square: np.ndarray
+    chi_square_p_value: np.ndarray
+
+
+def compute_experiment_stats(visitors: np.ndarray, conversions: np.ndarray, mask: np.ndarray,
+                             draws: int = 4000, tau: float = 0.05, seed: int = 0,
+                             max_sample_elements: int = 4_000_000) -> ExperimentStats:
+    """
+    visitors/conversions: (n_tests, max_variants), column 0 is the control;
+    mask marks real variants (rows are padded to max_variants).
+    tau is the standard deviation of the mSPRT mixing prior on the
+    difference in conversion rates, i.e. the size of effect expected.
+    """
+    n = np.where(mask, np.asarray(visitors, dtype=np.float64), 0.0)
+    c = np.where(mask, np.minimum(np.asarray(conversions, dtype=np.float64), n), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(n > 0, c / n, 0.0)
+
+        # Two-proportion z-test against column 0 with the pooled standard error
+        n0, c0, rate0 = n[:, :1], c[:, :1], rate[:, :1]
+        pooled = (c + c0) / (n + n0)
+        se = np.sqrt(pooled * (1 - pooled) * (1 / n + 1 / n0))
+        z = np.where((se > 0) & (n > 0) & (n0 > 0), (rate - rate0) / se, 0.0)
+        p_value = np.where(mask, np.minimum(2 * normal_sf(np.abs(z)), 1.0), 1.0)
+        lift = np.where(rate0 > 0, (rate - rate0) / rate0, 0.0)
+
+        # mSPRT with a N(0, tau^2) mixture over the difference in rates
+        variance = rate * (1 - rate) / n + rate0 * (1 - rate0) / n0
+        valid = (variance > 0) & (n > 0) & (n0 > 0)
+        variance = np.where(valid, variance, 1.0)
+        tau2 = tau * tau
+        log_lambda = 0.5 * np.log(variance / (variance + tau2)) + \
+            tau2 * (rate - rate0) ** 2 / (2 * variance * (variance + tau2))
+        always_valid = np.where(valid, np.minimum(1.0, np.exp(-log_lambda)), 1.0)
+
+        # Chi-square test of independence on the k x 2 table of each test
+        totals_n, totals_c = n.sum(axis=1, keepdims=True), c.sum(axis=1, keepdims=True)
+        overall = totals_c / totals_n
+        expected_c, expected_f = n * overall, n * (1 - overall)
+        cells = np.where(expected_c > 0, (c - expected_c) ** 2 / expected_c, 0.0) + \
+            np.where(expected_f > 0, ((n - c) - expected_f) ** 2 / expected_f, 0.0)
+        chi_square = np.where(mask, cells, 0.0).sum(axis=1)
+    df = np.maximum((mask & (n > 0)).sum(axis=1) - 1, 1)
+    chi_square_p = np.where(chi_square > 0, chi2_sf(chi_square, df), 1.0)
+
+    # Beta(1 + conversions, 1 + failures) posteriors. Once every arm has 30+
+    # of each the posterior is close to normal: probability-to-beat-control is
+    # then exact in closed form and probability-best samples cheap normals.
+    # Small arms are sampled from the beta itself. Chunks bound memory.
+    a, b = 1 + c, 1 + (n - c)
+    mean = a / (a + b)
+    sd = np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+    approximate = np.all(~mask | ((a >= 30) & (b >= 30)), axis=1)
+    prob_beat = np.where(approximate[:, None], normal_sf((mean[:, :1] - mean) / np.sqrt(sd ** 2 + sd[:, :1] ** 2)), 0.0)
+    prob_best = np.zeros_like(n)
+
+    n_tests, n_variants = n.shape
+    rng = np.random.default_rng(seed)
+    chunk = max(1, max_sample_elements // max(1, n_variants * draws))
+    for rows, sampler in (
+        (np.flatnonzero(approximate), lambda i: mean[i, :, None] + sd[i, :, None] * rng.standard_normal((len(i), n_variants, draws))),
+        (np.flatnonzero(~approximate), lambda i: rng.beta(a[i, :, None], b[i, :, None], size=(len(i), n_variants, draws))),
+    ):
+        for start in range(0, len(rows), chunk):
+            index = rows[start:start + chunk]
+            samples = np.where(mask[index, :, None], sampler(index), -np.inf)
+            if not approximate[index[0]]:
+                prob_beat[index] = (samples > samples[:, :1, :]).mean(axis=2)
+            best = samples.argmax(axis=1)
+            prob_best[index] = (best[:, None, :] == np.arange(n_variants)[None, :, None]).mean(axis=2)
+    prob_beat[:, 0] = 0.0
+
+    return ExperimentStats(
+        conversion_rate=rate,
+        lift=np.where(mask, lift, 0.0),
+        z_score=np.where(mask, z, 0.0),
+        p_value=p_value,
+        prob_beat_control=np.where(mask, prob_beat, 0.0),
+        prob_best=np.where(mask, prob_best, 0.0),
+        always_valid_p_value=always_valid,
+        chi_square=chi_square,
+        chi_square_p_value=chi_square_p,
+    )
@@ -0,0 +1,227 @@
+"""
+Efficient file delivery for protected content
+
+Supports single-range requests (206), ETag/Last-Modified conditional
+responses (304/412), zero-copy sends through the ASGI
+`http.response.zerocopysend` extension (os.sendfile in servers that offer
+it) with a chunked pread fallback, and an offload mode that hands the
+transfer to nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile).
+"""
+import asyncio
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+from fastapi import HTTPException, Request, Response, status
+from config.settings import settings
+from utils.streaming_upload import STORAGE_URL_PREFIX
+import logging
+
+logger = logging.getLogger(__name__)
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+SHA256_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into an inclusive (start, end) pair.
+    Returns None when the header is absent or uses multiple ranges (served as 200).
+    Raises 416 when the range cannot be satisfied.
+    """
+    if not range_header or "," in range_header:
+        return None
+
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), file_size - 1) if last else file_size - 1
+    else:
+        # Suffix range: the final N bytes
+        suffix = int(last)
+        start = max(file_size - suffix, 0)
+        end = file_size - 1
+
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    return start, end
+
+
+def make_etag(path: Path, stat_result: os.stat_result) -> str:
+    """Strong ETag: the content hash for content-addressed blobs, otherwise mtime+size"""
+    stem = path.name.split(".")[0]
+    if SHA256_NAME_PATTERN.match(stem):
+        return f'"{stem}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def _not_modified_since(header: Optional[str], mtime: float) -> bool:
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= int(since)
+
+
+class RangeFileResponse(Response):
+    """
+    Sends [start, end] of a file. Uses zero-copy sendfile when the ASGI server
+    advertises http.response.zerocopysend; otherwise reads chunks with pread
+    in a worker thread so the event loop is never blocked on disk I/O.
+    """
+
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = end - start + 1
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope.get("method") == "HEAD" or self.length <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        with open(self.path, "rb") as source:
+            if "http.response.zerocopysend" in (scope.get("extensions") or {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": source,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                })
+                return
+
+            fd = source.fileno()
+            position = self.start
+            remaining = self.length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(os.pread, fd, min(STREAM_CHUNK_SIZE, remaining), position)
+                if not chunk:
+                    break  # File was truncated underneath us
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def resolve_upload_path(file_path: Optional[str], url: Optional[str]) -> Optional[Path]:
+    """
+    Map a Content file_path, upload:// storage reference or legacy
+    /api/uploads URL to a path that must live inside UPLOAD_DIR
+    """
+    root = Path(settings.UPLOAD_DIR).resolve()
+    candidate = None
+    if file_path:
+        candidate = Path(file_path)
+    elif url:
+        for prefix in (STORAGE_URL_PREFIX, "/api/uploads/"):
+            if url.startswith(prefix):
+                candidate = root / url[len(prefix):]
+                break
+    if candidate is None:
+        return None
+
+    resolved = candidate.resolve()
+    if not resolved.is_relative_to(root) or not resolved.is_file():
+        return None
+    return resolved
+
+
+def upload_references(relative_path: str) -> List[str]:
+    """
+    The values a Content file_path or url holds for an upload (given relative
+    to UPLOAD_DIR), for exact lookups on those indexed columns
+    """
+    return [
+        f"{STORAGE_URL_PREFIX}{relative_path}",
+        f"/api/uploads/{relative_path}",
+        str(Path(settings.UPLOAD_DIR) / relative_path),
+        str(Path(settings.UPLOAD_DIR).resolve() / relative_path),
+    ]
+
+
+def build_file_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    filename: Optional[str] = None,
+    cache_control: str = "private, max-age=0, must-revalidate",
+) -> Response:
+    """
+    Build the response for a file, honouring conditional and Range headers.
+    Must only be called after authorization has been checked.
+    """
+    stat_result = path.stat()
+    file_size = stat_result.st_size
+    etag = make_etag(path, stat_result)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+    }
+    if filename:
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+
+    if_match = request.headers.get("if-match")
+    if if_match and not _etag_matches(if_match, etag):
+        return Response(status_code=status.HTTP_412_PRECONDITION_FAILED, headers=headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    elif _not_modified_since(request.headers.get("if-modified-since"), stat_result.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    mode = settings.FILE_DELIVERY_MODE
+    if mode in ("x-accel-redirect", "x-sendfile"):
+        # The front-end server performs the transfer, including Range handling.
+        # Both sides are resolved, as callers may build paths from a relative UPLOAD_DIR
+        path = path.resolve()
+        relative_path = path.relative_to(Path(settings.UPLOAD_DIR).resolve()).as_posix()
+        if mode == "x-accel-redirect":
+            headers["X-Accel-Redirect"] = f"{settings.FILE_DELIVERY_INTERNAL_PREFIX.rstrip('/')}/{relative_path}"
+        else:
+            headers["X-Sendfile"] = str(path)
+        return Response(status_code=status.HTTP_200_OK, headers=headers, media_type=media_type)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        byte_range = parse_range_header(request.headers.get("range"), file_size)
+
+    if byte_range is None:
+        return RangeFileResponse(path, 0, file_size - 1, status.HTTP_200_OK, headers, media_type)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    return RangeFileResponse(path, start, end, status.HTTP_206_PARTIAL_CONTENT, headers, media_type)
@@ -0,0 +1,106 @@
+"""
+Vectorised Holt-Winters forecasting
+
+Additive Holt-Winters with a damped trend and weekly seasonality, in its
+error-correction (ETS(A,Ad,A)) form, fitted to many daily series at once:
+every series and every candidate smoothing parameter combination is one
+lane of a NumPy array, so the only Python loop is over time steps. Each
+series keeps the parameter combination with the smallest one-step-ahead
+squared error. Prediction intervals use the analytic forecast variance of
+the model (Hyndman et al., "Forecasting with Exponential Smoothing", class 1):
+
+    var(h) = sigma^2 * (1 + sum_{j=1}^{h-1} (alpha + beta * phi_j + gamma * [j mod m == 0])^2)
+
+where phi_j = phi + phi^2 + ... + phi^j.
+"""
+from dataclasses import dataclass
+from itertools import product
+from statistics import NormalDist
+from typing import Sequence
+import numpy as np
+
+SEASON_LENGTH = 7
+DAMPING = 0.98
+
+# Smoothing parameter grid; combinations with beta > alpha are not admissible
+ALPHAS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.7)
+BETAS = (0.0, 0.01, 0.05, 0.15)
+GAMMAS = (0.01, 0.1, 0.25, 0.4)
+
+
+@dataclass
+class ForecastResult:
+    """Arrays have one row per input series"""
+    forecast: np.ndarray  # (series, horizon)
+    lower: np.ndarray
+    upper: np.ndarray
+    params: np.ndarray  # (series, 3): alpha, beta, gamma
+    rmse: np.ndarray  # (series,) one-step-ahead in-sample error
+
+
+def _parameter_grid() -> np.ndarray:
+    return np.array([
+        (alpha, beta, gamma) for alpha, beta, gamma in product(ALPHAS, BETAS, GAMMAS)
+        if beta <= alpha and gamma <= 1 - alpha
+    ])
+
+
+def holt_winters(series: np.ndarray, horizon: int, interval_level: float = 0.95,
+                 season_length: int = SEASON_LENGTH, phi: float = DAMPING,
+                 grid: Sequence[Sequence[float]] = None) -> ForecastResult:
+    """
+    Fit and forecast every row of series (shape (n_series, n_days), oldest
+    day first). Needs at least two full seasons of history. Forecasts and
+    interval bounds are clipped at zero since revenue cannot be negative.
+    """
+    y = np.asarray(series, dtype=np.float64)
+    if y.ndim == 1:
+        y = y[np.newaxis, :]
+    n_series, n_days = y.shape
+    m = season_length
+    if n_days < 2 * m:
+        raise ValueError(f"Holt-Winters needs at least {2 * m} observations, got {n_days}")
+
+    params = np.asarray(grid, dtype=np.float64) if grid is not None else _parameter_grid()
+    alpha, beta, gamma = (params[:, i, np.newaxis] for i in range(3))  # (combos, 1)
+
+    # Classical initialisation from the first two seasons
+    first, second = y[:, :m].mean(axis=1), y[:, m:2 * m].mean(axis=1)
+    level = np.broadcast_to(first, (len(params), n_series)).copy()
+    trend = np.broadcast_to((second - first) / m, (len(params), n_series)).copy()
+    season = np.broadcast_to(y[:, :m] - first[:, np.newaxis], (len(params), n_series, m)).copy()
+
+    sse = np.zeros((len(params), n_series))
+    for t in range(n_days):
+        s = t % m
+        error = y[:, t] - (level + phi * trend + season[:, :, s])
+        sse += error * error
+        level += phi * trend + alpha * error
+        trend = phi * trend + beta * error
+        season[:, :, s] += gamma * error
+
+    # Best parameter combination per series
+    best = np.argmin(sse, axis=0)
+    lanes = np.arange(n_series)
+    level, trend, season = level[best, lanes], trend[best, lanes], season[best, lanes]
+    chosen = params[best]
+    sigma2 = sse[best, lanes] / n_days
+
+    steps = np.arange(1, horizon + 1)
+    damped = np.cumsum(phi ** steps)  # phi_h
+    future_season = season[:, (n_days - 1 + steps) % m]
+    forecast = level[:, np.newaxis] + damped * trend[:, np.newaxis] + future_season
+
+    # c_j for j = 1..horizon-1; the variance multiplier for step h sums c_1..c_{h-1}
+    j = steps[:-1]
+    c = (chosen[:, 0:1] + chosen[:, 1:2] * damped[:-1] + chosen[:, 2:3] * (j % m == 0))
+    multiplier = 1 + np.concatenate([np.zeros((n_series, 1)), np.cumsum(c * c, axis=1)], axis=1)
+    half_width = NormalDist().inv_cdf(0.5 + interval_level / 2) * np.sqrt(sigma2[:, np.newaxis] * multiplier)
+
+    return ForecastResult(
+        forecast=np.clip(forecast, 0, None),
+        lower=np.clip(forecast - half_width, 0, None),
+        upper=np.clip(forecast + half_width, 0, None),
+        params=chosen,
+        rmse=np.sqrt(sigma2),
+    )
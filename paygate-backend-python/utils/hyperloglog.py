@@ -0,0 +1,144 @@
+"""
+HyperLogLog distinct counting
+
+A sketch starts as the exact set of its values' 64-bit hashes and turns
+into 2 ** precision HyperLogLog registers once it holds more than
+exact_limit of them, so small sets are counted exactly and large ones in
+constant space with a relative standard error of about
+1.04 / sqrt(2 ** precision). Sketches merge losslessly: the merge of the
+sketches of two sets is the sketch of their union. Sketches of different
+precision are merged by folding the finer one down.
+"""
+import hashlib
+import math
+import zlib
+from typing import Iterable, Optional, Set
+import numpy as np
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+
+def precision_for_error(relative_error: float) -> int:
+    """Smallest precision whose standard error is within relative_error"""
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def hash_value(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def _fold(registers: np.ndarray, precision: int, target: int) -> np.ndarray:
+    """The registers the same hashes would have produced at a lower precision"""
+    shift = precision - target
+    index = np.arange(len(registers))
+    low = index & ((1 << shift) - 1)
+    # The dropped index bits now lead the remaining hash bits
+    leading = np.zeros(len(registers), dtype=np.int64)
+    nonzero = low > 0
+    leading[nonzero] = shift - np.floor(np.log2(low[nonzero])).astype(np.int64)
+    ranks = np.where(registers > 0, np.where(nonzero, leading, registers.astype(np.int64) + shift), 0)
+    folded = np.zeros(1 << target, dtype=np.uint8)
+    np.maximum.at(folded, index >> shift, ranks.astype(np.uint8))
+    return folded
+
+
+class HyperLogLog:
+    def __init__(self, precision: int, exact_limit: int):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.hashes: Optional[Set[int]] = set()
+        self.registers: Optional[np.ndarray] = None
+
+    @property
+    def is_exact(self) -> bool:
+        return self.hashes is not None
+
+    def add(self, value: str):
+        self.add_hash(hash_value(value))
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add_hash(hash_value(value))
+
+    def add_hash(self, hashed: int):
+        if self.hashes is not None:
+            self.hashes.add(hashed)
+            if len(self.hashes) > self.exact_limit:
+                self._to_registers()
+            return
+        self._add_to_registers(hashed)
+
+    def _add_to_registers(self, hashed: int):
+        width = 64 - self.precision
+        index = hashed >> width
+        rest = hashed & ((1 << width) - 1)
+        rank = width - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def _to_registers(self):
+        hashes, self.hashes = self.hashes, None
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        for hashed in hashes:
+            self._add_to_registers(hashed)
+
+    def _fold_to(self, precision: int):
+        if self.registers is not None and precision < self.precision:
+            self.registers = _fold(self.registers, self.precision, precision)
+        self.precision = min(self.precision, precision)
+
+    def merge(self, other: "HyperLogLog"):
+        """Make this the sketch of the union of both sets, at the lower of the two precisions"""
+        self._fold_to(other.precision)
+        if other.hashes is not None and self.hashes is not None:
+            self.hashes |= other.hashes
+            if len(self.hashes) > self.exact_limit:
+                self._to_registers()
+            return
+        if other.hashes is not None:
+            for hashed in other.hashes:
+                self._add_to_registers(hashed)
+            return
+
+        registers, precision = other.registers, other.precision
+        if precision > self.precision:
+            registers = _fold(registers, precision, self.precision)
+        if self.hashes is not None:
+            hashes, self.hashes = self.hashes, None
+            self.registers = registers.copy()
+            for hashed in hashes:
+                self._add_to_registers(hashed)
+        else:
+            np.maximum(self.registers, registers, out=self.registers)
+
+    def count(self) -> int:
+        if self.hashes is not None:
+            return len(self.hashes)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        if self.hashes is not None:
+            raw = np.array(sorted(self.hashes), dtype=">u8").tobytes()
+        else:
+            raw = self.registers.tobytes()
+        return zlib.compress(raw)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, precision: int, exact: bool, exact_limit: int) -> "HyperLogLog":
+        sketch = cls(precision, exact_limit)
+        raw = zlib.decompress(data)
+        if exact:
+            sketch.hashes = set(np.frombuffer(raw, dtype=">u8").tolist())
+        else:
+            sketch.hashes = None
+            sketch.registers = np.frombuffer(raw, dtype=np.uint8).copy()
+        return sketch
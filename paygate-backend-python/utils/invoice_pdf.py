@@ -0,0 +1,124 @@
+"""
+Invoice PDF generation
+
+An invoice is an HTML template filled from a plain dict and laid out onto
+A4 pages with PyMuPDF's Story engine, so changing the design means editing
+INVOICE_TEMPLATE rather than drawing code. Everything here is CPU-bound and
+module-level so it can be shipped to a ProcessPoolExecutor; see
+services/invoice_render_service.py for caching and the pool.
+"""
+import html
+from string import Template
+from typing import Any, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the template or layout changes so cached PDFs are re-rendered
+TEMPLATE_VERSION = 1
+
+PAGE_SIZE = (595, 842)  # A4 in points
+MARGIN = 48
+
+INVOICE_CSS = """
+* { font-family: sans-serif; font-size: 10pt; color: #1f2933; }
+h1 { font-size: 22pt; margin: 0; }
+.muted { color: #7b8794; }
+.status { font-size: 12pt; font-weight: bold; }
+table { width: 100%; border-collapse: collapse; }
+th { text-align: left; border-bottom: 1px solid #cbd2d9; padding: 4px 0; }
+td { padding: 6px 0; }
+.amount { text-align: right; }
+.total td { border-top: 1px solid #cbd2d9; font-weight: bold; font-size: 12pt; }
+"""
+
+INVOICE_TEMPLATE = Template("""
+<h1>Invoice</h1>
+<p class="muted">$invoice_number</p>
+<p class="status">$status</p>
+<table>
+  <tr>
+    <td><b>Billed to</b><br/>$bill_to</td>
+    <td class="amount">
+      <b>Issued</b> $issued_at<br/>
+      <b>Due</b> $due_date<br/>
+      $paid_line
+    </td>
+  </tr>
+</table>
+<p></p>
+<table>
+  <tr><th>Description</th><th class="amount">Amount</th></tr>
+  $line_items
+  <tr class="total"><td>Total</td><td class="amount">$total</td></tr>
+</table>
+<p></p>
+<p class="muted">$seller</p>
+""")
+
+
+def _money(amount: float, currency: str) -> str:
+    return f"{currency} {amount:,.2f}"
+
+
+def _escape_lines(lines: List[str]) -> str:
+    return "<br/>".join(html.escape(line) for line in lines if line)
+
+
+def render_invoice_html(context: Dict[str, Any]) -> str:
+    currency = context.get("currency") or "USD"
+    items = context.get("line_items") or [
+        {"description": context.get("description") or "Services", "amount": context["amount"]}
+    ]
+    return INVOICE_TEMPLATE.substitute(
+        invoice_number=html.escape(context["invoice_number"] or f"#{context['id']}"),
+        status=html.escape((context.get("status") or "pending").upper()),
+        bill_to=_escape_lines(context.get("bill_to") or []),
+        issued_at=html.escape(context.get("issued_at") or ""),
+        due_date=html.escape(context.get("due_date") or "On receipt"),
+        paid_line=f"<b>Paid</b> {html.escape(context['paid_at'])}" if context.get("paid_at") else "",
+        line_items="".join(
+            f'<tr><td>{html.escape(item["description"])}</td>'
+            f'<td class="amount">{html.escape(_money(item["amount"], currency))}</td></tr>'
+            for item in items
+        ),
+        total=html.escape(_money(context["amount"], currency)),
+        seller=html.escape(context.get("seller") or ""),
+    )
+
+
+def render_invoice_pdf(context: Dict[str, Any], output_path: str) -> int:
+    """Write the invoice PDF to output_path; returns the number of pages"""
+    import fitz  # PyMuPDF
+
+    story = fitz.Story(html=render_invoice_html(context), user_css=INVOICE_CSS)
+    writer = fitz.DocumentWriter(output_path)
+    page_rect = fitz.Rect(0, 0, *PAGE_SIZE)
+    content_rect = page_rect + (MARGIN, MARGIN, -MARGIN, -MARGIN)
+    pages = 0
+    more = True
+    while more:
+        device = writer.begin_page(page_rect)
+        more, _ = story.place(content_rect)
+        story.draw(device)
+        writer.end_page()
+        pages += 1
+    writer.close()
+    return pages
+
+
+def render_invoice_batch(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Render a batch of invoices in one worker call; each job is
+    {"context": ..., "output_path": ...}. A failure is reported per invoice
+    instead of aborting the rest of the batch.
+    """
+    results = []
+    for job in jobs:
+        try:
+            pages = render_invoice_pdf(job["context"], job["output_path"])
+            results.append({"invoice_id": job["context"]["id"], "output_path": job["output_path"], "pages": pages})
+        except Exception as e:
+            logger.error(f"Invoice rendering failed for {job['context'].get('id')}: {str(e)}")
+            results.append({"invoice_id": job["context"].get("id"), "error": str(e)})
+    return results
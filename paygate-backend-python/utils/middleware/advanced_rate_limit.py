@@ -1,3 +1,4 @@
+import re
 import time
 import redis
 from typing import Dict
@@ -57,12 +58,23 @@ class RedisRateLimiter:
             "default": {"limit": 1000, "window": 60},  # 1000 requests per minute
         }
 
+        # Endpoints with path parameters, matched by pattern
+        self.pattern_limits = [
+            # Public A/B test endpoints hit by anonymous visitors
+            (re.compile(r"^/api/ab-tests/\d+/assign$"), {"limit": 60, "window": 60}),
+            (re.compile(r"^/api/ab-tests/\d+/convert$"), {"limit": 10, "window": 60}),
+        ]
+
     def get_endpoint_limits(self, path: str) -> dict:
         """Get rate limits for a specific endpoint"""
         # Look for exact match first
         if path in self.limits:
             return self.limits[path]
 
+        for pattern, limits in self.pattern_limits:
+            if pattern.match(path):
+                return limits
+
         # Look for partial matches in the path
         for limit_path, limits in self.limits.items():
             if limit_path != "default" and path.startswith(limit_path):
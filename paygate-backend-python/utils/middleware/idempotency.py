@@ -0,0 +1,242 @@
+"""
+Idempotency-Key support for mutating requests
+
+A POST/PUT/PATCH/DELETE carrying an Idempotency-Key header is executed at
+most once per caller and key. The first request claims the key, runs, and
+its response is stored (with a fingerprint of the request) for
+IDEMPOTENCY_TTL_SECONDS. Retries with the same key get the stored response
+replayed without touching the handler. A retry that arrives while the
+original is still running waits for it instead of running in parallel.
+Reusing a key for a different request is rejected with 422.
+
+Server errors (5xx) are not stored, so the client can retry those. Keys are
+kept in Redis so replays work across workers, with an in-process fallback.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEADER = b"idempotency-key"
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Response headers that must not be replayed verbatim
+SKIP_REPLAY_HEADERS = {b"set-cookie", b"date", b"server"}
+
+
+class LocalIdempotencyStore:
+    """Single-process store; waiters are woken through asyncio events"""
+
+    def __init__(self):
+        self._records: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._records.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._records.pop(key, None)
+            return None
+        return entry[1]
+
+    async def claim(self, key: str, record: Dict[str, Any], ttl: int) -> Optional[Dict[str, Any]]:
+        """Returns None if claimed, otherwise the existing record"""
+        existing = self._get(key)
+        if existing is not None:
+            return existing
+        self._records[key] = (time.monotonic() + ttl, record)
+        self._events[key] = asyncio.Event()
+        if len(self._records) > 10000:
+            now = time.monotonic()
+            for stale in [k for k, (expires, _) in self._records.items() if expires < now]:
+                self._records.pop(stale, None)
+        return None
+
+    async def complete(self, key: str, record: Dict[str, Any], ttl: int):
+        self._records[key] = (time.monotonic() + ttl, record)
+        self._wake(key)
+
+    async def release(self, key: str):
+        self._records.pop(key, None)
+        self._wake(key)
+
+    def _wake(self, key: str):
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        event = self._events.get(key)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._get(key)
+
+
+class RedisIdempotencyStore:
+    def __init__(self, client):
+        self.client = client
+
+    async def claim(self, key: str, record: Dict[str, Any], ttl: int) -> Optional[Dict[str, Any]]:
+        if await self.client.set(key, json.dumps(record), nx=True, ex=ttl):
+            return None
+        existing = await self.client.get(key)
+        return json.loads(existing) if existing else await self.claim(key, record, ttl)
+
+    async def complete(self, key: str, record: Dict[str, Any], ttl: int):
+        await self.client.set(key, json.dumps(record), ex=ttl)
+
+    async def release(self, key: str):
+        await self.client.delete(key)
+
+    async def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while True:
+            raw = await self.client.get(key)
+            record = json.loads(raw) if raw else None
+            if record is None or record["state"] != "in_flight" or time.monotonic() >= deadline:
+                return record
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+async def _json_response(send: Send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status_code,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, ttl: Optional[int] = None, lock_timeout: Optional[int] = None,
+                 max_body_bytes: Optional[int] = None):
+        self.app = app
+        self.ttl = ttl or settings.IDEMPOTENCY_TTL_SECONDS
+        self.lock_timeout = lock_timeout or settings.IDEMPOTENCY_LOCK_SECONDS
+        self.max_body_bytes = max_body_bytes or settings.IDEMPOTENCY_MAX_BODY_BYTES
+        self._store = None
+
+    async def _get_store(self):
+        if self._store is None:
+            store = LocalIdempotencyStore()
+            try:
+                import redis.asyncio as aioredis
+                client = aioredis.from_url(settings.REDIS_URL, socket_timeout=1, decode_responses=True)
+                await client.ping()
+                store = RedisIdempotencyStore(client)
+            except Exception as e:
+                logger.warning(f"Idempotency keys kept in process memory, Redis unavailable: {e}")
+            # Concurrent first requests all probe Redis; the first store wins
+            if self._store is None:
+                self._store = store
+        return self._store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(HEADER)
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+        if len(idempotency_key) > 255:
+            return await _json_response(send, 400, "Idempotency-Key must be at most 255 characters")
+
+        # Buffer the body: it is part of the fingerprint and must be replayed to the app
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return await _json_response(send, 413, "Request body too large for an idempotent request")
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        # Keys are scoped to the caller so one client can't read another's response
+        caller = hashlib.sha256(headers.get(b"authorization", b"")).hexdigest()[:32]
+        key = f"idempotency:{caller}:{hashlib.sha256(idempotency_key).hexdigest()}"
+        fingerprint = hashlib.sha256(b"\n".join([
+            scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body
+        ])).hexdigest()
+
+        replayed_body = False
+
+        async def replay_receive() -> Message:
+            nonlocal replayed_body
+            if not replayed_body:
+                replayed_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        store = await self._get_store()
+        try:
+            existing = await store.claim(key, {"state": "in_flight", "fingerprint": fingerprint}, self.lock_timeout)
+        except Exception as e:
+            # Losing deduplication is better than failing the request outright
+            logger.error(f"Idempotency store unavailable, executing without it: {e}")
+            return await self.app(scope, replay_receive, send)
+        if existing is not None:
+            if existing["fingerprint"] != fingerprint:
+                return await _json_response(send, 422, "Idempotency-Key was already used for a different request")
+            if existing["state"] == "in_flight":
+                existing = await store.wait(key, self.lock_timeout)
+            if existing is None:
+                return await _json_response(send, 409, "The original request failed; retry with the same key")
+            if existing["state"] == "in_flight":
+                return await _json_response(send, 409, "A request with this Idempotency-Key is still in progress")
+            return await self._replay(send, existing)
+
+        response: Dict[str, Any] = {"status": 500, "headers": [], "body": []}
+
+        async def capture_send(message: Message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await store.release(key)
+            raise
+
+        try:
+            if response["status"] >= 500:
+                await store.release(key)
+                return
+            await store.complete(key, {
+                "state": "done",
+                "fingerprint": fingerprint,
+                "status": response["status"],
+                "headers": [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in response["headers"] if name.lower() not in SKIP_REPLAY_HEADERS
+                ],
+                "body": base64.b64encode(b"".join(response["body"])).decode(),
+            }, self.ttl)
+        except Exception as e:
+            # The response has already been sent; the claim simply expires
+            logger.error(f"Failed to store idempotent response: {e}")
+
+    async def _replay(self, send: Send, record: Dict[str, Any]):
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": record["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": base64.b64decode(record["body"])})
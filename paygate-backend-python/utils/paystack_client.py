@@ -0,0 +1,323 @@
+"""
+Async Paystack API client
+
+One httpx.AsyncClient per process keeps a keep-alive pool to the gateway
+(HTTP/2 when the optional h2 package is installed and PAYSTACK_HTTP2 is on).
+Calls have connect/read timeouts and are retried with full-jitter
+exponential backoff on transport errors, 429 and 5xx. Non-idempotent calls
+(refunds) are only retried when the request provably never reached the
+gateway. A circuit breaker fails fast while the gateway is down, and every
+call records its latency per operation for the monitoring endpoint.
+
+Point PAYSTACK_BASE_URL at scripts/paystack_stub.py to run offline.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import httpx
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# The request was never sent, so even a refund is safe to retry
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class GatewayError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+class CircuitOpenError(GatewayError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls, rejects calls for
+    reset_timeout seconds, then lets a single trial call through (half-open).
+    Every allowed call must end in record_success, record_failure or release.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Paystack circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a call that says nothing about the gateway's health (e.g. cancelled)"""
+        self._trial_in_flight = False
+
+
+class LatencyMetrics:
+    """Per-operation call counts, errors and latency percentiles over a rolling window"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, operation: str, seconds: float, outcome: str):
+        counts = self._counts.setdefault(operation, {"calls": 0, "errors": 0, "retries": 0, "rejected": 0})
+        if outcome == "rejected":
+            # Short-circuited by the breaker; never reached the gateway
+            counts["rejected"] += 1
+            return
+        self._samples.setdefault(operation, deque(maxlen=self.window)).append(seconds * 1000)
+        counts["calls"] += 1
+        if outcome != "ok":
+            counts["errors"] += 1
+
+    def record_retry(self, operation: str):
+        self._counts.setdefault(operation, {"calls": 0, "errors": 0, "retries": 0, "rejected": 0})["retries"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        result = {}
+        for operation, counts in self._counts.items():
+            samples = sorted(self._samples.get(operation, ()))
+            stats = dict(counts)
+            if samples:
+                def percentile(p):
+                    return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2)
+                stats.update({
+                    "mean_ms": round(sum(samples) / len(samples), 2),
+                    "p50_ms": percentile(0.5),
+                    "p95_ms": percentile(0.95),
+                    "p99_ms": percentile(0.99),
+                    "max_ms": round(samples[-1], 2),
+                })
+            result[operation] = stats
+        return result
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class PaystackClient:
+    def __init__(self, base_url: str, secret_key: Optional[str], timeout: float = 10,
+                 connect_timeout: float = 3, max_retries: int = 3, backoff_base: float = 0.2,
+                 backoff_max: float = 3, max_connections: int = 100, http2: bool = False,
+                 breaker: Optional[CircuitBreaker] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.secret_key = secret_key
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=30,
+        )
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("PAYSTACK_HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LatencyMetrics()
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        # Celery tasks run each job on a fresh loop; pooled sockets can't follow
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.secret_key}", "Content-Type": "application/json"},
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # Full jitter keeps retrying clients from synchronising
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _request(self, operation: str, method: str, path: str,
+                       json: Optional[Dict[str, Any]] = None, idempotent: bool = True) -> Dict[str, Any]:
+        if not self.secret_key:
+            raise GatewayError("Paystack is not configured", retryable=False)
+        if not self.breaker.allow():
+            self.metrics.record(operation, 0, "rejected")
+            raise CircuitOpenError("Payment gateway is temporarily unavailable", retryable=True)
+
+        # The breaker sees one outcome per call, after its retries
+        healthy: Optional[bool] = None
+        try:
+            body = await self._send_with_retries(operation, method, path, json, idempotent)
+            healthy = True
+            return body
+        except GatewayError as e:
+            # A 4xx is the caller's problem, not the gateway's health
+            healthy = not e.retryable
+            raise
+        finally:
+            if healthy is True:
+                self.breaker.record_success()
+            elif healthy is False:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+
+    async def _send_with_retries(self, operation: str, method: str, path: str,
+                                 json: Optional[Dict[str, Any]], idempotent: bool) -> Dict[str, Any]:
+        last_error: Optional[GatewayError] = None
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                response = await self.client.request(method, path, json=json)
+            except httpx.TransportError as e:
+                self.metrics.record(operation, time.perf_counter() - started, "error")
+                last_error = GatewayError(f"Paystack {operation} failed: {type(e).__name__}", retryable=True)
+                if not idempotent and not isinstance(e, NOT_SENT_ERRORS):
+                    raise last_error
+            else:
+                elapsed = time.perf_counter() - started
+                if response.status_code in RETRYABLE_STATUS:
+                    self.metrics.record(operation, elapsed, "error")
+                    retry_after = response.headers.get("retry-after")
+                    last_error = GatewayError(
+                        f"Paystack {operation} returned {response.status_code}",
+                        status_code=response.status_code, retryable=True
+                    )
+                    if not idempotent and response.status_code != 429:
+                        raise last_error
+                else:
+                    self.metrics.record(operation, elapsed, "ok" if response.is_success else "error")
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = {}
+                    if not response.is_success or not body.get("status", False):
+                        raise GatewayError(
+                            body.get("message") or f"Paystack {operation} returned {response.status_code}",
+                            status_code=response.status_code
+                        )
+                    return body
+
+            if attempt < self.max_retries:
+                self.metrics.record_retry(operation)
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        raise last_error
+
+    async def initialize_transaction(self, email: str, amount: float, reference: str, currency: str = "NGN",
+                                     callback_url: Optional[str] = None,
+                                     metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "email": email,
+            "amount": int(round(amount * 100)),  # Paystack expects the currency subunit
+            "reference": reference,
+            "currency": currency,
+        }
+        if callback_url:
+            payload["callback_url"] = callback_url
+        if metadata:
+            payload["metadata"] = metadata
+        # Paystack rejects a reused reference, so retrying cannot double-charge
+        return await self._request("initialize", "POST", "/transaction/initialize", json=payload)
+
+    async def verify_transaction(self, reference: str) -> Dict[str, Any]:
+        return await self._request("verify", "GET", f"/transaction/verify/{reference}")
+
+    async def charge_authorization(self, email: str, amount: float, authorization_code: str, reference: str,
+                                   currency: str = "NGN", metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Charge a saved card (recurring billing); the reference makes retries safe"""
+        payload: Dict[str, Any] = {
+            "email": email,
+            "amount": int(round(amount * 100)),
+            "authorization_code": authorization_code,
+            "reference": reference,
+            "currency": currency,
+        }
+        if metadata:
+            payload["metadata"] = metadata
+        return await self._request("charge_authorization", "POST", "/transaction/charge_authorization", json=payload)
+
+    async def create_refund(self, reference: str, amount: Optional[float] = None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"transaction": reference}
+        if amount is not None:
+            payload["amount"] = int(round(amount * 100))
+        return await self._request("refund", "POST", "/refund", json=payload, idempotent=False)
+
+
+_client: Optional[PaystackClient] = None
+
+
+def get_paystack_client() -> PaystackClient:
+    global _client
+    if _client is None:
+        _client = PaystackClient(
+            base_url=settings.PAYSTACK_BASE_URL,
+            secret_key=settings.PAYSTACK_SECRET_KEY,
+            timeout=settings.PAYSTACK_TIMEOUT,
+            max_retries=settings.PAYSTACK_MAX_RETRIES,
+            max_connections=settings.PAYSTACK_MAX_CONNECTIONS,
+            http2=settings.PAYSTACK_HTTP2,
+            breaker=CircuitBreaker(settings.PAYSTACK_BREAKER_THRESHOLD, settings.PAYSTACK_BREAKER_RESET_SECONDS),
+        )
+    return _client
+
+
+async def close_paystack_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,248 @@
+"""
+Pooled SMTP delivery for Celery workers
+
+Each worker process keeps one persistent, authenticated SMTP connection and
+reuses it across tasks. Connections are checked with NOOP after sitting
+idle, recycled after a configurable number of messages, and re-established
+transparently when the server drops them. Recipient domains are throttled
+so large sends don't trip provider rate limits; the counters live in Redis
+when it is reachable so the limit holds across workers, with an in-process
+fallback.
+
+When EMAIL_HOST is not configured, messages are logged instead of sent,
+matching the previous development behaviour.
+"""
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import Dict, Any, Optional
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the connection is discarded and the send retried once
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def build_message(to_email: str, subject: str, body: str, html_body: Optional[str] = None,
+                  sender: Optional[str] = None) -> EmailMessage:
+    msg = EmailMessage()
+    msg['From'] = sender or settings.EMAIL_SENDER or 'noreply@paygate.com'
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.set_content(body or "")
+    if html_body:
+        msg.add_alternative(html_body, subtype='html')
+    return msg
+
+
+def recipient_domain(email: str) -> str:
+    return email.rsplit("@", 1)[-1].strip().lower()
+
+
+class SMTPConnectionPool:
+    """
+    A single reusable SMTP connection guarded by a lock.
+    Celery prefork children each get their own instance (see get_smtp_pool).
+    """
+
+    def __init__(self, host: Optional[str], port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, use_tls: bool = True, timeout: float = 30,
+                 max_messages: int = 100, idle_timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self._connection: Optional[smtplib.SMTP] = None
+        self._sent_on_connection = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.host)
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.port == 465:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            connection.ehlo()
+            if self.use_tls and connection.has_extn("starttls"):
+                connection.starttls()
+                connection.ehlo()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        self._sent_on_connection = 0
+        logger.debug(f"Opened SMTP connection to {self.host}:{self.port}")
+        return connection
+
+    def _discard(self):
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except Exception:
+                try:
+                    self._connection.close()
+                except Exception:
+                    pass
+        self._connection = None
+
+    def _get_connection(self) -> smtplib.SMTP:
+        if self._connection is not None:
+            if self._sent_on_connection >= self.max_messages:
+                self._discard()
+            elif time.monotonic() - self._last_used > self.idle_timeout:
+                # Servers drop idle sessions; probe before trusting the socket
+                try:
+                    status_code, _ = self._connection.noop()
+                    if status_code != 250:
+                        self._discard()
+                except (smtplib.SMTPException, OSError):
+                    self._discard()
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def send(self, message: EmailMessage) -> Dict[str, Any]:
+        """Send one message, reconnecting once if the connection has gone away"""
+        if not self.enabled:
+            logger.info(f"Email sent to {message['To']}: {message['Subject']} (no SMTP host configured)")
+            return {}
+
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    refused = self._get_connection().send_message(message)
+                    self._sent_on_connection += 1
+                    self._last_used = time.monotonic()
+                    return refused
+                except smtplib.SMTPRecipientsRefused:
+                    # The session is still usable; only this message failed
+                    self._last_used = time.monotonic()
+                    raise
+                except RECONNECT_ERRORS:
+                    self._discard()
+                    if attempt == 2:
+                        raise
+                    logger.warning(f"SMTP connection to {self.host} lost, reconnecting")
+                except smtplib.SMTPResponseException as e:
+                    if e.smtp_code != 421 or attempt == 2:
+                        self._discard()
+                        raise
+                    # 421: the server is closing the session
+                    self._discard()
+
+    def close(self):
+        with self._lock:
+            self._discard()
+
+
+class DomainThrottle:
+    """
+    Fixed one-minute window per recipient domain.
+    acquire() returns 0 when a send is allowed, otherwise the seconds to wait.
+    """
+
+    def __init__(self, default_per_minute: int, overrides: Optional[Dict[str, int]] = None,
+                 redis_url: Optional[str] = None):
+        self.default_per_minute = default_per_minute
+        self.overrides = overrides or {}
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.redis_client = None
+        if redis_url:
+            try:
+                import redis
+                self.redis_client = redis.from_url(redis_url, socket_timeout=1)
+                self.redis_client.ping()
+            except Exception as e:
+                logger.warning(f"Email throttle falling back to in-process counters: {e}")
+                self.redis_client = None
+
+    def limit_for(self, domain: str) -> int:
+        return self.overrides.get(domain, self.default_per_minute)
+
+    def acquire(self, domain: str) -> float:
+        limit = self.limit_for(domain)
+        if limit <= 0:
+            return 0.0
+        now = time.time()
+        window = int(now // 60)
+        wait = (window + 1) * 60 - now
+
+        if self.redis_client is not None:
+            key = f"email_throttle:{domain}:{window}"
+            try:
+                pipe = self.redis_client.pipeline()
+                pipe.incr(key)
+                pipe.expire(key, 120)
+                count, _ = pipe.execute()
+                return 0.0 if count <= limit else wait
+            except Exception as e:
+                logger.warning(f"Email throttle Redis error, using local counters: {e}")
+
+        with self._lock:
+            for stale in [k for k in self._counts if k[1] < window]:
+                del self._counts[stale]
+            count = self._counts.get((domain, window), 0) + 1
+            self._counts[(domain, window)] = count
+        return 0.0 if count <= limit else wait
+
+
+def parse_domain_limits(raw: Optional[str]) -> Dict[str, int]:
+    """Parse "gmail.com=120,yahoo.com=60" into per-domain limits"""
+    limits = {}
+    for item in (raw or "").split(","):
+        if "=" in item:
+            domain, value = item.split("=", 1)
+            limits[domain.strip().lower()] = int(value)
+    return limits
+
+
+_pool: Optional[SMTPConnectionPool] = None
+_throttle: Optional[DomainThrottle] = None
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = SMTPConnectionPool(
+            host=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_USERNAME,
+            password=settings.EMAIL_PASSWORD,
+            use_tls=settings.EMAIL_USE_TLS,
+            max_messages=settings.EMAIL_MAX_MESSAGES_PER_CONNECTION,
+            idle_timeout=settings.EMAIL_CONNECTION_IDLE_TIMEOUT,
+        )
+    return _pool
+
+
+def get_domain_throttle() -> DomainThrottle:
+    global _throttle
+    if _throttle is None:
+        _throttle = DomainThrottle(
+            settings.EMAIL_DOMAIN_RATE_PER_MINUTE,
+            parse_domain_limits(settings.EMAIL_DOMAIN_RATE_OVERRIDES),
+            settings.REDIS_URL if settings.EMAIL_HOST else None,
+        )
+    return _throttle
+
+
+def _reset_after_fork():
+    # A socket inherited from the parent must never be shared with it
+    global _pool, _throttle
+    _pool = None
+    _throttle = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,311 @@
+"""
+Streaming upload ingestion for the PayGate application
+
+Uploads are consumed chunk by chunk: the size limit is enforced as bytes
+arrive, the SHA-256 digest and MIME type are computed on the fly, and the
+data is written to a temp file that is atomically renamed into place once
+the whole body has been received. Files are stored content-addressed, so
+re-uploading identical bytes reuses the existing blob.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
+from fastapi import HTTPException, Request, UploadFile, status
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Allowed file types and their corresponding directories
+ALLOWED_EXTENSIONS = {
+    'image/jpeg': 'images',
+    'image/png': 'images',
+    'image/gif': 'images',
+    'image/webp': 'images',
+    'application/pdf': 'documents',
+    'application/msword': 'documents',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'documents',
+    'video/mp4': 'videos',
+    'video/quicktime': 'videos',
+    'video/webm': 'videos',
+}
+
+FILE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'application/pdf': '.pdf',
+    'application/msword': '.doc',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+    'video/webm': '.webm',
+}
+
+# Maximum file size per directory - memory use no longer grows with these
+MAX_FILE_SIZES = {
+    'images': 10 * 1024 * 1024,  # 10MB
+    'documents': 200 * 1024 * 1024,  # 200MB
+    'videos': 2 * 1024 * 1024 * 1024,  # 2GB
+}
+
+# Content.type value for each upload directory
+CONTENT_TYPES = {
+    'images': 'image',
+    'documents': 'document',
+    'videos': 'video',
+}
+
+# Only this subtree of UPLOAD_DIR is served without authorization (avatars);
+# everything else is delivered through access-checked endpoints
+PUBLIC_UPLOAD_DIR = 'public'
+PUBLIC_URL_PREFIX = '/api/uploads/public/'
+
+# Reference to a private upload, resolved by utils.file_delivery.resolve_upload_path
+STORAGE_URL_PREFIX = 'upload://'
+
+# Bytes needed from the start of the stream to sniff the MIME type
+SNIFF_BYTES = 64
+
+# Containers whose magic bytes are shared by several allowed types
+_ZIP_CONTAINER_TYPES = {'application/vnd.openxmlformats-officedocument.wordprocessingml.document'}
+
+
+def get_file_extension(content_type: str) -> str:
+    """Get file extension from content type"""
+    return FILE_EXTENSIONS.get(content_type, '.bin')
+
+
+def sniff_mime_type(head: bytes, declared_type: Optional[str] = None) -> Optional[str]:
+    """
+    Detect the MIME type from the leading bytes of a file.
+    The client-declared type is only trusted for container formats (e.g. docx is a zip).
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'application/msword'
+    if head.startswith(b'PK\x03\x04'):
+        return declared_type if declared_type in _ZIP_CONTAINER_TYPES else 'application/zip'
+    if head[4:8] == b'ftyp':
+        return 'video/quicktime' if head[8:12] == b'qt  ' else 'video/mp4'
+    if head.startswith(b'\x1aE\xdf\xa3'):
+        return 'video/webm'
+    return None
+
+
+def _discard(temp_path: Path):
+    try:
+        temp_path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _resolve_content_type(head: bytes, declared_type: Optional[str]) -> str:
+    """Sniff the content type and reject anything outside ALLOWED_EXTENSIONS"""
+    content_type = sniff_mime_type(head, declared_type)
+    if content_type not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {content_type or declared_type or 'unknown'}"
+        )
+    return content_type
+
+
+def blob_relative_path(sha256: str, content_type: str) -> str:
+    """
+    Content-addressed location of a blob: <type dir>/<hash[0:2]>/<hash[2:4]>/<hash><ext>.
+    The two shard levels keep every directory small regardless of upload volume.
+    """
+    return f"{ALLOWED_EXTENSIONS[content_type]}/{sha256[:2]}/{sha256[2:4]}/{sha256}{get_file_extension(content_type)}"
+
+
+def _place_file(source: Path, root: Path, content_type: str, sha256: str) -> Tuple[Path, bool]:
+    """
+    Atomically move a fully written file to its content-addressed location.
+    If identical bytes are already stored the new copy is discarded.
+    """
+    target_path = root / blob_relative_path(sha256, content_type)
+    if target_path.exists():
+        _discard(source)
+        return target_path, True
+
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(source, target_path)
+    return target_path, False
+
+
+class StoredUpload:
+    """
+    Result of a streamed upload that has been committed to disk
+    """
+
+    def __init__(self, path: Path, size: int, sha256: str, content_type: str, original_name: str,
+                 root: Optional[Path] = None, deduplicated: bool = False):
+        self.path = path
+        self.deduplicated = deduplicated
+        self.root = root or Path(settings.UPLOAD_DIR)
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+        self.original_name = original_name
+
+    @property
+    def category(self) -> str:
+        return ALLOWED_EXTENSIONS[self.content_type]
+
+    @property
+    def relative_path(self) -> str:
+        return self.path.relative_to(self.root).as_posix()
+
+    @property
+    def url(self) -> str:
+        """Storage reference, not a servable URL; see PUBLIC_URL_PREFIX"""
+        return f"{STORAGE_URL_PREFIX}{self.relative_path}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "url": self.url,
+            "size": self.size,
+            "sha256": self.sha256,
+            "content_type": self.content_type,
+            "original_name": self.original_name,
+            "deduplicated": self.deduplicated,
+        }
+
+
+async def iter_upload_file(file: UploadFile, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield a multipart UploadFile in fixed-size chunks instead of reading it whole"""
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def iter_request_body(request: Request) -> AsyncIterator[bytes]:
+    """Yield a raw request body as it arrives from the client, without spooling"""
+    async for chunk in request.stream():
+        if chunk:
+            yield chunk
+
+
+async def store_stream(
+    chunks: AsyncIterator[bytes],
+    original_name: str,
+    declared_type: Optional[str] = None,
+    upload_root: Optional[str] = None,
+    max_size: Optional[int] = None,
+) -> StoredUpload:
+    """
+    Consume an async byte stream into the upload directory layout.
+    Raises 415 for unsupported types and 413 as soon as the size limit is crossed.
+    """
+    root = Path(upload_root or settings.UPLOAD_DIR)
+    temp_dir = root / ".tmp"
+    temp_dir.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_name = tempfile.mkstemp(dir=temp_dir, prefix="upload_", suffix=".part")
+    temp_path = Path(temp_name)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    content_type = None
+    limit = max_size
+
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            async for chunk in chunks:
+                if content_type is None:
+                    head += chunk[:SNIFF_BYTES]
+                    if len(head) >= SNIFF_BYTES:
+                        content_type = _resolve_content_type(head, declared_type)
+                        if limit is None:
+                            limit = MAX_FILE_SIZES[ALLOWED_EXTENSIONS[content_type]]
+
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the maximum size of {limit} bytes"
+                    )
+
+                digest.update(chunk)
+                await asyncio.to_thread(buffer.write, chunk)
+
+            if content_type is None:
+                # Stream was shorter than the sniff window
+                content_type = _resolve_content_type(head, declared_type)
+
+            await asyncio.to_thread(buffer.flush)
+            await asyncio.to_thread(os.fsync, buffer.fileno())
+
+        sha256 = digest.hexdigest()
+        target_path, deduplicated = _place_file(temp_path, root, content_type, sha256)
+    except BaseException:
+        _discard(temp_path)
+        raise
+
+    logger.info(f"Stored upload {original_name} ({size} bytes, {content_type}) at {target_path}")
+    return StoredUpload(target_path, size, sha256, content_type, original_name, root, deduplicated)
+
+
+async def store_upload_file(file: UploadFile, upload_root: Optional[str] = None) -> StoredUpload:
+    """Stream a multipart UploadFile into the upload directory layout"""
+    return await store_stream(
+        iter_upload_file(file),
+        original_name=os.path.basename(file.filename or "upload"),
+        declared_type=file.content_type,
+        upload_root=upload_root,
+    )
+
+
+def _hash_file(path: Path, chunk_size: int) -> Tuple[bytes, str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as source:
+        head = source.read(SNIFF_BYTES)
+        source.seek(0)
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return head, digest.hexdigest(), size
+
+
+async def commit_file(
+    source: Path,
+    original_name: str,
+    declared_type: Optional[str] = None,
+    upload_root: Optional[str] = None,
+) -> StoredUpload:
+    """
+    Validate, hash and atomically move a file that was assembled on disk
+    (e.g. by a resumable upload session) into the upload directory layout.
+    """
+    root = Path(upload_root or settings.UPLOAD_DIR)
+    head, sha256, size = await asyncio.to_thread(_hash_file, source, settings.UPLOAD_CHUNK_SIZE)
+    content_type = _resolve_content_type(head, declared_type)
+    limit = MAX_FILE_SIZES[ALLOWED_EXTENSIONS[content_type]]
+    if size > limit:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the maximum size of {limit} bytes"
+        )
+
+    target_path, deduplicated = _place_file(source, root, content_type, sha256)
+    logger.info(f"Committed upload {original_name} ({size} bytes, {content_type}) at {target_path}")
+    return StoredUpload(target_path, size, sha256, content_type, original_name, root, deduplicated)
@@ -4,6 +4,7 @@ WebSocket broadcasting utility for analytics events
 import json
 import asyncio
 from typing import Dict, Any
+from config.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +12,10 @@ logger = logging.getLogger(__name__)
 # Global set to store WebSocket connections
 websocket_connections = set()
 
+# Redis pub/sub channel that fans events out to every API process's clients
+REALTIME_CHANNEL = "paygate:realtime"
+_bus_client = None  # redis.asyncio client, or False once found unavailable
+
 
 def register_websocket_connection(websocket):
     """Register a new WebSocket connection"""
@@ -54,4 +59,81 @@ async def broadcast_analytics_event(event_type: str, data: Dict[str, Any]):
         "data": data,
         "timestamp": asyncio.get_event_loop().time()
     }
-    await broadcast_to_websocket_clients(message)
\ No newline at end of file
+    await broadcast_to_websocket_clients(message)
+
+async def _get_bus():
+    global _bus_client
+    if _bus_client is None:
+        try:
+            import redis.asyncio as aioredis
+            client = aioredis.from_url(settings.REDIS_URL, socket_timeout=2)
+            await client.ping()
+            _bus_client = client
+        except Exception as e:
+            logger.warning(f"Realtime bus unavailable, broadcasting in-process only: {e}")
+            _bus_client = False
+    return _bus_client or None
+
+
+async def publish_analytics_event(event_type: str, data: Dict[str, Any]):
+    """
+    Publish an analytics event to the clients of every API process via the
+    Redis bus, falling back to this process's clients when Redis is down
+    """
+    bus = await _get_bus()
+    if bus is not None:
+        try:
+            await bus.publish(REALTIME_CHANNEL, json.dumps({"event_type": event_type, "data": data}, default=str))
+            return
+        except Exception as e:
+            logger.warning(f"Realtime bus publish failed, broadcasting locally: {e}")
+    await broadcast_analytics_event(event_type, data)
+
+
+async def _forward_bus_message(message: Dict[str, Any]):
+    try:
+        event = json.loads(message["data"])
+        await broadcast_analytics_event(event["event_type"], event["data"])
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring malformed realtime bus message: {e}")
+
+
+async def run_realtime_subscriber(reconnect_delay: float = 5.0, poll_interval: float = 1.0):
+    """
+    Forward bus events to this process's WebSocket clients.
+    Runs for the lifetime of the application; resubscribes at once if the
+    connection drops, backing off only while Redis keeps failing.
+    """
+    if await _get_bus() is None:
+        return
+
+    import redis.asyncio as aioredis
+    # A subscriber sits idle between events, so it gets its own connection
+    # without a read timeout; health checks detect a dead connection instead
+    client = aioredis.from_url(settings.REDIS_URL, socket_timeout=None, health_check_interval=30)
+    failures = 0
+    try:
+        while True:
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(REALTIME_CHANNEL)
+                failures = 0
+                while True:
+                    # Returns None when nothing arrived within poll_interval
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=poll_interval)
+                    if message is not None and message.get("type") == "message":
+                        await _forward_bus_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime bus subscription lost: {e}")
+                if failures:
+                    await asyncio.sleep(min(reconnect_delay * failures, 60))
+                failures += 1
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+    finally:
+        await client.aclose()